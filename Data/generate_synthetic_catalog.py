@@ -0,0 +1,298 @@
+"""
+Synthetic catalog generator for scale testing
+
+Creates N fake movies that look like the output of recommendation_pipeline.ipynb:
+  - narrative: 384-dim unit vectors (all-MiniLM-L6-v2 space)
+  - visual:    608-dim = normalize(512 CLIP) ++ normalize(96-bin color histogram)
+  - audio:     8-dim normalize([tempo, 7 spectral contrast bands])
+  - documents: Gemini-format [VISUAL_STYLE]/[NARRATIVE_ARC]/[AUDIO_LANDSCAPE]/[EMOTIONAL_VIBE] text
+
+Movies are drawn from latent "genre" clusters of Zipf-distributed size, and the
+visual/audio modalities follow the narrative cluster most of the time, so the
+similarity structure resembles a real catalog rather than uniform noise.
+
+Outputs (under --out):
+  movie_trailers.csv            same columns as Data/movie_trailers.csv
+  movie_trailers_enriched.csv   OMDb-style metadata columns (see src/omdb_crawler.py)
+  serving_snapshot/             see serving_snapshot.py
+  trailer_db/                   ChromaDB store (skip with --snapshot-only)
+
+Example:
+  python Data/generate_synthetic_catalog.py --count 100000 --out Data/synthetic_100k
+  python Data/generate_synthetic_catalog.py --count 1000000 --snapshot-only --out /tmp/synthetic_1m
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serving_snapshot import COLLECTIONS, DIMENSIONS, finish_snapshot, open_snapshot_writer
+
+CLIP_DIM = 512
+HIST_BINS = 32
+
+GENRES = [
+    ['Horror', 'Thriller'], ['Action', 'Adventure'], ['Drama'], ['Comedy'], ['Sci-Fi', 'Action'],
+    ['Romance', 'Drama'], ['Documentary'], ['Animation', 'Family'], ['Crime', 'Drama'],
+    ['Comedy', 'Romance'], ['Action', 'Thriller'], ['Fantasy', 'Adventure'], ['Mystery', 'Thriller'],
+    ['War', 'Drama'], ['Music', 'Biography'], ['Western'],
+]
+
+VOCAB = {
+    'visual_style': ['low-key lighting', 'neon-soaked palette', 'desaturated teal and orange', 'handheld camera',
+                     'sweeping drone shots', 'practical effects', 'high-contrast noir shadows', 'pastel colors',
+                     'rain-slicked streets', 'golden hour warmth', 'claustrophobic close-ups', 'glossy CGI',
+                     'grainy 16mm texture', 'symmetrical framing', 'strobe-lit montage', 'cold blue moonlight'],
+    'narrative_arc': ['a grieving family uncovers a secret', 'a heist goes wrong', 'an unlikely friendship forms',
+                      'a detective hunts a serial killer', 'a chosen hero leaves home', 'a small town is haunted',
+                      'a rivalry escalates into war', 'a musician chases one last shot', 'a crew is stranded in space',
+                      'lovers are separated by circumstance', 'a con artist plays both sides',
+                      'a possessed child terrorizes a household', 'car chases through the city',
+                      'a courtroom showdown', 'a time loop twist', 'a betrayal by a mentor'],
+    'audio_landscape': ['pulsing synth score', 'orchestral swells', 'dissonant strings', 'jump-scare stingers',
+                        'upbeat pop soundtrack', 'whispered dialogue', 'booming explosions', 'acoustic folk guitar',
+                        'ticking clock motif', 'choir chants', 'heavy bass drops', 'quiet piano theme',
+                        'gunfire and sirens', 'playful woodwinds', 'distorted industrial noise', 'jazz saxophone'],
+    'emotional_vibe': ['dread', 'exhilaration', 'melancholy', 'heartwarming', 'tension', 'nostalgia',
+                       'paranoia', 'triumph', 'whimsy', 'grief', 'awe', 'romantic longing',
+                       'date-night crowd', 'family audience', 'genre fans', 'awards-season drama lovers'],
+}
+
+TITLE_WORDS = (
+    ['Crimson', 'Silent', 'Last', 'Hollow', 'Midnight', 'Broken', 'Golden', 'Electric', 'Lost', 'Wild',
+     'Frozen', 'Burning', 'Hidden', 'Savage', 'Velvet', 'Iron', 'Paper', 'Glass', 'Final', 'Lonely'],
+    ['Harbor', 'Signal', 'Kingdom', 'Witness', 'Summer', 'Frontier', 'Orbit', 'Garden', 'Protocol', 'Echo',
+     'Empire', 'Road', 'Inheritance', 'Carnival', 'Tide', 'Covenant', 'Horizon', 'Asylum', 'Requiem', 'Heist'],
+)
+
+DIRECTORS = ['Ava Lindqvist', 'Marcus Oyelaran', 'Hana Sato', 'Diego Ferreira', 'Priya Raman', 'Tom Kessler',
+             'Ines Moreau', 'Kwame Asante', 'Lena Novak', 'Samuel Ortiz', 'Mei Chen', 'Oliver Grant']
+ACTORS = ['Nora Blake', 'Idris Vance', 'Sofia Reyes', 'Jonah Park', 'Amara Okafor', 'Felix Hart', 'Maya Ito',
+          'Leo Brandt', 'Zara Quinn', 'Elias Ward', 'Ruth Mensah', 'Caleb Stone', 'Yara Haddad', 'Owen Price']
+RATED = ['G', 'PG', 'PG-13', 'R', 'NR']
+
+
+def unit_rows(matrix):
+    """
+    L2 normalize each row (the notebook's normalize(), row-wise)
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class CatalogModel:
+    """
+    Per-cluster parameters shared by every chunk of generated movies
+    """
+
+    def __init__(self, clusters, rng):
+        self.clusters = clusters
+        # Zipf-like cluster popularity: a few big genres, a long tail of niches
+        popularity = 1.0 / np.arange(1, clusters + 1) ** 0.8
+        self.cluster_p = popularity / popularity.sum()
+
+        self.narrative_centroids = unit_rows(rng.standard_normal((clusters, DIMENSIONS['narrative'])))
+        # Sentence embeddings of same-format documents are never orthogonal either
+        self.narrative_common = unit_rows(rng.standard_normal((1, DIMENSIONS['narrative'])))[0] * 0.7
+        self.clip_centroids = unit_rows(rng.standard_normal((clusters, CLIP_DIM)))
+        # CLIP image embeddings share a large common component (they all live in a narrow cone)
+        self.clip_common = unit_rows(rng.standard_normal((1, CLIP_DIM)))[0] * 1.5
+        self.palettes = rng.dirichlet(np.full(HIST_BINS, 0.6), size=(clusters, 3))
+        self.tempo = rng.uniform(70, 170, size=clusters)
+        self.contrast = rng.uniform(14, 28, size=(clusters, 7))
+        self.rating = rng.uniform(5.0, 8.0, size=clusters)
+        self.vocab_offsets = rng.integers(0, 16, size=(clusters, 4))
+        self.genres = [GENRES[c % len(GENRES)] for c in range(clusters)]
+
+
+def generate_chunk(model, rng, count, follow_cluster=0.75):
+    """
+    Generate `count` movies: cluster ids and the three embedding matrices
+    """
+    clusters = rng.choice(model.clusters, size=count, p=model.cluster_p)
+
+    def modality_clusters():
+        # Most movies keep their narrative cluster for visuals/audio, the rest drift
+        drift = rng.random(count) > follow_cluster
+        other = rng.choice(model.clusters, size=count, p=model.cluster_p)
+        return np.where(drift, other, clusters)
+
+    narrative = model.narrative_common + model.narrative_centroids[clusters] + rng.standard_normal(
+        (count, DIMENSIONS['narrative']), dtype=np.float32) * 0.04
+    narrative = unit_rows(narrative)
+
+    vis_clusters = modality_clusters()
+    clip = model.clip_common + model.clip_centroids[vis_clusters] + rng.standard_normal(
+        (count, CLIP_DIM), dtype=np.float32) * 0.05
+    # Color histograms: each channel is a noisy draw around the cluster palette
+    palette = model.palettes[vis_clusters]
+    noise = rng.gamma(4.0, 1.0, size=palette.shape)
+    hist = palette * noise
+    hist = hist / hist.sum(axis=2, keepdims=True)
+    visual = np.concatenate([unit_rows(clip), unit_rows(hist.reshape(count, 3 * HIST_BINS))], axis=1)
+
+    aud_clusters = modality_clusters()
+    tempo = np.clip(model.tempo[aud_clusters] + rng.normal(0, 8, size=count), 55, 200)
+    contrast = model.contrast[aud_clusters] + rng.normal(0, 1.5, size=(count, 7))
+    audio = unit_rows(np.concatenate([tempo[:, None], contrast], axis=1))
+
+    return clusters, narrative.astype(np.float32), visual.astype(np.float32), audio.astype(np.float32)
+
+
+def make_titles(count, rng):
+    """
+    Unique, plausible titles; repeats become sequels ("Crimson Harbor 2")
+    """
+    first, second = TITLE_WORDS
+    a = rng.integers(0, len(first), size=count)
+    b = rng.integers(0, len(second), size=count)
+    use_the = rng.random(count) < 0.4
+    seen = {}
+    titles = []
+    for i in range(count):
+        base = f"{'The ' if use_the[i] else ''}{first[a[i]]} {second[b[i]]}"
+        n = seen.get(base, 0) + 1
+        seen[base] = n
+        titles.append(base if n == 1 else f"{base} {n}")
+    return titles
+
+
+def make_document(model, cluster, rng_values):
+    """
+    Build a Gemini-format analysis from the cluster's vocabulary slice
+    """
+    parts = []
+    for s, (marker, key) in enumerate([('[VISUAL_STYLE]', 'visual_style'), ('[NARRATIVE_ARC]', 'narrative_arc'),
+                                       ('[AUDIO_LANDSCAPE]', 'audio_landscape'),
+                                       ('[EMOTIONAL_VIBE]', 'emotional_vibe')]):
+        words = VOCAB[key]
+        offset = model.vocab_offsets[cluster, s]
+        picks = [words[(offset + int(r)) % len(words)] for r in rng_values[s]]
+        parts.append(f"{marker}: {', '.join(dict.fromkeys(picks))}.")
+    return '\n'.join(parts)
+
+
+def make_metadata(model, clusters, rng):
+    """
+    OMDb-style metadata columns for a chunk, vectorized per column
+    """
+    n = len(clusters)
+    years = np.clip(2025 - rng.exponential(9.0, size=n), 1950, 2025).astype(int)
+    ratings = np.clip(rng.normal(model.rating[clusters], 0.8), 1.0, 9.8)
+    rated = rng.integers(0, len(RATED), size=n)
+    runtimes = rng.integers(80, 170, size=n)
+    directors = rng.integers(0, len(DIRECTORS), size=n)
+    votes = rng.integers(500, 900000, size=n)
+    # Three distinct cast members: a random start and two distinct forward steps
+    first = rng.integers(0, len(ACTORS), size=n)
+    step = rng.integers(1, len(ACTORS) // 2, size=n)
+    cast = np.stack([first, first + step, first + 2 * step], axis=1) % len(ACTORS)
+    return [{
+        'Year': str(years[i]),
+        'Rated': RATED[rated[i]],
+        'Runtime': f"{runtimes[i]} min",
+        'Genre': ', '.join(model.genres[clusters[i]]),
+        'Director': DIRECTORS[directors[i]],
+        'Actors': ', '.join(ACTORS[a] for a in cast[i]),
+        'Language': 'English',
+        'Country': 'USA',
+        'Poster': 'N/A',
+        'imdbRating': f"{ratings[i]:.1f}",
+        'imdbVotes': f"{votes[i]:,}",
+    } for i in range(n)]
+
+
+def write_chroma(chroma_path, titles, links, documents, snapshot, batch_size):
+    """
+    Bulk load the three collections in the largest batches ChromaDB accepts
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    max_batch = getattr(client, 'get_max_batch_size', lambda: batch_size)()
+    batch_size = min(batch_size, max_batch)
+    collections = {modality: client.get_or_create_collection(name=name) for modality, name in COLLECTIONS.items()}
+
+    for start in range(0, len(titles), batch_size):
+        end = min(start + batch_size, len(titles))
+        ids = [f"{title}_full" for title in titles[start:end]]
+        metas = [{'title': titles[i], 'desc': documents[i][:100], 'link': links[i]} for i in range(start, end)]
+        for modality, collection in collections.items():
+            kwargs = {'documents': documents[start:end]} if modality == 'narrative' else {}
+            collection.add(ids=ids, embeddings=np.asarray(snapshot[modality][start:end]),
+                           metadatas=metas, **kwargs)
+        print(f"  ...ChromaDB {end}/{len(titles)}", end='\r', flush=True)
+    print()
+
+
+def generate_catalog(count, out_dir, clusters=48, seed=7, chunk_size=50000,
+                     snapshot_only=False, batch_size=5000):
+    rng = np.random.default_rng(seed)
+    model = CatalogModel(clusters, rng)
+    os.makedirs(out_dir, exist_ok=True)
+    snapshot_path = os.path.join(out_dir, 'serving_snapshot')
+
+    start = time.time()
+    titles = make_titles(count, rng)
+    links = [f"https://www.youtube.com/watch?v=syn{row:08d}" for row in range(count)]
+    arrays = open_snapshot_writer(snapshot_path, count)
+    documents = []
+
+    enriched_fields = ['Movie Title', 'YouTube Link', 'Year', 'Rated', 'Runtime', 'Genre', 'Director', 'Actors',
+                       'Language', 'Country', 'Poster', 'imdbRating', 'imdbVotes', 'imdbID']
+    with open(os.path.join(out_dir, 'movie_trailers.csv'), 'w', encoding='utf-8', newline='') as f_plain, \
+            open(os.path.join(out_dir, 'movie_trailers_enriched.csv'), 'w', encoding='utf-8', newline='') as f_rich:
+        plain = csv.writer(f_plain)
+        plain.writerow(['Movie Title', 'YouTube Link'])
+        rich = csv.DictWriter(f_rich, fieldnames=enriched_fields)
+        rich.writeheader()
+
+        for chunk_start in range(0, count, chunk_size):
+            n = min(chunk_size, count - chunk_start)
+            clusters_ids, narrative, visual, audio = generate_chunk(model, rng, n)
+            end = chunk_start + n
+            arrays['narrative'][chunk_start:end] = narrative
+            arrays['visual'][chunk_start:end] = visual
+            arrays['audio'][chunk_start:end] = audio
+            arrays['present'][chunk_start:end] = True
+
+            picks = rng.integers(0, 6, size=(n, 4, 4))
+            metadata = make_metadata(model, clusters_ids, rng)
+            for i in range(n):
+                row = chunk_start + i
+                documents.append(make_document(model, int(clusters_ids[i]), picks[i]))
+                plain.writerow([titles[row], links[row]])
+                rich.writerow({'Movie Title': titles[row], 'YouTube Link': links[row],
+                               'imdbID': f"tt{9000000 + row:07d}", **metadata[i]})
+            print(f"  ...generated {end}/{count} ({time.time() - start:.1f}s)", end='\r', flush=True)
+    print()
+
+    finish_snapshot(snapshot_path, titles, documents, arrays, source=f'synthetic(seed={seed}, clusters={clusters})')
+    print(f"✓ Snapshot written to {snapshot_path} ({time.time() - start:.1f}s)")
+
+    if not snapshot_only:
+        write_chroma(os.path.join(out_dir, 'trailer_db'), titles, links, documents, arrays, batch_size)
+        print(f"✓ ChromaDB store written to {os.path.join(out_dir, 'trailer_db')} ({time.time() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic movie catalog for scale testing")
+    parser.add_argument('--count', type=int, default=10000, help="number of movies")
+    parser.add_argument('--out', default='Data/synthetic', help="output directory")
+    parser.add_argument('--clusters', type=int, default=48, help="latent genre clusters")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--chunk-size', type=int, default=50000, help="movies generated per chunk")
+    parser.add_argument('--batch-size', type=int, default=5000, help="ChromaDB add() batch size")
+    parser.add_argument('--snapshot-only', action='store_true',
+                        help="skip ChromaDB (HNSW indexing dominates runtime at 1M titles)")
+    args = parser.parse_args()
+
+    generate_catalog(args.count, args.out, clusters=args.clusters, seed=args.seed, chunk_size=args.chunk_size,
+                     snapshot_only=args.snapshot_only, batch_size=args.batch_size)
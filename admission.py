@@ -0,0 +1,158 @@
+"""
+Deadline-aware admission control and load shedding
+
+Every scoring route gets a concurrency budget. A request that finds its
+budget full queues, but only while the estimated queue wait (queued requests
+x the route's moving-average service time / concurrency) fits inside its
+deadline; otherwise it is rejected at once with 503 + Retry-After, before any
+work is done. A request still queued when its deadline passes is rejected the
+same way. Overload then costs shed requests a fast 503 instead of making
+every request, including cheap ones, wait behind an unbounded queue.
+
+Deadlines come from the X-Deadline-Ms request header (milliseconds the client
+is still willing to wait) or the route's priority class default:
+
+  critical     health, metrics, static files: never budgeted, never shed
+  interactive  catalog browsing, analysis, recommendations, search
+  bulk         whole-catalog similarity scoring; slider drags make most of
+               these stale within a second, so they get shorter deadlines
+               and a smaller budget
+"""
+
+import math
+import os
+import threading
+import time
+
+DEADLINE_HEADER = 'X-Deadline-Ms'
+MAX_DEADLINE_MS = 30000
+
+CPUS = os.cpu_count() or 1
+
+# priority class: (default concurrency, default deadline ms)
+PRIORITY_CLASSES = {
+    'critical': (None, None),
+    'interactive': (2 * CPUS, 2000),
+    'bulk': (CPUS, 1000),
+}
+
+
+class Budget:
+    """
+    Concurrency slots for one route, with a bounded, deadline-checked queue
+    """
+
+    def __init__(self, name, priority, concurrency, deadline_ms):
+        self.name = name
+        self.priority = priority
+        self.concurrency = concurrency
+        self.deadline_ms = deadline_ms
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        # Exponential moving average of handler time, seeded optimistically
+        self.service_s = 0.01
+        self.counters = {'admitted': 0, 'queued': 0, 'shed': 0, 'expired': 0}
+
+    def estimated_wait(self):
+        return (self.waiting + 1) * self.service_s / self.concurrency
+
+    def acquire(self, deadline):
+        """
+        Take a slot before `deadline` (time.monotonic()). Returns None when
+        admitted, else the suggested retry delay in seconds.
+        """
+        with self.cond:
+            if self.in_flight < self.concurrency and not self.waiting:
+                self.in_flight += 1
+                self.counters['admitted'] += 1
+                return None
+
+            wait = self.estimated_wait()
+            if wait > deadline - time.monotonic():
+                self.counters['shed'] += 1
+                return wait
+
+            self.waiting += 1
+            self.counters['queued'] += 1
+            try:
+                while self.in_flight >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['expired'] += 1
+                        return self.estimated_wait()
+                    self.cond.wait(remaining)
+                self.in_flight += 1
+                self.counters['admitted'] += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    def release(self, elapsed):
+        with self.cond:
+            self.in_flight -= 1
+            self.service_s += 0.2 * (elapsed - self.service_s)
+            self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            return dict(self.counters, priority=self.priority, concurrency=self.concurrency,
+                        deadline_ms=self.deadline_ms, in_flight=self.in_flight, waiting=self.waiting,
+                        service_ms=round(self.service_s * 1000, 2))
+
+
+def parse_budgets(spec):
+    """
+    Parse "similarity=4,recommend=8" into {route: concurrency}
+    """
+    budgets = {}
+    for part in (spec or '').split(','):
+        if not part.strip():
+            continue
+        name, _, value = part.partition('=')
+        budgets[name.strip()] = int(value)
+    return budgets
+
+
+class AdmissionController:
+    def __init__(self, enabled=True, overrides=None, deadline_ms=None):
+        self.enabled = enabled
+        self.overrides = overrides or {}
+        self.deadline_ms = deadline_ms
+        self.budgets = {}
+
+    def budget(self, name, priority):
+        """
+        The route's Budget, or None for critical routes
+        """
+        concurrency, deadline_ms = PRIORITY_CLASSES[priority]
+        if concurrency is None:
+            return None
+        budget = Budget(name, priority, max(1, self.overrides.get(name, concurrency)),
+                        self.deadline_ms or deadline_ms)
+        self.budgets[name] = budget
+        return budget
+
+    def deadline(self, budget, header):
+        """
+        Absolute monotonic deadline from the X-Deadline-Ms header value, or
+        the budget's default when it is missing or malformed
+        """
+        try:
+            deadline_ms = min(max(float(header), 0.0), MAX_DEADLINE_MS)
+        except (TypeError, ValueError):
+            deadline_ms = budget.deadline_ms
+        return time.monotonic() + deadline_ms / 1000.0
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'routes': {name: budget.stats() for name, budget in self.budgets.items()},
+        }
+
+
+def retry_after_seconds(wait):
+    """
+    Retry-After takes whole seconds; never suggest 0
+    """
+    return max(1, math.ceil(wait))
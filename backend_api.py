@@ -1,454 +1,842 @@
 """
 Flask API for Movie Recommender Backend
-Integrates with ChromaDB vector database
+Serves from an in-memory index of the ChromaDB vector database (or its
+serving snapshot). With a snapshot and an ONNX query encoder it only needs
+Flask and NumPy at runtime: chromadb, torch and pandas are never imported.
 """
 
-from flask import Flask, jsonify, send_from_directory, request
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import Flask, Response, g, jsonify, send_from_directory, request
 from flask_cors import CORS
-import chromadb
+import csv
+import functools
+import hmac
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import os
+import signal
+import threading
 import json
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+import time
+
+from admission import DEADLINE_HEADER, AdmissionController, parse_budgets, retry_after_seconds
+from catalog_changes import DEFAULT_RETAINED_TITLES, CatalogChangeLog
+from color_palette import METRICS as PALETTE_METRICS, color_histogram, image_histogram, palette_rows, parse_palette
+from index_generations import Generation, GenerationManager
+from index_segments import DEFAULT_COMPACT_ROWS, Compactor
+from metadata_catalog import decode_cursor, encode_cursor, parse_fields, parse_filters, parse_sort
+from neighbour_table import load_neighbour_table
+from query_planner import ACCURACY_LEVELS, DEFAULT_CACHE_SIZE, QueryPlanner
+from query_encoder import (
+    CLIP_MODEL_NAME,
+    DEFAULT_ENCODE_BATCH,
+    DEFAULT_ENCODE_CACHE_SIZE,
+    BatchingEncoder,
+    load_clip_text_encoder,
+    load_query_encoder,
+)
+from response_encoding import (
+    DEFAULT_COMPRESS_MIN_BYTES,
+    FastJSONProvider,
+    compress,
+    dumps,
+)
+from movie_analysis import (
+    FACETS,
+    generate_multimodal_tags,
+    generate_tags_from_analysis,
+    parse_analysis_features,
+    parse_gemini_analysis,
+)
+from score_payload import FORMATS, encode_score_vectors
+from scoring import (
+    DEFAULT_WEIGHTS,
+    MODALITIES,
+    RECOMMEND_RESULTS,
+    SEARCH_CANDIDATES,
+    SEARCH_RESULTS,
+    SIMILARITY_RESULTS,
+    modality_vector_rows,
+    query_column_rows,
+    query_facet_rows,
+    query_rows,
+    query_similarity_rows,
+    rank_fusion,
+    recommend_from_pool,
+    row_query,
+    sample_pool,
+)
+from serving_index import load_serving_index
+from sharding import (
+    DEFAULT_TIMEOUT_MS as DEFAULT_SHARD_TIMEOUT_MS,
+    ScatterGather,
+    ShardUnavailable,
+    decode_query,
+)
+from single_flight import SingleFlight
+from taste_profile import DEFAULT_DISLIKE_WEIGHT, DEFAULT_LIKE_WEIGHT, TasteProfile, parse_seeds
+from warmup import (
+    DEFAULT_WARMUP_TIMEOUT,
+    DEFAULT_WARMUP_TITLES,
+    WARMUP_QUERIES,
+    Readiness,
+    TitlePopularity,
+    popular_titles,
+    run_warmup,
+)
+from weight_lattice import DEFAULT_LOOKUP_MODE, load_lattice
 
 app = Flask(__name__)
+# jsonify() encodes with orjson when it is installed (response_encoding.py)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Configuration
 TRAILERS_DIR = "Data/trailers"
 THUMBNAILS_DIR = "thumbnails"
-DATABASE_PATH = "Data/trailer_db"
-CSV_FILE = "Data/movie_trailers.csv"
-
-# Initialize database and models
-print("Connecting to ChromaDB database...")
-try:
-    chroma_client = chromadb.PersistentClient(path=DATABASE_PATH)
-    nar_collection = chroma_client.get_collection("db_narrative")
-    vis_collection = chroma_client.get_collection("db_visuals")
-    aud_collection = chroma_client.get_collection("db_audio")
-    print(f"✓ Connected! Found {nar_collection.count()} movies in database")
-except Exception as e:
-    print(f"❌ Database connection failed: {e}")
-    nar_collection = None
-    vis_collection = None
-    aud_collection = None
+DATABASE_PATH = os.environ.get("CHROMA_PERSIST_DIRECTORY", "Data/trailer_db")
+CSV_FILE = os.environ.get("MOVIES_CSV_PATH", "Data/movie_trailers.csv")
+ENRICHED_CSV_FILE = os.environ.get("MOVIES_ENRICHED_CSV_PATH", "Data/movie_trailers_enriched.csv")
+SNAPSHOT_PATH = os.environ.get("SERVING_SNAPSHOT_PATH", "Data/serving_snapshot")
+LATTICE_PATH = os.environ.get("WEIGHT_LATTICE_PATH", "Data/weight_lattice.npz")
+LATTICE_MODE = os.environ.get("WEIGHT_LATTICE_MODE", DEFAULT_LOOKUP_MODE)
+NEIGHBOUR_TABLE_PATH = os.environ.get("NEIGHBOUR_TABLE_PATH", "Data/neighbour_table.npz")
+# Exact /api/similarity and /api/recommend answers kept by the query planner (0 disables)
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+# auto | onnx | sentence-transformers | none (see query_encoder.py)
+QUERY_ENCODER = os.environ.get("QUERY_ENCODER", "auto")
+QUERY_ENCODER_PATH = os.environ.get("QUERY_ENCODER_PATH", "Data/query_encoder")
+QUERY_ENCODER_MODEL = os.environ.get("QUERY_ENCODER_MODEL", "all-MiniLM-L6-v2")
+# CLIP text tower for /api/search?mode=visual: auto | onnx | transformers | none
+CLIP_TEXT_ENCODER = os.environ.get("CLIP_TEXT_ENCODER", "auto")
+CLIP_TEXT_ENCODER_PATH = os.environ.get("CLIP_TEXT_ENCODER_PATH", "Data/clip_text_encoder")
+CLIP_MODEL = os.environ.get("CLIP_MODEL", CLIP_MODEL_NAME)
+# Query embeddings kept per encoder, and most queries encoded in one inference
+ENCODE_CACHE_SIZE = int(os.environ.get("ENCODE_CACHE_SIZE", DEFAULT_ENCODE_CACHE_SIZE))
+ENCODE_BATCH = int(os.environ.get("ENCODE_BATCH", DEFAULT_ENCODE_BATCH))
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+DEFAULT_VECTOR_TOP = 1000
+MAX_SIMILARITY_RESULTS = 100
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+BUNDLE_SECTIONS = ('movie', 'analysis', 'recommendations', 'similarity')
+SEARCH_MODES = ('text', 'visual', 'fused')
+DEFAULT_VISUAL_WEIGHT = 0.5
+# Share one computation between identical concurrent requests (single_flight.py)
+SINGLE_FLIGHT = os.environ.get("SINGLE_FLIGHT", "1") != "0"
+# Per-route concurrency budgets and deadlines (admission.py); off unless enabled
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "0") == "1"
+ROUTE_CONCURRENCY = parse_budgets(os.environ.get("ROUTE_CONCURRENCY"))
+REQUEST_DEADLINE_MS = float(os.environ.get("REQUEST_DEADLINE_MS", 0)) or None
+# Seconds between checks for changed index sources (0: reload only on request)
+INDEX_RELOAD_INTERVAL = float(os.environ.get("INDEX_RELOAD_INTERVAL", 0))
+# Delta segment rows that trigger a background compaction (0 disables it)
+SEGMENT_COMPACT_ROWS = int(os.environ.get("SEGMENT_COMPACT_ROWS", DEFAULT_COMPACT_ROWS))
+# Changed titles /api/movies/changes remembers; older versions get a full snapshot
+CATALOG_CHANGE_RETENTION = int(os.environ.get("CATALOG_CHANGE_RETENTION", DEFAULT_RETAINED_TITLES))
+# Required in X-Admin-Token by /api/admin/*; without it only loopback clients may call them
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# Comma-separated shard servers (sharding.py); /api/similarity and /api/recommend then fan out to them
+SHARD_URLS = [url for url in os.environ.get("SHARD_URLS", "").split(',') if url.strip()]
+SHARD_TIMEOUT_MS = float(os.environ.get("SHARD_TIMEOUT_MS", DEFAULT_SHARD_TIMEOUT_MS))
+# gzip/brotli JSON and text responses of at least COMPRESS_MIN_BYTES for clients that accept it
+RESPONSE_COMPRESSION = os.environ.get("RESPONSE_COMPRESSION", "1") != "0"
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", DEFAULT_COMPRESS_MIN_BYTES))
+# Warm each index generation before it takes traffic; /api/ready reports when the first one is (warmup.py)
+WARMUP = os.environ.get("WARMUP", "1") != "0"
+WARMUP_TITLES = int(os.environ.get("WARMUP_TITLES", DEFAULT_WARMUP_TITLES))
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", DEFAULT_WARMUP_TIMEOUT))
 
 # Load text model for search queries
-print("Loading text model...")
-try:
-    text_model = SentenceTransformer('all-MiniLM-L6-v2')
-    print("✓ Models loaded successfully")
-except Exception as e:
-    print(f"❌ Error loading text model: {e}")
-    text_model = None
-
-# Load CSV data for movie metadata
-movies_data = {}
-try:
-    df_trailers = pd.read_csv(CSV_FILE)
-    print(f"✓ Loaded {len(df_trailers)} movies from CSV")
-    for _, row in df_trailers.iterrows():
-        movies_data[row['Movie Title']] = {
-            'title': row['Movie Title'],
-            'youtube_link': row.get('YouTube Link', ''),
-        }
-except Exception as e:
-    print(f"❌ Error loading CSV: {e}")
+text_model = clip_model = None
+if SHARD_URLS:
+    # The shards hold the vectors; a coordinator has nothing to search (sharding.py)
+    print("❌ Search is disabled on a sharding coordinator")
+else:
+    print("Loading text model...")
+    try:
+        text_model = load_query_encoder(QUERY_ENCODER, QUERY_ENCODER_PATH, QUERY_ENCODER_MODEL)
+        if text_model:
+            print(f"✓ Models loaded successfully ({text_model.name})")
+        else:
+            print("❌ No query encoder installed; search is disabled")
+    except Exception as e:
+        print(f"❌ Error loading text model: {e}")
+
+    try:
+        clip_model = load_clip_text_encoder(CLIP_TEXT_ENCODER, CLIP_TEXT_ENCODER_PATH, CLIP_MODEL)
+        if clip_model:
+            print(f"✓ CLIP text encoder loaded ({clip_model.name})")
+        else:
+            print("❌ No CLIP text encoder installed; visual search is disabled")
+    except Exception as e:
+        print(f"❌ Error loading CLIP text encoder: {e}")
+
+# Repeated queries skip the encoder; concurrent ones share an inference (query_encoder.py)
+if text_model:
+    text_model = BatchingEncoder(text_model, ENCODE_CACHE_SIZE, ENCODE_BATCH)
+if clip_model:
+    clip_model = BatchingEncoder(clip_model, ENCODE_CACHE_SIZE, ENCODE_BATCH)
+
+
+def build_generation():
+    """
+    Load everything the scoring routes read into a new index generation
+    (index_generations.py); raises when the serving index cannot be built
+    """
+    # Load CSV data for movie metadata
+    movies_data = {}
+    try:
+        with open(CSV_FILE, 'r', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        print(f"✓ Loaded {len(rows)} movies from CSV")
+        for row in rows:
+            movies_data[row['Movie Title']] = {
+                'title': row['Movie Title'],
+                'youtube_link': row.get('YouTube Link') or '',
+            }
+    except Exception as e:
+        print(f"❌ Error loading CSV: {e}")
+
+    # Load embeddings and metadata into memory for scoring; a coordinator's shards hold the embeddings
+    print("Building serving index...")
+    serving_index = load_serving_index(
+        DATABASE_PATH, SNAPSHOT_PATH, ENRICHED_CSV_FILE,
+        {title: movie['youtube_link'] for title, movie in movies_data.items()}, vectors=not SHARD_URLS
+    )
+    print(f"✓ Serving index ready: {len(serving_index.live_rows())} movies from {serving_index.source} "
+          f"({len(serving_index.segments) - 1} delta segments), {serving_index.catalog.enriched} with metadata")
+    compactor.check(serving_index)
+    catalog_version = catalog_changes.observe(serving_index)
+
+    if SHARD_URLS:
+        generation = Generation(serving_index, movies=movies_data, catalog_version=catalog_version)
+    else:
+        generation = Generation(serving_index, *scoring_structures(serving_index), movies=movies_data,
+                                catalog_version=catalog_version)
+    # Reloads warm the next generation before it takes over; the first one warms in the background
+    if WARMUP and generations.current is not None:
+        readiness.warmed(warm_generation(generation))
+    return generation
+
+
+def scoring_structures(serving_index):
+    """
+    (lattice, neighbour table, planner) for a generation that scores in this
+    process, with the per-row keyword signatures and palettes built up front
+    """
+    # Precomputed /api/similarity answers over the weight simplex (weight_lattice.py)
+    weight_lattice = None
+    if os.path.exists(LATTICE_PATH):
+        try:
+            weight_lattice = load_lattice(LATTICE_PATH)
+            if weight_lattice.matches(serving_index):
+                print(f"✓ Weight lattice loaded: resolution {weight_lattice.resolution}, mode {LATTICE_MODE}")
+            else:
+                print("❌ Weight lattice was built for a different catalog; ignoring it")
+                weight_lattice = None
+        except Exception as e:
+            print(f"❌ Error loading weight lattice: {e}")
+
+    # Precomputed narrative neighbours for the first phase of progressive /api/recommend
+    neighbour_table = None
+    if os.path.exists(NEIGHBOUR_TABLE_PATH):
+        try:
+            neighbour_table = load_neighbour_table(NEIGHBOUR_TABLE_PATH)
+            if neighbour_table.matches(serving_index):
+                print(f"✓ Neighbour table loaded: {neighbour_table.depth} neighbours per movie")
+            else:
+                print("❌ Neighbour table was built for a different catalog; ignoring it")
+                neighbour_table = None
+        except Exception as e:
+            print(f"❌ Error loading neighbour table: {e}")
+
+    # Keyword signatures for the shared-theme recommendation tags (keyword_signatures.py)
+    start = time.time()
+    keywords = serving_index.keywords
+    print(f"✓ Keyword signatures ready: {len(keywords.vocab)} terms in {time.time() - start:.1f}s")
+    # Color histograms and their coarse codes for /api/search/palette (color_palette.py)
+    start = time.time()
+    serving_index.palettes
+    print(f"✓ Color palettes ready in {time.time() - start:.1f}s")
+
+    # Picks cache, lattice, neighbour table, sample or full scan per request (query_planner.py)
+    planner = QueryPlanner(serving_index, weight_lattice, LATTICE_MODE, neighbour_table, RESULT_CACHE_SIZE)
+    return weight_lattice, neighbour_table, planner
+
+
+def source_fingerprint():
+    """
+    Size and mtime of every file a generation is built from
+    """
+    paths = (os.path.join(SNAPSHOT_PATH, 'manifest.json'), os.path.join(SNAPSHOT_PATH, 'segments', 'log.json'),
+             os.path.join(DATABASE_PATH, 'chroma.sqlite3'), CSV_FILE, ENRICHED_CSV_FILE, LATTICE_PATH,
+             NEIGHBOUR_TABLE_PATH)
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            fingerprint.append((path, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            fingerprint.append((path, None, None))
+    return tuple(fingerprint)
+
+
+def reload_after_compaction():
+    # A load already running may have read the segments before the new base was in place
+    while not generations.reload(wait=True):
+        time.sleep(1)
+
+
+# Merges delta segments into a new base once they grow past SEGMENT_COMPACT_ROWS (index_segments.py)
+compactor = Compactor(SNAPSHOT_PATH, SEGMENT_COMPACT_ROWS, on_done=reload_after_compaction)
+# Versions every generation's catalog for /api/movies/changes (catalog_changes.py)
+catalog_changes = CatalogChangeLog(CATALOG_CHANGE_RETENTION)
+# Warmup state behind /api/ready, and the titles warmups start with (warmup.py)
+readiness = Readiness()
+title_requests = TitlePopularity()
+generations = GenerationManager(build_generation, source_fingerprint)
+if generations.load():
+    print(f"✓ Serving generation {generations.current.number}")
+else:
+    print(f"❌ Error building serving index: {generations.last_error}")
+if INDEX_RELOAD_INTERVAL > 0:
+    generations.watch(INDEX_RELOAD_INTERVAL)
+# kill -HUP reloads too, where the platform has it
+if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGHUP, lambda signum, frame: generations.reload())
+
+# Exact rankings behind progressive responses run here so a deadline can cut them off
+recommend_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='recommend')
+# The ranked sections of a /api/movie/<title>/bundle response run side by side here
+bundle_executor = ThreadPoolExecutor(max_workers=2 * (os.cpu_count() or 1), thread_name_prefix='bundle')
+# The visual half of fused searches
+search_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='search')
+
+single_flight = SingleFlight()
+admission = AdmissionController(ADMISSION_CONTROL, ROUTE_CONCURRENCY, REQUEST_DEADLINE_MS)
+scatter = ScatterGather(SHARD_URLS, SHARD_TIMEOUT_MS) if SHARD_URLS else None
+if scatter:
+    print(f"✓ Scoring on {len(SHARD_URLS)} shards")
+
+
+@app.before_request
+def pin_generation():
+    """
+    Every request reads one index generation from start to finish, even if
+    a reload swaps in the next one meanwhile
+    """
+    g.generation = generations.acquire()
 
 
-def get_all_movies_from_db():
+@app.teardown_request
+def unpin_generation(exc):
+    generations.release(g.pop('generation', None))
+
+
+@app.after_request
+def compress_response(response):
     """
-    Get all movies from the ChromaDB collections
+    Compress large buffered JSON and text responses; streams and files pass through
     """
-    if not nar_collection:
+    if RESPONSE_COMPRESSION:
+        compress(response, request.accept_encodings, COMPRESS_MIN_BYTES)
+    return response
+
+
+def request_key():
+    """
+    Normalized identity of the current request: route, sorted query
+    parameters and, for JSON bodies, the body with sorted keys
+    """
+    body = request.get_json(silent=True)
+    body = json.dumps(body, sort_keys=True) if body is not None else request.get_data()
+    return request.method, request.path, tuple(sorted(request.args.items(multi=True))), body
+
+
+def stream_format():
+    """
+    'ndjson' or 'sse' when the client asked for a streamed response, through
+    ?stream= or the Accept header, else None
+    """
+    fmt = request.args.get('stream')
+    if fmt is None:
+        accept = request.headers.get('Accept', '')
+        fmt = next((name for name, mimetype in STREAM_FORMATS.items() if mimetype in accept), None)
+    return fmt
+
+
+def coalesced(view):
+    """
+    Identical requests in flight at the same time wait on one call of `view`
+    and share its serialized response (marked with X-Coalesced: 1). Goes
+    inside @admitted, so every request is admitted against its own deadline
+    before it joins a call. A 503 only answers the request that computed it;
+    requests that waited on it run the call again.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # Streamed responses are consumed as they are produced, so they cannot be shared
+        if not SINGLE_FLIGHT or stream_format():
+            return view(*args, **kwargs)
+
+        def render():
+            response = app.make_response(view(*args, **kwargs))
+            return response.get_data(), response.status_code, list(response.headers.items())
+
+        key = request_key()
+        while True:
+            (body, status, headers), shared = single_flight.do(key, render, request.url_rule.rule)
+            if not shared or status != 503:
+                break
+        response = Response(body, status=status, headers=headers)
+        if shared:
+            response.headers['X-Coalesced'] = '1'
+        return response
+
+    return wrapper
+
+
+def admitted(name, priority):
+    """
+    Run the view inside the route's concurrency budget. Requests that would
+    wait past their deadline get 503 + Retry-After without doing any work.
+    g.deadline holds the request's absolute time.monotonic() deadline.
+    """
+    def decorate(view):
+        budget = admission.budget(name, priority)
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if budget is None or not admission.enabled:
+                return view(*args, **kwargs)
+
+            g.deadline = admission.deadline(budget, request.headers.get(DEADLINE_HEADER))
+            wait = budget.acquire(g.deadline)
+            if wait is not None:
+                response = jsonify({"error": "Server overloaded, retry later", "route": name,
+                                    "retry_after_ms": round(wait * 1000)})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(retry_after_seconds(wait))
+                return response
+
+            start = time.perf_counter()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                budget.release(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
+
+
+def get_all_movies_from_db(serving_index):
+    """
+    Get all movies from the serving index
+    """
+    if not serving_index:
         return []
 
     try:
-        # Get all data from narrative collection
-        data = nar_collection.get(include=['metadatas', 'documents'])
-        movies = []
-
-        for i, metadata in enumerate(data['metadatas']):
-            title = metadata.get('title', 'Unknown')
-            movie_data = movies_data.get(title, {})
-
-            # Generate simulated IMDB data for realistic variety
-            import random
-            random.seed(hash(title) % 1000)  # Consistent data per title
-
-            # Realistic movie data generation
-            imdb_rating = round(random.uniform(6.5, 9.2), 1)
-            year = random.choice([2020, 2021, 2022, 2023, 2024])
-            rated = random.choice(['PG', 'PG-13', 'R', 'G', 'NR'])
-            runtime = f"{random.randint(85, 180)} min"
-
-            # Sample genres based on common combinations
-            genre_options = [
-                ['Action', 'Adventure'], ['Drama'], ['Comedy'], ['Horror', 'Thriller'],
-                ['Sci-Fi', 'Action'], ['Romance', 'Drama'], ['Documentary'], ['Animation', 'Family'],
-                ['Crime', 'Drama'], ['Comedy', 'Romance'], ['Action', 'Thriller'], ['Fantasy', 'Adventure']
-            ]
-            genres = random.choice(genre_options)
-
-            # Sample directors and actors
-            directors = ['Christopher Nolan', 'Jordan Peele', 'Greta Gerwig', 'Denis Villeneuve', 'Chloe Zhao',
-                        'Ryan Coogler', 'Nia DaCosta', 'James Cameron', 'Martin Scorsese', 'Taika Waititi']
-            director = random.choice(directors)
-
-            actors = ['Ryan Gosling, Emma Stone', 'Michael B. Jordan, Lupita Nyong\'o', 'Timothée Chalamet, Zendaya',
-                     'Margot Robbie, Ryan Reynolds', 'Oscar Isaac, Jessica Chastain', 'John David Washington, Zendaya',
-                     'Florence Pugh, Adam Driver', 'LaKeith Stanfield, Tessa Thompson']
-            actor_list = random.choice(actors)
-
-            movies.append({
-                'id': title,  # Use title as ID for simplicity
-                'title': title,
-                'description': data['documents'][i],
-                'youtube_link': movie_data.get('youtube_link', ''),
-                'imdb_rating': imdb_rating,
-                'year': year,
-                'rated': rated,
-                'runtime': runtime,
-                'genres': genres,
-                'director': director,
-                'actors': actor_list,
-                'language': 'English',
-                'country': 'USA',
-                'poster': None  # Could be added if available
-            })
-
-        return movies
+        return [serving_index.movie_record(row) for row in serving_index.live_rows()]
     except Exception as e:
         print(f"Error getting movies from database: {e}")
         return []
 
 
-def generate_tags_from_analysis(source_analysis, target_analysis, similarity_score):
+def with_catalog_version(response):
     """
-    Generate explanation tags based on Gemini analysis (legacy function)
+    Tag a catalog response with the version /api/movies/changes takes as `since`
     """
-    tags = []
+    if g.generation:
+        response.headers['X-Catalog-Version'] = str(g.generation.catalog_version)
+    return response
 
-    # Visual similarity based on the CLIP/visual vectors
-    if similarity_score > 0.8:
-        tags.append({
-            "type": "visual",
-            "label": "Very similar visual style and cinematography",
-            "strength": float(similarity_score)
-        })
-    elif similarity_score > 0.6:
-        tags.append({
-            "type": "visual",
-            "label": "Similar cinematography and visual elements",
-            "strength": float(similarity_score)
-        })
 
-    # Narrative similarity based on content analysis
-    if similarity_score > 0.7:
-        tags.append({
-            "type": "narrative",
-            "label": "Similar storytelling and narrative themes",
-            "strength": float(similarity_score * 0.9)
-        })
+@app.route('/api/movies', methods=['GET'])
+@admitted('movies', 'interactive')
+@coalesced
+def get_movies():
+    """
+    Get all available movies (X-Catalog-Version names the catalog version)
+
+    Optional query parameters:
+      sort=title|year|imdb_rating|runtime (prefix with - for descending)
+      fields=title,year,poster (project each movie to these keys)
+      the /api/recommend filters (genre, min_rating, ...)
+      limit / offset / cursor switch to a paged envelope:
+        {"movies": [...], "total": n, "offset": o, "limit": l, "next_cursor": c}
+    """
+    serving_index = g.generation.index if g.generation else None
+    paged = any(key in request.args for key in ('limit', 'offset', 'cursor'))
+    if not paged and not any(key in request.args for key in ('sort', 'fields')) and not parse_filters(request.args):
+        return with_catalog_version(jsonify(get_all_movies_from_db(serving_index)))
 
-    # Genre matching from analysis text
-    common_keywords = []
-    if source_analysis and target_analysis:
-        source_words = set(source_analysis.lower().split())
-        target_words = set(target_analysis.lower().split())
-        common_keywords = list(source_words & target_words)
+    if not serving_index:
+        return jsonify({"movies": [], "total": 0, "offset": 0, "limit": 0, "next_cursor": None} if paged else [])
 
-        if len(common_keywords) > 5:
-            tags.append({
-                "type": "theme",
-                "label": f"Shared thematic elements",
-                "strength": min(0.9, len(common_keywords) / 20)
-            })
+    try:
+        sort, descending = parse_sort(request.args.get('sort'))
+        offset = int(request.args.get('offset', 0))
+        if request.args.get('cursor'):
+            # The cursor carries the sort and position; filters must be repeated
+            sort, descending, offset = decode_cursor(request.args['cursor'])
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE)) if paged else None
+        if offset < 0 or (limit is not None and limit < 1):
+            raise ValueError("offset must be >= 0 and limit >= 1")
+        if limit is not None:
+            limit = min(limit, MAX_PAGE_SIZE)
+        fields = parse_fields(request.args.get('fields'))
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    catalog = serving_index.catalog
+    mask = catalog.filter_mask(filters, serving_index.title_index)
+    rows, total = catalog.browse(sort, descending, offset, limit, mask)
+
+    # Only the requested page is materialized
+    movies = []
+    for row in rows:
+        movie = serving_index.movie_record(row)
+        movies.append({field: movie[field] for field in fields} if fields else movie)
+
+    if not paged:
+        return with_catalog_version(jsonify(movies))
+
+    next_offset = offset + len(rows)
+    return with_catalog_version(jsonify({
+        "movies": movies,
+        "total": int(total),
+        "offset": offset,
+        "limit": limit,
+        "next_cursor": encode_cursor(sort, descending, next_offset) if next_offset < total else None
+    }))
+
+
+@app.route('/api/movies/changes', methods=['GET'])
+@admitted('movie_changes', 'interactive')
+@coalesced
+def get_movie_changes():
+    """
+    What changed in the catalog since version `since` (from X-Catalog-Version
+    or an earlier answer here):
+      {"version", "since", "full": false, "added": [movies], "updated": [movies], "removed": [titles]}
+    When the change log no longer reaches back that far, a full snapshot:
+      {"version", "full": true, "movies": [movies]}
+    fields=title,year,poster projects the movies as in /api/movies.
+    """
+    generation = g.generation
+    if not generation:
+        return jsonify({"error": "Database not available"}), 500
+
+    try:
+        since = int(request.args['since'])
+    except (KeyError, ValueError):
+        return jsonify({"error": "since must be a catalog version (X-Catalog-Version)"}), 400
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Sort by strength
-    tags.sort(key=lambda x: x["strength"], reverse=True)
-    return tags[:3]  # Return top 3 tags
+    serving_index = generation.index
 
+    def project(movie):
+        return {field: movie[field] for field in fields} if fields else movie
 
-def parse_gemini_analysis(analysis_text):
+    changes = catalog_changes.since(since, generation.catalog_version)
+    if changes is None:
+        movies = [project(movie) for movie in get_all_movies_from_db(serving_index)]
+        return with_catalog_version(jsonify({"version": generation.catalog_version, "full": True, "movies": movies}))
+
+    delta = {"version": generation.catalog_version, "since": since, "full": False,
+             "added": [], "updated": [], "removed": []}
+    for title, change in changes.items():
+        if change == 'removed':
+            delta['removed'].append(title)
+        else:
+            row = serving_index.row(title)
+            if row is not None:
+                delta[change].append(project(serving_index.movie_record(row)))
+    return with_catalog_version(jsonify(delta))
+
+
+def recommendation_payload(movies, similarities, combined, weights, themes=None):
     """
-    Parse the structured Gemini analysis to extract specific features
+    /api/recommend entries for scored movie records. `themes` are what each
+    movie shares with the source (KeywordIndex.shared_themes).
     """
-    if not analysis_text:
-        return {}
+    recommendations = []
+    for i, movie in enumerate(movies):
+        target_similarities = {m: float(similarities[m][i]) for m in similarities}
+
+        # Generate tags with individual similarity scores and shared themes
+        tags = generate_multimodal_tags(target_similarities, weights, themes[i] if themes else None)
+
+        entry = {
+            'id': movie['id'],
+            'title': movie['title'],
+            'description': movie['description'],
+            'youtube_link': movie['youtube_link'],
+            'similarity': float(combined[i]),
+            'similarities': target_similarities,  # Individual feature similarities
+            'tags': tags,
+            'genres': movie['genres'],
+            'year': movie['year'],
+            'poster': movie['poster']
+        }
+        recommendations.append(entry)
+    return recommendations
 
-    features = {
-        'visual_style': [],
-        'narrative_arc': [],
-        'audio_landscape': [],
-        'emotional_vibe': []
-    }
 
-    # Parse the structured sections
-    sections = {
-        '[VISUAL_STYLE]': 'visual_style',
-        '[NARRATIVE_ARC]': 'narrative_arc',
-        '[AUDIO_LANDSCAPE]': 'audio_landscape',
-        '[EMOTIONAL_VIBE]': 'emotional_vibe'
-    }
+def ranked_payload(serving_index, result, weights, source_row=None):
+    rows, similarities, combined = result
+    themes = None
+    if source_row is not None:
+        keywords = serving_index.keywords
+        themes = keywords.shared_themes(keywords.source(source_row), rows)
+    return recommendation_payload([serving_index.movie_record(row) for row in rows], similarities, combined, weights,
+                                  themes)
 
-    for section_marker, key in sections.items():
-        if section_marker in analysis_text:
-            # Find the section content
-            start_idx = analysis_text.find(section_marker) + len(section_marker)
-            end_idx = analysis_text.find('[', start_idx)
-            if end_idx == -1:
-                end_idx = len(analysis_text)
-
-            section_content = analysis_text[start_idx:end_idx].strip()
-            if section_content.startswith(':'):
-                section_content = section_content[1:].strip()
-
-            # Split by common delimiters and clean up
-            items = []
-            for delimiter in [',', ';']:
-                if delimiter in section_content:
-                    items = [item.strip() for item in section_content.split(delimiter)]
-                    break
-
-            if not items and section_content:
-                items = [section_content]
-
-            # Clean and filter items
-            for item in items:
-                if item and len(item.strip()) > 3:  # Filter out very short items
-                    clean_item = item.strip().rstrip('.')
-                    if clean_item:
-                        features[key].append({
-                            'type': key.replace('_', ' '),
-                            'value': clean_item
-                        })
-
-    return features
-
-def parse_analysis_features(analysis_text, analysis_type):
-    """
-    Parse AI analysis text to extract specific features
-    """
-    if not analysis_text:
-        return []
 
-    if analysis_type == 'narrative':
-        # For narrative, parse the Gemini structured analysis
-        parsed = parse_gemini_analysis(analysis_text)
-        features = []
-        for category, items in parsed.items():
-            features.extend(items)
-        return features
+def shard_headers(response, answered):
+    """
+    How many shards a scatter-gather answer heard from, and whether some were missing
+    """
+    response.headers['X-Shards'] = f"{answered}/{len(scatter.urls)}"
+    if answered < len(scatter.urls):
+        response.headers['X-Partial-Results'] = '1'
+    return response
 
-    elif analysis_type == 'visual':
-        # For visual analysis, we don't have detailed text usually, so return generic info
-        return [{'type': 'feature', 'value': 'CLIP visual embeddings + Color histograms'}]
 
-    elif analysis_type == 'audio':
-        # For audio analysis, we don't have detailed text usually, so return generic info
-        return [{'type': 'feature', 'value': 'Tempo detection + Spectral contrast analysis'}]
+def unsharded_only(route):
+    """
+    The response for routes that score this process's own vectors, which a
+    sharding coordinator does not load
+    """
+    return jsonify({"error": f"{route} is not available on a sharding coordinator"}), 501
 
-    return []
 
+def planned_response(response, strategy, answered=None):
+    response.headers['X-Query-Plan'] = strategy
+    return response if answered is None else shard_headers(response, answered)
 
-def generate_multimodal_tags(similarities, weights):
+
+def ranked_recommendations(generation, title, weights, filters=None, accuracy='exact', timeout=None):
     """
-    Generate explanation tags based on multimodal similarity scores
+    /api/recommend entries for `title` as (entries, strategy, shards answered
+    or None when scored in process), or None for an unknown title
     """
-    tags = []
-
-    # Narrative similarity
-    if similarities['narrative'] > 0.7:
-        tags.append({
-            "type": "narrative",
-            "label": f"Strong narrative similarity ({similarities['narrative']*100:.0f}%)",
-            "strength": float(similarities['narrative'] * weights['narrative'])
-        })
-    elif similarities['narrative'] > 0.5:
-        tags.append({
-            "type": "narrative",
-            "label": f"Similar storytelling themes ({similarities['narrative']*100:.0f}%)",
-            "strength": float(similarities['narrative'] * weights['narrative'])
+    if scatter:
+        # Exact ranking from every shard that answers within the shard timeout (or `timeout` seconds)
+        found = scatter.recommend(title, weights, filters, timeout)
+        if found is None:
+            return None
+        movies, similarities, combined, themes, answered = found
+        recommendations = recommendation_payload(movies, similarities, combined, weights, themes=themes)
+        return recommendations, 'scatter_gather', answered
+
+    serving_index, planner = generation.index, generation.planner
+    source_row = serving_index.row(title)
+    if source_row is None:
+        return None
+    plan = planner.plan('recommend', source_row, weights, filters, RECOMMEND_RESULTS, accuracy)
+    return ranked_payload(serving_index, planner.execute(plan), weights, source_row), plan.strategy, None
+
+
+def ranked_similarities(generation, title, weights, filters=None, k=SIMILARITY_RESULTS, accuracy='approximate'):
+    """
+    /api/similarity entries for `title`, returned like ranked_recommendations
+    """
+    if scatter:
+        found = scatter.similarity(title, weights, filters, k)
+        if found is None:
+            return None
+        entries, answered = found
+        return ([{key: entry[key] for key in ('title', 'similarity', 'similarities')} for entry in entries],
+                'scatter_gather', answered)
+
+    serving_index, planner = generation.index, generation.planner
+    source_row = serving_index.row(title)
+    if source_row is None:
+        return None
+
+    # The planner picks the cheapest strategy that meets the accuracy
+    plan = planner.plan('similarity', source_row, weights, filters, k, accuracy)
+    rows, similarities, combined = planner.execute(plan)
+
+    similarity_scores = []
+    for i, target_row in enumerate(rows):
+        similarity_scores.append({
+            'title': serving_index.titles[target_row],
+            'similarity': float(combined[i]),
+            'similarities': {m: float(similarities[m][i]) for m in similarities}
         })
+    return similarity_scores, plan.strategy, None
 
-    # Visual similarity
-    if similarities['visual'] > 0.7:
-        tags.append({
-            "type": "visual",
-            "label": f"Very similar visual style ({similarities['visual']*100:.0f}%)",
-            "strength": float(similarities['visual'] * weights['visual'])
-        })
-    elif similarities['visual'] > 0.5:
-        tags.append({
-            "type": "visual",
-            "label": f"Similar cinematography ({similarities['visual']*100:.0f}%)",
-            "strength": float(similarities['visual'] * weights['visual'])
-        })
 
-    # Audio similarity
-    if similarities['audio'] > 0.7:
-        tags.append({
-            "type": "audio",
-            "label": f"Very similar audio style ({similarities['audio']*100:.0f}%)",
-            "strength": float(similarities['audio'] * weights['audio'])
-        })
-    elif similarities['audio'] > 0.5:
-        tags.append({
-            "type": "audio",
-            "label": f"Similar sound design ({similarities['audio']*100:.0f}%)",
-            "strength": float(similarities['audio'] * weights['audio'])
-        })
+def progressive_recommendations(generation, source_row, weights, filters=None, deadline=None):
+    """
+    Yield (phase, source, result) for /api/recommend: an approximate ranking
+    from the neighbour table (or a catalog sample) straight away, then the
+    exact ranking, unless `deadline` (time.monotonic()) passes first, which
+    yields ('deadline', None, None). With nothing approximate to show, the
+    exact ranking is always awaited. When the planner can answer exactly
+    without a scan (an earlier answer, enough stored neighbours), that answer
+    is the only phase.
+    """
+    serving_index, planner = generation.index, generation.planner
+    plan = planner.plan('recommend', source_row, weights, filters, RECOMMEND_RESULTS)
+    if plan.strategy != 'scan':
+        yield 'exact', plan.strategy, planner.execute(plan)
+        return
+
+    mask = plan.mask
+    exact = recommend_executor.submit(planner.execute, plan)
+    if generation.table:
+        pool, source = generation.table.candidates(source_row), 'neighbour_table'
+    else:
+        pool, source = sample_pool(serving_index, source_row), 'sample'
 
-    # Combined weighted score
-    total_weighted = sum(similarities[feature] * weights[feature] for feature in similarities.keys())
-    if total_weighted > 0.8:
-        tags.append({
-            "type": "combined",
-            "label": f"Highly recommended match ({total_weighted*100:.0f}%)",
-            "strength": float(total_weighted)
-        })
+    timeout = None
+    if pool is not None:
+        yield 'approximate', source, recommend_from_pool(serving_index, source_row, weights, pool, mask)
+        if deadline is not None:
+            timeout = max(0.0, deadline - time.monotonic())
 
-    # Sort by strength and return top 3
-    tags.sort(key=lambda x: x["strength"], reverse=True)
-    return tags[:3]
+    try:
+        result = exact.result(timeout)
+    except FutureTimeoutError:
+        exact.cancel()
+        yield 'deadline', None, None
+        return
+    yield 'exact', 'scan', result
 
 
-@app.route('/api/movies', methods=['GET'])
-def get_movies():
+def stream_recommendations(phases, fmt, start=None):
     """
-    Get all available movies
+    Serialize (phase, source, recommendations) as NDJSON lines or SSE events:
+    {"phase", "source", "exact", "elapsed_ms", "recommendations"}, where the
+    exact phase also says whether it `changed` the approximate titles
     """
-    movies = get_all_movies_from_db()
-    return jsonify(movies)
+    start = start or time.perf_counter()
+    shown = None
+    for phase, source, recommendations in phases:
+        event = {'phase': phase, 'source': source, 'exact': phase == 'exact'}
+        if recommendations is not None:
+            titles = [recommendation['title'] for recommendation in recommendations]
+            event['recommendations'] = recommendations
+            if phase == 'exact':
+                event['changed'] = titles != shown
+            shown = titles
+        event['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        data = dumps(event)
+        yield b'event: ' + phase.encode() + b'\ndata: ' + data + b'\n\n' if fmt == 'sse' else data + b'\n'
 
 
 @app.route('/api/recommend/<path:movie_title>', methods=['GET', 'POST'])
+@admitted('recommend', 'interactive')
+@coalesced
 def get_recommendations(movie_title):
     """
     Get recommendations for a specific movie based on multimodal similarity with custom weights
+
+    stream=ndjson|sse (or an Accept of application/x-ndjson / text/event-stream)
+    streams an approximate ranking first and the exact one when it is ready.
+    deadline_ms stops waiting for the exact ranking after that long; without
+    streaming it returns the best ranking available by then, naming it in
+    the X-Recommend-Phase header.
     """
     print(f"Getting recommendations for: {movie_title}")
+    start = time.perf_counter()
 
-    if not nar_collection:
+    generation = g.generation
+    if not generation and not scatter:
         return jsonify({"error": "Database not available"}), 500
+    title_requests.hit(movie_title, generation.index if generation else None)
 
     # Get custom weights from request (POST) or use defaults (GET)
-    if request.method == 'POST':
-        weights = request.json.get('weights', {})
-    else:
-        # Parse weights from query parameters
-        weights = {
-            'narrative': float(request.args.get('narrative', 0.4)),
-            'visual': float(request.args.get('visual', 0.35)),
-            'audio': float(request.args.get('audio', 0.25))
-        }
-
-    print(f"Using weights: {weights}")
-
     try:
-        # Get the source movie data from all collections
-        source_nar = nar_collection.get(where={"title": movie_title}, include=['embeddings', 'metadatas', 'documents'])
-        source_vis = vis_collection.get(where={"title": movie_title}, include=['embeddings']) if vis_collection else None
-        source_aud = aud_collection.get(where={"title": movie_title}, include=['embeddings']) if aud_collection else None
-
-        print(f"Source data found - Narrative: {len(source_nar['ids'])}, Visual: {len(source_vis['ids']) if source_vis else 0}, Audio: {len(source_aud['ids']) if source_aud else 0}")
+        if request.method == 'POST':
+            body = request.json or {}
+            weights = body.get('weights', {})
+            filters = parse_filters(body.get('filters')) or parse_filters(request.args)
+            deadline_ms = body.get('deadline_ms', request.args.get('deadline_ms'))
+            accuracy = body.get('accuracy', request.args.get('accuracy', 'exact'))
+        else:
+            # Parse weights from query parameters
+            weights = {
+                'narrative': float(request.args.get('narrative', 0.4)),
+                'visual': float(request.args.get('visual', 0.35)),
+                'audio': float(request.args.get('audio', 0.25))
+            }
+            filters = parse_filters(request.args)
+            deadline_ms = request.args.get('deadline_ms')
+            accuracy = request.args.get('accuracy', 'exact')
+        if accuracy not in ACCURACY_LEVELS:
+            raise ValueError(f"Unknown accuracy '{accuracy}' (choose from {', '.join(ACCURACY_LEVELS)})")
+        deadline_ms = None if deadline_ms is None else float(deadline_ms)
+        if deadline_ms is not None and deadline_ms < 0:
+            raise ValueError("deadline_ms must be >= 0")
+        fmt = stream_format()
+        if fmt is not None and fmt not in STREAM_FORMATS:
+            raise ValueError(f"Unknown stream format '{fmt}' (choose from {', '.join(STREAM_FORMATS)})")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    print(f"Using weights: {weights}, filters: {filters}")
 
-        if not source_nar['ids']:
+    try:
+        # Without streaming, only an exact ranking under a deadline has phases to choose from
+        if scatter or (fmt is None and (deadline_ms is None or accuracy != 'exact')):
+            found = ranked_recommendations(generation, movie_title, weights, filters, accuracy,
+                                           None if deadline_ms is None else deadline_ms / 1000.0)
+            if found is None:
+                print(f"Movie '{movie_title}' not found in database")
+                return jsonify({"error": f"Movie '{movie_title}' not found"}), 404
+            recommendations, strategy, answered = found
+            print(f"Returning {len(recommendations)} recommendations ({strategy})")
+            if fmt is None:
+                return planned_response(jsonify(recommendations), strategy, answered)
+            # Shards answer exactly in one go, so the stream has a single phase
+            phases = [('exact', strategy, recommendations)]
+            return planned_response(Response(stream_recommendations(phases, fmt, start),
+                                             mimetype=STREAM_FORMATS[fmt],
+                                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}),
+                                    strategy, answered)
+
+        serving_index = generation.index
+        source_row = serving_index.row(movie_title)
+        if source_row is None:
             print(f"Movie '{movie_title}' not found in database")
             return jsonify({"error": f"Movie '{movie_title}' not found"}), 404
 
-        source_nar_embedding = source_nar['embeddings'][0]
-        source_analysis = source_nar['documents'][0]
-
-        # Query similar movies using narrative embeddings
-        narrative_results = nar_collection.query(
-            query_embeddings=[source_nar_embedding],
-            n_results=20,
-            include=['embeddings', 'metadatas', 'documents', 'distances']
-        )
-
-        recommendations = []
-
-        for i, movie_id in enumerate(narrative_results['ids'][0]):
-            target_title = narrative_results['metadatas'][0][i]['title']
-
-            # Skip the source movie itself
-            if target_title == movie_title:
-                continue
-
-            # Calculate multimodal similarity
-            similarities = {}
-
-            # 1. Narrative similarity
-            nar_distance = narrative_results['distances'][0][i]
-            similarities['narrative'] = max(0, 1 - nar_distance)
-
-            # 2. Visual similarity
-            if source_vis and len(source_vis['embeddings']) > 0 and vis_collection:
-                try:
-                    target_vis = vis_collection.get(where={"title": target_title}, include=['embeddings'])
-                    if len(target_vis['embeddings']) > 0:
-                        vis_sim = cosine_similarity([source_vis['embeddings'][0]], [target_vis['embeddings'][0]])[0][0]
-                        similarities['visual'] = max(0, float(vis_sim))
-                    else:
-                        similarities['visual'] = 0.5
-                except:
-                    similarities['visual'] = 0.5
-            else:
-                similarities['visual'] = 0.5
-
-            # 3. Audio similarity
-            if source_aud and len(source_aud['embeddings']) > 0 and aud_collection:
-                try:
-                    target_aud = aud_collection.get(where={"title": target_title}, include=['embeddings'])
-                    if len(target_aud['embeddings']) > 0:
-                        aud_sim = cosine_similarity([source_aud['embeddings'][0]], [target_aud['embeddings'][0]])[0][0]
-                        similarities['audio'] = max(0, float(aud_sim))
-                    else:
-                        similarities['audio'] = 0.5
-                except:
-                    similarities['audio'] = 0.5
-            else:
-                similarities['audio'] = 0.5
-
-            # Calculate weighted similarity
-            combined_similarity = (
-                similarities['narrative'] * weights['narrative'] +
-                similarities['visual'] * weights['visual'] +
-                similarities['audio'] * weights['audio']
-            )
-
-            # Generate tags with individual similarity scores
-            target_analysis = narrative_results['documents'][0][i]
-            tags = generate_multimodal_tags(similarities, weights)
-
-            # Get movie metadata
-            movie_data = movies_data.get(target_title, {})
-
-            recommendations.append({
-                'id': target_title,
-                'title': target_title,
-                'description': target_analysis,
-                'youtube_link': movie_data.get('youtube_link', ''),
-                'similarity': float(combined_similarity),
-                'similarities': similarities,  # Individual feature similarities
-                'tags': tags,
-                'genres': [],
-                'year': None,
-                'poster': None
-            })
-
-        # Sort by similarity and return top 8
-        recommendations.sort(key=lambda x: x['similarity'], reverse=True)
-        result = recommendations[:8]
-
-        print(f"Returning {len(result)} recommendations")
-        return jsonify(result)
-
+        deadline = None if deadline_ms is None else time.monotonic() + deadline_ms / 1000.0
+        phases = progressive_recommendations(generation, source_row, weights, filters, deadline)
+        if fmt is not None:
+            payloads = ((phase, source,
+                         None if result is None else ranked_payload(serving_index, result, weights, source_row))
+                        for phase, source, result in phases)
+            response = Response(stream_recommendations(payloads, fmt, start),
+                                mimetype=STREAM_FORMATS[fmt],
+                                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+            # The stream outlives the request; keep its generation pinned until it closes
+            generations.retain(generation)
+            response.call_on_close(lambda: generations.release(generation))
+            return response
+
+        # Best ranking available by the deadline
+        best = None
+        for phase, source, result in phases:
+            if result is not None:
+                best = phase, source, result
+        response = jsonify(ranked_payload(serving_index, best[2], weights, source_row))
+        response.headers['X-Recommend-Phase'] = best[0]
+        return planned_response(response, best[1])
+
+    except ShardUnavailable as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         print(f"Error getting recommendations: {str(e)}")
         import traceback
@@ -456,57 +844,62 @@ def get_recommendations(movie_title):
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 
+def movie_analysis(serving_index, row, movie_title):
+    """
+    The /api/analysis payload for a catalog row
+    """
+    # Only the narrative collection stores the Gemini analysis text
+    narrative_content = serving_index.documents[row]
+    visual_content = None
+    audio_content = None
+
+    # Parse the Gemini narrative analysis to extract structured sections
+    parsed_narrative = parse_gemini_analysis(narrative_content) if narrative_content else {}
+
+    return {
+        'title': movie_title,
+        'visual_style': ' '.join([item.get('value', '') for item in parsed_narrative.get('visual_style', [])]),
+        'narrative_arc': ' '.join([item.get('value', '') for item in parsed_narrative.get('narrative_arc', [])]),
+        'audio_landscape': ' '.join([item.get('value', '') for item in parsed_narrative.get('audio_landscape', [])]),
+        'emotional_vibe': ' '.join([item.get('value', '') for item in parsed_narrative.get('emotional_vibe', [])]),
+        'narrative': {
+            'available': True,
+            'content': narrative_content,
+            'features': parse_analysis_features(narrative_content, 'narrative')
+        },
+        'visual': {
+            'available': serving_index.has_modality(row, 'visual'),
+            'content': visual_content,
+            'features': parse_analysis_features(visual_content, 'visual')
+        },
+        'audio': {
+            'available': serving_index.has_modality(row, 'audio'),
+            'content': audio_content,
+            'features': parse_analysis_features(audio_content, 'audio')
+        }
+    }
+
+
 @app.route('/api/analysis/<path:movie_title>', methods=['GET'])
+@admitted('analysis', 'interactive')
+@coalesced
 def get_movie_analysis(movie_title):
     """
     Get detailed AI analysis for a specific movie
     """
     print(f"Getting analysis for: {movie_title}")
 
-    if not nar_collection:
+    serving_index = g.generation.index if g.generation else None
+    if not serving_index:
         return jsonify({"error": "Database not available"}), 500
+    title_requests.hit(movie_title, serving_index)
 
     try:
-        # Get the source movie data from all collections
-        source_nar = nar_collection.get(where={"title": movie_title}, include=['embeddings', 'metadatas', 'documents'])
-        source_vis = vis_collection.get(where={"title": movie_title}, include=['embeddings', 'documents']) if vis_collection else None
-        source_aud = aud_collection.get(where={"title": movie_title}, include=['embeddings', 'documents']) if aud_collection else None
-
-        if not source_nar['ids']:
+        row = serving_index.row(movie_title)
+        if row is None:
             return jsonify({"error": f"Movie '{movie_title}' not found"}), 404
 
-        # Parse features from analysis content
-        narrative_content = source_nar['documents'][0] if source_nar['documents'] else None
-        visual_content = source_vis['documents'][0] if source_vis and source_vis.get('documents') else None
-        audio_content = source_aud['documents'][0] if source_aud and source_aud.get('documents') else None
-
-        # Parse the Gemini narrative analysis to extract structured sections
-        parsed_narrative = parse_gemini_analysis(narrative_content) if narrative_content else {}
-
-        analysis = {
-            'title': movie_title,
-            'visual_style': ' '.join([item.get('value', '') for item in parsed_narrative.get('visual_style', [])]),
-            'narrative_arc': ' '.join([item.get('value', '') for item in parsed_narrative.get('narrative_arc', [])]),
-            'audio_landscape': ' '.join([item.get('value', '') for item in parsed_narrative.get('audio_landscape', [])]),
-            'emotional_vibe': ' '.join([item.get('value', '') for item in parsed_narrative.get('emotional_vibe', [])]),
-            'narrative': {
-                'available': True,
-                'content': narrative_content,
-                'features': parse_analysis_features(narrative_content, 'narrative')
-            },
-            'visual': {
-                'available': source_vis is not None and len(source_vis['ids']) > 0,
-                'content': visual_content,
-                'features': parse_analysis_features(visual_content, 'visual')
-            },
-            'audio': {
-                'available': source_aud is not None and len(source_aud['ids']) > 0,
-                'content': audio_content,
-                'features': parse_analysis_features(audio_content, 'audio')
-            }
-        }
-
-        return jsonify(analysis)
+        return jsonify(movie_analysis(serving_index, row, movie_title))
 
     except Exception as e:
         print(f"Error getting analysis: {str(e)}")
@@ -516,6 +909,8 @@ def get_movie_analysis(movie_title):
 
 
 @app.route('/api/similarity', methods=['POST'])
+@admitted('similarity', 'bulk')
+@coalesced
 def get_similarity_scores():
     """
     Get similarity scores for all movies based on custom weights
@@ -524,135 +919,505 @@ def get_similarity_scores():
     target_movie = data.get('movie_title')
     weights = data.get('weights', {'narrative': 0.4, 'visual': 0.35, 'audio': 0.25})
 
-    if not target_movie or not nar_collection:
+    generation = g.generation
+    if not target_movie or not (generation or scatter):
         return jsonify([])
+    title_requests.hit(target_movie, generation.index if generation else None)
 
     try:
-        # Get the source movie data
-        source_nar = nar_collection.get(where={"title": target_movie}, include=['embeddings'])
-        source_vis = vis_collection.get(where={"title": target_movie}, include=['embeddings']) if vis_collection else None
-        source_aud = aud_collection.get(where={"title": target_movie}, include=['embeddings']) if aud_collection else None
+        filters = parse_filters(data.get('filters')) or parse_filters(request.args)
+        k = int(data.get('k', SIMILARITY_RESULTS))
+        if not 1 <= k <= MAX_SIMILARITY_RESULTS:
+            raise ValueError(f"k must be between 1 and {MAX_SIMILARITY_RESULTS}")
+        # Lattice answers between lattice points are approximate; "exact": true rules them out
+        accuracy = data.get('accuracy', 'exact' if data.get('exact') else 'approximate')
+        if accuracy not in ACCURACY_LEVELS:
+            raise ValueError(f"Unknown accuracy '{accuracy}' (choose from {', '.join(ACCURACY_LEVELS)})")
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
 
-        if not source_nar['ids']:
+    try:
+        found = ranked_similarities(generation, target_movie, weights, filters, k, accuracy)
+        if found is None:
             return jsonify([])
+        similarity_scores, strategy, answered = found
+        return planned_response(jsonify(similarity_scores), strategy, answered)  # Top 20
+
+    except ShardUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        print(f"Error calculating similarities: {str(e)}")
+        return jsonify([])
 
-        # Get all movies for comparison
-        all_movies = get_all_movies_from_db()
-        similarity_scores = []
 
-        for movie in all_movies:
-            if movie['title'] == target_movie:
-                continue
+@app.route('/api/movie/<path:movie_title>/bundle', methods=['GET', 'POST'])
+@admitted('bundle', 'interactive')
+@coalesced
+def get_movie_bundle(movie_title):
+    """
+    Everything a movie page shows, in one response from one lookup of the movie
 
-            # Calculate multimodal similarity
-            similarities = {}
+    sections=movie,analysis,recommendations,similarity (default: all) picks
+    what is computed. Weights, filters and accuracy are read as /api/recommend
+    reads them (query parameters, or a POST body); k sizes the similarity
+    section. The two ranked sections run concurrently, and each is exactly
+    what its own route would return; `plans` names their strategies.
+    """
+    generation = g.generation
+    if not generation:
+        return jsonify({"error": "Database not available"}), 500
+    title_requests.hit(movie_title, generation.index)
 
-            # Narrative similarity
-            try:
-                target_nar = nar_collection.get(where={"title": movie['title']}, include=['embeddings'])
-                if len(target_nar['embeddings']) > 0:
-                    nar_sim = cosine_similarity([source_nar['embeddings'][0]], [target_nar['embeddings'][0]])[0][0]
-                    similarities['narrative'] = max(0, float(nar_sim))
-                else:
-                    similarities['narrative'] = 0.5
-            except:
-                similarities['narrative'] = 0.5
-
-            # Visual similarity
-            if source_vis and len(source_vis['embeddings']) > 0 and vis_collection:
-                try:
-                    target_vis = vis_collection.get(where={"title": movie['title']}, include=['embeddings'])
-                    if len(target_vis['embeddings']) > 0:
-                        vis_sim = cosine_similarity([source_vis['embeddings'][0]], [target_vis['embeddings'][0]])[0][0]
-                        similarities['visual'] = max(0, float(vis_sim))
-                    else:
-                        similarities['visual'] = 0.5
-                except:
-                    similarities['visual'] = 0.5
-            else:
-                similarities['visual'] = 0.5
-
-            # Audio similarity
-            if source_aud and len(source_aud['embeddings']) > 0 and aud_collection:
-                try:
-                    target_aud = aud_collection.get(where={"title": movie['title']}, include=['embeddings'])
-                    if len(target_aud['embeddings']) > 0:
-                        aud_sim = cosine_similarity([source_aud['embeddings'][0]], [target_aud['embeddings'][0]])[0][0]
-                        similarities['audio'] = max(0, float(aud_sim))
-                    else:
-                        similarities['audio'] = 0.5
-                except:
-                    similarities['audio'] = 0.5
-            else:
-                similarities['audio'] = 0.5
-
-            # Ensure all similarities have valid values
-            similarities['narrative'] = similarities.get('narrative', 0.5) or 0.5
-            similarities['visual'] = similarities.get('visual', 0.5) or 0.5
-            similarities['audio'] = similarities.get('audio', 0.5) or 0.5
-
-            # Calculate weighted similarity
-            combined_similarity = (
-                float(similarities['narrative']) * float(weights['narrative']) +
-                float(similarities['visual']) * float(weights['visual']) +
-                float(similarities['audio']) * float(weights['audio'])
-            )
-
-            similarity_scores.append({
-                'title': movie['title'],
-                'similarity': float(combined_similarity),
-                'similarities': similarities
-            })
-
-        # Sort by similarity
-        similarity_scores.sort(key=lambda x: x['similarity'], reverse=True)
-        return jsonify(similarity_scores[:20])  # Return top 20
+    try:
+        if request.method == 'POST':
+            body = request.json or {}
+            sections = body.get('sections', request.args.get('sections'))
+            weights = body.get('weights', DEFAULT_WEIGHTS)
+            filters = parse_filters(body.get('filters')) or parse_filters(request.args)
+            k = int(body.get('k', request.args.get('k', SIMILARITY_RESULTS)))
+            accuracy = body.get('accuracy', request.args.get('accuracy'))
+        else:
+            sections = request.args.get('sections')
+            weights = {m: float(request.args.get(m, DEFAULT_WEIGHTS[m])) for m in DEFAULT_WEIGHTS}
+            filters = parse_filters(request.args)
+            k = int(request.args.get('k', SIMILARITY_RESULTS))
+            accuracy = request.args.get('accuracy')
+        if sections is None:
+            sections = BUNDLE_SECTIONS
+        elif isinstance(sections, str):
+            sections = [section.strip() for section in sections.split(',') if section.strip()]
+        unknown = [section for section in sections if section not in BUNDLE_SECTIONS]
+        if unknown:
+            raise ValueError(f"Unknown section(s) {', '.join(unknown)} (choose from {', '.join(BUNDLE_SECTIONS)})")
+        if not 1 <= k <= MAX_SIMILARITY_RESULTS:
+            raise ValueError(f"k must be between 1 and {MAX_SIMILARITY_RESULTS}")
+        if accuracy is not None and accuracy not in ACCURACY_LEVELS:
+            raise ValueError(f"Unknown accuracy '{accuracy}' (choose from {', '.join(ACCURACY_LEVELS)})")
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    serving_index = generation.index
+    row = serving_index.row(movie_title)
+    if row is None:
+        return jsonify({"error": f"Movie '{movie_title}' not found"}), 404
 
+    try:
+        ranked = {}
+        if 'recommendations' in sections:
+            ranked['recommendations'] = bundle_executor.submit(
+                ranked_recommendations, generation, movie_title, weights, filters, accuracy or 'exact')
+        if 'similarity' in sections:
+            ranked['similarity'] = bundle_executor.submit(
+                ranked_similarities, generation, movie_title, weights, filters, k, accuracy or 'approximate')
+
+        bundle = {'title': movie_title}
+        if 'movie' in sections:
+            bundle['movie'] = serving_index.movie_record(row)
+        if 'analysis' in sections:
+            bundle['analysis'] = movie_analysis(serving_index, row, movie_title)
+
+        plans, answered = {}, []
+        for section, future in ranked.items():
+            entries, plans[section], shards = future.result() or ([], None, None)
+            bundle[section] = entries
+            if shards is not None:
+                answered.append(shards)
+        if ranked:
+            bundle['plans'] = plans
+
+        response = jsonify(bundle)
+        return shard_headers(response, min(answered)) if answered else response
+
+    except ShardUnavailable as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        print(f"Error calculating similarities: {str(e)}")
-        return jsonify([])
+        print(f"Error building movie bundle: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
+def session_profile(generation, body):
+    """
+    The TasteProfile a /api/session/recommend body describes: its `profile`
+    token, if any, with the liked and disliked titles applied. Returns
+    (profile, titles not in the catalog).
+    """
+    seeds = ([(title, weight) for title, weight in parse_seeds(body.get('liked'), DEFAULT_LIKE_WEIGHT)]
+             + [(title, -weight) for title, weight in parse_seeds(body.get('disliked'), DEFAULT_DISLIKE_WEIGHT)])
+    profile = TasteProfile.decode(body['profile']) if body.get('profile') else TasteProfile()
+
+    queries = {}
+    if scatter:
+        # Each seed's vectors come from the shard that owns it, all looked up at once
+        sources = scatter.sources([title for title, _ in seeds], time.monotonic() + scatter.timeout)
+        queries = {title: decode_query(source['query']) for title, source in sources.items() if source is not None}
+    else:
+        serving_index = generation.index
+        for title, _ in seeds:
+            row = serving_index.row(title)
+            if row is not None:
+                queries[title] = row_query(serving_index, row)
+
+    unknown = []
+    for title, weight in seeds:
+        if title in queries:
+            profile.update(title, weight, queries[title])
+        elif title not in unknown:
+            unknown.append(title)
+    return profile, unknown
+
+
+@app.route('/api/session/recommend', methods=['POST'])
+@admitted('session', 'interactive')
+@coalesced
+def get_session_recommendations():
+    """
+    Recommendations for a whole session's taste instead of one movie
+
+    The body lists `liked` and optionally `disliked` titles (or {"title",
+    "weight"} objects) and may carry the `profile` token a previous response
+    returned, so a client only sends what changed since. The profile's
+    per-modality centroid is scored against the catalog in one pass, and
+    every title in the profile is left out of the results.
+    """
+    generation = g.generation
+    if not generation and not scatter:
+        return jsonify({"error": "Database not available"}), 500
+
+    try:
+        body = request.json or {}
+        weights = body.get('weights', DEFAULT_WEIGHTS)
+        filters = parse_filters(body.get('filters')) or parse_filters(request.args)
+        k = int(body.get('k', SIMILARITY_RESULTS))
+        if not 1 <= k <= MAX_SIMILARITY_RESULTS:
+            raise ValueError(f"k must be between 1 and {MAX_SIMILARITY_RESULTS}")
+        profile, unknown = session_profile(generation, body)
+        if not len(profile):
+            raise ValueError("No liked or disliked title was found in the catalog")
+        if generation:
+            for title in profile.seeds:
+                title_requests.hit(title, generation.index)
+    except ShardUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Titles already in the session are never recommended back
+    filters = dict(filters, exclude=list(filters.get('exclude', [])) + list(profile.seeds))
+    try:
+        if scatter:
+            entries, answered = scatter.query_similarity(profile.query(), weights, filters, k)
+            recommendations = recommendation_payload(
+                [entry['movie'] for entry in entries],
+                {m: [entry['similarities'][m] for entry in entries] for m in MODALITIES},
+                [entry['similarity'] for entry in entries], weights)
+            strategy = 'scatter_gather'
+        else:
+            serving_index, answered = generation.index, None
+            mask = serving_index.catalog.filter_mask(filters, serving_index.title_index)
+            result = query_similarity_rows(serving_index, profile.query(), weights, mask, k)
+            recommendations = ranked_payload(serving_index, result, weights)
+            strategy = 'scan'
+
+        response = jsonify({
+            'recommendations': recommendations,
+            'profile': profile.encode(),
+            'seeds': profile.describe(),
+            'unknown': unknown,
+        })
+        return planned_response(response, strategy, answered)
+
+    except ShardUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        print(f"Error building session recommendations: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
+@app.route('/api/explain', methods=['POST'])
+@admitted('explain', 'interactive')
+def explain_query():
+    """
+    How a /api/similarity or /api/recommend request would be executed
+
+    Body: {"query": "similarity"|"recommend", "movie_title", "weights",
+    "filters", "k", "accuracy"} with the same defaults as those routes.
+    "analyze": true also runs the plan and reports the measured time.
+    """
+    data = request.json or {}
+    query = data.get('query', 'similarity')
+    generation = g.generation
+    if not generation:
+        return jsonify({"error": "Database not available"}), 500
+    if scatter:
+        return unsharded_only('/api/explain')
+    serving_index, planner = generation.index, generation.planner
+
+    try:
+        if query not in ('similarity', 'recommend'):
+            raise ValueError(f"Unknown query '{query}' (choose from similarity, recommend)")
+        weights = data.get('weights', DEFAULT_WEIGHTS)
+        filters = parse_filters(data.get('filters'))
+        k = int(data.get('k', SIMILARITY_RESULTS if query == 'similarity' else RECOMMEND_RESULTS))
+        accuracy = data.get('accuracy', 'approximate' if query == 'similarity' else 'exact')
+        source_row = serving_index.row(data.get('movie_title'))
+        if source_row is None:
+            return jsonify({"error": f"Movie '{data.get('movie_title')}' not found"}), 404
+        plan = planner.plan(query, source_row, weights, filters, k, accuracy)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    explanation = dict(plan.to_dict(), movie_title=serving_index.titles[source_row])
+    if data.get('analyze'):
+        rows = planner.execute(plan)[0]
+        explanation.update(elapsed_ms=round(plan.elapsed_ms, 4), results=len(rows))
+    return jsonify(explanation)
+
+
+@app.route('/api/similarity/vectors/<path:movie_title>', methods=['GET'])
+@admitted('similarity_vectors', 'bulk')
+@coalesced
+def get_similarity_vectors(movie_title):
+    """
+    Unfused narrative/visual/audio scores for client-side re-weighting
+
+    Query parameters:
+      top=1000 keeps the union of each modality's best rows (top=all for the whole catalog)
+      format=binary|msgpack|arrow|json (see score_payload.py)
+      titles=0 omits the title table (rows are /api/movies row numbers)
+      the /api/recommend filters
+    """
+    serving_index = g.generation.index if g.generation else None
+    if not serving_index:
+        return jsonify({"error": "Database not available"}), 500
+    if scatter:
+        return unsharded_only('/api/similarity/vectors')
+
+    try:
+        top = request.args.get('top', str(DEFAULT_VECTOR_TOP))
+        top = None if top == 'all' else int(top)
+        if top is not None and top < 1:
+            raise ValueError("top must be >= 1 or 'all'")
+        fmt = request.args.get('format', 'binary')
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}' (choose from {', '.join(FORMATS)})")
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    source_row = serving_index.row(movie_title)
+    if source_row is None:
+        return jsonify({"error": f"Movie '{movie_title}' not found"}), 404
+
+    mask = serving_index.catalog.filter_mask(filters, serving_index.title_index)
+    rows, similarities, thresholds = modality_vector_rows(serving_index, source_row, mask, top)
+    header = {
+        'source': serving_index.titles[source_row],
+        'count': len(rows),
+        'total': len(serving_index.live_rows()),
+        'thresholds': thresholds,
+    }
+    titles = [serving_index.titles[r] for r in rows] if request.args.get('titles', '1') != '0' else None
+    if serving_index.live is not None:
+        # /api/movies skips shadowed and deleted segment rows
+        rows = np.cumsum(serving_index.live)[rows] - 1
+
+    try:
+        payload = encode_score_vectors(fmt, header, titles, rows, similarities)
+    except ImportError as e:
+        return jsonify({"error": f"format={fmt} is not available on this server: {e}"}), 406
+    return Response(payload, mimetype=FORMATS[fmt])
+
+
+def search_modes(mode):
+    """
+    The search modes `mode` runs on this server: a fused search without one
+    of its encoders falls back to the other
+    """
+    available = [m for m, model in (('text', text_model), ('visual', clip_model)) if model]
+    return available if mode == 'fused' else [m for m in available if m == mode]
+
+
+def parse_facets(value):
+    """
+    facet= query parameter -> facet columns to search (None: the whole
+    description). Raises ValueError on unknown names.
+    """
+    if value is None:
+        return None
+    if value == 'all':
+        return list(range(len(FACETS)))
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in FACETS]
+    if unknown or not names:
+        raise ValueError(f"Unknown facet '{', '.join(unknown)}' (choose from {', '.join(FACETS)} or all)")
+    return sorted({FACETS.index(name) for name in names})
+
+
+def search_results(generation, query, mode='text', visual_weight=DEFAULT_VISUAL_WEIGHT, facets=None):
+    """
+    /api/search entries for a text query: narrative matches ('text'), CLIP
+    matches against the trailers' frames ('visual'), or both by rank fusion
+    ('fused'). With `facets` the text side matches each movie's best
+    description section among them instead of the whole description.
+    """
+    serving_index = generation.index
+    modes = search_modes(mode)
+    if not modes:
+        return []
+
+    k = SEARCH_CANDIDATES if len(modes) > 1 else SEARCH_RESULTS
+
+    def visual_rows():
+        return query_column_rows(serving_index, 'visual', clip_model.encode(query), k)
+
+    # A fused search encodes and scans its visual half while the text half runs
+    visual = search_executor.submit(visual_rows) if len(modes) > 1 else None
+
+    rankings = {}
+    matched = None
+    if 'text' in modes and facets is not None:
+        if serving_index.has_facets:
+            rows, relevances, matched = query_facet_rows(serving_index, text_model.encode(query), facets, k)
+        else:
+            # No facets built yet (python facet_index.py build): nothing matches a section
+            rows, relevances = np.zeros(0, dtype=np.int64), np.zeros(0)
+        rankings['text'] = rows
+    elif 'text' in modes:
+        # Nearest narrative embeddings, ranked like the ChromaDB query was
+        rows, distances = query_rows(serving_index, 'narrative', text_model.encode(query), k)
+        rankings['text'] = rows
+        relevances = 1 - distances  # Convert distance to relevance
+    if 'visual' in modes:
+        rows, relevances = visual.result() if visual else visual_rows()
+        rankings['visual'] = rows
+    if len(modes) > 1:
+        rows, relevances = rank_fusion(rankings, {'text': 1 - visual_weight, 'visual': visual_weight})
+        matched = None
+
+    results = []
+    for i, (row, relevance) in enumerate(zip(rows, relevances)):
+        result = search_entry(serving_index, row, relevance)
+        if matched is not None:
+            result['facet'] = FACETS[matched[i]]
+        results.append(result)
+    return results
+
+
+def search_entry(serving_index, row, relevance):
+    title = serving_index.titles[row]
+    return {
+        'id': title,
+        'title': title,
+        'description': serving_index.documents[row],
+        'youtube_link': serving_index.catalog.youtube_link[row],
+        'relevance': float(relevance)
+    }
 
 
 @app.route('/api/search', methods=['GET'])
+@admitted('search', 'interactive')
+@coalesced
 def search_movies():
     """
     Search movies by text query
+
+    mode=visual matches the query against what the trailers show instead of
+    their descriptions; mode=fused ranks by both, the visual side weighing
+    visual_weight (default 0.5).
+
+    facet=audio_landscape (comma-separated, or all) matches the query against
+    those sections of the descriptions only, each movie by its best one.
     """
     query = request.args.get('q', '')
-    if not query or not text_model or not nar_collection:
+    try:
+        mode = request.args.get('mode', 'text')
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown mode '{mode}' (choose from {', '.join(SEARCH_MODES)})")
+        visual_weight = float(request.args.get('visual_weight', DEFAULT_VISUAL_WEIGHT))
+        if not 0 <= visual_weight <= 1:
+            raise ValueError("visual_weight must be between 0 and 1")
+        facets = parse_facets(request.args.get('facet'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    generation = g.generation
+    if not query or not search_modes(mode) or not generation:
         return jsonify([])
 
     try:
-        # Encode the search query
-        query_embedding = text_model.encode(query)
-
-        # Search in the narrative collection
-        results = nar_collection.query(
-            query_embeddings=[query_embedding.tolist()],
-            n_results=10,
-            include=['metadatas', 'documents', 'distances']
-        )
-
-        search_results = []
-        for i, movie_id in enumerate(results['ids'][0]):
-            title = results['metadatas'][0][i]['title']
-            movie_data = movies_data.get(title, {})
-
-            search_results.append({
-                'id': title,
-                'title': title,
-                'description': results['documents'][0][i],
-                'youtube_link': movie_data.get('youtube_link', ''),
-                'relevance': 1 - results['distances'][0][i]  # Convert distance to relevance
-            })
-
-        return jsonify(search_results)
+        return jsonify(search_results(generation, query, mode, visual_weight, facets))
 
     except Exception as e:
         print(f"Error searching movies: {e}")
         return jsonify([])
 
 
+def palette_query():
+    """
+    The request's query palette: a reference image (multipart field `image`,
+    or the body itself with an image/* Content-Type) or colors= (query
+    string or JSON body). Raises ValueError on bad colors or images, and
+    ImportError for images without Pillow.
+    """
+    if request.method == 'POST':
+        upload = request.files.get('image')
+        if upload is not None:
+            return image_histogram(upload.read())
+        if request.mimetype.startswith('image/'):
+            return image_histogram(request.get_data())
+        body = request.get_json(silent=True)
+        if isinstance(body, dict) and body.get('colors'):
+            return color_histogram(parse_palette(body['colors']))
+    return color_histogram(parse_palette(request.args.get('colors', '')))
+
+
+@app.route('/api/search/palette', methods=['GET', 'POST'])
+@admitted('palette', 'interactive')
+@coalesced
+def search_palette():
+    """
+    Find trailers whose color grading matches a palette
+
+    GET colors=1b2a49,e0a458:0.3 (hex colors, each optionally :weight), or
+    POST a reference image or {"colors": [...]}. metric=intersection
+    (default) or chi2; accuracy=exact scores every row instead of the coarse
+    pre-filter's candidates. Accepts the same filters as /api/recommend.
+    """
+    try:
+        metric = request.args.get('metric', 'intersection')
+        if metric not in PALETTE_METRICS:
+            raise ValueError(f"Unknown metric '{metric}' (choose from {', '.join(PALETTE_METRICS)})")
+        accuracy = request.args.get('accuracy', 'approximate')
+        if accuracy not in ACCURACY_LEVELS:
+            raise ValueError(f"Unknown accuracy '{accuracy}' (choose from {', '.join(ACCURACY_LEVELS)})")
+        filters = parse_filters(request.args)
+        query = palette_query()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except ImportError as e:
+        return jsonify({"error": f"Image palettes are not available on this server: {e}"}), 406
+
+    generation = g.generation
+    if not generation:
+        return jsonify({"error": "Database not available"}), 500
+    if scatter:
+        return unsharded_only('/api/search/palette')
+    serving_index = generation.index
+
+    try:
+        mask = serving_index.catalog.filter_mask(filters, serving_index.title_index)
+        rows, scores = palette_rows(serving_index, query, SEARCH_RESULTS, metric, mask, accuracy)
+        return jsonify([search_entry(serving_index, row, score) for row, score in zip(rows, scores)])
+
+    except Exception as e:
+        print(f"Error searching palettes: {e}")
+        return jsonify([])
+
+
 @app.route('/api/trailers/<path:filename>', methods=['GET'])
 def serve_trailer(filename):
     """
@@ -674,15 +1439,87 @@ def health_check():
     """
     Health check endpoint
     """
-    movie_count = nar_collection.count() if nar_collection else 0
+    generation = g.generation
     return jsonify({
         "status": "healthy",
-        "movies_count": movie_count,
-        "database_connected": nar_collection is not None,
-        "text_model_loaded": text_model is not None
+        "movies_count": len(generation.index.live_rows()) if generation else 0,
+        "database_connected": generation is not None,
+        "generation": generation.number if generation else None,
+        "text_model_loaded": text_model is not None,
+        "clip_model_loaded": clip_model is not None,
+        "facets_loaded": bool(generation and generation.index.has_facets)
+    })
+
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness: 200 once the serving index is loaded and warm, 503 before
+    (route traffic on this; /api/health only says the process is alive)
+    """
+    generation = g.generation
+    status = readiness.describe()
+    status["generation"] = generation.number if generation else None
+    if generation is None and not scatter:
+        status["status"] = "unavailable"
+    if not readiness.ready or status["status"] == "unavailable":
+        response = jsonify(status)
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return jsonify(status)
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    Serving counters: executed vs coalesced requests, and admitted vs shed
+    requests, per route
+    """
+    generation = g.generation
+    return jsonify({
+        "single_flight": dict(single_flight.stats(), enabled=SINGLE_FLIGHT),
+        "admission": admission.stats(),
+        "planner": generation.planner.stats() if generation else None,
+        "generations": generations.stats(),
+        "compaction": compactor.stats(),
+        "catalog": catalog_changes.stats(),
+        "readiness": readiness.describe(),
+        "encoders": {name: model.stats() for name, model in (('text', text_model), ('clip', clip_model)) if model},
+        "shards": scatter.stats() if scatter else None
     })
 
 
+def admin_allowed():
+    """
+    ADMIN_TOKEN in X-Admin-Token, or any loopback client when no token is set
+    """
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_index():
+    """
+    Build the next index generation from the current files and switch to it
+    without a restart. In-flight requests finish on the old generation.
+    ?wait=1 responds once the new generation is serving (or the load failed).
+    """
+    if not admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+
+    wait = request.args.get('wait', '0') != '0'
+    before = generations.current
+    if not generations.reload(wait=wait):
+        return jsonify({"error": "A reload is already running", "generations": generations.stats()}), 409
+    if not wait:
+        return jsonify({"status": "loading", "generations": generations.stats()}), 202
+    if generations.current is before:
+        return jsonify({"error": generations.last_error, "generations": generations.stats()}), 500
+    return jsonify({"status": "reloaded", "generations": generations.stats()})
+
+
 @app.route('/', methods=['GET'])
 def serve_frontend():
     """
@@ -699,6 +1536,62 @@ def serve_static_files(path):
     return send_from_directory('.', path)
 
 
+def warmup_requests(generation):
+    """
+    What a warmup of `generation` runs: searches (free text, then popular
+    titles' names as typed into the search bar), then every popular title's
+    default-weight recommendations, similarity ranking and analysis, each
+    serialized like its response
+    """
+    serving_index = generation.index
+    titles = popular_titles(serving_index, WARMUP_TITLES, title_requests.most_common(WARMUP_TITLES))
+    if text_model:
+        for query in WARMUP_QUERIES + tuple(titles[:len(WARMUP_QUERIES)]):
+            yield 'search', query, lambda query=query: dumps(search_results(generation, query))
+    if clip_model:
+        for query in WARMUP_QUERIES:
+            yield 'search', query, lambda query=query: dumps(search_results(generation, query, 'visual'))
+    for title in titles:
+        yield ('recommend', title,
+               lambda title=title: dumps(ranked_recommendations(generation, title, DEFAULT_WEIGHTS)[0]))
+        yield ('similarity', title,
+               lambda title=title: dumps(ranked_similarities(generation, title, DEFAULT_WEIGHTS)[0]))
+        yield ('analysis', title,
+               lambda title=title: dumps(movie_analysis(serving_index, serving_index.row(title), title)))
+
+
+def warm_generation(generation):
+    report = run_warmup(warmup_requests(generation), WARMUP_TIMEOUT)
+    print(f"✓ Warmed generation in {report['seconds']}s: {report['requests']}"
+          + (f", errors {report['errors']}" if report['errors'] else "")
+          + (" (timed out)" if report['timed_out'] else ""))
+    return report
+
+
+def warm_first_generation():
+    generation = generations.acquire()
+    if generation is None:
+        if scatter:
+            readiness.warmed(None)
+        else:
+            readiness.unavailable()
+        return
+    try:
+        readiness.warming()
+        readiness.warmed(warm_generation(generation))
+    finally:
+        generations.release(generation)
+
+
+# The process answers /api/health right away and /api/ready once this is done
+if WARMUP:
+    threading.Thread(target=warm_first_generation, name='warmup', daemon=True).start()
+elif generations.current is not None or scatter:
+    readiness.warmed(None)
+else:
+    readiness.unavailable()
+
+
 # For Vercel serverless deployment
 def handler(request):
     return app
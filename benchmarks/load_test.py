@@ -0,0 +1,495 @@
+"""
+HTTP load harness for backend_api.py
+
+Drives the API with the request mixes the frontend actually produces:
+  - page_load:    /api/movies, /api/analysis/<title>, /api/similarity, /api/recommend/<title>
+  - slider_sweep: a WeightPanel drag, i.e. a run of /api/similarity + /api/recommend calls
+                  whose weights walk across the narrative/visual/audio simplex
+  - typeahead:    /api/search bursts for every prefix of a query as the user types
+  - trending:     page_load for one of a handful of hot titles, the thundering herd
+                  that request coalescing (single_flight.py) collapses
+
+Closed loop:  python benchmarks/load_test.py --concurrency 16 --duration 30
+Open loop:    python benchmarks/load_test.py --rate 20 --duration 30
+Compare:      python benchmarks/load_test.py --compare before.json after.json
+
+Only the standard library is used so the harness runs from any checkout.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MIX = "page_load=0.3,slider_sweep=0.4,typeahead=0.3"
+DEFAULT_WEIGHTS = {'narrative': 0.4, 'visual': 0.35, 'audio': 0.25}
+
+TYPEAHEAD_QUERIES = [
+    "dark psychological horror",
+    "neon-lit rainy city at night",
+    "heist thriller with synth score",
+    "family animated adventure",
+    "coming of age drama",
+    "space opera epic",
+]
+
+TRENDING_TITLES = 3
+
+PERCENTILES = [('p50', 50.0), ('p95', 95.0), ('p99', 99.0), ('p999', 99.9)]
+
+
+class Recorder:
+    """
+    Thread-safe collector of per-route latency samples and errors
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.status_codes = {}
+
+    def record(self, route, latency_ms, status):
+        with self.lock:
+            self.samples.setdefault(route, []).append(latency_ms)
+            codes = self.status_codes.setdefault(route, {})
+            codes[str(status)] = codes.get(str(status), 0) + 1
+            if not (200 <= status < 300):
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return None
+    # Multiplying first keeps exact ranks exact (0.95 * 100 is not 95.0 in floats)
+    rank = max(1, math.ceil(pct * len(sorted_values) / 100.0))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples, errors, elapsed_s, status_codes=None):
+    """
+    Reduce a list of latency samples to the report's summary fields
+    """
+    values = sorted(samples)
+    count = len(values)
+    summary = {
+        'count': count,
+        'errors': errors,
+        'error_rate': round(errors / count, 6) if count else 0.0,
+        'throughput_rps': round(count / elapsed_s, 3) if elapsed_s > 0 else 0.0,
+        'latency_ms': {
+            'mean': round(sum(values) / count, 3) if count else None,
+            'max': round(values[-1], 3) if count else None,
+        }
+    }
+    for name, pct in PERCENTILES:
+        value = percentile(values, pct)
+        summary['latency_ms'][name] = round(value, 3) if value is not None else None
+    if status_codes is not None:
+        summary['status_codes'] = status_codes
+    return summary
+
+
+class LoadClient:
+    """
+    Minimal HTTP client that tags every request with a route template
+    """
+
+    def __init__(self, base_url, recorder, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+
+    def request(self, route, path, payload=None, scheduled_at=None):
+        url = self.base_url + path
+        data = None
+        headers = {'Accept': 'application/json'}
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        req = urllib.request.Request(url, data=data, headers=headers, method='POST' if data else 'GET')
+        # Open-loop latency is measured from the scheduled send time so queueing
+        # inside the harness is not hidden (avoids coordinated omission)
+        start = scheduled_at if scheduled_at is not None else time.perf_counter()
+        body = None
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as res:
+                body = res.read()
+                status = res.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except Exception:
+            status = 0
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        self.recorder.record(route, latency_ms, status)
+        return body
+
+
+def quote_title(title):
+    return urllib.parse.quote(title, safe='')
+
+
+def random_weights(rng):
+    """
+    Uniform sample from the narrative/visual/audio simplex
+    """
+    a, b = sorted([rng.random(), rng.random()])
+    return {'narrative': round(a, 3), 'visual': round(b - a, 3), 'audio': round(1 - b, 3)}
+
+
+def scenario_page_load(client, rng, titles, scheduled_at=None):
+    """
+    What App.jsx does on first paint plus selecting one movie
+    """
+    client.request('GET /api/movies', '/api/movies', scheduled_at=scheduled_at)
+    title = rng.choice(titles)
+    client.request('GET /api/analysis/<title>', f'/api/analysis/{quote_title(title)}')
+    client.request('POST /api/similarity', '/api/similarity',
+                   payload={'movie_title': title, 'weights': DEFAULT_WEIGHTS})
+    client.request('GET /api/recommend/<title>', f'/api/recommend/{quote_title(title)}')
+
+
+def scenario_slider_sweep(client, rng, titles, steps=8, scheduled_at=None):
+    """
+    One WeightPanel drag: weights interpolate between two random simplex points
+    """
+    title = rng.choice(titles)
+    start, end = random_weights(rng), random_weights(rng)
+    for step in range(steps):
+        t = step / max(1, steps - 1)
+        weights = {k: round(start[k] + (end[k] - start[k]) * t, 3) for k in start}
+        client.request('POST /api/similarity', '/api/similarity',
+                       payload={'movie_title': title, 'weights': weights},
+                       scheduled_at=scheduled_at if step == 0 else None)
+        if step % 2 == 1:
+            query = urllib.parse.urlencode(weights)
+            client.request('GET /api/recommend/<title>',
+                           f'/api/recommend/{quote_title(title)}?{query}')
+
+
+def scenario_typeahead(client, rng, titles, scheduled_at=None):
+    """
+    SearchBar burst: one /api/search per typed prefix of a query
+    """
+    query = rng.choice(TYPEAHEAD_QUERIES + titles[:20])
+    prefixes = [query[:i] for i in range(2, len(query) + 1, rng.choice([1, 2, 3]))]
+    for i, prefix in enumerate(prefixes):
+        client.request('GET /api/search', '/api/search?' + urllib.parse.urlencode({'q': prefix}),
+                       scheduled_at=scheduled_at if i == 0 else None)
+
+
+def scenario_trending(client, rng, titles, scheduled_at=None):
+    """
+    Everyone opens the same few trending titles with default weights
+    """
+    scenario_page_load(client, rng, titles[:TRENDING_TITLES], scheduled_at=scheduled_at)
+
+
+SCENARIOS = {
+    'page_load': scenario_page_load,
+    'slider_sweep': scenario_slider_sweep,
+    'typeahead': scenario_typeahead,
+    'trending': scenario_trending,
+}
+
+
+def parse_mix(mix):
+    """
+    Parse "page_load=0.3,typeahead=0.7" into normalized scenario weights
+    """
+    weights = {}
+    for part in mix.split(','):
+        if not part.strip():
+            continue
+        name, _, value = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})")
+        weights[name] = float(value or 1.0)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Scenario mix must have a positive total weight")
+    return {name: value / total for name, value in weights.items()}
+
+
+def pick_scenario(rng, mix):
+    r = rng.random()
+    cumulative = 0.0
+    for name, weight in mix.items():
+        cumulative += weight
+        if r <= cumulative:
+            return name
+    return list(mix)[-1]
+
+
+def discover_titles(base_url, timeout, limit):
+    """
+    Fetch the catalog once (not recorded) to get realistic titles to query
+    """
+    with urllib.request.urlopen(base_url.rstrip('/') + '/api/movies', timeout=timeout) as res:
+        movies = json.loads(res.read())
+    if isinstance(movies, dict):
+        movies = movies.get('movies', [])
+    titles = [m['title'] for m in movies if m.get('title')]
+    return titles[:limit] if limit else titles
+
+
+def fetch_server_metrics(base_url, timeout):
+    """
+    /api/metrics counters, or None for a backend without the route
+    """
+    try:
+        with urllib.request.urlopen(base_url.rstrip('/') + '/api/metrics', timeout=timeout) as res:
+            return json.loads(res.read())
+    except Exception:
+        return None
+
+
+def server_metrics_delta(before, after):
+    """
+    Single-flight counters accumulated during the measured run
+    """
+    if not before or not after:
+        return None
+    routes = {}
+    for route, counters in after['single_flight']['routes'].items():
+        base = before['single_flight']['routes'].get(route, {})
+        routes[route] = {k: v - base.get(k, 0) for k, v in counters.items()}
+    executed = sum(c['executed'] for c in routes.values())
+    coalesced = sum(c['coalesced'] for c in routes.values())
+    return {
+        'single_flight': {
+            'executed': executed,
+            'coalesced': coalesced,
+            'coalesced_ratio': round(coalesced / (executed + coalesced), 4) if executed + coalesced else 0.0,
+            'routes': routes,
+        }
+    }
+
+
+def run_closed_loop(client, titles, mix, concurrency, duration, seed):
+    """
+    N workers each run sessions back to back until the duration expires
+    """
+    deadline = time.perf_counter() + duration
+    sessions = {name: 0 for name in mix}
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000003 + worker_id)
+        while time.perf_counter() < deadline:
+            name = pick_scenario(rng, mix)
+            SCENARIOS[name](client, rng, titles)
+            with lock:
+                sessions[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sessions
+
+
+def run_open_loop(client, titles, mix, rate, duration, seed, max_in_flight):
+    """
+    Sessions arrive as a Poisson process at `rate` per second regardless of
+    how fast the server answers
+    """
+    rng = random.Random(seed)
+    sessions = {name: 0 for name in mix}
+    dropped = 0
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    start = time.perf_counter()
+    next_arrival = start
+
+    def run(name, session_seed, scheduled_at):
+        try:
+            SCENARIOS[name](client, random.Random(session_seed), titles, scheduled_at=scheduled_at)
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - start >= duration:
+                break
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            name = pick_scenario(rng, mix)
+            if not in_flight.acquire(blocking=False):
+                # The harness itself is saturated; count it instead of silently queueing
+                dropped += 1
+                continue
+            sessions[name] += 1
+            pool.submit(run, name, rng.getrandbits(32), next_arrival)
+    return sessions, dropped
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def build_report(args, mix, recorder, titles, started_at, elapsed, sessions, dropped, server=None):
+    routes = {}
+    all_samples = []
+    total_errors = 0
+    for route in sorted(recorder.samples):
+        samples = recorder.samples[route]
+        errors = recorder.errors.get(route, 0)
+        routes[route] = summarize(samples, errors, elapsed, recorder.status_codes.get(route, {}))
+        all_samples.extend(samples)
+        total_errors += errors
+
+    return {
+        'config': {
+            'base_url': args.base_url,
+            'mode': 'open' if args.rate else 'closed',
+            'concurrency': None if args.rate else args.concurrency,
+            'rate': args.rate,
+            'max_in_flight': args.max_in_flight if args.rate else None,
+            'duration_s': args.duration,
+            'mix': mix,
+            'seed': args.seed,
+            'titles': len(titles),
+        },
+        'meta': {
+            'git_revision': git_revision(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started_at)),
+            'elapsed_s': round(elapsed, 3),
+            'python': sys.version.split()[0],
+        },
+        'sessions': sessions,
+        'dropped_sessions': dropped,
+        'overall': summarize(all_samples, total_errors, elapsed),
+        'routes': routes,
+        'server': server,
+    }
+
+
+def compare_reports(base_path, new_path, threshold):
+    """
+    Print per-route deltas between two reports; exit non-zero on regressions
+    """
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    regressions = []
+    print(f"{'route':<32} {'metric':<16} {'base':>12} {'new':>12} {'change':>9}")
+    for route in ['overall'] + sorted(set(base['routes']) | set(new['routes'])):
+        b = base['overall'] if route == 'overall' else base['routes'].get(route)
+        n = new['overall'] if route == 'overall' else new['routes'].get(route)
+        if not b or not n:
+            print(f"{route:<32} {'(missing in one report)':<16}")
+            continue
+        metrics = [('throughput_rps', b['throughput_rps'], n['throughput_rps'], False),
+                   ('error_rate', b['error_rate'], n['error_rate'], True)]
+        metrics += [(f'{name}_ms', b['latency_ms'][name], n['latency_ms'][name], True)
+                    for name, _ in PERCENTILES]
+        for metric, bv, nv, lower_is_better in metrics:
+            if bv is None or nv is None:
+                continue
+            change = (nv - bv) / bv if bv else (0.0 if nv == bv else float('inf'))
+            worse = change > threshold if lower_is_better else change < -threshold
+            marker = '  !' if worse else ''
+            print(f"{route:<32} {metric:<16} {bv:>12.3f} {nv:>12.3f} {change * 100:>8.1f}%{marker}")
+            if worse and metric != 'p999_ms':
+                regressions.append((route, metric))
+
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {threshold * 100:.0f}%")
+        return 1
+    print("\nNo regressions beyond threshold")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the movie recommender API")
+    parser.add_argument('--base-url', default=os.environ.get('API_BASE_URL', 'http://localhost:5000'))
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of load")
+    parser.add_argument('--concurrency', type=int, default=8, help="closed-loop workers")
+    parser.add_argument('--rate', type=float, default=None, help="open-loop sessions per second")
+    parser.add_argument('--max-in-flight', type=int, default=256, help="open-loop session cap")
+    parser.add_argument('--warmup', type=float, default=3.0, help="unrecorded warmup seconds")
+    parser.add_argument('--timeout', type=float, default=30.0, help="per-request timeout")
+    parser.add_argument('--titles', type=int, default=0, help="limit the title pool (0 = all)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="write the JSON report here")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help="diff two reports")
+    parser.add_argument('--threshold', type=float, default=0.10, help="regression threshold for --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare_reports(args.compare[0], args.compare[1], args.threshold))
+
+    mix = parse_mix(args.mix)
+    titles = discover_titles(args.base_url, args.timeout, args.titles)
+    if not titles:
+        print("❌ /api/movies returned no titles; is the backend running with a database?")
+        sys.exit(1)
+    print(f"✓ {len(titles)} titles, mix {mix}")
+
+    if args.warmup > 0:
+        print(f"Warming up for {args.warmup:.0f}s...")
+        warm_client = LoadClient(args.base_url, Recorder(), args.timeout)
+        run_closed_loop(warm_client, titles, mix, min(4, args.concurrency), args.warmup, args.seed + 1)
+
+    recorder = Recorder()
+    started_at = time.time()
+    client = LoadClient(args.base_url, recorder, args.timeout)
+
+    metrics_before = fetch_server_metrics(args.base_url, args.timeout)
+    start = time.perf_counter()
+    if args.rate:
+        print(f"Open loop: {args.rate} sessions/s for {args.duration:.0f}s")
+        sessions, dropped = run_open_loop(client, titles, mix, args.rate, args.duration,
+                                          args.seed, args.max_in_flight)
+    else:
+        print(f"Closed loop: {args.concurrency} workers for {args.duration:.0f}s")
+        sessions = run_closed_loop(client, titles, mix, args.concurrency, args.duration, args.seed)
+        dropped = 0
+    elapsed = time.perf_counter() - start
+    server = server_metrics_delta(metrics_before, fetch_server_metrics(args.base_url, args.timeout))
+
+    report = build_report(args, mix, recorder, titles, started_at, elapsed, sessions, dropped, server)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"✓ Report written to {args.output}")
+    else:
+        print(text)
+
+    overall = report['overall']
+    print(f"\n{overall['count']} requests, {overall['throughput_rps']} req/s, "
+          f"p50 {overall['latency_ms']['p50']} ms, p99 {overall['latency_ms']['p99']} ms, "
+          f"errors {overall['error_rate'] * 100:.2f}%")
+    if server:
+        flights = server['single_flight']
+        print(f"Server: {flights['executed']} computations, {flights['coalesced']} coalesced requests "
+              f"({flights['coalesced_ratio'] * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
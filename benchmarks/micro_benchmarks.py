@@ -0,0 +1,605 @@
+"""
+Micro-benchmarks for the scoring, fusion and tag-generation kernels
+
+Each benchmark is timed in isolation (no Flask, no ChromaDB) at several
+catalog sizes / dimensionalities. Timing follows the pytest-benchmark recipe:
+calibrate the loop count until one round takes at least --min-time, run
+warmup rounds, then record --rounds rounds of per-call timings.
+
+    python benchmarks/micro_benchmarks.py run --save main
+    python benchmarks/micro_benchmarks.py run --filter fusion --save my-branch
+    python benchmarks/micro_benchmarks.py compare main my-branch
+    python benchmarks/micro_benchmarks.py list
+
+`compare` flags a benchmark as slower only when the difference is both
+statistically significant (two-sided Mann-Whitney U over the round samples)
+and larger than --min-effect, and exits non-zero if anything got slower.
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'Data'))
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.baselines')
+
+BENCHMARKS = []
+
+
+def benchmark(group, **param_grid):
+    """
+    Register a benchmark. The decorated function receives one combination of
+    the parameter grid, does its setup and returns the zero-argument callable
+    that gets timed.
+    """
+    def register(setup):
+        combos = [{}]
+        for key, values in param_grid.items():
+            combos = [dict(combo, **{key: value}) for combo in combos for value in values]
+        for params in combos:
+            label = ','.join(f'{k}={v}' for k, v in params.items())
+            name = f"{group}/{setup.__name__}" + (f"[{label}]" if label else '')
+            BENCHMARKS.append((name, setup, params))
+        return setup
+    return register
+
+
+# --- Fixtures -----------------------------------------------------------------
+
+def synthetic_catalog(count, seed=0):
+    """
+    Titles, documents and embeddings from the synthetic catalog generator
+    """
+    from generate_synthetic_catalog import CatalogModel, generate_chunk, make_document, make_titles
+
+    rng = np.random.default_rng(seed)
+    model = CatalogModel(32, rng)
+    clusters, narrative, visual, audio = generate_chunk(model, rng, count)
+    picks = rng.integers(0, 6, size=(count, 4, 4))
+    documents = [make_document(model, int(clusters[i]), picks[i]) for i in range(count)]
+    return {
+        'titles': make_titles(count, rng),
+        'documents': documents,
+        'narrative': narrative,
+        'visual': visual,
+        'audio': audio,
+    }
+
+
+def long_documents(documents):
+    # Real Gemini answers run to a few kilobytes; repeat each section's items
+    return ['\n'.join(line + (' ' + line.split(':', 1)[1]) * 8 for line in doc.split('\n')) for doc in documents]
+
+
+def random_similarities(count, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(0.2, 1.0, size=(count, 3))
+    return [{'narrative': float(n), 'visual': float(v), 'audio': float(a)} for n, v, a in values]
+
+
+# --- Kernels ------------------------------------------------------------------
+
+@benchmark('tags', results=[8, 100, 1000])
+def generate_multimodal_tags(results):
+    from movie_analysis import generate_multimodal_tags
+    from scoring import DEFAULT_WEIGHTS
+
+    similarities = random_similarities(results)
+
+    def run():
+        for sims in similarities:
+            generate_multimodal_tags(sims, DEFAULT_WEIGHTS)
+    return run
+
+
+@benchmark('tags', results=[8, 100])
+def generate_tags_from_analysis(results):
+    from movie_analysis import generate_tags_from_analysis
+
+    catalog = synthetic_catalog(results + 1)
+    source, targets = catalog['documents'][0], catalog['documents'][1:]
+
+    def run():
+        for target in targets:
+            generate_tags_from_analysis(source, target, 0.75)
+    return run
+
+
+@benchmark('tags', results=[8, 100], length=['short', 'long'])
+def shared_themes(results, length):
+    """
+    Shared-theme tags from precomputed keyword signatures, for comparison
+    with generate_tags_from_analysis re-tokenizing both documents per pair
+    """
+    from keyword_signatures import KeywordIndex, SegmentKeywords
+
+    documents = synthetic_catalog(results + 1)['documents']
+    if length == 'long':
+        documents = long_documents(documents)
+    keywords = KeywordIndex([SegmentKeywords(documents)])
+    source, targets = keywords.source(0), np.arange(1, results + 1)
+
+    def run():
+        keywords.shared_themes(source, targets)
+    return run
+
+
+@benchmark('catalog', movies=[10000, 100000])
+def build_keyword_signatures(movies):
+    """
+    Load-time cost of tokenizing, MinHashing and TF-IDF ranking every analysis section
+    """
+    from keyword_signatures import KeywordIndex, SegmentKeywords
+
+    documents = synthetic_catalog(movies)['documents']
+
+    def run():
+        KeywordIndex([SegmentKeywords(documents)])
+    return run
+
+
+@benchmark('parse', documents=[1, 100], length=['short', 'long'])
+def parse_gemini_analysis(documents, length):
+    from movie_analysis import parse_gemini_analysis
+
+    docs = synthetic_catalog(documents)['documents']
+    if length == 'long':
+        docs = long_documents(docs)
+
+    def run():
+        for doc in docs:
+            parse_gemini_analysis(doc)
+    return run
+
+
+def synthetic_index(movies):
+    """
+    A ServingIndex over a synthetic catalog with generated metadata
+    """
+    from metadata_catalog import MetadataCatalog
+    from serving_index import ServingIndex
+
+    catalog = synthetic_catalog(movies)
+    rng = np.random.default_rng(movies)
+    genres = ['Horror', 'Drama', 'Comedy', 'Action', 'Sci-Fi', 'Romance', 'Thriller', 'Family']
+    rows = {title: {'imdbRating': f"{rng.uniform(3, 9.5):.1f}", 'Year': str(rng.integers(1970, 2026)),
+                    'Runtime': f"{rng.integers(80, 170)} min", 'Genre': ', '.join(rng.choice(genres, 2, replace=False))}
+            for title in catalog['titles']}
+    present = np.ones((movies, 3), dtype=np.bool_)
+    embeddings = {m: catalog[m] for m in ('narrative', 'visual', 'audio')}
+    return ServingIndex(catalog['titles'], embeddings, catalog['documents'], present,
+                        MetadataCatalog(catalog['titles'], rows), 'synthetic')
+
+
+@benchmark('fusion', movies=[256, 10000, 100000])
+def recommend_rows(movies):
+    """
+    /api/recommend scoring: narrative neighbours, then weighted fusion
+    """
+    from scoring import DEFAULT_WEIGHTS, recommend_rows
+
+    index = synthetic_index(movies)
+
+    def run():
+        recommend_rows(index, 0, DEFAULT_WEIGHTS)
+    return run
+
+
+@benchmark('fusion', movies=[256, 10000, 100000])
+def similarity_rows(movies):
+    """
+    /api/similarity scoring: all three modalities over the whole catalog
+    """
+    from scoring import DEFAULT_WEIGHTS, similarity_rows
+
+    index = synthetic_index(movies)
+
+    def run():
+        similarity_rows(index, 0, DEFAULT_WEIGHTS)
+    return run
+
+
+@benchmark('fusion', movies=[10000, 100000], selectivity=['genre', 'genre+rating'])
+def filtered_similarity_rows(movies, selectivity):
+    """
+    Filter evaluation on the bitmap/sorted indexes plus masked top-k
+    """
+    from metadata_catalog import parse_filters
+    from scoring import DEFAULT_WEIGHTS, similarity_rows
+
+    index = synthetic_index(movies)
+    args = {'genre': 'Horror'} if selectivity == 'genre' else {'genre': 'Horror', 'min_rating': '7.5'}
+
+    def run():
+        mask = index.catalog.filter_mask(parse_filters(args), index.title_index)
+        similarity_rows(index, 0, DEFAULT_WEIGHTS, mask)
+    return run
+
+
+@benchmark('fusion', movies=[10000, 100000], seeds=[1, 50])
+def session_profile(movies, seeds):
+    """
+    /api/session/recommend scoring: a taste profile of `seeds` liked titles,
+    updated one title at a time and scored in one pass over the catalog
+    """
+    from scoring import DEFAULT_WEIGHTS, query_similarity_rows, row_query
+    from taste_profile import TasteProfile
+
+    index = synthetic_index(movies)
+
+    def run():
+        profile = TasteProfile()
+        for row in range(seeds):
+            profile.update(index.titles[row], 1.0, row_query(index, row))
+        mask = np.ones(len(index), dtype=np.bool_)
+        mask[:seeds] = False
+        query_similarity_rows(index, profile.query(), DEFAULT_WEIGHTS, mask)
+    return run
+
+
+@benchmark('fusion', dim=[8, 384, 608])
+def similarity_vector(dim):
+    """
+    One modality's cosine kernel at each embedding width (100k rows)
+    """
+    from scoring import similarity_vector
+    from serving_index import ServingIndex
+
+    rng = np.random.default_rng(dim)
+    matrix = rng.standard_normal((100000, dim)).astype(np.float32)
+    embeddings = {'narrative': matrix, 'visual': matrix, 'audio': matrix}
+    index = ServingIndex(range(100000), embeddings, None, np.ones((100000, 3), dtype=np.bool_), None, 'random')
+
+    def run():
+        similarity_vector(index, 'visual', 0)
+    return run
+
+
+@benchmark('catalog', movies=[256, 10000, 100000])
+def movie_records(movies):
+    """
+    /api/movies payload build from the metadata catalog
+    """
+    index = synthetic_index(movies)
+
+    def run():
+        [index.movie_record(row) for row in range(len(index))]
+    return run
+
+
+@benchmark('catalog', movies=[10000, 100000], filtered=[False, True])
+def browse_page(movies, filtered):
+    """
+    One sorted /api/movies page (50 rows, -imdb_rating) deep into the catalog
+    """
+    from metadata_catalog import parse_filters
+
+    index = synthetic_index(movies)
+    filters = parse_filters({'genre': 'Horror'}) if filtered else {}
+
+    def run():
+        mask = index.catalog.filter_mask(filters, index.title_index)
+        rows, _ = index.catalog.browse('imdb_rating', True, movies // 4, 50, mask)
+        [index.movie_record(row) for row in rows]
+    return run
+
+
+@benchmark('catalog', movies=[10000, 100000])
+def build_metadata_catalog(movies):
+    """
+    Startup cost of the columnar catalog and its indexes
+    """
+    from metadata_catalog import MetadataCatalog
+
+    index = synthetic_index(movies)
+    rows = {title: {'imdbRating': '7.1', 'Year': '2020', 'Runtime': '101 min', 'Genre': 'Drama, Horror'}
+            for title in index.titles}
+
+    def run():
+        MetadataCatalog(index.titles, rows)
+    return run
+
+
+@benchmark('search', movies=[10000, 100000], mode=['text', 'visual', 'fused'])
+def search_rows(movies, mode):
+    """
+    /api/search ranking once the query is encoded: narrative L2 (text), CLIP
+    slice cosine (visual) or both plus rank fusion (fused)
+    """
+    from query_encoder import CLIP_DIMENSION
+    from scoring import SEARCH_CANDIDATES, query_column_rows, query_rows, rank_fusion
+
+    index = synthetic_index(movies)
+    rng = np.random.default_rng(1)
+    text = rng.standard_normal(384).astype(np.float32)
+    clip = rng.standard_normal(CLIP_DIMENSION).astype(np.float32)
+    index.column_norms('visual', CLIP_DIMENSION)
+
+    def run():
+        if mode == 'text':
+            query_rows(index, 'narrative', text)
+        elif mode == 'visual':
+            query_column_rows(index, 'visual', clip)
+        else:
+            rankings = {'text': query_rows(index, 'narrative', text, SEARCH_CANDIDATES)[0],
+                        'visual': query_column_rows(index, 'visual', clip, SEARCH_CANDIDATES)[0]}
+            rank_fusion(rankings, {'text': 0.5, 'visual': 0.5})
+    return run
+
+
+@benchmark('search', movies=[10000, 100000], facets=[1, 4])
+def facet_rows(movies, facets):
+    """
+    /api/search?facet= ranking once the query is encoded: cosine against
+    `facets` section embeddings per movie, best one kept (max-sim)
+    """
+    from index_segments import Segment
+    from scoring import query_facet_rows
+    from serving_index import ServingIndex
+
+    index = synthetic_index(movies)
+    rng = np.random.default_rng(1)
+    segment = index.segments[0]
+    sections = rng.standard_normal((movies, 4, 384)).astype(np.float32)
+    index = ServingIndex.from_segments(
+        [Segment(segment.titles, segment.embeddings, segment.documents, segment.present, facets=sections)],
+        index.catalog, 'synthetic')
+    query = rng.standard_normal(384).astype(np.float32)
+
+    def run():
+        query_facet_rows(index, query, list(range(facets)))
+    return run
+
+
+@benchmark('search', movies=[10000, 100000], metric=['intersection', 'chi2'], accuracy=['approximate', 'exact'])
+def palette_rows(movies, metric, accuracy):
+    """
+    /api/search/palette ranking once the palette is parsed: coarse code
+    pre-filter, then exact scores for its candidates (or for every row, with
+    accuracy=exact)
+    """
+    import color_palette
+
+    index = synthetic_index(movies)
+    query = color_palette.color_histogram(color_palette.parse_palette('1b2a49,e0a458:0.3'))
+    index.palettes
+
+    def run():
+        color_palette.palette_rows(index, query, 10, metric, accuracy=accuracy)
+    return run
+
+
+@benchmark('responses', results=[20, 100], encoder=['json', 'fast'])
+def recommendation_json(results, encoder):
+    """
+    /api/recommend body serialization: stdlib json.dumps vs
+    response_encoding.dumps (orjson when installed)
+    """
+    from response_encoding import dumps
+
+    index = synthetic_index(1000)
+    similarities = random_similarities(results)
+    entries = []
+    for row in range(results):
+        movie = index.movie_record(row)
+        entry = {field: movie[field] for field in ('id', 'title', 'description', 'youtube_link')}
+        entry.update(similarity=0.5, similarities=similarities[row], tags=['Similar Story', 'Visual Match'],
+                     genres=movie['genres'], year=movie['year'], poster=movie['poster'])
+        entries.append(entry)
+
+    def run():
+        json.dumps(entries) if encoder == 'json' else dumps(entries)
+    return run
+
+
+# --- Runner -------------------------------------------------------------------
+
+def time_loops(fn, loops):
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - start
+
+
+def calibrate(fn, min_time):
+    """
+    Smallest power-of-two loop count whose round takes at least min_time
+    """
+    loops = 1
+    while True:
+        elapsed = time_loops(fn, loops)
+        if elapsed >= min_time or loops >= 1 << 20:
+            return loops
+        # Jump close to the target instead of doubling one step at a time
+        loops = max(loops * 2, 1 << math.ceil(math.log2(max(1, loops * min_time / max(elapsed, 1e-9)))))
+
+
+def run_benchmark(fn, rounds, warmup, min_time):
+    loops = calibrate(fn, min_time)
+    for _ in range(warmup):
+        time_loops(fn, loops)
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        samples = [time_loops(fn, loops) / loops for _ in range(rounds)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    ordered = sorted(samples)
+    q1, q3 = np.percentile(ordered, [25, 75])
+    return {
+        'loops': loops,
+        'rounds': rounds,
+        'min': ordered[0],
+        'max': ordered[-1],
+        'mean': statistics.fmean(samples),
+        'median': statistics.median(samples),
+        'stddev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'iqr': float(q3 - q1),
+        'samples': samples,
+    }
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1.0), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.3f} {unit}"
+    return f"{seconds / 1e-9:8.1f} ns"
+
+
+def machine_info():
+    return {
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def baseline_path(name):
+    if name.endswith('.json') or os.sep in name:
+        return name
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def command_run(args):
+    selected = [b for b in BENCHMARKS if not args.filter or args.filter in b[0]]
+    if not selected:
+        print(f"❌ No benchmarks match '{args.filter}'")
+        return 1
+
+    results = {}
+    for name, setup, params in selected:
+        fn = setup(**params)
+        stats = run_benchmark(fn, args.rounds, args.warmup, args.min_time)
+        results[name] = stats
+        print(f"{name:<60} median {format_time(stats['median'])}  "
+              f"iqr {format_time(stats['iqr'])}  ({stats['loops']} loops x {stats['rounds']} rounds)")
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': machine_info(),
+        'settings': {'rounds': args.rounds, 'warmup': args.warmup, 'min_time': args.min_time},
+        'results': results,
+    }
+    if args.save:
+        path = baseline_path(args.save)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"✓ Saved {len(results)} results to {path}")
+    return 0
+
+
+def mann_whitney_u(a, b):
+    """
+    Two-sided Mann-Whitney U test (normal approximation with tie correction).
+    Returns the p-value.
+    """
+    n1, n2 = len(a), len(b)
+    if n1 < 2 or n2 < 2:
+        return 1.0
+    combined = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    ranks = [0.0] * len(combined)
+    tie_term = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        rank = (i + j) / 2.0 + 1.0
+        for k in range(i, j + 1):
+            ranks[k] = rank
+        ties = j - i + 1
+        tie_term += ties ** 3 - ties
+        i = j + 1
+
+    rank_sum_a = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u = rank_sum_a - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    mean_u = n1 * n2 / 2.0
+    var_u = n1 * n2 / 12.0 * ((n + 1) - tie_term / (n * (n - 1)))
+    if var_u <= 0:
+        return 1.0
+    z = (abs(u - mean_u) - 0.5) / math.sqrt(var_u)
+    return math.erfc(max(z, 0.0) / math.sqrt(2.0))
+
+
+def command_compare(args):
+    with open(baseline_path(args.base)) as f:
+        base = json.load(f)['results']
+    with open(baseline_path(args.new)) as f:
+        new = json.load(f)['results']
+
+    slower, faster = [], []
+    print(f"{'benchmark':<60} {'base':>11} {'new':>11} {'change':>8} {'p':>8}")
+    for name in sorted(set(base) & set(new)):
+        b, n = base[name], new[name]
+        change = n['median'] / b['median'] - 1.0
+        p_value = mann_whitney_u(b['samples'], n['samples'])
+        significant = p_value < args.alpha and abs(change) > args.min_effect
+        verdict = ''
+        if significant and change > 0:
+            verdict = '  SLOWER'
+            slower.append(name)
+        elif significant:
+            verdict = '  faster'
+            faster.append(name)
+        print(f"{name:<60} {format_time(b['median'])} {format_time(n['median'])} "
+              f"{change * 100:>7.1f}% {p_value:>8.4f}{verdict}")
+
+    for name in sorted(set(base) ^ set(new)):
+        print(f"{name:<60} (only in {'base' if name in base else 'new'})")
+
+    print(f"\n{len(faster)} faster, {len(slower)} slower "
+          f"(alpha={args.alpha}, min effect={args.min_effect * 100:.0f}%)")
+    return 1 if slower else 0
+
+
+def command_list(args):
+    for name, _, _ in BENCHMARKS:
+        print(name)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kernel micro-benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help="run benchmarks")
+    run.add_argument('--filter', default=None, help="substring of benchmark names to run")
+    run.add_argument('--rounds', type=int, default=15)
+    run.add_argument('--warmup', type=int, default=2, help="unrecorded rounds after calibration")
+    run.add_argument('--min-time', type=float, default=0.02, help="minimum seconds per round")
+    run.add_argument('--save', default=None, help=f"baseline name (stored in {BASELINE_DIR}) or path")
+    run.set_defaults(func=command_run)
+
+    compare = sub.add_parser('compare', help="compare two saved baselines")
+    compare.add_argument('base')
+    compare.add_argument('new')
+    compare.add_argument('--alpha', type=float, default=0.01, help="significance level")
+    compare.add_argument('--min-effect', type=float, default=0.05, help="ignore changes smaller than this")
+    compare.set_defaults(func=command_compare)
+
+    sub.add_parser('list', help="list benchmark names").set_defaults(func=command_list)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Response parity and footprint of the full vs the lite serving runtime
+
+Boots backend_api.py twice in fresh interpreters, once per environment, and
+replays the same requests through Flask's test client:
+
+  full:  QUERY_ENCODER=sentence-transformers CLIP_TEXT_ENCODER=transformers  (torch query encoders)
+  lite:  QUERY_ENCODER=onnx CLIP_TEXT_ENCODER=onnx                          (onnxruntime + tokenizers)
+
+Every response must be identical except /api/search results, where the
+titles both runtimes return must agree within --search-tolerance (the
+quantized ONNX encoder is not bit exact), and the health payload's encoder
+name. It also reports cold start, peak RSS,
+the heavy modules imported, and the on-disk size of every imported package.
+
+    python benchmarks/runtime_parity.py --titles 50
+    python benchmarks/runtime_parity.py --lite-env SERVING_SNAPSHOT_PATH=Data/serving_snapshot --json parity.json
+
+Exits non-zero when a response differs.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import sysconfig
+import time
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('torch', 'chromadb', 'sentence_transformers', 'transformers', 'sklearn', 'pandas')
+SEARCH_QUERIES = ["dark psychological horror", "heist thriller", "family adventure", "space opera"]
+DEFAULT_WEIGHTS = {'narrative': 0.4, 'visual': 0.35, 'audio': 0.25}
+
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for base, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(base, name)) for name in files
+                     if not os.path.islink(os.path.join(base, name)))
+    return total
+
+
+def imported_package_bytes():
+    """
+    On-disk size of every third-party top-level package currently imported
+    """
+    site_dirs = {sysconfig.get_paths()['purelib'], sysconfig.get_paths()['platlib']}
+    packages = {}
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if '.' in name or not path:
+            continue
+        for site in site_dirs:
+            if path.startswith(site + os.sep):
+                top = os.path.relpath(path, site).split(os.sep)[0]
+                packages[top] = os.path.join(site, top)
+    return {name: directory_size(path) for name, path in sorted(packages.items())}
+
+
+def requests_for(titles):
+    yield 'GET', '/api/health', None
+    yield 'GET', '/api/movies', None
+    for title in titles:
+        path = quote(title, safe='')
+        yield 'GET', f'/api/analysis/{path}', None
+        yield 'GET', f'/api/recommend/{path}', None
+        yield 'POST', '/api/similarity', {'movie_title': title, 'weights': DEFAULT_WEIGHTS}
+        yield 'POST', '/api/similarity', {'movie_title': title, 'weights': DEFAULT_WEIGHTS,
+                                          'filters': {'min_rating': 6}}
+    for query in SEARCH_QUERIES:
+        yield 'GET', f'/api/search?q={quote(query)}', None
+        yield 'GET', f'/api/search?q={quote(query)}&mode=visual', None
+        yield 'GET', f'/api/search?q={quote(query)}&facet=all', None
+    yield 'GET', '/api/search/palette?colors=1b2a49,e0a458:0.3', None
+
+
+def probe(titles_limit):
+    """
+    Runs inside the child interpreter: import the backend, replay requests,
+    print a JSON report on the last stdout line
+    """
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    # Measure cold requests, not a background warmup
+    os.environ.setdefault('WARMUP', '0')
+    import backend_api
+
+    cold_start = time.perf_counter() - start
+    client = backend_api.app.test_client()
+    generation = backend_api.generations.current
+    titles = list(dict.fromkeys(generation.index.titles))[:titles_limit] if generation else []
+
+    responses = []
+    request_start = time.perf_counter()
+    for method, path, body in requests_for(titles):
+        response = client.post(path, json=body) if method == 'POST' else client.get(path)
+        responses.append({'method': method, 'path': path, 'body': body,
+                          'status': response.status_code, 'json': response.get_json()})
+    request_seconds = time.perf_counter() - request_start
+
+    report = {
+        'cold_start_s': cold_start,
+        'request_s': request_seconds,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'heavy_modules': sorted(m for m in HEAVY_MODULES if m in sys.modules),
+        'module_count': len(sys.modules),
+        'package_bytes': imported_package_bytes(),
+        'encoder': getattr(backend_api.text_model, 'name', None),
+        'responses': responses,
+    }
+    print(json.dumps(report))
+
+
+def run_probe(env_overrides, titles_limit):
+    env = dict(os.environ, **env_overrides)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--probe', '--titles', str(titles_limit)],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"Backend probe failed with {env_overrides}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def diff_responses(full, lite, search_tolerance):
+    """
+    List of human readable differences between the two response lists
+    """
+    differences = []
+    for a, b in zip(full, lite):
+        label = f"{a['method']} {a['path']}"
+        if a['status'] != b['status']:
+            differences.append(f"{label}: status {a['status']} != {b['status']}")
+        elif a['path'] == '/api/health':
+            continue
+        elif a['path'].startswith('/api/search'):
+            # Near-ties at the cut-off may swap between encoders, so compare the results both returned
+            relevance = {r['title']: r['relevance'] for r in b['json']}
+            shared = [(r['relevance'], relevance[r['title']]) for r in a['json'] if r['title'] in relevance]
+            if a['json'] and b['json'] and not shared:
+                differences.append(f"{label}: no result in common")
+            gap = max((abs(x - y) for x, y in shared), default=0)
+            if gap > search_tolerance:
+                differences.append(f"{label}: relevance differs by {gap:.2e}")
+        elif a['json'] != b['json']:
+            differences.append(f"{label}: body differs")
+    if len(full) != len(lite):
+        differences.append(f"request counts differ: {len(full)} != {len(lite)}")
+    return differences
+
+
+def parse_env(pairs):
+    env = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition('=')
+        env[key] = value
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the full and lite serving runtimes")
+    parser.add_argument('--titles', type=int, default=25, help="titles to replay per-title routes for")
+    parser.add_argument('--full-env', nargs='*',
+                        default=['QUERY_ENCODER=sentence-transformers', 'CLIP_TEXT_ENCODER=transformers'])
+    parser.add_argument('--lite-env', nargs='*', default=['QUERY_ENCODER=onnx', 'CLIP_TEXT_ENCODER=onnx'])
+    parser.add_argument('--search-tolerance', type=float, default=5e-3)
+    parser.add_argument('--json', help="write both reports (without response bodies) to this path")
+    parser.add_argument('--probe', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        probe(args.titles)
+        return
+
+    reports = {
+        'full': run_probe(parse_env(args.full_env), args.titles),
+        'lite': run_probe(parse_env(args.lite_env), args.titles),
+    }
+    differences = diff_responses(reports['full']['responses'], reports['lite']['responses'], args.search_tolerance)
+
+    print(f"{'':<24} {'full':>12} {'lite':>12}")
+    for key, label, fmt in (('encoder', 'query encoder', '{}'), ('cold_start_s', 'cold start (s)', '{:.2f}'),
+                            ('max_rss_mb', 'peak RSS (MB)', '{:.0f}'), ('module_count', 'modules imported', '{}')):
+        print(f"{label:<24} {fmt.format(reports['full'][key]):>12} {fmt.format(reports['lite'][key]):>12}")
+    sizes = {name: sum(r['package_bytes'].values()) / 1e6 for name, r in reports.items()}
+    print(f"{'imported packages (MB)':<24} {sizes['full']:>12.0f} {sizes['lite']:>12.0f}")
+    print(f"heavy modules: full={reports['full']['heavy_modules']} lite={reports['lite']['heavy_modules']}")
+    print(f"{len(reports['full']['responses'])} requests replayed, {len(differences)} differences")
+    for line in differences[:20]:
+        print(f"  ✗ {line}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({name: {k: v for k, v in r.items() if k != 'responses'} for name, r in reports.items()},
+                      f, indent=2, sort_keys=True)
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Throughput and latency of sharded scoring (sharding.py) vs shard count
+
+For every shard count, launches that many local shard processes over the
+serving snapshot, waits for them to load, then drives scatter-gather
+/api/similarity and /api/recommend queries from a closed loop of client
+threads for a fixed duration. Reports per-query throughput, latency
+percentiles, partial answers (shards past the timeout) and each shard's
+resident memory.
+
+    python benchmarks/shard_scaling.py --shards 1,2,4 --concurrency 8 --duration 20
+    python benchmarks/shard_scaling.py --shards 1,4 --output scaling.json
+
+Shards share the machine here, so throughput only scales while there are
+idle cores; the per-shard memory and per-query scan time are what a
+multi-host deployment divides.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+DEFAULT_TIMEOUT_MS = 2000
+PERCENTILES = [('p50', 50.0), ('p95', 95.0), ('p99', 99.0)]
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def random_weights(rng):
+    a, b = sorted([rng.random(), rng.random()])
+    return {'narrative': round(a, 3), 'visual': round(b - a, 3), 'audio': round(1 - b, 3)}
+
+
+def rss_mb(pid):
+    """
+    Resident memory of a process from /proc, or None where that does not exist
+    """
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def drive(client, titles, concurrency, duration, seed):
+    """
+    Closed loop: every thread alternates similarity and recommend queries
+    until `duration` passes. Returns {query: [(latency_ms, answered)]} and errors.
+    """
+    samples = {'similarity': [], 'recommend': []}
+    errors = {'similarity': 0, 'recommend': 0}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        query = 'similarity' if n % 2 else 'recommend'
+        while time.perf_counter() < stop_at:
+            title, weights = rng.choice(titles), random_weights(rng)
+            start = time.perf_counter()
+            try:
+                if query == 'similarity':
+                    answered = client.similarity(title, weights)[1]
+                else:
+                    answered = client.recommend(title, weights)[-1]
+                with lock:
+                    samples[query].append(((time.perf_counter() - start) * 1000.0, answered))
+            except Exception:
+                with lock:
+                    errors[query] += 1
+            query = 'recommend' if query == 'similarity' else 'similarity'
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors
+
+
+def summarize(samples, errors, shards, elapsed_s):
+    values = sorted(latency for latency, _ in samples)
+    summary = {
+        'count': len(values),
+        'errors': errors,
+        'partial': sum(1 for _, answered in samples if answered < shards),
+        'throughput_qps': round(len(values) / elapsed_s, 2),
+        'latency_ms': {'mean': round(sum(values) / len(values), 3) if values else None},
+    }
+    for name, pct in PERCENTILES:
+        value = percentile(values, pct)
+        summary['latency_ms'][name] = round(value, 3) if value is not None else None
+    return summary
+
+
+def run(shards, titles, args):
+    from sharding import ScatterGather, launch_shards, stop_shards, wait_healthy
+
+    data_args = ['--snapshot', args.snapshot, '--enriched', args.enriched, '--csv', args.csv]
+    processes, urls = launch_shards(shards, args.base_port, data_args=data_args,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        start = time.perf_counter()
+        wait_healthy(urls, processes=processes)
+        startup_s = time.perf_counter() - start
+        client = ScatterGather(urls, args.timeout_ms)
+        if args.warmup > 0:
+            drive(client, titles, args.concurrency, args.warmup, args.seed)
+
+        start = time.perf_counter()
+        samples, errors = drive(client, titles, args.concurrency, args.duration, args.seed)
+        elapsed_s = time.perf_counter() - start
+        return {
+            'shards': shards,
+            'startup_s': round(startup_s, 2),
+            'shard_rss_mb': [rss_mb(process.pid) for process in processes],
+            'queries': {query: summarize(samples[query], errors[query], shards, elapsed_s) for query in samples},
+        }
+    finally:
+        stop_shards(processes)
+
+
+def print_report(results):
+    print(f"{'shards':>6}  {'query':<10} {'qps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'partial':>7} {'errors':>6}  shard RSS MB")
+    for result in results:
+        for query, summary in result['queries'].items():
+            latency = summary['latency_ms']
+            print(f"{result['shards']:>6}  {query:<10} {summary['throughput_qps']:>8} {latency['p50'] or 0:>8.2f} "
+                  f"{latency['p95'] or 0:>8.2f} {latency['p99'] or 0:>8.2f} {summary['partial']:>7} "
+                  f"{summary['errors']:>6}  {result['shard_rss_mb']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', default='1,2,4', help="comma-separated shard counts to compare")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds measured per shard count")
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--timeout-ms', type=float, default=DEFAULT_TIMEOUT_MS, help="per-query shard timeout")
+    parser.add_argument('--base-port', type=int, default=5101)
+    parser.add_argument('--titles', type=int, default=1000, help="distinct source titles sampled")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--snapshot', default=os.environ.get('SERVING_SNAPSHOT_PATH',
+                                                             os.path.join(ROOT, 'Data', 'serving_snapshot')))
+    parser.add_argument('--enriched', default=os.environ.get('MOVIES_ENRICHED_CSV_PATH',
+                                                             os.path.join(ROOT, 'Data', 'movie_trailers_enriched.csv')))
+    parser.add_argument('--csv', default=os.environ.get('MOVIES_CSV_PATH',
+                                                        os.path.join(ROOT, 'Data', 'movie_trailers.csv')))
+    parser.add_argument('--output', help="write the results as JSON")
+    args = parser.parse_args()
+
+    from index_segments import load_segments
+
+    segments, live = load_segments(args.snapshot)
+    titles = [title for segment in segments for title in segment.titles]
+    if live is not None:
+        titles = [title for title, alive in zip(titles, live) if alive]
+    titles = random.Random(args.seed).sample(titles, min(args.titles, len(titles)))
+    print(f"{len(titles)} source titles, concurrency {args.concurrency}, {args.duration}s per shard count")
+
+    results = []
+    for shards in [int(n) for n in args.shards.split(',')]:
+        print(f"Running {shards} shard(s)...")
+        results.append(run(shards, titles, args))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'cpus': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Catalog versions and the change log behind /api/movies/changes
+
+Every index generation (index_generations.py) is observed once while it is
+built: its live titles and their record digests (Segment.metadata) are
+compared with the previous build's, and when anything was added, updated or
+removed the catalog gets a new version and the log a new entry. A client
+that knows version v then only needs the net changes of the entries after
+v, instead of the whole catalog.
+
+Versions are millisecond timestamps, bumped by one when two would collide,
+so they keep increasing across restarts. The log only lives in memory and
+keeps at most `retained_titles` changed titles; a `since` older than its
+oldest entry (including any version from before a restart) is answered with
+a full snapshot instead.
+"""
+
+import threading
+import time
+from collections import deque
+
+# Changed titles kept across all log entries before the oldest entries are dropped
+DEFAULT_RETAINED_TITLES = 50000
+
+
+class CatalogChangeLog:
+    def __init__(self, retained_titles=DEFAULT_RETAINED_TITLES):
+        self.retained_titles = retained_titles
+        self.lock = threading.Lock()
+        self.version = None
+        self.oldest = None
+        self.digests = None
+        self.entries = deque()
+        self.titles = 0
+
+    def _next_version(self):
+        now = int(time.time() * 1000)
+        return now if self.version is None else max(now, self.version + 1)
+
+    def observe(self, index):
+        """
+        Record the live catalog of a newly built index; returns its version
+        """
+        digests = {title: int(index.digests[row]) for title, row in index.title_index.items()}
+        with self.lock:
+            if self.digests is None:
+                self.version = self.oldest = self._next_version()
+            else:
+                previous = self.digests
+                added = [title for title in digests if title not in previous]
+                removed = [title for title in previous if title not in digests]
+                updated = [title for title, digest in digests.items()
+                           if title in previous and previous[title] != digest]
+                if added or updated or removed:
+                    self.version = self._next_version()
+                    self.entries.append((self.version, added, updated, removed))
+                    self.titles += len(added) + len(updated) + len(removed)
+                    while self.entries and self.titles > self.retained_titles:
+                        dropped = self.entries.popleft()
+                        self.oldest = dropped[0]
+                        self.titles -= len(dropped[1]) + len(dropped[2]) + len(dropped[3])
+            self.digests = digests
+            return self.version
+
+    def since(self, version, upto):
+        """
+        Net changes from `version` to `upto` as {title: 'added' | 'updated' |
+        'removed'}, or None when the log no longer reaches back to `version`
+        """
+        with self.lock:
+            if version == upto:
+                return {}
+            if self.oldest is None or version < self.oldest or version > upto:
+                return None
+            changes = {}
+            for entry_version, added, updated, removed in self.entries:
+                if entry_version <= version:
+                    continue
+                if entry_version > upto:
+                    break
+                for title in added:
+                    # Removed and then re-added: the client still holds the old record
+                    changes[title] = 'updated' if changes.get(title) == 'removed' else 'added'
+                for title in updated:
+                    if changes.get(title) != 'added':
+                        changes[title] = 'updated'
+                for title in removed:
+                    # Added and removed again: the client never saw it
+                    if changes.get(title) == 'added':
+                        del changes[title]
+                    else:
+                        changes[title] = 'removed'
+            return changes
+
+    def stats(self):
+        with self.lock:
+            return {
+                'version': self.version,
+                'oldest': self.oldest,
+                'entries': len(self.entries),
+                'retained_titles': self.titles,
+                'max_retained_titles': self.retained_titles,
+            }
@@ -0,0 +1,255 @@
+"""
+Color-palette search over the color histograms stored in the visual vectors
+
+Every visual vector ends with the trailer's color histogram: 32 bins for
+each of the blue, green and red channels (the pipeline's
+extract_full_visuals histograms OpenCV's BGR frames), averaged over the
+sampled frames and L2-normalized. Palette search compares a query
+histogram, built from a few colors or from a reference image, with them by
+histogram intersection or chi-square (as a similarity: 1 minus the
+chi-square distance), both 1 for identical color distributions.
+
+SegmentPalette copies the histograms out of the visual matrix once per
+loaded segment into a contiguous (rows, 96) float32 matrix, each channel
+renormalized to sum to 1, and quantizes them to 16 coarse bins per channel
+as uint8 codes, 48 bytes a row. A search intersects the query's codes with
+every row's, an eighth of the bytes the histograms take, and scores only
+the PALETTE_CANDIDATES best rows exactly.
+
+accuracy='exact' scores every row instead. The rounded-up codes do bound
+the exact scores, but on the synthetic catalogs the rows whose bound still
+reached the k-th best score cost more to gather and rescore than a scan.
+"""
+
+import io
+
+import numpy as np
+
+from query_encoder import CLIP_DIMENSION
+from scoring import MODALITIES, top_k
+
+CHANNELS = ('blue', 'green', 'red')
+HISTOGRAM_BINS = 32
+HISTOGRAM_WIDTH = len(CHANNELS) * HISTOGRAM_BINS
+# Coarse bins per channel for the pre-filter, and the fine bins each one sums
+COARSE_BINS = 16
+COARSE_WIDTH = HISTOGRAM_BINS // COARSE_BINS
+CODE_SCALE = 255
+METRICS = ('intersection', 'chi2')
+# Rows the coarse pass keeps for exact scoring (recall@10 about 0.99 on the synthetic 200k catalog)
+PALETTE_CANDIDATES = 4096
+# Gaussian spread, in bins, of a query color over its neighbours; trailers average many frames
+COLOR_SPREAD = 1.5
+# Longest side a reference image is reduced to before counting its pixels
+IMAGE_SIDE = 256
+# Rows copied per step when building the histogram matrix
+BUILD_BLOCK = 65536
+# Rows scored per step, so temporaries stay in cache
+SCORE_BLOCK = 8192
+
+
+class SegmentPalette:
+    """
+    Per-channel normalized color histograms of one segment's rows and their
+    coarse codes
+    """
+
+    def __init__(self, visual):
+        rows = len(visual)
+        self.histograms = np.zeros((rows, HISTOGRAM_WIDTH), dtype=np.float32)
+        self.codes = np.zeros((rows, len(CHANNELS) * COARSE_BINS), dtype=np.uint8)
+        # In blocks, so a memory-mapped visual matrix is read once without a full copy
+        for start in range(0, rows, BUILD_BLOCK):
+            block = np.asarray(visual[start:start + BUILD_BLOCK, -HISTOGRAM_WIDTH:], dtype=np.float32)
+            histograms = normalize_channels(block)
+            self.histograms[start:start + len(block)] = histograms.reshape(len(block), -1)
+            self.codes[start:start + len(block)] = coarse_codes(histograms)
+        # Rows without a histogram (no trailer frames) never match
+        self.present = self.histograms.any(axis=1)
+        if visual.shape[1] < CLIP_DIMENSION + HISTOGRAM_WIDTH:
+            self.present[:] = False
+
+    def __len__(self):
+        return len(self.histograms)
+
+
+def normalize_channels(histograms):
+    """
+    (rows, 96) histograms -> (rows, 3, 32), each channel summing to 1 (or all 0)
+    """
+    histograms = np.maximum(np.asarray(histograms, dtype=np.float32).reshape(-1, len(CHANNELS), HISTOGRAM_BINS), 0)
+    sums = histograms.sum(axis=2, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(sums > 0, histograms / sums, 0).astype(np.float32)
+
+
+def coarse_codes(histograms):
+    """
+    (rows, 3, 32) normalized histograms -> (rows, 24) uint8 coarse bins,
+    rounded up so they never fall below the histograms they summarize
+    """
+    coarse = histograms.reshape(len(histograms), len(CHANNELS), COARSE_BINS, COARSE_WIDTH).sum(axis=3)
+    # The margin covers float rounding in the sums
+    codes = np.ceil(coarse.reshape(len(histograms), -1) * CODE_SCALE + 1e-3)
+    return np.minimum(codes, CODE_SCALE).astype(np.uint8)
+
+
+class PaletteQuery:
+    """
+    A query histogram ready to score: (3, 32) channels summing to 1
+    """
+
+    def __init__(self, histogram):
+        histogram = normalize_channels(histogram)[0]
+        if not histogram.any():
+            raise ValueError("The palette has no colors")
+        self.histogram = histogram.reshape(-1)
+        self.codes = coarse_codes(histogram[None])[0]
+        # Bins the query leaves empty score 0 under both metrics
+        self.columns = np.flatnonzero(self.histogram)
+        if len(self.columns) == len(self.histogram):
+            self.columns = None
+
+    def coarse_scores(self, codes):
+        """
+        Intersections of the query's coarse codes with rows of `codes`, in code units
+        """
+        # 48 uint8 minima never overflow uint16
+        return np.minimum(codes, self.codes).sum(axis=1, dtype=np.uint16)
+
+    def scores(self, histograms, metric):
+        """
+        Exact scores in [0, 1] (1: identical color distributions) of (rows, 96) histograms
+        """
+        query = self.histogram if self.columns is None else self.histogram[self.columns]
+        scores = np.empty(len(histograms), dtype=np.float64)
+        for start in range(0, len(histograms), SCORE_BLOCK):
+            block = histograms[start:start + SCORE_BLOCK]
+            if self.columns is not None:
+                block = block[:, self.columns]
+            if metric == 'intersection':
+                similarity = np.minimum(block, query)
+            else:
+                # The query's bins are all > 0 here, so no division by zero
+                similarity = 2 * block * query / (block + query)
+            scores[start:start + len(block)] = similarity.sum(axis=1)
+        return scores / len(CHANNELS)
+
+
+def parse_color(value):
+    """
+    '#ff8800', 'ff8800' or 'f80' -> (red, green, blue)
+    """
+    digits = value.strip().lstrip('#')
+    if len(digits) == 3:
+        digits = ''.join(c * 2 for c in digits)
+    try:
+        if len(digits) != 6:
+            raise ValueError
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        raise ValueError(f"Invalid color '{value}' (use hex like #ff8800)") from None
+
+
+def parse_palette(value):
+    """
+    colors= parameter -> [((red, green, blue), weight)]: comma-separated hex
+    colors, each optionally weighted with :weight (default 1). Raises
+    ValueError on malformed colors or weights.
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list):
+        raise ValueError("colors must be a comma-separated string or a list")
+    palette = []
+    for item in value:
+        if isinstance(item, dict):
+            color, weight = item.get('color', ''), item.get('weight', 1)
+        else:
+            color, _, weight = str(item).partition(':')
+            if not color.strip():
+                continue
+        try:
+            weight = float(1 if weight in ('', None) else weight)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid weight {weight!r} for color '{color}'") from None
+        if not weight >= 0:
+            raise ValueError(f"Color weights must be >= 0, got {weight}")
+        palette.append((parse_color(str(color)), weight))
+    if not palette:
+        raise ValueError("colors needs at least one hex color, e.g. colors=1b2a49,e0a458:0.3")
+    return palette
+
+
+def color_histogram(palette, spread=COLOR_SPREAD):
+    """
+    Query histogram of weighted colors, each spread over neighbouring bins
+    the way a graded trailer's pixels spread around its palette
+    """
+    centres = np.arange(HISTOGRAM_BINS)
+    histogram = np.zeros((len(CHANNELS), HISTOGRAM_BINS), dtype=np.float64)
+    for (red, green, blue), weight in palette:
+        for channel, value in enumerate((blue, green, red)):
+            centre = (value + 0.5) * HISTOGRAM_BINS / 256 - 0.5
+            kernel = np.exp(-0.5 * ((centres - centre) / spread) ** 2)
+            histogram[channel] += weight * kernel / kernel.sum()
+    return PaletteQuery(histogram)
+
+
+def pixel_histogram(pixels):
+    """
+    Query histogram of (..., 3) uint8 RGB pixels, binned like the pipeline's frames
+    """
+    pixels = np.asarray(pixels, dtype=np.uint8).reshape(-1, 3)
+    if not len(pixels):
+        raise ValueError("The image has no pixels")
+    bins = pixels >> 3  # 256 levels / 32 bins
+    # Channels in BGR order, like the stored histograms
+    return PaletteQuery(np.stack([np.bincount(bins[:, channel], minlength=HISTOGRAM_BINS)
+                                  for channel in (2, 1, 0)]).astype(np.float64))
+
+
+def image_histogram(data):
+    """
+    Query histogram of an encoded reference image (anything Pillow reads).
+    Raises ImportError without Pillow and ValueError for unreadable images.
+    """
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEGs decode straight at a fraction of their size
+        image.draft('RGB', (IMAGE_SIDE, IMAGE_SIDE))
+        image = image.convert('RGB')
+    except Exception as e:
+        raise ValueError(f"Could not read the image: {e}") from None
+    image.thumbnail((IMAGE_SIDE, IMAGE_SIDE))
+    return pixel_histogram(np.asarray(image))
+
+
+def palette_rows(index, query, k, metric='intersection', mask=None, accuracy='approximate',
+                 candidates=PALETTE_CANDIDATES):
+    """
+    The k rows whose color histograms score best against a PaletteQuery,
+    restricted to `mask` (default: live rows). Returns (rows, scores).
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}' (choose from {', '.join(METRICS)})")
+    palettes = index.palettes
+    eligible = np.concatenate([palette.present for palette in palettes]) & index.present[:, MODALITIES.index('visual')]
+    if mask is not None:
+        eligible &= mask
+    elif index.live is not None:
+        eligible &= index.live
+
+    if accuracy == 'exact':
+        scores = np.concatenate([query.scores(palette.histograms, metric) for palette in palettes])
+        rows = top_k(scores, k, eligible)
+        return rows, scores[rows]
+
+    coarse = np.concatenate([query.coarse_scores(palette.codes) for palette in palettes])
+    # In row order, so equal scores rank like a scan over the whole catalog
+    shortlist = np.sort(top_k(coarse, max(candidates, k), eligible))
+    scores = query.scores(index.palette_histograms(shortlist), metric)
+    picked = top_k(scores, k)
+    return shortlist[picked], scores[picked]
@@ -50,6 +50,9 @@ npm install
 # Build React app
 npm run build
 
+# Pre-render the read-only API (movies, analysis) into the build
+python static_api.py --out dist/static-api
+
 # Create systemd service for the Python backend
 sudo tee /etc/systemd/system/movie-recommender.service > /dev/null <<EOF
 [Unit]
@@ -100,6 +103,13 @@ server {
         add_header 'Access-Control-Allow-Headers' 'Origin, Content-Type, Accept, Authorization' always;
     }
 
+    # Pre-rendered read-only API, served from the .gz files static_api.py writes
+    location /static-api/ {
+        root /var/www/movie-recommender/dist;
+        gzip_static on;
+        add_header Cache-Control "public, max-age=300";
+    }
+
     # Handle static assets
     location /static/ {
         root /var/www/movie-recommender;
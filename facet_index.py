@@ -0,0 +1,129 @@
+"""
+Facet embeddings: each section of a movie's Gemini analysis embedded on its own
+
+The narrative vector embeds the whole analysis, so a query about the
+soundtrack competes with everything else the text says about the plot,
+visuals and mood. Facets keep one all-MiniLM-L6-v2 vector per section
+(movie_analysis.FACETS) in a (N, 4, 384) facets.npy next to the snapshot's
+other matrices, and /api/search?facet= scores queries against the
+sections it names, taking each movie's best one (max-sim).
+
+Sections are encoded many at a time, shortest first so each batch pads to
+similar lengths, which keeps building them close to the cost of encoding
+the whole documents once. Movies without a section get a zero vector,
+which never matches.
+
+    python facet_index.py build
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from movie_analysis import FACETS, analysis_sections
+from serving_snapshot import FACET_FILE, facet_manifest, load_snapshot, open_facet_writer
+
+# Documents whose sections go to the encoder in one call
+DEFAULT_BATCH_DOCUMENTS = 64
+
+
+def encode_facets(encoder, documents, out=None, batch_documents=DEFAULT_BATCH_DOCUMENTS):
+    """
+    (len(documents), len(FACETS), dim) section embeddings, written into
+    `out` when given (e.g. a memory-mapped facets.npy)
+    """
+    if out is None:
+        out = np.zeros((len(documents), len(FACETS), facet_dimension(encoder)), dtype=np.float32)
+    for start in range(0, len(documents), batch_documents):
+        chunk = documents[start:start + batch_documents]
+        positions, texts = [], []
+        for offset, document in enumerate(chunk):
+            sections = analysis_sections(document)
+            for column, key in enumerate(FACETS):
+                if sections.get(key):
+                    positions.append((offset, column))
+                    texts.append(sections[key])
+
+        block = np.zeros((len(chunk),) + out.shape[1:], dtype=np.float32)
+        if texts:
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            vectors = encoder.encode_batch([texts[i] for i in order])
+            for vector, i in zip(vectors, order):
+                block[positions[i]] = vector
+        out[start:start + len(chunk)] = block
+    return out
+
+
+def facet_dimension(encoder):
+    return int(encoder.encode_batch(['dimension']).shape[1])
+
+
+def build_facets(path, encoder, force=False, batch_documents=DEFAULT_BATCH_DOCUMENTS):
+    """
+    Add facets.npy to the snapshot (or delta segment) directory at `path`.
+    Returns the number of rows encoded, 0 when it already had them.
+    """
+    snapshot = load_snapshot(path)
+    manifest = snapshot['manifest']
+    if 'facets' in snapshot and not force:
+        return 0
+
+    documents = snapshot['documents']
+    out = open_facet_writer(path, len(documents), facet_dimension(encoder))
+    encode_facets(encoder, documents, out, batch_documents)
+    out.flush()
+
+    # The manifest goes last, through a rename, so the facets appear all at once
+    manifest['facets'] = facet_manifest(out)
+    target = os.path.join(path, 'manifest.json')
+    with open(target + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(target + '.tmp', target)
+    return len(documents)
+
+
+def build_all(snapshot_path, encoder, force=False, batch_documents=DEFAULT_BATCH_DOCUMENTS):
+    """
+    Facets for the serving snapshot base and every delta segment logged on
+    top of it. Returns the number of rows encoded.
+    """
+    from index_segments import _locked, read_log, segment_path, write_log
+
+    # Hold off compaction, which would replace the base and drop the deltas
+    with _locked(snapshot_path, '.compact.lock'):
+        rows = build_facets(snapshot_path, encoder, force, batch_documents)
+        with _locked(snapshot_path):
+            log = read_log(snapshot_path)
+            base_seq = load_snapshot(snapshot_path)['manifest'].get('segment_seq', 0)
+            deltas = sum(build_facets(segment_path(snapshot_path, entry['seq']), encoder, force, batch_documents)
+                         for entry in log['segments'] if entry['seq'] > base_seq)
+            if deltas:
+                # Delta manifests are not watched; rewriting the log tells running servers to reload
+                write_log(snapshot_path, log)
+    return rows + deltas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Embed each Gemini analysis section for /api/search?facet=")
+    parser.add_argument('--snapshot', default=os.environ.get('SERVING_SNAPSHOT_PATH', 'Data/serving_snapshot'))
+    parser.add_argument('--encoder', default=os.environ.get('QUERY_ENCODER', 'auto'),
+                        help="onnx, sentence-transformers or auto (see query_encoder.py)")
+    parser.add_argument('--encoder-path', default=os.environ.get('QUERY_ENCODER_PATH', 'Data/query_encoder'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build')
+    build.add_argument('--force', action='store_true', help="re-encode segments that already have facets")
+    build.add_argument('--batch', type=int, default=DEFAULT_BATCH_DOCUMENTS, help="documents per encoder call")
+    args = parser.parse_args()
+
+    from query_encoder import load_query_encoder
+
+    encoder = load_query_encoder(args.encoder, args.encoder_path)
+    if encoder is None:
+        raise SystemExit("No query encoder available; install sentence-transformers or export one to "
+                         f"{args.encoder_path}")
+    start = time.time()
+    rows = build_all(args.snapshot, encoder, args.force, args.batch)
+    print(f"✓ Encoded {len(FACETS)} facets for {rows} movies into {FACET_FILE} files in {time.time() - start:.1f}s")
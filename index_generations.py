@@ -0,0 +1,213 @@
+"""
+Hot-swappable serving index generations
+
+Everything the scoring routes read (embedding matrices, title index, metadata
+catalog, lattice, neighbour table, planner cache, trailer links) is bundled
+into one immutable Generation. Picking up newly ingested trailers means
+building the next generation on a background thread while the current one
+keeps serving, then swapping a single reference:
+
+  - every request pins the generation current when it started (acquire /
+    release), so in-flight requests finish on the data they began with
+  - a swapped-out generation is reclaimed as soon as its last request
+    releases it
+  - the loader only builds once earlier retired generations are reclaimed,
+    so at most two generations are ever resident, plus the one being built
+
+Reloads are triggered explicitly (reload()) or by watch(), which polls the
+on-disk sources' fingerprint.
+"""
+
+import threading
+import time
+
+# How long a reload waits for requests pinned to a retired generation
+DRAIN_TIMEOUT = 60.0
+# Builds attempted while the sources keep changing underneath (an ingest still writing)
+LOAD_ATTEMPTS = 3
+
+
+class Generation:
+    def __init__(self, index, lattice=None, table=None, planner=None, movies=None, fingerprint=None,
+                 catalog_version=None):
+        self.number = None
+        self.index = index
+        self.lattice = lattice
+        self.table = table
+        self.planner = planner
+        self.movies = movies or {}
+        self.fingerprint = fingerprint
+        self.catalog_version = catalog_version
+        self.loaded_at = None
+        self.build_seconds = None
+        self.refs = 0
+        self.retired = False
+
+    def describe(self):
+        return {
+            'generation': self.number,
+            'movies': len(self.index),
+            'catalog_version': self.catalog_version,
+            'source': self.index.source,
+            'lattice': self.lattice is not None,
+            'neighbour_table': self.table is not None,
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.loaded_at)),
+            'build_seconds': round(self.build_seconds, 3),
+            'in_flight': self.refs,
+        }
+
+    def reclaim(self):
+        # Nothing can reach this generation any more; drop the big arrays now
+        # rather than whenever the last stray reference to the object goes
+        self.index = self.lattice = self.table = self.planner = None
+        self.movies = {}
+
+
+class GenerationManager:
+    """
+    build(): returns the next Generation (raises on failure)
+    fingerprint(): a value that changes whenever the on-disk sources do
+    """
+
+    def __init__(self, build, fingerprint=None, drain_timeout=DRAIN_TIMEOUT):
+        self.build = build
+        self.fingerprint = fingerprint
+        self.drain_timeout = drain_timeout
+        self.cond = threading.Condition()
+        self.current = None
+        self.retired = []
+        self.number = 0
+        self.loading = False
+        self.last_error = None
+        self.reloads = 0
+        self.reclaimed = 0
+
+    def acquire(self):
+        """
+        Pin and return the current generation (None before the first load)
+        """
+        with self.cond:
+            generation = self.current
+            if generation is not None:
+                generation.refs += 1
+            return generation
+
+    def retain(self, generation):
+        """
+        An extra pin, for work that outlives the request (streamed responses)
+        """
+        with self.cond:
+            generation.refs += 1
+        return generation
+
+    def release(self, generation):
+        if generation is None:
+            return
+        with self.cond:
+            generation.refs -= 1
+            if generation.retired and generation.refs == 0:
+                self._reclaim(generation)
+
+    def _reclaim(self, generation):
+        self.retired.remove(generation)
+        generation.reclaim()
+        self.reclaimed += 1
+        self.cond.notify_all()
+
+    def _swap(self, generation):
+        with self.cond:
+            self.number += 1
+            generation.number = self.number
+            previous, self.current = self.current, generation
+            if previous is not None:
+                previous.retired = True
+                self.retired.append(previous)
+                if previous.refs == 0:
+                    self._reclaim(previous)
+        return previous
+
+    def load(self):
+        """
+        Build the next generation on this thread and switch to it. Returns the
+        new generation, or None when the build failed or earlier generations
+        did not drain in time (see last_error); the current one keeps serving.
+        """
+        with self.cond:
+            drained = self.cond.wait_for(lambda: not self.retired, timeout=self.drain_timeout)
+        if not drained:
+            self.last_error = f"{len(self.retired)} retired generation(s) still in use after {self.drain_timeout}s"
+            return None
+
+        start = time.perf_counter()
+        try:
+            for _ in range(LOAD_ATTEMPTS):
+                fingerprint = self.fingerprint() if self.fingerprint else None
+                generation = self.build()
+                # Sources rewritten during the build could have produced a torn generation
+                if fingerprint is None or self.fingerprint() == fingerprint:
+                    break
+            else:
+                raise RuntimeError(f"sources changed during each of {LOAD_ATTEMPTS} builds")
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            return None
+        generation.fingerprint = fingerprint
+        generation.build_seconds = time.perf_counter() - start
+        generation.loaded_at = time.time()
+        self.last_error = None
+        self._swap(generation)
+        return generation
+
+    def reload(self, wait=False):
+        """
+        Load the next generation in the background. Returns False when a
+        load is already running.
+        """
+        with self.cond:
+            if self.loading:
+                return False
+            self.loading = True
+            self.reloads += 1
+
+        def run():
+            try:
+                self.load()
+            finally:
+                with self.cond:
+                    self.loading = False
+
+        thread = threading.Thread(target=run, name='index-reload', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def changed(self):
+        current = self.current
+        return self.fingerprint is not None and (current is None or self.fingerprint() != current.fingerprint)
+
+    def watch(self, interval):
+        """
+        Poll the sources every `interval` seconds and reload when they change
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.changed():
+                        self.reload()
+                except Exception as e:
+                    self.last_error = f"{type(e).__name__}: {e}"
+
+        threading.Thread(target=run, name='index-watch', daemon=True).start()
+
+    def stats(self):
+        with self.cond:
+            return {
+                'current': self.current.describe() if self.current else None,
+                'retired': [{'generation': g.number, 'in_flight': g.refs} for g in self.retired],
+                'loading': self.loading,
+                'reloads': self.reloads,
+                'reclaimed': self.reclaimed,
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,461 @@
+"""
+Append-only delta segments, tombstones and compaction for the serving snapshot
+
+Re-exporting the whole catalog for every few trailers the ingest pipeline
+adds does not scale, so a serving snapshot is an immutable base plus small
+delta snapshots appended next to it:
+
+    serving_snapshot/
+        manifest.json ...        the base (serving_snapshot.py format)
+        segments/log.json        sequence numbers, live deltas and tombstones
+        segments/000007/ ...     one delta, same format as the base
+
+Every append and every deletion takes the next sequence number. A row is
+live unless a newer segment holds the same title (a re-ingest) or the
+title's tombstone is newer than the row's segment (a deletion). The base
+manifest's segment_seq says which sequence numbers it already contains, so
+anything at or below it in the log is ignored.
+
+Loaded segments are shared between index generations (index_generations.py)
+as long as their files are unchanged, so picking up a delta reads and
+normalizes only the delta. Compaction merges the base and every delta into
+a new base in a scratch directory and swaps its files in; appends and
+deletions logged meanwhile carry newer sequence numbers and survive it.
+
+    python index_segments.py sync      # append what changed in ChromaDB
+    python index_segments.py delete "Some Title"
+    python index_segments.py compact
+    python index_segments.py status
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from color_palette import SegmentPalette
+from keyword_signatures import SegmentKeywords
+from metadata_catalog import parse_columns
+from serving_snapshot import (
+    FACET_FILE,
+    MODALITIES,
+    SEGMENT_LOG,
+    SEGMENTS_DIR,
+    finish_snapshot,
+    load_snapshot,
+    open_facet_writer,
+    open_snapshot_writer,
+    write_snapshot,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single writer is assumed
+    fcntl = None
+
+LOG_FORMAT = 1
+# Delta rows (plus shadowed or deleted rows) that trigger a background compaction
+DEFAULT_COMPACT_ROWS = 5000
+# Rows copied per step while compacting; bounds memory for memory-mapped bases
+COPY_BLOCK = 8192
+SNAPSHOT_FILES = ['titles.json', 'documents.jsonl', 'present.npy'] + [f'{m}.npy' for m in MODALITIES]
+
+_segments = weakref.WeakValueDictionary()
+_segments_lock = threading.Lock()
+
+
+class Segment:
+    """
+    One immutable run of rows: titles, documents, embeddings and their norms.
+    A sharding coordinator loads its segments without `embeddings` (None):
+    the shards score, it only serves titles and metadata.
+    """
+
+    def __init__(self, titles, embeddings, documents, present, seq=0, manifest=None, facets=None):
+        self.titles = list(titles)
+        self.documents = documents
+        self.present = np.asarray(present, dtype=np.bool_)
+        if embeddings is None:
+            self.embeddings = self.squared_norms = self.norms = None
+        else:
+            self.embeddings = {m: np.ascontiguousarray(embeddings[m], dtype=np.float32) for m in MODALITIES}
+            self.squared_norms = {m: np.einsum('ij,ij->i', e, e) for m, e in self.embeddings.items()}
+            self.norms = {m: np.sqrt(sq) for m, sq in self.squared_norms.items()}
+        # Per-section embeddings (facet_index.py), (rows, facets, dim), when the snapshot has them
+        self.facets = facets
+        self.facet_norms = None if facets is None else np.sqrt(np.einsum('ijk,ijk->ij', facets, facets))
+        self.seq = seq
+        self.manifest = manifest or {}
+        self._metadata = None
+        self._keywords = None
+        self._palette = None
+
+    def __len__(self):
+        return len(self.titles)
+
+    @property
+    def keywords(self):
+        # Tokenized once per loaded segment (keyword_signatures.py); reloads reuse it like the segment
+        if self._keywords is None:
+            self._keywords = SegmentKeywords(self.documents)
+        return self._keywords
+
+    @property
+    def palette(self):
+        # Color histograms copied out of the visual vectors once per loaded segment (color_palette.py)
+        if self._palette is None:
+            self._palette = SegmentPalette(self.embeddings['visual'])
+        return self._palette
+
+    def metadata(self, enriched_rows, links=None):
+        """
+        parse_columns for this segment's titles, plus one hash per row of
+        everything /api/movies shows for it (catalog_changes.py compares
+        them), reused while the rows' enriched CSV values and trailer links
+        are unchanged
+        """
+        links = links or {}
+        # Rows share the CSV's column order, so their values identify them
+        rows = [hash((title, tuple(enriched_rows.get(title, {}).values()), links.get(title))) for title in self.titles]
+        key = hash(tuple(rows))
+        if self._metadata is None or self._metadata[0] != key:
+            digests = np.array([hash((row, document)) for row, document in zip(rows, self.documents)], dtype=np.int64)
+            self._metadata = (key, parse_columns(self.titles, enriched_rows, links), digests)
+        return self._metadata[1], self._metadata[2]
+
+
+def segment_path(path, seq):
+    return os.path.join(path, SEGMENTS_DIR, f'{seq:06d}')
+
+
+def open_segment(path, vectors=True):
+    """
+    Load a snapshot directory as a Segment, reusing the one already loaded
+    while its manifest is unchanged. Without `vectors` the matrices are
+    never read (see Segment).
+    """
+    manifest_path = os.path.join(path, 'manifest.json')
+    before = os.stat(manifest_path)
+    key = (os.path.realpath(path), before.st_ino, before.st_mtime_ns, vectors)
+    with _segments_lock:
+        segment = _segments.get(key)
+    if segment is not None:
+        return segment
+
+    snapshot = load_snapshot(path)
+    manifest = snapshot['manifest']
+    segment = Segment(snapshot['titles'], snapshot if vectors else None, snapshot['documents'], snapshot['present'],
+                      manifest.get('segment_seq', 0), manifest, snapshot.get('facets') if vectors else None)
+    after = os.stat(manifest_path)
+    # Only cache what was read from one unchanged snapshot
+    if (after.st_ino, after.st_mtime_ns) == key[1:3]:
+        with _segments_lock:
+            _segments[key] = segment
+    return segment
+
+
+def read_log(path):
+    try:
+        with open(os.path.join(path, SEGMENTS_DIR, SEGMENT_LOG), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            base_seq = json.load(f).get('segment_seq', 0)
+        return {'format': LOG_FORMAT, 'next_seq': base_seq + 1, 'segments': [], 'tombstones': {}}
+
+
+def write_log(path, log):
+    target = os.path.join(path, SEGMENTS_DIR, SEGMENT_LOG)
+    with open(target + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(log, f, indent=2, ensure_ascii=False)
+    os.replace(target + '.tmp', target)
+
+
+@contextlib.contextmanager
+def _locked(path, name='.lock'):
+    directory = os.path.join(path, SEGMENTS_DIR)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), 'w') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def live_mask(segments, tombstones):
+    """
+    Boolean mask over the rows of `segments` (oldest first), or None when
+    every row is live
+    """
+    if len(segments) == 1 and not tombstones:
+        return None
+    newest = {}
+    for segment in segments:
+        for title in segment.titles:
+            newest[title] = segment.seq
+    live = np.ones(sum(len(segment) for segment in segments), dtype=np.bool_)
+    row = 0
+    for segment in segments:
+        for title in segment.titles:
+            if newest[title] > segment.seq or tombstones.get(title, 0) > segment.seq:
+                live[row] = False
+            row += 1
+    return None if live.all() else live
+
+
+def load_segments(path, log=None, vectors=True):
+    """
+    The base and every delta logged after it, oldest first, with their live mask
+    """
+    base = open_segment(path, vectors)
+    log = log or read_log(path)
+    segments = [base]
+    for entry in log['segments']:
+        if entry['seq'] > base.seq:
+            segment = open_segment(segment_path(path, entry['seq']), vectors)
+            if segment.manifest['dims'] != base.manifest['dims']:
+                raise ValueError(f"Segment {entry['seq']} has dimensions {segment.manifest['dims']}, "
+                                 f"the base has {base.manifest['dims']}")
+            segments.append(segment)
+    tombstones = {title: seq for title, seq in log['tombstones'].items() if seq > base.seq}
+    return segments, live_mask(segments, tombstones)
+
+
+def append_segment(path, titles, embeddings, documents, present=None, facets=None):
+    """
+    Log newly ingested (or re-ingested) movies, and their section
+    embeddings when given, as a delta segment. Returns its sequence number.
+    """
+    with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+        dims = json.load(f)['dims']
+    for modality in MODALITIES:
+        if embeddings[modality].shape[1] != dims[modality]:
+            raise ValueError(f"{modality} vectors have {embeddings[modality].shape[1]} dimensions, "
+                             f"the base has {dims[modality]}")
+
+    with _locked(path):
+        log = read_log(path)
+        seq = log['next_seq']
+        write_snapshot(segment_path(path, seq), titles, embeddings, documents, present,
+                       source='append', segment_seq=seq, facets=facets)
+        log['next_seq'] = seq + 1
+        log['segments'].append({'seq': seq, 'count': len(titles), 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')})
+        write_log(path, log)
+    return seq
+
+
+def delete_titles(path, titles):
+    """
+    Tombstone every row currently holding these titles. Returns the
+    tombstones' sequence number.
+    """
+    with _locked(path):
+        log = read_log(path)
+        seq = log['next_seq']
+        for title in titles:
+            log['tombstones'][title] = seq
+        log['next_seq'] = seq + 1
+        write_log(path, log)
+    return seq
+
+
+def compact(path):
+    """
+    Merge the base and its deltas into a new base, dropping dead rows.
+    Returns the new base manifest, or None when there was nothing to merge.
+    """
+    with _locked(path, '.compact.lock'):
+        with _locked(path):
+            log = read_log(path)
+        segments, live = load_segments(path, log)
+        if len(segments) == 1 and live is None:
+            return None
+        seq = log['next_seq'] - 1
+        base = segments[0]
+
+        offsets = np.cumsum([0] + [len(segment) for segment in segments])
+        keeps = [np.arange(len(segment)) if live is None else np.flatnonzero(live[offsets[i]:offsets[i + 1]])
+                 for i, segment in enumerate(segments)]
+        scratch = os.path.join(path, SEGMENTS_DIR, 'compacting')
+        shutil.rmtree(scratch, ignore_errors=True)
+        arrays = open_snapshot_writer(scratch, sum(len(keep) for keep in keeps), base.manifest['dims'])
+        # Facets survive compaction only if every segment has them
+        if all(segment.facets is not None for segment in segments):
+            arrays['facets'] = open_facet_writer(scratch, len(arrays['present']), base.facets.shape[2])
+
+        titles, documents, out = [], [], 0
+        for segment, keep in zip(segments, keeps):
+            for start in range(0, len(keep), COPY_BLOCK):
+                block = keep[start:start + COPY_BLOCK]
+                for modality in MODALITIES:
+                    arrays[modality][out:out + len(block)] = segment.embeddings[modality][block]
+                arrays['present'][out:out + len(block)] = segment.present[block]
+                if 'facets' in arrays:
+                    arrays['facets'][out:out + len(block)] = segment.facets[block]
+                out += len(block)
+            titles.extend(segment.titles[row] for row in keep)
+            documents.extend(segment.documents[row] for row in keep)
+        manifest = finish_snapshot(scratch, titles, documents, arrays, base.manifest.get('source', 'unknown'), seq)
+        del arrays, segments
+
+        with _locked(path):
+            # Replacing (not rewriting) the files leaves the old base intact for
+            # generations still memory-mapping it; the manifest goes last
+            for name in SNAPSHOT_FILES + [FACET_FILE, 'manifest.json']:
+                if name != FACET_FILE or os.path.exists(os.path.join(scratch, name)):
+                    os.replace(os.path.join(scratch, name), os.path.join(path, name))
+            log = read_log(path)
+            merged = [entry['seq'] for entry in log['segments'] if entry['seq'] <= seq]
+            log['segments'] = [entry for entry in log['segments'] if entry['seq'] > seq]
+            log['tombstones'] = {title: s for title, s in log['tombstones'].items() if s > seq}
+            write_log(path, log)
+        for merged_seq in merged:
+            shutil.rmtree(segment_path(path, merged_seq), ignore_errors=True)
+        shutil.rmtree(scratch, ignore_errors=True)
+    return manifest
+
+
+class Compactor:
+    """
+    Compacts in the background once an index carries `threshold` delta,
+    shadowed or deleted rows; on_done() runs after each compaction
+    """
+
+    def __init__(self, path, threshold=DEFAULT_COMPACT_ROWS, on_done=None):
+        self.path = path
+        self.threshold = threshold
+        self.on_done = on_done
+        self.lock = threading.Lock()
+        self.running = False
+        self.compactions = 0
+        self.last_seconds = None
+        self.last_error = None
+
+    def pending_rows(self, index):
+        dead = 0 if index.live is None else len(index) - int(index.live.sum())
+        return index.delta_rows + dead
+
+    def check(self, index):
+        """
+        Start a compaction if `index` crossed the threshold. Returns whether one started.
+        """
+        if not self.threshold or self.pending_rows(index) < self.threshold:
+            return False
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+        threading.Thread(target=self._run, name='index-compact', daemon=True).start()
+        return True
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            compact(self.path)
+            self.compactions += 1
+            self.last_seconds = time.perf_counter() - start
+            self.last_error = None
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+        finally:
+            with self.lock:
+                self.running = False
+        if self.on_done and self.last_error is None:
+            self.on_done()
+
+    def stats(self):
+        return {
+            'threshold': self.threshold,
+            'running': self.running,
+            'compactions': self.compactions,
+            'last_seconds': round(self.last_seconds, 3) if self.last_seconds is not None else None,
+            'last_error': self.last_error,
+        }
+
+
+def changed_rows(index, titles, embeddings, documents, present):
+    """
+    Rows of an exported catalog that are new or differ from the live index,
+    and the live titles the export no longer has
+    """
+    changed = []
+    for row, title in enumerate(titles):
+        current = index.row(title)
+        if (current is None or index.documents[current] != documents[row]
+                or not np.array_equal(index.present[current], present[row])
+                or any(not np.array_equal(index.vector(m, current), embeddings[m][row]) for m in MODALITIES)):
+            changed.append(row)
+    exported = set(titles)
+    removed = sorted({index.titles[row] for row in index.live_rows()} - exported)
+    return np.array(changed, dtype=np.int64), removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Delta segments on top of the serving snapshot")
+    parser.add_argument('--db', default=os.environ.get('CHROMA_PERSIST_DIRECTORY', 'Data/trailer_db'))
+    parser.add_argument('--snapshot', default=os.environ.get('SERVING_SNAPSHOT_PATH', 'Data/serving_snapshot'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('sync', help="append new or re-ingested movies and tombstone removed ones")
+    delete = commands.add_parser('delete', help="tombstone titles")
+    delete.add_argument('titles', nargs='+')
+    commands.add_parser('compact', help="merge every delta into a new base now")
+    commands.add_parser('status')
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.command == 'sync':
+        from serving_index import load_serving_index
+        from serving_snapshot import read_chroma_catalog
+
+        index = load_serving_index(snapshot_path=args.snapshot)
+        titles, embeddings, documents, present = read_chroma_catalog(args.db)
+        rows, removed = changed_rows(index, titles, embeddings, documents, present)
+        if len(rows):
+            facets = None
+            if index.segments[0].facets is not None:
+                # Keep /api/search?facet= covering the new movies (see facet_index.py)
+                from facet_index import encode_facets
+                from query_encoder import load_query_encoder
+
+                encoder = load_query_encoder(os.environ.get('QUERY_ENCODER', 'auto'),
+                                             os.environ.get('QUERY_ENCODER_PATH', 'Data/query_encoder'))
+                if encoder is not None:
+                    facets = encode_facets(encoder, [documents[row] for row in rows])
+                else:
+                    print("⚠ No query encoder available; the appended movies get no facets until "
+                          "`python facet_index.py build`")
+            seq = append_segment(args.snapshot, [titles[row] for row in rows],
+                                 {m: embeddings[m][rows] for m in MODALITIES},
+                                 [documents[row] for row in rows], present[rows], facets)
+            print(f"✓ Appended {len(rows)} movies as segment {seq}")
+        if removed:
+            delete_titles(args.snapshot, removed)
+            print(f"✓ Tombstoned {len(removed)} movies no longer in {args.db}")
+        if not len(rows) and not removed:
+            print("✓ Serving snapshot already matches the ingest store")
+    elif args.command == 'delete':
+        seq = delete_titles(args.snapshot, args.titles)
+        print(f"✓ Tombstoned {len(args.titles)} titles at {seq}")
+    elif args.command == 'compact':
+        manifest = compact(args.snapshot)
+        if manifest is None:
+            print("✓ Nothing to compact")
+        else:
+            print(f"✓ Compacted into a base of {manifest['count']} movies in {time.time() - start:.1f}s")
+    else:
+        log = read_log(args.snapshot)
+        segments, live = load_segments(args.snapshot, log)
+        rows = sum(len(segment) for segment in segments)
+        print(json.dumps({
+            'base_rows': len(segments[0]),
+            'base_seq': segments[0].seq,
+            'segments': [{'seq': segment.seq, 'rows': len(segment)} for segment in segments[1:]],
+            'tombstones': len(log['tombstones']),
+            'live_rows': rows if live is None else int(live.sum()),
+            'next_seq': log['next_seq'],
+        }, indent=2))
@@ -0,0 +1,310 @@
+"""
+Keyword signatures: what two movies' analyses have in common, precomputed
+
+Recommendation tags name the themes a recommended movie shares with the
+source ("Shared: heist, neon, synth score"). Comparing the two analyses as
+text would tokenize both documents for every result; instead each section
+of each analysis (movie_analysis.FACETS) is tokenized once, when its
+segment is loaded, into:
+
+    terms    its words minus stopwords, plus adjacent pairs of them, as
+             sorted 63-bit term ids (a hash of the term, so every process
+             and shard agrees on them) with their counts
+    top      its TOP_TERMS highest TF-IDF terms, the IDF taken per section
+             over every row of the snapshot
+    minhash  MINHASH_PERMUTATIONS minimums of hashed term ids; the share
+             of them two sections agree on estimates their Jaccard overlap
+
+Explaining a result list then costs a lookup of each result's top terms in
+the source's terms and a comparison of small signatures, vectorised over
+the whole list.
+"""
+
+import hashlib
+import re
+from collections import Counter
+
+import numpy as np
+
+from movie_analysis import FACETS, analysis_sections
+
+# Terms kept per movie and section for explanations
+TOP_TERMS = 8
+MINHASH_PERMUTATIONS = 32
+# Shared terms named in a tag
+SHARED_TERMS = 3
+# Signature value of a section without terms
+EMPTY_SIGNATURE = np.uint32(0xFFFFFFFF)
+# Groups (movie sections) hashed per MinHash block; bounds the (permutations, terms) buffer
+MINHASH_BLOCK = 8192
+
+STOPWORDS = frozenset("""
+    a about above after again against all also am an and any are around as at be because been before being
+    below between both but by can could did do does doing down during each even ever every few for from
+    further had has have having he her here hers him his how i if in into is it its itself just like
+    more most much my no nor not now of off on once one only or other our out over own same she should
+    so some such than that the their them then there these they this those through to too under until
+    up upon very was we were what when where which while who whom why will with within without would you
+    your goes gets make makes made feel feels feeling sense overall throughout trailer film movie
+""".split())
+
+_WORDS = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+# Pairs never span punctuation: "noir shadows, teal" pairs "noir shadows" only
+_PHRASES = re.compile(r"[,.;:!?()\[\]\n]")
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0x5EED)
+_MULTIPLIERS = _rng.integers(1, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_INCREMENTS = _rng.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def section_terms(text):
+    """
+    Terms of one analysis section, repeated as often as they occur
+    """
+    terms = []
+    for phrase in _PHRASES.split(text.lower()):
+        previous = None
+        for word in _WORDS.findall(phrase):
+            if len(word) < 3 or word in STOPWORDS:
+                previous = None
+                continue
+            terms.append(word)
+            if previous:
+                terms.append(f'{previous} {word}')
+            previous = word
+    return terms
+
+
+def term_id(term):
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little') >> 1
+
+
+class SegmentKeywords:
+    """
+    Term ids, counts and MinHash signatures of every section of a segment's
+    documents. Group g is row g // len(FACETS), section g % len(FACETS).
+    """
+
+    def __init__(self, documents=None):
+        self.vocab = {}
+        if documents is None:
+            return
+        ids, counts, sizes = [], [], []
+        ids_of = {}
+        for document in documents:
+            sections = analysis_sections(document)
+            for facet in FACETS:
+                terms = Counter(section_terms(sections.get(facet, '')))
+                for term, count in terms.items():
+                    if term not in ids_of:
+                        ids_of[term] = term_id(term)
+                        self.vocab[ids_of[term]] = term
+                    ids.append(ids_of[term])
+                    counts.append(count)
+                sizes.append(len(terms))
+
+        self.offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+        groups = np.repeat(np.arange(len(sizes)), sizes)
+        ids = np.array(ids, dtype=np.uint64)
+        order = np.lexsort((ids, groups))
+        self.ids = ids[order]
+        self.counts = np.array(counts, dtype=np.uint16)[order]
+        self.minhash = self._signatures()
+
+    def __len__(self):
+        return len(self.minhash)
+
+    def _signatures(self):
+        groups = len(self.offsets) - 1
+        signatures = np.full((groups, MINHASH_PERMUTATIONS), EMPTY_SIGNATURE, dtype=np.uint32)
+        hashed = self.ids % np.uint64(_PRIME)
+        for start in range(0, groups, MINHASH_BLOCK):
+            stop = min(start + MINHASH_BLOCK, groups)
+            first, last = self.offsets[start], self.offsets[stop]
+            if first == last:
+                continue
+            values = (_MULTIPLIERS[:, None] * hashed[None, first:last] + _INCREMENTS[:, None]) % np.uint64(_PRIME)
+            filled = np.flatnonzero(self.offsets[start + 1:stop + 1] > self.offsets[start:stop]) + start
+            signatures[filled] = np.minimum.reduceat(values, self.offsets[filled] - first, axis=1).T
+        return signatures.reshape(-1, len(FACETS), MINHASH_PERMUTATIONS)
+
+    @classmethod
+    def select(cls, parts, picks):
+        """
+        The rows `picks[i]` of each SegmentKeywords `parts[i]`, in that
+        order, as one (e.g. a shard's partition)
+        """
+        selected = cls()
+        ids, counts, sizes, signatures = [], [], [], []
+        for part, rows in zip(parts, picks):
+            groups = (np.asarray(rows, dtype=np.int64)[:, None] * len(FACETS) + np.arange(len(FACETS))).ravel()
+            starts, stops = part.offsets[groups], part.offsets[groups + 1]
+            lengths = stops - starts
+            within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            entries = np.repeat(starts, lengths) + within
+            ids.append(part.ids[entries])
+            counts.append(part.counts[entries])
+            sizes.append(lengths)
+            signatures.append(part.minhash[np.asarray(rows, dtype=np.int64)])
+            selected.vocab.update(part.vocab)
+        selected.ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.uint64)
+        selected.counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.uint16)
+        sizes = np.concatenate(sizes) if sizes else np.zeros(0, dtype=np.int64)
+        selected.offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+        selected.minhash = (np.concatenate(signatures) if signatures
+                            else np.zeros((0, len(FACETS), MINHASH_PERMUTATIONS), dtype=np.uint32))
+        return selected
+
+
+def section_idf(parts):
+    """
+    Per section, (sorted term ids, smoothed IDF) over the groups of every
+    SegmentKeywords in `parts`
+    """
+    idf = []
+    for column in range(len(FACETS)):
+        ids, documents = [], 0
+        for part in parts:
+            sizes = np.diff(part.offsets)
+            in_section = np.repeat(np.arange(len(sizes)) % len(FACETS) == column, sizes)
+            ids.append(part.ids[in_section])
+            documents += int((sizes[column::len(FACETS)] > 0).sum())
+        terms, frequency = np.unique(np.concatenate(ids) if ids else np.zeros(0, dtype=np.uint64),
+                                     return_counts=True)
+        idf.append((terms, (np.log((1.0 + documents) / (1.0 + frequency)) + 1.0).astype(np.float32)))
+    return idf
+
+
+class KeywordIndex:
+    """
+    Keyword signatures of a ServingIndex's rows, segment by segment, with TF-IDF
+    weights from `frequencies` (SegmentKeywords; by default the segments themselves)
+    """
+
+    def __init__(self, parts, frequencies=None):
+        self.parts = parts
+        self.offsets = np.cumsum([0] + [len(part) for part in parts])
+        self.idf = section_idf(parts if frequencies is None else frequencies)
+        self.vocab = {}
+        self.top_ids, self.top_weights = [], []
+        for part in parts:
+            self.vocab.update(part.vocab)
+            top_ids, top_weights = self._top_terms(part)
+            self.top_ids.append(top_ids)
+            self.top_weights.append(top_weights)
+        # Term ids by how shared terms that score alike are named: pairs before
+        # the words they contain, then alphabetically
+        named = np.array(sorted(self.vocab, key=lambda i: (-self.vocab[i].count(' '), self.vocab[i])), dtype=np.uint64)
+        self._term_ranks = np.argsort(named)
+        self._term_ids = named[self._term_ranks]
+        self._term_words = {i: frozenset(term.split()) for i, term in self.vocab.items()}
+
+    def _idf(self, column, ids):
+        terms, idf = self.idf[column]
+        if not len(terms):
+            return np.ones(len(ids), dtype=np.float32)
+        found = np.searchsorted(terms, ids).clip(max=len(terms) - 1)
+        return np.where(terms[found] == ids, idf[found], np.float32(1.0))
+
+    def _weights(self, part):
+        # TF-IDF of every entry of `part`
+        sizes = np.diff(part.offsets)
+        columns = np.repeat(np.arange(len(sizes)) % len(FACETS), sizes)
+        weights = np.zeros(len(part.ids), dtype=np.float32)
+        for column in range(len(FACETS)):
+            picked = columns == column
+            weights[picked] = self._idf(column, part.ids[picked])
+        return weights * part.counts
+
+    def _top_terms(self, part):
+        groups = len(part.offsets) - 1
+        sizes = np.diff(part.offsets)
+        group_of = np.repeat(np.arange(groups), sizes)
+        weights = self._weights(part)
+        # Heaviest first within each group, ties by term id
+        order = np.lexsort((part.ids, -weights, group_of))
+        rank = np.arange(len(order)) - part.offsets[group_of[order]]
+        kept = order[rank < TOP_TERMS]
+        top_ids = np.zeros((groups, TOP_TERMS), dtype=np.uint64)
+        top_weights = np.zeros((groups, TOP_TERMS), dtype=np.float32)
+        top_ids[group_of[kept], rank[rank < TOP_TERMS]] = part.ids[kept]
+        top_weights[group_of[kept], rank[rank < TOP_TERMS]] = weights[kept]
+        shape = (groups // len(FACETS), len(FACETS), TOP_TERMS)
+        return top_ids.reshape(shape), top_weights.reshape(shape)
+
+    def _locate(self, row):
+        segment = int(np.searchsorted(self.offsets, row, side='right')) - 1
+        return segment, row - self.offsets[segment]
+
+    def source(self, row):
+        """
+        Everything shared_themes() needs about the movie being explained,
+        JSON-serializable so a shard can send it to the others
+        """
+        segment = int(np.searchsorted(self.offsets, row, side='right')) - 1
+        part, local = self.parts[segment], row - self.offsets[segment]
+        terms = []
+        for column in range(len(FACETS)):
+            group = local * len(FACETS) + column
+            start, stop = part.offsets[group], part.offsets[group + 1]
+            weights = self._idf(column, part.ids[start:stop]) * part.counts[start:stop]
+            terms.append({'ids': [int(i) for i in part.ids[start:stop]], 'weights': [float(w) for w in weights]})
+        return {'terms': terms, 'minhash': part.minhash[local].tolist()}
+
+    def shared_themes(self, source, rows, limit=SHARED_TERMS):
+        """
+        For each of `rows`, the terms of its top TF-IDF terms that the
+        source's analysis has too, by combined weight, and the MinHash
+        estimate of its closest section overlap with the source:
+        {'terms': [...], 'overlap': float}, or None when nothing is shared
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return []
+        owner = np.searchsorted(self.offsets, rows, side='right') - 1
+        top_ids = np.zeros((len(rows), len(FACETS), TOP_TERMS), dtype=np.uint64)
+        top_weights = np.zeros((len(rows), len(FACETS), TOP_TERMS), dtype=np.float32)
+        signatures = np.zeros((len(rows), len(FACETS), MINHASH_PERMUTATIONS), dtype=np.uint32)
+        for i, part in enumerate(self.parts):
+            picked = owner == i
+            if picked.any():
+                local = rows[picked] - self.offsets[i]
+                top_ids[picked] = self.top_ids[i][local]
+                top_weights[picked] = self.top_weights[i][local]
+                signatures[picked] = part.minhash[local]
+
+        scores = np.full(top_ids.shape, -np.inf, dtype=np.float32)
+        for column, section in enumerate(source['terms']):
+            ids = np.asarray(section['ids'], dtype=np.uint64)
+            if not len(ids):
+                continue
+            weights = np.asarray(section['weights'], dtype=np.float32)
+            found = np.searchsorted(ids, top_ids[:, column]).clip(max=len(ids) - 1)
+            shared = (ids[found] == top_ids[:, column]) & (top_weights[:, column] > 0)
+            scores[:, column][shared] = (top_weights[:, column] + weights[found])[shared]
+
+        reference = np.asarray(source['minhash'], dtype=np.uint32)
+        comparable = (signatures != EMPTY_SIGNATURE).any(axis=2) & (reference != EMPTY_SIGNATURE).any(axis=1)
+        overlaps = np.where(comparable, (signatures == reference).mean(axis=2), 0.0).max(axis=1)
+
+        # Every row's shared terms ranked at once; only the few named are visited in Python
+        scores, top_ids = scores.reshape(len(rows), -1), top_ids.reshape(len(rows), -1)
+        found = np.searchsorted(self._term_ids, top_ids).clip(max=max(len(self._term_ids) - 1, 0))
+        order = np.lexsort((self._term_ranks[found] if len(self._term_ids) else found, -scores), axis=-1)
+        ranked = np.take_along_axis(top_ids, order, axis=1).tolist()
+        shared = np.isfinite(scores).sum(axis=1).tolist()
+
+        themes = []
+        for candidates, count, overlap in zip(ranked, shared, overlaps.tolist()):
+            terms, words = [], set()
+            for term_id in candidates[:count]:
+                # "synth score" already says "synth"; keep each word once
+                term_words = self._term_words[term_id]
+                if words.isdisjoint(term_words):
+                    terms.append(self.vocab[term_id])
+                    words |= term_words
+                    if len(terms) == limit:
+                        break
+            themes.append({'terms': terms, 'overlap': round(overlap, 4)} if terms else None)
+        return themes
+
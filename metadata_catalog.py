@@ -0,0 +1,438 @@
+"""
+Columnar movie metadata catalog with filter indexes
+
+Metadata comes from the OMDb/IMDb enriched CSV (src/omdb_crawler.py and
+enrich_movies.py write `movie_trailers_enriched.csv`). Every column is an
+array aligned to the serving index's row order, so a filter evaluates to a
+boolean row mask that the scoring kernels apply before top-k selection.
+
+Indexes:
+  - bitmap indexes (packed bits) on genre, MPAA rating, release year and
+    IMDb rating bucket (floor of the rating)
+  - sorted indexes (argsort permutations) on imdb_rating, year and runtime
+    for range predicates
+  - presorted browse orders (title, year, imdb_rating, runtime in both
+    directions) so /api/movies can page through a sort in O(page size)
+"""
+
+import base64
+import csv
+import json
+import os
+import re
+
+import numpy as np
+
+MISSING = ('', 'N/A', 'nan', 'None')
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if value in MISSING else value
+
+
+def _parse_float(value):
+    value = _clean(value)
+    try:
+        return float(value.replace(',', '')) if value else None
+    except ValueError:
+        return None
+
+
+def _parse_year(value):
+    # OMDb years look like "2023", "2019–2022" or "2021–"
+    match = re.search(r'\d{4}', _clean(value) or '')
+    return int(match.group(0)) if match else None
+
+
+def _parse_runtime(value):
+    match = re.search(r'\d+', _clean(value) or '')
+    return int(match.group(0)) if match else None
+
+
+def load_enriched_rows(csv_path):
+    """
+    Read the enriched trailer CSV into {title: row}
+    """
+    rows = {}
+    if not csv_path or not os.path.exists(csv_path):
+        return rows
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            title = _clean(row.get('Movie Title'))
+            if title:
+                rows[title] = row
+    return rows
+
+
+class BitmapIndex:
+    """
+    Value -> packed bitmap of rows holding that value
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.bitmaps = {}
+
+    @classmethod
+    def build(cls, count, values_per_row):
+        index = cls(count)
+        rows_by_value = {}
+        for row, values in enumerate(values_per_row):
+            for value in values:
+                rows_by_value.setdefault(value, []).append(row)
+        for value, rows in rows_by_value.items():
+            bits = np.zeros(count, dtype=np.bool_)
+            bits[rows] = True
+            index.bitmaps[value] = np.packbits(bits)
+        return index
+
+    @classmethod
+    def from_column(cls, column):
+        """
+        One bitmap per whole number in a numeric column (NaN: no value),
+        truncating like int()
+        """
+        index = cls(len(column))
+        valid = ~np.isnan(column)
+        values = np.trunc(column[valid]).astype(np.int64)
+        rows = np.flatnonzero(valid)
+        for value in np.unique(values):
+            bits = np.zeros(len(column), dtype=np.bool_)
+            bits[rows[values == value]] = True
+            index.bitmaps[int(value)] = np.packbits(bits)
+        return index
+
+    def empty(self):
+        return np.zeros((self.count + 7) // 8, dtype=np.uint8)
+
+    def any_of(self, values):
+        """
+        Packed bitmap of rows matching at least one of `values`
+        """
+        result = self.empty()
+        for value in values:
+            bitmap = self.bitmaps.get(value)
+            if bitmap is not None:
+                np.bitwise_or(result, bitmap, out=result)
+        return result
+
+    def values(self):
+        return sorted(self.bitmaps)
+
+
+class SortedIndex:
+    """
+    Rows ordered by a numeric column (missing values excluded)
+    """
+
+    def __init__(self, column):
+        valid = np.flatnonzero(~np.isnan(column))
+        order = np.argsort(column[valid], kind='stable')
+        self.rows = valid[order]
+        self.values = column[self.rows]
+        self.count = len(column)
+
+    def range(self, low=None, high=None):
+        """
+        Packed bitmap of rows with low <= value <= high
+        """
+        start = 0 if low is None else np.searchsorted(self.values, low, side='left')
+        end = len(self.values) if high is None else np.searchsorted(self.values, high, side='right')
+        bits = np.zeros(self.count, dtype=np.bool_)
+        bits[self.rows[start:end]] = True
+        return np.packbits(bits)
+
+
+NUMERIC_COLUMNS = ('imdb_rating', 'year', 'runtime', 'imdb_votes')
+TEXT_COLUMNS = ('rated', 'genres', 'director', 'actors', 'language', 'country', 'poster', 'imdb_id', 'youtube_link')
+
+
+def parse_columns(titles, enriched_rows, links=None):
+    """
+    Parse the enriched CSV rows of `titles` into metadata columns: the
+    per-row (slow) half of building a catalog, which index_segments.py
+    caches per segment
+    """
+    links = links or {}
+    rows = [enriched_rows.get(title, {}) for title in titles]
+    return {
+        'imdb_rating': np.array([_parse_float(row.get('imdbRating')) for row in rows], dtype=np.float64),
+        'year': np.array([_parse_year(row.get('Year')) for row in rows], dtype=np.float64),
+        'runtime': np.array([_parse_runtime(row.get('Runtime')) for row in rows], dtype=np.float64),
+        'imdb_votes': np.array([_parse_float(row.get('imdbVotes')) for row in rows], dtype=np.float64),
+        'rated': [_clean(row.get('Rated')) for row in rows],
+        'genres': [[g.strip() for g in (_clean(row.get('Genre')) or '').split(',') if g.strip()] for row in rows],
+        'director': [_clean(row.get('Director')) for row in rows],
+        'actors': [_clean(row.get('Actors')) for row in rows],
+        'language': [_clean(row.get('Language')) for row in rows],
+        'country': [_clean(row.get('Country')) for row in rows],
+        'poster': [_clean(row.get('Poster')) for row in rows],
+        'imdb_id': [_clean(row.get('imdbID')) for row in rows],
+        'youtube_link': [links.get(title) or _clean(row.get('YouTube Link')) or ''
+                         for title, row in zip(titles, rows)],
+        'enriched': sum(1 for row in rows if row),
+    }
+
+
+def concat_columns(blocks):
+    """
+    Columns for consecutive runs of titles, joined in order
+    """
+    if len(blocks) == 1:
+        return blocks[0]
+    columns = {key: np.concatenate([block[key] for block in blocks]) for key in NUMERIC_COLUMNS}
+    columns.update({key: [value for block in blocks for value in block[key]] for key in TEXT_COLUMNS})
+    columns['enriched'] = sum(block['enriched'] for block in blocks)
+    return columns
+
+
+class MetadataCatalog:
+    """
+    Metadata columns aligned to a list of titles, plus filter indexes.
+    Rows outside `live` (shadowed or deleted segment rows) never pass a filter.
+    """
+
+    def __init__(self, titles, enriched_rows, links=None, live=None, columns=None):
+        self.titles = list(titles)
+        count = len(self.titles)
+        self.count = count
+        self.live = live
+
+        columns = columns or parse_columns(self.titles, enriched_rows, links)
+        for key in NUMERIC_COLUMNS + TEXT_COLUMNS:
+            setattr(self, key, columns[key])
+        self.enriched = columns['enriched']
+
+        lowered_genres = [[g.lower() for g in genres] for genres in self.genres]
+        self.genre_index = BitmapIndex.build(count, lowered_genres)
+        self.rated_index = BitmapIndex.build(count, [[r.upper()] if r else [] for r in self.rated])
+        self.year_index = BitmapIndex.from_column(self.year)
+        self.rating_bucket_index = BitmapIndex.from_column(self.imdb_rating)
+        self.sorted_indexes = {
+            'imdb_rating': SortedIndex(self.imdb_rating),
+            'year': SortedIndex(self.year),
+            'runtime': SortedIndex(self.runtime),
+        }
+        self.browse_orders = self._build_browse_orders()
+
+    def _build_browse_orders(self):
+        """
+        Row permutations for every browse sort. Missing values sort last in
+        both directions and ties keep catalog order.
+        """
+        rows = np.arange(self.count)
+        titles = np.array([title.lower() for title in self.titles], dtype=str)
+        orders = {}
+        # Sort on the dense rank of each title so equal titles stay in catalog order
+        _, rank = np.unique(titles, return_inverse=True)
+        orders[('title', False)] = np.lexsort((rows, rank))
+        orders[('title', True)] = np.lexsort((rows, -rank))
+
+        for key in ('year', 'imdb_rating', 'runtime'):
+            column = getattr(self, key)
+            missing = np.isnan(column)
+            filled = np.where(missing, 0.0, column)
+            orders[(key, False)] = np.lexsort((rows, filled, missing))
+            orders[(key, True)] = np.lexsort((rows, -filled, missing))
+        return {key: order.astype(np.int32) for key, order in orders.items()}
+
+    def browse(self, sort=None, descending=False, offset=0, limit=None, mask=None):
+        """
+        One page of rows in browse order. Returns (rows, total matching rows).
+        """
+        order = self.browse_orders[(sort, descending)] if sort else None
+        if mask is None:
+            total = self.count
+            end = total if limit is None else min(total, offset + limit)
+            if order is None:
+                return np.arange(offset, max(offset, end)), total
+            return order[offset:end], total
+
+        matching = np.flatnonzero(mask) if order is None else order[mask[order]]
+        total = len(matching)
+        end = total if limit is None else offset + limit
+        return matching[offset:end], total
+
+    def _value(self, column, row):
+        value = column[row]
+        if np.isnan(value):
+            return None
+        return int(value) if column is not self.imdb_rating else float(value)
+
+    def movie_record(self, row, description=None):
+        """
+        The movie dict served by /api/movies (and embedded in other responses)
+        """
+        runtime = self._value(self.runtime, row)
+        title = self.titles[row]
+        return {
+            'id': title,  # Use title as ID for simplicity
+            'title': title,
+            'description': description,
+            'youtube_link': self.youtube_link[row],
+            'imdb_rating': self._value(self.imdb_rating, row),
+            'year': self._value(self.year, row),
+            'rated': self.rated[row],
+            'runtime': f"{runtime} min" if runtime is not None else None,
+            'genres': self.genres[row],
+            'director': self.director[row],
+            'actors': self.actors[row],
+            'language': self.language[row],
+            'country': self.country[row],
+            'poster': self.poster[row],
+        }
+
+    def _rating_range(self, low, high):
+        # Whole-number lower bounds with no upper bound are a union of rating buckets
+        if high is None and low is not None and float(low).is_integer():
+            return self.rating_bucket_index.any_of(range(int(low), 11))
+        return self.sorted_indexes['imdb_rating'].range(low, high)
+
+    def filter_mask(self, filters, title_index=None):
+        """
+        Evaluate parsed filters to a boolean row mask, or None when nothing is filtered
+        """
+        if not filters:
+            return None if self.live is None else self.live.copy()
+
+        packed = None
+
+        def intersect(bitmap):
+            nonlocal packed
+            packed = bitmap if packed is None else np.bitwise_and(packed, bitmap)
+
+        if filters.get('genres'):
+            intersect(self.genre_index.any_of(g.lower() for g in filters['genres']))
+        if filters.get('rated'):
+            intersect(self.rated_index.any_of(r.upper() for r in filters['rated']))
+        if filters.get('years'):
+            intersect(self.year_index.any_of(filters['years']))
+        if filters.get('min_rating') is not None or filters.get('max_rating') is not None:
+            intersect(self._rating_range(filters.get('min_rating'), filters.get('max_rating')))
+        if filters.get('min_year') is not None or filters.get('max_year') is not None:
+            intersect(self.sorted_indexes['year'].range(filters.get('min_year'), filters.get('max_year')))
+        if filters.get('min_runtime') is not None or filters.get('max_runtime') is not None:
+            intersect(self.sorted_indexes['runtime'].range(filters.get('min_runtime'), filters.get('max_runtime')))
+        if filters.get('exclude_genres'):
+            excluded = self.genre_index.any_of(g.lower() for g in filters['exclude_genres'])
+            intersect(np.bitwise_not(excluded))
+
+        if packed is None:
+            mask = np.ones(self.count, dtype=np.bool_)
+        else:
+            mask = np.unpackbits(packed, count=self.count).astype(np.bool_)
+
+        for title in filters.get('exclude', []):
+            row = title_index.get(title) if title_index is not None else None
+            if row is not None:
+                mask[row] = False
+        if self.live is not None:
+            mask &= self.live
+        return mask
+
+
+BROWSE_SORT_KEYS = ('title', 'year', 'imdb_rating', 'runtime')
+
+
+def parse_sort(value):
+    """
+    "year" / "-imdb_rating" -> (key, descending). Raises ValueError for unknown keys.
+    """
+    if not value:
+        return None, False
+    descending = value.startswith('-')
+    key = value.lstrip('-+')
+    if key not in BROWSE_SORT_KEYS:
+        raise ValueError(f"Unknown sort '{key}' (choose from {', '.join(BROWSE_SORT_KEYS)})")
+    return key, descending
+
+
+MOVIE_FIELDS = ('id', 'title', 'description', 'youtube_link', 'imdb_rating', 'year', 'rated', 'runtime',
+                'genres', 'director', 'actors', 'language', 'country', 'poster')
+
+
+def parse_fields(value):
+    """
+    "title,year,poster" -> tuple of movie fields, or None for every field
+    """
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in MOVIE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def encode_cursor(sort, descending, offset):
+    state = json.dumps({'sort': ('-' if descending else '') + sort if sort else None, 'offset': offset})
+    return base64.urlsafe_b64encode(state.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Opaque page cursor -> (sort, descending, offset). Raises ValueError if malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        sort, descending = parse_sort(state.get('sort'))
+        offset = int(state['offset'])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return sort, descending, offset
+
+
+FILTER_LIST_KEYS = {'genre': 'genres', 'exclude_genre': 'exclude_genres', 'rated': 'rated', 'exclude': 'exclude'}
+FILTER_NUMBER_KEYS = ('min_rating', 'max_rating', 'min_year', 'max_year', 'min_runtime', 'max_runtime')
+
+
+def parse_filters(source):
+    """
+    Read filter parameters from request args (MultiDict) or a JSON object.
+
+    genre / exclude_genre / rated accept comma-separated values; exclude takes
+    one title per parameter (titles may contain commas) or a JSON list.
+    Raises ValueError on malformed numbers.
+    """
+    if not source:
+        return {}
+
+    def values(key, split=True):
+        if hasattr(source, 'getlist'):
+            raw = source.getlist(key)
+        else:
+            raw = source.get(key, [])
+            raw = raw if isinstance(raw, list) else [raw]
+        result = []
+        for value in raw:
+            if value is None:
+                continue
+            parts = str(value).split(',') if split else [str(value)]
+            result.extend(part.strip() for part in parts if part.strip())
+        return result
+
+    filters = {}
+    for key, name in FILTER_LIST_KEYS.items():
+        found = values(key, split=(key != 'exclude'))
+        if found:
+            filters[name] = found
+    years = values('year')
+    if years:
+        try:
+            filters['years'] = [int(y) for y in years]
+        except ValueError:
+            raise ValueError(f"Invalid year filter: {years}")
+    for key in FILTER_NUMBER_KEYS:
+        found = values(key)
+        if found:
+            try:
+                filters[key] = float(found[0])
+            except ValueError:
+                raise ValueError(f"Invalid {key} filter: {found[0]}")
+    return filters
@@ -0,0 +1,212 @@
+"""
+Text analysis helpers: parsing Gemini trailer analyses and building the
+explanation tags shown on recommendation cards
+"""
+
+
+def generate_tags_from_analysis(source_analysis, target_analysis, similarity_score):
+    """
+    Generate explanation tags based on Gemini analysis (legacy function)
+    """
+    tags = []
+
+    # Visual similarity based on the CLIP/visual vectors
+    if similarity_score > 0.8:
+        tags.append({
+            "type": "visual",
+            "label": "Very similar visual style and cinematography",
+            "strength": float(similarity_score)
+        })
+    elif similarity_score > 0.6:
+        tags.append({
+            "type": "visual",
+            "label": "Similar cinematography and visual elements",
+            "strength": float(similarity_score)
+        })
+
+    # Narrative similarity based on content analysis
+    if similarity_score > 0.7:
+        tags.append({
+            "type": "narrative",
+            "label": "Similar storytelling and narrative themes",
+            "strength": float(similarity_score * 0.9)
+        })
+
+    # Genre matching from analysis text
+    common_keywords = []
+    if source_analysis and target_analysis:
+        source_words = set(source_analysis.lower().split())
+        target_words = set(target_analysis.lower().split())
+        common_keywords = list(source_words & target_words)
+
+        if len(common_keywords) > 5:
+            tags.append({
+                "type": "theme",
+                "label": f"Shared thematic elements",
+                "strength": min(0.9, len(common_keywords) / 20)
+            })
+
+    # Sort by strength
+    tags.sort(key=lambda x: x["strength"], reverse=True)
+    return tags[:3]  # Return top 3 tags
+
+
+# The structured sections of a Gemini analysis, in document order
+ANALYSIS_SECTIONS = {
+    '[VISUAL_STYLE]': 'visual_style',
+    '[NARRATIVE_ARC]': 'narrative_arc',
+    '[AUDIO_LANDSCAPE]': 'audio_landscape',
+    '[EMOTIONAL_VIBE]': 'emotional_vibe'
+}
+FACETS = tuple(ANALYSIS_SECTIONS.values())
+
+
+def analysis_sections(analysis_text):
+    """
+    The text of each section present in a Gemini analysis, by section key
+    """
+    sections = {}
+    if not analysis_text:
+        return sections
+
+    for section_marker, key in ANALYSIS_SECTIONS.items():
+        if section_marker in analysis_text:
+            # Find the section content
+            start_idx = analysis_text.find(section_marker) + len(section_marker)
+            end_idx = analysis_text.find('[', start_idx)
+            if end_idx == -1:
+                end_idx = len(analysis_text)
+
+            section_content = analysis_text[start_idx:end_idx].strip()
+            if section_content.startswith(':'):
+                section_content = section_content[1:].strip()
+            sections[key] = section_content
+    return sections
+
+
+def parse_gemini_analysis(analysis_text):
+    """
+    Parse the structured Gemini analysis to extract specific features
+    """
+    if not analysis_text:
+        return {}
+
+    features = {key: [] for key in FACETS}
+
+    for key, section_content in analysis_sections(analysis_text).items():
+        # Split by common delimiters and clean up
+        items = []
+        for delimiter in [',', ';']:
+            if delimiter in section_content:
+                items = [item.strip() for item in section_content.split(delimiter)]
+                break
+
+        if not items and section_content:
+            items = [section_content]
+
+        # Clean and filter items
+        for item in items:
+            if item and len(item.strip()) > 3:  # Filter out very short items
+                clean_item = item.strip().rstrip('.')
+                if clean_item:
+                    features[key].append({
+                        'type': key.replace('_', ' '),
+                        'value': clean_item
+                    })
+
+    return features
+
+def parse_analysis_features(analysis_text, analysis_type):
+    """
+    Parse AI analysis text to extract specific features
+    """
+    if not analysis_text:
+        return []
+
+    if analysis_type == 'narrative':
+        # For narrative, parse the Gemini structured analysis
+        parsed = parse_gemini_analysis(analysis_text)
+        features = []
+        for category, items in parsed.items():
+            features.extend(items)
+        return features
+
+    elif analysis_type == 'visual':
+        # For visual analysis, we don't have detailed text usually, so return generic info
+        return [{'type': 'feature', 'value': 'CLIP visual embeddings + Color histograms'}]
+
+    elif analysis_type == 'audio':
+        # For audio analysis, we don't have detailed text usually, so return generic info
+        return [{'type': 'feature', 'value': 'Tempo detection + Spectral contrast analysis'}]
+
+    return []
+
+
+def generate_multimodal_tags(similarities, weights, themes=None):
+    """
+    Generate explanation tags based on multimodal similarity scores, and
+    on the terms both analyses share (keyword_signatures.py) when given
+    """
+    tags = []
+
+    # Narrative similarity
+    if similarities['narrative'] > 0.7:
+        tags.append({
+            "type": "narrative",
+            "label": f"Strong narrative similarity ({similarities['narrative']*100:.0f}%)",
+            "strength": float(similarities['narrative'] * weights['narrative'])
+        })
+    elif similarities['narrative'] > 0.5:
+        tags.append({
+            "type": "narrative",
+            "label": f"Similar storytelling themes ({similarities['narrative']*100:.0f}%)",
+            "strength": float(similarities['narrative'] * weights['narrative'])
+        })
+
+    # Visual similarity
+    if similarities['visual'] > 0.7:
+        tags.append({
+            "type": "visual",
+            "label": f"Very similar visual style ({similarities['visual']*100:.0f}%)",
+            "strength": float(similarities['visual'] * weights['visual'])
+        })
+    elif similarities['visual'] > 0.5:
+        tags.append({
+            "type": "visual",
+            "label": f"Similar cinematography ({similarities['visual']*100:.0f}%)",
+            "strength": float(similarities['visual'] * weights['visual'])
+        })
+
+    # Audio similarity
+    if similarities['audio'] > 0.7:
+        tags.append({
+            "type": "audio",
+            "label": f"Very similar audio style ({similarities['audio']*100:.0f}%)",
+            "strength": float(similarities['audio'] * weights['audio'])
+        })
+    elif similarities['audio'] > 0.5:
+        tags.append({
+            "type": "audio",
+            "label": f"Similar sound design ({similarities['audio']*100:.0f}%)",
+            "strength": float(similarities['audio'] * weights['audio'])
+        })
+
+    # Combined weighted score
+    total_weighted = sum(similarities[feature] * weights[feature] for feature in similarities.keys())
+    if total_weighted > 0.8:
+        tags.append({
+            "type": "combined",
+            "label": f"Highly recommended match ({total_weighted*100:.0f}%)",
+            "strength": float(total_weighted)
+        })
+
+    # Sort by strength and return top 3
+    tags.sort(key=lambda x: x["strength"], reverse=True)
+    if themes:
+        # Naming what the movies have in common always makes the cut
+        return tags[:2] + [{
+            "type": "theme",
+            "label": f"Shared: {', '.join(themes['terms'])}",
+            "strength": float(themes['overlap'])
+        }]
+    return tags[:3]
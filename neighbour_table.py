@@ -0,0 +1,101 @@
+"""
+Precomputed narrative neighbour table for progressive /api/recommend
+
+/api/recommend re-ranks a title's nearest narrative neighbours, and finding
+them means a squared-L2 scan over the whole catalog. The table stores every
+title's `depth` nearest neighbours (self excluded, ties in row order), so a
+first answer only has to re-rank a few dozen stored rows. With filters the
+stored list is filtered too, so it can run short; the exact scan that
+follows corrects it.
+
+    python neighbour_table.py build --depth 64
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from weight_lattice import titles_digest
+
+TABLE_FORMAT = 1
+DEFAULT_DEPTH = 64
+# Rows scored per matrix product while building; bounds the (block, N) buffer
+BUILD_BLOCK = 256
+
+
+def build_neighbour_table(index, depth=DEFAULT_DEPTH, block=BUILD_BLOCK):
+    """
+    (N, depth) nearest narrative rows per row, nearest first
+    """
+    matrix = index.embeddings['narrative']
+    squared = index.squared_norms['narrative']
+    depth = min(depth, len(index) - 1)
+    neighbours = np.empty((len(index), depth), dtype=np.int32)
+
+    for start in range(0, len(index), block):
+        stop = min(start + block, len(index))
+        distances = squared[start:stop, None] + squared[None, :] - 2.0 * (matrix[start:stop] @ matrix.T)
+        np.maximum(distances, 0.0, out=distances)
+        distances[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        nearest = np.argpartition(distances, depth - 1, axis=1)[:, :depth]
+        for i, rows in enumerate(nearest):
+            order = np.lexsort((rows, distances[i, rows]))
+            neighbours[start + i] = rows[order]
+
+    return {
+        'format': TABLE_FORMAT,
+        'depth': depth,
+        'titles_digest': titles_digest(index.titles),
+        'neighbours': neighbours,
+    }
+
+
+def save_neighbour_table(path, arrays):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    meta = {key: arrays[key] for key in ('format', 'depth', 'titles_digest')}
+    np.savez(path, meta=np.array(json.dumps(meta)), neighbours=arrays['neighbours'])
+
+
+class NeighbourTable:
+    def __init__(self, arrays):
+        self.depth = int(arrays['depth'])
+        self.titles_digest = arrays['titles_digest']
+        self.neighbours = arrays['neighbours']
+
+    def matches(self, index):
+        return self.titles_digest == titles_digest(index.titles)
+
+    def candidates(self, row):
+        return self.neighbours[row]
+
+
+def load_neighbour_table(path):
+    with np.load(path) as data:
+        arrays = json.loads(str(data['meta']))
+        if arrays['format'] != TABLE_FORMAT:
+            raise ValueError(f"Unsupported neighbour table format {arrays['format']}")
+        arrays['neighbours'] = data['neighbours']
+    return NeighbourTable(arrays)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute narrative neighbours for progressive /api/recommend")
+    parser.add_argument('--db', default=os.environ.get('CHROMA_PERSIST_DIRECTORY', 'Data/trailer_db'))
+    parser.add_argument('--snapshot', default=os.environ.get('SERVING_SNAPSHOT_PATH', 'Data/serving_snapshot'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build')
+    build.add_argument('--out', default=os.environ.get('NEIGHBOUR_TABLE_PATH', 'Data/neighbour_table.npz'))
+    build.add_argument('--depth', type=int, default=DEFAULT_DEPTH, help="neighbours stored per title")
+    args = parser.parse_args()
+
+    from serving_index import load_serving_index
+
+    index = load_serving_index(args.db, args.snapshot)
+    start = time.time()
+    arrays = build_neighbour_table(index, args.depth)
+    save_neighbour_table(args.out, arrays)
+    print(f"✓ Wrote {arrays['depth']} neighbours for {len(index)} movies to {args.out} "
+          f"({os.path.getsize(args.out) / 1e6:.1f} MB) in {time.time() - start:.1f}s")
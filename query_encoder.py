@@ -0,0 +1,428 @@
+"""
+Text query encoders for /api/search
+
+Search text is embedded with all-MiniLM-L6-v2 into the narrative space. The
+full runtime runs it through sentence-transformers (torch); the lite runtime
+runs the same network exported to ONNX, optionally int8-quantized, with
+onnxruntime + tokenizers, which install in tens of MB instead of torch's GBs.
+
+Visual search (mode=visual) embeds the text with CLIP's text tower instead,
+into the space of the CLIP image embeddings that make up the first
+CLIP_DIMENSION columns of every visual vector. It too runs through
+transformers (torch) or as an ONNX export.
+
+Export once on a machine that has sentence-transformers (and transformers):
+    python query_encoder.py export --out Data/query_encoder --quantize
+    python query_encoder.py export-clip --out Data/clip_text_encoder --quantize
+
+The server wraps each encoder in a BatchingEncoder: repeated queries are
+answered from an LRU of their embeddings, and queries that miss it while an
+inference runs are encoded together in the next one.
+"""
+
+import argparse
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+ENCODER_CONFIG = 'encoder.json'
+# The model behind the visual collection's image embeddings (Data/recommendation_pipeline.ipynb)
+CLIP_MODEL_NAME = 'openai/clip-vit-base-patch32'
+CLIP_DIMENSION = 512
+CLIP_MAX_TOKENS = 77
+# Query embeddings each BatchingEncoder remembers
+DEFAULT_ENCODE_CACHE_SIZE = 1024
+# Most queries one inference encodes
+DEFAULT_ENCODE_BATCH = 16
+
+
+class SentenceTransformerEncoder:
+    """
+    all-MiniLM-L6-v2 through sentence-transformers (pulls in torch)
+    """
+
+    def __init__(self, model_name=MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.name = f"sentence-transformers:{model_name}"
+
+    def encode(self, text):
+        return np.asarray(self.model.encode(text), dtype=np.float32)
+
+    def encode_batch(self, texts):
+        return np.asarray(self.model.encode(list(texts)), dtype=np.float32)
+
+
+class OnnxQueryEncoder:
+    """
+    The exported transformer plus mean pooling (and normalization when the
+    sentence-transformers pipeline had it), on onnxruntime
+    """
+
+    def __init__(self, path):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, ENCODER_CONFIG), encoding='utf-8') as f:
+            self.config = json.load(f)
+        model_file = os.path.join(path, 'model_quantized.onnx')
+        if not os.path.exists(model_file):
+            model_file = os.path.join(path, 'model.onnx')
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=['CPUExecutionProvider'])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, 'tokenizer.json'))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(self.config['max_seq_length'])
+        self.name = f"onnx:{os.path.basename(model_file)}"
+
+    def encode(self, text):
+        encoding = self.tokenizer.encode(text)
+        feeds = {
+            'input_ids': np.array([encoding.ids], dtype=np.int64),
+            'attention_mask': np.array([encoding.attention_mask], dtype=np.int64),
+            'token_type_ids': np.array([encoding.type_ids], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.inputs})[0][0]
+
+        mask = feeds['attention_mask'][0, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=0) / max(float(mask.sum()), 1e-9)
+        if self.config.get('normalize'):
+            pooled /= max(float(np.linalg.norm(pooled)), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        feeds = {
+            'input_ids': _padded([e.ids for e in encodings]),
+            'attention_mask': _padded([e.attention_mask for e in encodings]),
+            'token_type_ids': _padded([e.type_ids for e in encodings]),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.inputs})[0]
+
+        mask = feeds['attention_mask'][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config.get('normalize'):
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+
+class ClipTextEncoder:
+    """
+    CLIP's text tower and projection through transformers (pulls in torch)
+    """
+
+    def __init__(self, model_name=CLIP_MODEL_NAME):
+        import torch
+        from transformers import AutoTokenizer, CLIPTextModelWithProjection
+
+        self.torch = torch
+        self.model = CLIPTextModelWithProjection.from_pretrained(model_name).eval()
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.name = f"transformers:{model_name}"
+
+    def encode(self, text):
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts):
+        inputs = self.tokenizer(list(texts), padding=True, truncation=True, max_length=CLIP_MAX_TOKENS,
+                                return_tensors='pt')
+        with self.torch.no_grad():
+            embeds = self.model(input_ids=inputs['input_ids'], attention_mask=inputs['attention_mask']).text_embeds
+        return embeds.cpu().numpy().astype(np.float32)
+
+
+class OnnxClipTextEncoder:
+    """
+    The exported CLIP text tower (text_embeds output) on onnxruntime
+    """
+
+    def __init__(self, path):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, ENCODER_CONFIG), encoding='utf-8') as f:
+            self.config = json.load(f)
+        model_file = os.path.join(path, 'model_quantized.onnx')
+        if not os.path.exists(model_file):
+            model_file = os.path.join(path, 'model.onnx')
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=['CPUExecutionProvider'])
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, 'tokenizer.json'))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(self.config['max_seq_length'])
+        self.pad_id = self.config['pad_token_id']
+        self.name = f"onnx:clip:{os.path.basename(model_file)}"
+
+    def encode(self, text):
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        feeds = {
+            'input_ids': _padded([e.ids for e in encodings], self.pad_id),
+            'attention_mask': _padded([e.attention_mask for e in encodings]),
+        }
+        return self.session.run(None, feeds)[0].astype(np.float32)
+
+
+def _padded(rows, value=0):
+    width = max(len(row) for row in rows)
+    return np.array([row + [value] * (width - len(row)) for row in rows], dtype=np.int64)
+
+
+class BatchingEncoder:
+    """
+    An encoder behind an LRU of query embeddings, whose cache misses are
+    encoded in batches: the first miss runs an inference, and the misses that
+    arrive meanwhile wait and go into the next one together (up to
+    `max_batch`). That batch is run by one of the requests waiting on it, so
+    a request never runs batches once its own query is encoded. A query
+    already being encoded is not encoded twice.
+    """
+
+    def __init__(self, encoder, cache_size=DEFAULT_ENCODE_CACHE_SIZE, max_batch=DEFAULT_ENCODE_BATCH):
+        self.encoder = encoder
+        self.name = encoder.name
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        # Signalled whenever a batch finishes
+        self.idle = threading.Condition(self.lock)
+        self.cache = OrderedDict()
+        self.inflight = {}
+        self.pending = []
+        self.running = False
+        self.counters = {'hits': 0, 'misses': 0, 'batches': 0, 'batched': 0}
+
+    def encode(self, text):
+        with self.lock:
+            vector = self.cache.get(text)
+            if vector is not None:
+                self.cache.move_to_end(text)
+                self.counters['hits'] += 1
+                return vector
+            self.counters['misses'] += 1
+            future = self.inflight.get(text)
+            if future is None:
+                future = self.inflight[text] = Future()
+                self.pending.append(text)
+
+        while True:
+            with self.lock:
+                while self.running and not future.done():
+                    self.idle.wait()
+                if future.done():
+                    return future.result()
+                # Nothing is running and this text is still pending: run the next batch
+                self.running = True
+                batch = self.pending[:self.max_batch]
+                del self.pending[:self.max_batch]
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        try:
+            vectors, error = self.encoder.encode_batch(batch), None
+        except Exception as e:
+            vectors, error = None, e
+        with self.lock:
+            try:
+                self.counters['batches'] += 1
+                self.counters['batched'] += len(batch)
+                for i, text in enumerate(batch):
+                    future = self.inflight.pop(text)
+                    if error is not None:
+                        future.set_exception(error)
+                        continue
+                    vector = np.array(vectors[i], dtype=np.float32)
+                    # Shared by every request for this text
+                    vector.setflags(write=False)
+                    if self.cache_size > 0:
+                        self.cache[text] = vector
+                        if len(self.cache) > self.cache_size:
+                            self.cache.popitem(last=False)
+                    future.set_result(vector)
+            finally:
+                self.running = False
+                self.idle.notify_all()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, name=self.name, cached=len(self.cache), cache_size=self.cache_size,
+                        max_batch=self.max_batch)
+
+
+def has_onnx_encoder(path):
+    return bool(path) and os.path.exists(os.path.join(path, ENCODER_CONFIG))
+
+
+def load_query_encoder(kind='auto', path=None, model_name=MODEL_NAME):
+    """
+    kind: 'onnx', 'sentence-transformers', 'none', or 'auto' (the ONNX export
+    at `path` if there is one and onnxruntime is installed, otherwise
+    sentence-transformers if installed). Returns None when nothing is available.
+    """
+    if kind == 'none':
+        return None
+    if kind == 'onnx' or (kind == 'auto' and has_onnx_encoder(path)):
+        try:
+            return OnnxQueryEncoder(path)
+        except ImportError:
+            if kind == 'onnx':
+                raise
+    try:
+        return SentenceTransformerEncoder(model_name)
+    except ImportError:
+        if kind == 'sentence-transformers':
+            raise
+        return None
+
+
+def load_clip_text_encoder(kind='auto', path=None, model_name=CLIP_MODEL_NAME):
+    """
+    load_query_encoder for the CLIP text tower: kind is 'onnx',
+    'transformers', 'none' or 'auto'. Unlike the query encoder, 'auto' only
+    loads the ONNX export at `path`: the transformers CLIP model costs
+    seconds and hundreds of MB at startup, so it is only loaded when asked for.
+    """
+    if kind == 'none':
+        return None
+    if kind == 'transformers':
+        return ClipTextEncoder(model_name)
+    if kind == 'onnx' or has_onnx_encoder(path):
+        try:
+            return OnnxClipTextEncoder(path)
+        except ImportError:
+            if kind == 'onnx':
+                raise
+    return None
+
+
+def export_onnx(out_dir, model_name=MODEL_NAME, quantize=False, opset=17):
+    """
+    Export the sentence-transformers model's transformer to ONNX next to its
+    tokenizer and pooling config
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0]
+    os.makedirs(out_dir, exist_ok=True)
+
+    transformer.tokenizer.backend_tokenizer.save(os.path.join(out_dir, 'tokenizer.json'))
+    config = {
+        'model': model_name,
+        'max_seq_length': int(model.max_seq_length),
+        'pooling': 'mean',
+        'normalize': any(type(module).__name__ == 'Normalize' for module in model),
+        'dimension': int(model.get_sentence_embedding_dimension()),
+    }
+    with open(os.path.join(out_dir, ENCODER_CONFIG), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    network = transformer.auto_model.eval()
+    sample = transformer.tokenizer(['an example query'], return_tensors='pt')
+    names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    axes = {name: {0: 'batch', 1: 'tokens'} for name in names}
+    axes['last_hidden_state'] = {0: 'batch', 1: 'tokens'}
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *tensors):
+            return self.inner(**dict(zip(names, tensors))).last_hidden_state
+
+    model_path = os.path.join(out_dir, 'model.onnx')
+    with torch.no_grad():
+        torch.onnx.export(Wrapper(network), tuple(sample[name] for name in names), model_path,
+                          input_names=names, output_names=['last_hidden_state'],
+                          dynamic_axes=axes, opset_version=opset, dynamo=False)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(model_path, os.path.join(out_dir, 'model_quantized.onnx'), weight_type=QuantType.QInt8)
+    return config
+
+
+def export_clip_onnx(out_dir, model_name=CLIP_MODEL_NAME, quantize=False, opset=17):
+    """
+    Export CLIP's text tower and projection to ONNX next to its tokenizer
+    """
+    import torch
+    from transformers import AutoTokenizer, CLIPTextModelWithProjection
+
+    model = CLIPTextModelWithProjection.from_pretrained(model_name).eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, 'tokenizer.json'))
+    config = {
+        'model': model_name,
+        'max_seq_length': min(int(model.config.max_position_embeddings), CLIP_MAX_TOKENS),
+        'pad_token_id': int(tokenizer.pad_token_id),
+        'dimension': int(model.config.projection_dim),
+    }
+    with open(os.path.join(out_dir, ENCODER_CONFIG), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask).text_embeds
+
+    sample = tokenizer(['an example query', 'a longer example query'], padding=True, return_tensors='pt')
+    names = ['input_ids', 'attention_mask']
+    axes = {name: {0: 'batch', 1: 'tokens'} for name in names}
+    axes['text_embeds'] = {0: 'batch'}
+
+    model_path = os.path.join(out_dir, 'model.onnx')
+    with torch.no_grad():
+        torch.onnx.export(Wrapper(model), tuple(sample[name] for name in names), model_path,
+                          input_names=names, output_names=['text_embeds'],
+                          dynamic_axes=axes, opset_version=opset, dynamo=False)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(model_path, os.path.join(out_dir, 'model_quantized.onnx'), weight_type=QuantType.QInt8)
+    return config
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the search query encoders to ONNX")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export')
+    export.add_argument('--out', default=os.environ.get('QUERY_ENCODER_PATH', 'Data/query_encoder'))
+    export.add_argument('--model', default=MODEL_NAME)
+    export.add_argument('--quantize', action='store_true', help="also write an int8 model_quantized.onnx")
+    export_clip = commands.add_parser('export-clip', help="CLIP's text tower, for visual search")
+    export_clip.add_argument('--out', default=os.environ.get('CLIP_TEXT_ENCODER_PATH', 'Data/clip_text_encoder'))
+    export_clip.add_argument('--model', default=CLIP_MODEL_NAME)
+    export_clip.add_argument('--quantize', action='store_true', help="also write an int8 model_quantized.onnx")
+    args = parser.parse_args()
+
+    if args.command == 'export-clip':
+        config = export_clip_onnx(args.out, args.model, args.quantize)
+    else:
+        config = export_onnx(args.out, args.model, args.quantize)
+    sizes = ', '.join(f"{name} {os.path.getsize(os.path.join(args.out, name)) / 1e6:.1f} MB"
+                      for name in ('model.onnx', 'model_quantized.onnx')
+                      if os.path.exists(os.path.join(args.out, name)))
+    print(f"✓ Exported {config['model']} ({config['dimension']}-dim) to {args.out}: {sizes}")
@@ -0,0 +1,243 @@
+"""
+Cost-based planning for /api/similarity and /api/recommend
+
+The same ranking can be produced several ways, at very different costs:
+
+  cache            an earlier exact answer to the identical query
+  lattice          weight_lattice.py's stored candidates (similarity, unfiltered);
+                   exact when the weights sit on a lattice point
+  neighbour_table  neighbour_table.py's stored neighbours (recommend); exact
+                   when enough of them pass the filters
+  sample           a strided catalog sample (recommend); approximate
+  scan             scoring the whole catalog; always exact
+
+Every strategy's cost is estimated as a fixed overhead plus the rows it has
+to score times a per-row time. Row counts come from the catalog size, filter
+selectivity and requested k; the times start from priors measured on a
+200k-title catalog and then follow measured latencies (moving average).
+The plan is the cheapest strategy that meets the requested accuracy:
+'exact' only accepts strategies that can show their answer equals the
+scan's, 'approximate' accepts all of them.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from scoring import (
+    MODALITIES,
+    RECOMMEND_CANDIDATES,
+    recommend_from_pool,
+    recommend_rows,
+    sample_pool,
+    similarity_rows,
+)
+from weight_lattice import DEFAULT_LOOKUP_MODE
+
+STRATEGIES = ('cache', 'lattice', 'neighbour_table', 'sample', 'scan')
+ACCURACY_LEVELS = ('exact', 'approximate')
+DEFAULT_CACHE_SIZE = 2048
+
+# strategy: (fixed ms, ms per row scored) until latencies have been measured
+COST_PRIORS = {
+    'cache': (0.005, 0.0),
+    'lattice': (0.05, 0.0005),
+    'neighbour_table': (0.05, 0.0002),
+    'sample': (0.1, 0.0006),
+    'scan': (0.1, 0.0002),
+}
+
+
+def _moving_average(estimate, observed):
+    """
+    Move 10% toward an observation clamped to 4x either side of the estimate,
+    so one cold or preempted run cannot price a strategy out of every plan
+    (a strategy that is never chosen is never measured again)
+    """
+    observed = min(max(observed, estimate / 4), estimate * 4)
+    return estimate + 0.1 * (observed - estimate)
+
+
+class Plan:
+    """
+    The chosen strategy plus every option considered, for execution and /api/explain
+    """
+
+    def __init__(self, query, row, weights, k, accuracy, mask, key, options, inputs):
+        self.query = query
+        self.row = row
+        self.weights = weights
+        self.k = k
+        self.accuracy = accuracy
+        self.mask = mask
+        self.key = key
+        self.options = options
+        self.inputs = inputs
+        chosen = min((o for o in options if o['eligible']),
+                     key=lambda o: (o['estimated_ms'], not o['exact']))
+        self.strategy = chosen['strategy']
+        self.exact = chosen['exact']
+        self.estimated_ms = chosen['estimated_ms']
+        self.rows_scored = chosen['rows']
+
+    def to_dict(self):
+        return {
+            'query': self.query,
+            'accuracy': self.accuracy,
+            'strategy': self.strategy,
+            'exact': self.exact,
+            'estimated_ms': self.estimated_ms,
+            'inputs': self.inputs,
+            'options': self.options,
+        }
+
+
+class QueryPlanner:
+    def __init__(self, index, lattice=None, lattice_mode=DEFAULT_LOOKUP_MODE, table=None,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        self.index = index
+        self.lattice = lattice
+        self.lattice_mode = lattice_mode
+        self.table = table
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.costs = {strategy: list(prior) for strategy, prior in COST_PRIORS.items()}
+        self.counters = {strategy: {'executed': 0, 'ms': 0.0} for strategy in STRATEGIES}
+
+    def estimate(self, strategy, rows):
+        fixed, per_row = self.costs[strategy]
+        return round(fixed + rows * per_row, 4)
+
+    def _option(self, strategy, rows=0, exact=False, reason=None, accuracy='exact', note=None):
+        available = reason is None
+        return {
+            'strategy': strategy,
+            'available': available,
+            'exact': exact if available else False,
+            'eligible': available and (exact or accuracy == 'approximate'),
+            'rows': int(rows),
+            'estimated_ms': self.estimate(strategy, rows) if available else None,
+            'reason': reason or note or ('exact' if exact else 'approximate'),
+        }
+
+    def plan(self, query, row, weights, filters=None, k=None, accuracy='exact'):
+        """
+        Plan a 'similarity' or 'recommend' query for catalog row `row`
+        """
+        if accuracy not in ACCURACY_LEVELS:
+            raise ValueError(f"Unknown accuracy '{accuracy}' (choose from {', '.join(ACCURACY_LEVELS)})")
+        index = self.index
+        total = len(index)
+        mask = index.catalog.filter_mask(filters, index.title_index)
+        allowed = total if mask is None else int(mask.sum())
+        key = (query, row, tuple(float(weights[m]) for m in MODALITIES),
+               json.dumps(filters or {}, sort_keys=True), k)
+        # recommend_rows spends one narrative candidate on the source row when it is allowed
+        needed = RECOMMEND_CANDIDATES - (1 if mask is None or mask[row] else 0)
+
+        with self.lock:
+            cached = key in self.cache
+        options = [self._option('cache', 0, True, None if cached else "no earlier answer to this query", accuracy)]
+
+        if query == 'similarity':
+            # Not `mask is not None`: the mask also drops rows dead in delta
+            # segments, which the lattice already leaves out
+            if self.lattice is None:
+                reason = "no weight lattice loaded"
+            elif filters:
+                reason = "filters are not materialized in the lattice"
+            elif k > self.lattice.k:
+                reason = f"k={k} exceeds the lattice's k={self.lattice.k}"
+            elif not self.lattice.covers(row, weights):
+                reason = "weights or title not covered by the lattice"
+            else:
+                reason = None
+            on_point = reason is None and self.lattice.on_point(weights)
+            note = "weights on a lattice point" if on_point else "weights between lattice points"
+            rows = self.lattice.width(row, self.lattice_mode) if reason is None else 0
+            options.append(self._option('lattice', rows, on_point, reason, accuracy, note))
+            options.append(self._option('neighbour_table', reason="recommend queries only", accuracy=accuracy))
+            options.append(self._option('sample', reason="recommend queries only", accuracy=accuracy))
+            options.append(self._option('scan', total * len(MODALITIES), True, None, accuracy, "scores every row"))
+        else:
+            options.append(self._option('lattice', reason="similarity queries only", accuracy=accuracy))
+            if self.table is None:
+                options.append(self._option('neighbour_table', reason="no neighbour table loaded",
+                                            accuracy=accuracy))
+            else:
+                stored = self.table.candidates(row)
+                found = len(stored) if mask is None else int(mask[stored].sum())
+                exact = found >= needed or len(stored) >= total - 1
+                note = f"{found} of {len(stored)} stored neighbours pass the filters, {needed} needed"
+                options.append(self._option('neighbour_table', len(stored), exact, None, accuracy, note))
+
+            pool = sample_pool(index, row)
+            if pool is None:
+                reason = "catalog is smaller than the sample"
+            elif len(pool) * allowed / total < needed:
+                reason = "too few sampled rows pass the filters"
+            else:
+                reason = None
+            options.append(self._option('sample', 0 if pool is None else len(pool), False, reason, accuracy,
+                                        "a strided sample may miss the nearest neighbours"))
+            options.append(self._option('scan', total, True, None, accuracy, "scores every row"))
+
+        inputs = {'catalog_size': total, 'allowed_rows': allowed, 'selectivity': round(allowed / total, 4),
+                  'k': k, 'weights': dict(zip(MODALITIES, key[2]))}
+        return Plan(query, row, weights, k, accuracy, mask, key, options, inputs)
+
+    def _run(self, plan):
+        index, row, weights = self.index, plan.row, plan.weights
+        if plan.strategy == 'cache':
+            with self.lock:
+                self.cache.move_to_end(plan.key)
+                return self.cache[plan.key]
+        if plan.strategy == 'lattice':
+            return self.lattice.lookup(row, weights, plan.k, self.lattice_mode)
+        if plan.strategy == 'neighbour_table':
+            return recommend_from_pool(index, row, weights, self.table.candidates(row), plan.mask, k=plan.k)
+        if plan.strategy == 'sample':
+            return recommend_from_pool(index, row, weights, sample_pool(index, row), plan.mask, k=plan.k)
+        if plan.query == 'similarity':
+            return similarity_rows(index, row, weights, plan.mask, plan.k)
+        return recommend_rows(index, row, weights, plan.mask, k=plan.k)
+
+    def execute(self, plan):
+        """
+        (rows, similarities, combined) for the plan; measures it and caches
+        exact answers
+        """
+        start = time.perf_counter()
+        try:
+            result = self._run(plan)
+        except KeyError:
+            # Evicted between planning and execution
+            plan.strategy, plan.rows_scored = 'scan', len(self.index)
+            result = self._run(plan)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self.lock:
+            counters = self.counters[plan.strategy]
+            counters['executed'] += 1
+            counters['ms'] += elapsed_ms
+            cost = self.costs[plan.strategy]
+            if plan.rows_scored:
+                cost[1] = _moving_average(cost[1], max(0.0, elapsed_ms - cost[0]) / plan.rows_scored)
+            else:
+                cost[0] = _moving_average(cost[0], elapsed_ms)
+            if plan.exact and plan.strategy != 'cache' and self.cache_size > 0:
+                self.cache[plan.key] = result
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        plan.elapsed_ms = elapsed_ms
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                'cache_entries': len(self.cache),
+                'strategies': {s: dict(self.counters[s], fixed_ms=round(self.costs[s][0], 4),
+                                       ms_per_row=self.costs[s][1]) for s in STRATEGIES},
+            }
@@ -0,0 +1,91 @@
+"""
+Fast JSON encoding and response compression
+
+Every JSON response goes through FastJSONProvider (installed as app.json),
+so jsonify() encodes with orjson when it is installed and with compact
+stdlib json otherwise.
+
+compress() gzips (or, with the `brotli` package and a client that asks for
+it, brotli-compresses) large JSON and text responses on the way out.
+"""
+
+import gzip
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent as they are
+DEFAULT_COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'application/x-ndjson', 'image/svg+xml')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _default(obj):
+    # NumPy scalars and arrays that slipped into a payload, as jsonify's callers expect
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_encode_stdlib = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_default).encode
+
+
+def dumps(obj):
+    """
+    Compact UTF-8 JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return _encode_stdlib(obj).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with dumps(); parsing stays stdlib json
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+def compress(response, accept_encodings, min_bytes=DEFAULT_COMPRESS_MIN_BYTES):
+    """
+    Compress a buffered JSON or text response in place when the client
+    accepts gzip (or br) and the body is at least `min_bytes`
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers):
+        return response
+    mimetype = response.mimetype or ''
+    if not (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < min_bytes:
+        return response
+    encoding = accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+    if encoding == 'br':
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    else:
+        return response
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
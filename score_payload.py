@@ -0,0 +1,132 @@
+"""
+Compact encodings of per-modality similarity vectors
+
+/api/similarity/vectors returns the unfused narrative, visual and audio
+scores for one source movie so the frontend can re-fuse and re-rank on
+slider moves without a round-trip. Scores lie in [0, 1] and are stored as
+16-bit fixed point (score * 65535, |error| <= 7.7e-6): the same two bytes as
+float16, whose 4.9e-4 step near 1.0 reorders close recommendations. Rows are
+catalog row numbers, with the titles as an id table.
+
+Binary layout (format=binary, little endian):
+  b'SIMV' | uint16 version | uint16 reserved | uint32 header length
+  header JSON (space padded to a multiple of 4 bytes)
+  uint32 rows[count]
+  uint16 scores[3][count]  (modality-major: narrative, visual, audio)
+
+format=msgpack and format=arrow carry the same fields and need the optional
+msgpack / pyarrow packages.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from scoring import MODALITIES
+
+MAGIC = b'SIMV'
+PAYLOAD_VERSION = 1
+SCORE_SCALE = 65535
+FORMATS = {
+    'binary': 'application/octet-stream',
+    'msgpack': 'application/x-msgpack',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'json': 'application/json',
+}
+
+
+def quantize(scores):
+    return np.rint(np.clip(scores, 0.0, 1.0) * SCORE_SCALE).astype('<u2')
+
+
+def dequantize(scores):
+    return np.asarray(scores, dtype=np.float32) / SCORE_SCALE
+
+
+def _header(header, titles):
+    header = dict(header, version=PAYLOAD_VERSION, modalities=list(MODALITIES), scale=SCORE_SCALE)
+    if titles is not None:
+        header['titles'] = list(titles)
+    return header
+
+
+def encode_binary(header, titles, rows, similarities):
+    header = json.dumps(_header(header, titles), separators=(',', ':')).encode('utf-8')
+    header += b' ' * (-len(header) % 4)
+    parts = [MAGIC, struct.pack('<HHI', PAYLOAD_VERSION, 0, len(header)), header,
+             np.asarray(rows, dtype='<u4').tobytes()]
+    parts.extend(quantize(similarities[m]).tobytes() for m in MODALITIES)
+    return b''.join(parts)
+
+
+def decode_binary(payload):
+    """
+    Inverse of encode_binary: (header, rows, {modality: float32 scores})
+    """
+    if payload[:4] != MAGIC:
+        raise ValueError("Not a score vector payload")
+    version, _, header_length = struct.unpack_from('<HHI', payload, 4)
+    if version != PAYLOAD_VERSION:
+        raise ValueError(f"Unsupported payload version {version}")
+    offset = 12 + header_length
+    header = json.loads(payload[12:offset])
+    count = header['count']
+    rows = np.frombuffer(payload, dtype='<u4', count=count, offset=offset)
+    offset += 4 * count
+    similarities = {}
+    for modality in MODALITIES:
+        similarities[modality] = dequantize(np.frombuffer(payload, dtype='<u2', count=count, offset=offset))
+        offset += 2 * count
+    return header, rows, similarities
+
+
+def encode_msgpack(header, titles, rows, similarities):
+    import msgpack
+
+    body = _header(header, titles)
+    body['rows'] = np.asarray(rows, dtype='<u4').tobytes()
+    body['scores'] = {m: quantize(similarities[m]).tobytes() for m in MODALITIES}
+    return msgpack.packb(body, use_bin_type=True)
+
+
+def encode_arrow(header, titles, rows, similarities):
+    import pyarrow as pa
+
+    header = _header(header, None)
+    columns = {'row': pa.array(np.asarray(rows, dtype=np.uint32))}
+    if titles is not None:
+        columns['title'] = pa.array(list(titles), type=pa.string())
+    for modality in MODALITIES:
+        columns[modality] = pa.array(quantize(similarities[modality]))
+    table = pa.table(columns).replace_schema_metadata({'score_vectors': json.dumps(header)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_json(header, titles, rows, similarities):
+    body = _header(header, titles)
+    body['rows'] = [int(r) for r in rows]
+    body['scores'] = {m: quantize(similarities[m]).tolist() for m in MODALITIES}
+    return json.dumps(body).encode('utf-8')
+
+
+ENCODERS = {
+    'binary': encode_binary,
+    'msgpack': encode_msgpack,
+    'arrow': encode_arrow,
+    'json': encode_json,
+}
+
+
+def encode_score_vectors(fmt, header, titles, rows, similarities):
+    """
+    Encode one payload; raises ValueError for unknown formats and ImportError
+    when the optional package behind msgpack / arrow is missing
+    """
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown format '{fmt}' (choose from {', '.join(ENCODERS)})")
+    return ENCODERS[fmt](header, titles, rows, similarities)
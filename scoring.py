@@ -0,0 +1,326 @@
+"""
+Similarity scoring kernels shared by the recommendation endpoints
+"""
+
+import numpy as np
+
+MODALITIES = ('narrative', 'visual', 'audio')
+DEFAULT_WEIGHTS = {'narrative': 0.4, 'visual': 0.35, 'audio': 0.25}
+MISSING_SIMILARITY = 0.5
+
+RECOMMEND_CANDIDATES = 20
+RECOMMEND_RESULTS = 8
+SIMILARITY_RESULTS = 20
+SEARCH_RESULTS = 10
+# Rows each search mode contributes to a fused search
+SEARCH_CANDIDATES = 100
+# How slowly reciprocal rank fusion discounts lower ranks (the usual 60)
+RANK_FUSION_K = 60
+# Rows scanned for a first /api/recommend answer when no neighbour table is loaded
+APPROXIMATE_SAMPLE = 8192
+
+
+def row_query(index, row):
+    """
+    What scoring needs to know about a catalog row as a query: its vectors,
+    their norms and which modalities it has. sharding.py ships these to
+    shards that do not hold the row.
+    """
+    return {
+        'vectors': {m: index.vector(m, row) for m in MODALITIES},
+        'norms': {m: index.norms[m][row] for m in MODALITIES},
+        'squared_norms': {m: index.squared_norms[m][row] for m in MODALITIES},
+        'present': [bool(index.present[row, column]) for column in range(len(MODALITIES))],
+    }
+
+
+def similarity_vector(index, modality, row, rows=None):
+    """
+    Cosine similarity of `row` against `rows` (default: every row of the
+    index), clipped at 0. Rows missing the modality on either side get a
+    neutral score.
+    """
+    return query_similarity(index, modality, row_query(index, row), rows)
+
+
+def query_similarity(index, modality, query, rows=None):
+    """
+    similarity_vector for a row_query, which need not come from this index
+    """
+    norms = index.norms[modality]
+    column = MODALITIES.index(modality)
+    dots = index.dot(modality, query['vectors'][modality], rows)
+    if rows is not None:
+        target_norms = norms[rows]
+        present = index.present[rows, column]
+    else:
+        target_norms = norms
+        present = index.present[:, column]
+
+    denominator = target_norms * query['norms'][modality]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sims = np.where(denominator > 0, dots / denominator, 0.0).astype(np.float64)
+    np.maximum(sims, 0.0, out=sims)
+    if not query['present'][column]:
+        sims[:] = MISSING_SIMILARITY
+    else:
+        sims[~present] = MISSING_SIMILARITY
+    return sims
+
+
+def narrative_distances(index, row):
+    """
+    Squared L2 distance from `row` to every row, i.e. ChromaDB's default
+    "l2" space that nar_collection.query() ranks by
+    """
+    return query_distances(index, row_query(index, row))
+
+
+def query_distances(index, query):
+    """
+    narrative_distances for a row_query
+    """
+    squared = index.squared_norms['narrative']
+    vector = query['vectors']['narrative']
+    distances = squared + query['squared_norms']['narrative'] - 2.0 * index.dot('narrative', vector)
+    return np.maximum(distances, 0.0).astype(np.float64)
+
+
+def query_rows(index, modality, vector, k=SEARCH_RESULTS):
+    """
+    The k rows nearest to a query vector by squared L2, the ranking a
+    ChromaDB collection.query() returns. Returns (rows, distances).
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    distances = index.squared_norms[modality] + float(vector @ vector) - 2.0 * index.dot(modality, vector)
+    distances = np.maximum(distances, 0.0).astype(np.float64)
+    candidates = index.present[:, MODALITIES.index(modality)]
+    if index.live is not None:
+        candidates = candidates & index.live
+    rows = top_k(-distances, k, candidates)
+    return rows, distances[rows]
+
+
+def query_column_rows(index, modality, vector, k=SEARCH_RESULTS):
+    """
+    The k rows whose first len(vector) columns of `modality` are most
+    cosine-similar to a query vector, such as a CLIP text embedding against
+    the CLIP image part of the visual vectors. Returns (rows, similarities).
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    width = index.segments[0].embeddings[modality].shape[1]
+    if len(vector) > width:
+        raise ValueError(f"A {len(vector)}-dim query does not fit the {width}-dim {modality} vectors")
+    padded = np.zeros(width, dtype=np.float32)
+    padded[:len(vector)] = vector
+
+    norms = index.column_norms(modality, len(vector))
+    denominator = norms * float(np.linalg.norm(vector))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sims = np.where(denominator > 0, index.dot(modality, padded) / denominator, 0.0).astype(np.float64)
+    candidates = index.present[:, MODALITIES.index(modality)] & (norms > 0)
+    if index.live is not None:
+        candidates = candidates & index.live
+    rows = top_k(sims, k, candidates)
+    return rows, sims[rows]
+
+
+def query_facet_rows(index, vector, columns, k=SEARCH_RESULTS):
+    """
+    The k rows whose best section embedding among facet `columns` is most
+    cosine-similar to a query vector (max-sim). Returns (rows, similarities,
+    the facet column each row matched best).
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    columns = list(columns)
+    denominator = index.facet_norms[:, columns] * float(np.linalg.norm(vector))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sims = np.where(denominator > 0, index.facet_dot(columns, vector) / denominator, -np.inf)
+    # First of equally good facets, like a scan in column order
+    picked = np.argmax(sims, axis=1)
+    best = sims[np.arange(len(sims)), picked].astype(np.float64)
+    # Rows with none of the sections never match
+    candidates = np.isfinite(best)
+    if index.live is not None:
+        candidates = candidates & index.live
+    rows = top_k(best, k, candidates)
+    return rows, best[rows], np.asarray(columns)[picked[rows]]
+
+
+def rank_fusion(rankings, weights, k=SEARCH_RESULTS):
+    """
+    Weighted reciprocal rank fusion of rankings ({name: rows, best first})
+    whose scores are not comparable. Rank r (from 1) in ranking m scores
+    weights[m] * (K + 1) / (K + r), so a row ranked first everywhere scores
+    sum(weights). Returns (rows, scores) for the top k.
+    """
+    scores = {}
+    for name, rows in rankings.items():
+        for rank, row in enumerate(rows, start=1):
+            row = int(row)
+            scores[row] = scores.get(row, 0.0) + weights[name] * (RANK_FUSION_K + 1) / (RANK_FUSION_K + rank)
+    best = sorted(scores, key=lambda row: (-scores[row], row))[:k]
+    return np.array(best, dtype=np.int64), np.array([scores[row] for row in best], dtype=np.float64)
+
+
+def fuse_vectors(similarities, weights):
+    """
+    Weighted late fusion of the per-modality similarity vectors
+    """
+    return (
+        similarities['narrative'] * float(weights['narrative']) +
+        similarities['visual'] * float(weights['visual']) +
+        similarities['audio'] * float(weights['audio'])
+    )
+
+
+def top_k(scores, k, mask=None):
+    """
+    Rows holding the k largest scores, best first, restricted to `mask`.
+    Ties keep row order, matching a stable sort over the whole catalog.
+    """
+    rows = np.flatnonzero(mask) if mask is not None else np.arange(len(scores))
+    values = scores[rows]
+    if k <= 0 or len(rows) == 0:
+        return rows[:0]
+    if k < len(rows):
+        # Everything strictly above the k-th value, then ties in row order
+        threshold = np.partition(values, len(values) - k)[len(values) - k]
+        above = values > threshold
+        ties = np.flatnonzero(values == threshold)[:k - int(above.sum())]
+        keep = np.concatenate([np.flatnonzero(above), ties])
+        rows, values = rows[keep], values[keep]
+    order = np.lexsort((rows, -values))
+    return rows[order]
+
+
+def recommend_rows(index, row, weights, mask=None, candidates=RECOMMEND_CANDIDATES, k=RECOMMEND_RESULTS):
+    """
+    /api/recommend scoring: take the `candidates` nearest narrative neighbours
+    allowed by `mask`, re-rank them by fused multimodal similarity.
+
+    Returns (rows, similarities, combined) for the top k, best first.
+    """
+    distances = narrative_distances(index, row)
+    nearest = top_k(-distances, candidates, mask)
+    nearest = nearest[nearest != row]
+
+    similarities = {
+        'narrative': np.maximum(0.0, 1.0 - distances[nearest]),
+        'visual': similarity_vector(index, 'visual', row, nearest),
+        'audio': similarity_vector(index, 'audio', row, nearest),
+    }
+    combined = fuse_vectors(similarities, weights)
+    order = np.argsort(-combined, kind='stable')[:k]
+    return nearest[order], {m: s[order] for m, s in similarities.items()}, combined[order]
+
+
+def sample_pool(index, row, size=APPROXIMATE_SAMPLE):
+    """
+    An evenly strided subset of the catalog to look for neighbours in, or
+    None when the catalog is small enough that the subset would be all of it
+    """
+    if len(index) <= size:
+        return None
+    pool = np.arange(0, len(index), -(-len(index) // size))
+    return pool[pool != row]
+
+
+def recommend_from_pool(index, row, weights, pool, mask=None,
+                        candidates=RECOMMEND_CANDIDATES, k=RECOMMEND_RESULTS):
+    """
+    recommend_rows restricted to the neighbours found in `pool` (rows other
+    than `row`). Equal to recommend_rows whenever the pool holds the true
+    nearest allowed neighbours, e.g. a deep enough neighbour table row.
+    """
+    pool = np.asarray(pool)
+    if mask is not None:
+        pool = pool[mask[pool]]
+    # recommend_rows spends one of its candidates on the source row itself
+    if mask is None or mask[row]:
+        candidates -= 1
+
+    squared = index.squared_norms['narrative']
+    dots = index.dot('narrative', index.vector('narrative', row), pool)
+    distances = np.maximum(squared[pool] + squared[row] - 2.0 * dots, 0.0)
+    distances = distances.astype(np.float64)
+    nearest = np.lexsort((pool, distances))[:candidates]
+    pool, distances = pool[nearest], distances[nearest]
+
+    similarities = {
+        'narrative': np.maximum(0.0, 1.0 - distances),
+        'visual': similarity_vector(index, 'visual', row, pool),
+        'audio': similarity_vector(index, 'audio', row, pool),
+    }
+    combined = fuse_vectors(similarities, weights)
+    order = np.argsort(-combined, kind='stable')[:k]
+    return pool[order], {m: s[order] for m, s in similarities.items()}, combined[order]
+
+
+def similarity_rows(index, row, weights, mask=None, k=SIMILARITY_RESULTS):
+    """
+    /api/similarity scoring: fused cosine similarity against the whole catalog
+    allowed by `mask` (the source movie is always excluded).
+
+    Returns (rows, similarities, combined) for the top k, best first.
+    """
+    allowed = np.ones(len(index), dtype=np.bool_) if mask is None else mask.copy()
+    allowed[row] = False
+    return query_similarity_rows(index, row_query(index, row), weights, allowed, k)
+
+
+def query_similarity_rows(index, query, weights, mask=None, k=SIMILARITY_RESULTS):
+    """
+    similarity_rows for a row_query, e.g. a session's taste profile
+    (taste_profile.py); excluding titles is up to `mask`
+    """
+    similarities = query_catalog_similarities(index, query)
+    combined = fuse_vectors(similarities, weights)
+    rows = top_k(combined, k, mask)
+    return rows, {m: s[rows] for m, s in similarities.items()}, combined[rows]
+
+
+def catalog_similarities(index, row):
+    """
+    Per-modality cosine similarity of `row` against the whole catalog, as
+    /api/similarity fuses them
+    """
+    return query_catalog_similarities(index, row_query(index, row))
+
+
+def query_catalog_similarities(index, query):
+    similarities = {}
+    for modality in MODALITIES:
+        sims = query_similarity(index, modality, query)
+        # A similarity of exactly 0 is reported as neutral, as the per-pair loop did
+        sims[sims == 0] = MISSING_SIMILARITY
+        similarities[modality] = sims
+    return similarities
+
+
+def modality_vector_rows(index, row, mask=None, top=None):
+    """
+    Unfused /api/similarity scores for client-side re-weighting.
+
+    With `top`, only the union of each modality's `top` best rows is kept.
+    thresholds[m] is the best modality-m score among the allowed rows left
+    out, so no omitted row can fuse above sum(weights[m] * thresholds[m]);
+    a client whose k-th fused score clears that bound has the exact top k.
+
+    Returns (rows, similarities, thresholds), rows in catalog order.
+    """
+    similarities = catalog_similarities(index, row)
+    allowed = np.ones(len(index), dtype=np.bool_) if mask is None else mask.copy()
+    allowed[row] = False
+
+    if top is None or top >= int(allowed.sum()):
+        keep = allowed
+    else:
+        keep = np.zeros(len(index), dtype=np.bool_)
+        for sims in similarities.values():
+            keep[top_k(sims, top, allowed)] = True
+
+    omitted = allowed & ~keep
+    thresholds = {m: float(s[omitted].max()) if omitted.any() else 0.0 for m, s in similarities.items()}
+    rows = np.flatnonzero(keep)
+    return rows, {m: s[rows] for m, s in similarities.items()}, thresholds
@@ -0,0 +1,221 @@
+"""
+In-memory serving index: embedding matrices, title lookup and metadata
+
+Built once at startup from a serving snapshot (see serving_snapshot.py) or
+straight from the ChromaDB collections, so request handlers score against
+NumPy matrices instead of issuing one ChromaDB get() per candidate.
+
+A snapshot with delta segments (index_segments.py) becomes one index whose
+rows are the base segment's followed by each delta's. Segment matrices are
+never concatenated: dot() multiplies segment by segment, so appending a
+small delta does not copy the base. Rows shadowed by a newer segment or
+deleted by a tombstone stay in place but are left out of `live`, which the
+catalog folds into every filter mask.
+"""
+
+import os
+
+import numpy as np
+
+from color_palette import HISTOGRAM_WIDTH
+from index_segments import Segment, load_segments
+from keyword_signatures import KeywordIndex
+from metadata_catalog import MetadataCatalog, concat_columns, load_enriched_rows
+from serving_snapshot import MODALITIES, read_chroma_catalog
+
+
+class ServingIndex:
+    """
+    Row-aligned titles, documents, embeddings and metadata for the whole catalog
+    """
+
+    def __init__(self, titles, embeddings, documents, present, catalog, source, live=None, keywords=None):
+        self._assemble([Segment(titles, embeddings, documents, present)], catalog, source, live)
+        # A shard passes its rows' signatures weighed over the whole catalog (sharding.load_shard)
+        self._keywords = keywords
+
+    @classmethod
+    def from_segments(cls, segments, catalog, source, live=None, digests=None):
+        index = cls.__new__(cls)
+        index._assemble(segments, catalog, source, live, digests)
+        return index
+
+    def _assemble(self, segments, catalog, source, live, digests=None):
+        self.segments = segments
+        self.offsets = np.cumsum([0] + [len(segment) for segment in segments])
+        self.live = live
+        # Per-row hashes of each movie's served record (Segment.metadata), when loaded with them
+        self.digests = digests
+        if len(segments) == 1:
+            segment = segments[0]
+            self.titles = segment.titles
+            self.documents = segment.documents
+            self.present = segment.present
+            self.squared_norms = segment.squared_norms
+            self.norms = segment.norms
+        else:
+            self.titles = [title for segment in segments for title in segment.titles]
+            self.documents = [document for segment in segments for document in segment.documents]
+            self.present = np.concatenate([segment.present for segment in segments])
+            if segments[0].embeddings is None:
+                self.squared_norms = self.norms = None
+            else:
+                self.squared_norms = {m: np.concatenate([s.squared_norms[m] for s in segments]) for m in MODALITIES}
+                self.norms = {m: np.concatenate([s.norms[m] for s in segments]) for m in MODALITIES}
+        # False for a sharding coordinator's titles-and-metadata index (load_serving_index(vectors=False))
+        self.has_vectors = segments[0].embeddings is not None
+        self._embeddings = segments[0].embeddings if len(segments) == 1 else None
+        # Section embeddings (facet_index.py) are searchable only when every segment has them
+        facets = [segment.facets for segment in segments]
+        self.has_facets = all(f is not None for f in facets) and len({f.shape[2] for f in facets}) == 1
+        self.facet_norms = (np.concatenate([segment.facet_norms for segment in segments])
+                            if self.has_facets else None)
+
+        self.title_index = {}
+        for row, title in enumerate(self.titles):
+            # Keep the first row for duplicated titles, like a where={"title": ...} get()
+            if live is None or live[row]:
+                self.title_index.setdefault(title, row)
+        self.catalog = catalog
+        self.source = source
+        self._column_norms = {}
+        self._keywords = None
+
+    def __len__(self):
+        return len(self.titles)
+
+    @property
+    def embeddings(self):
+        # Whole-catalog matrices for offline builders; request paths use dot()
+        if self._embeddings is None:
+            self._embeddings = {m: np.concatenate([s.embeddings[m] for s in self.segments]) for m in MODALITIES}
+        return self._embeddings
+
+    @property
+    def delta_rows(self):
+        return int(self.offsets[-1] - self.offsets[1])
+
+    def live_rows(self):
+        return np.arange(len(self)) if self.live is None else np.flatnonzero(self.live)
+
+    def vector(self, modality, row):
+        segment = int(np.searchsorted(self.offsets, row, side='right')) - 1
+        return self.segments[segment].embeddings[modality][row - self.offsets[segment]]
+
+    def dot(self, modality, vector, rows=None):
+        """
+        matrix @ vector for every row (or just `rows`), one segment at a time
+        """
+        if len(self.segments) == 1:
+            matrix = self.segments[0].embeddings[modality]
+            return matrix @ vector if rows is None else matrix[rows] @ vector
+        if rows is None:
+            return np.concatenate([segment.embeddings[modality] @ vector for segment in self.segments])
+
+        rows = np.asarray(rows)
+        owner = np.searchsorted(self.offsets, rows, side='right') - 1
+        dots = np.empty(len(rows), dtype=np.float32)
+        for i, segment in enumerate(self.segments):
+            picked = owner == i
+            if picked.any():
+                dots[picked] = segment.embeddings[modality][rows[picked] - self.offsets[i]] @ vector
+        return dots
+
+    @property
+    def palettes(self):
+        """
+        Each segment's color histograms for palette search (color_palette.py)
+        """
+        return [segment.palette for segment in self.segments]
+
+    def palette_histograms(self, rows):
+        """
+        (len(rows), 96) color histograms of `rows`, gathered segment by segment
+        """
+        rows = np.asarray(rows)
+        if len(self.segments) == 1:
+            return self.segments[0].palette.histograms[rows]
+        owner = np.searchsorted(self.offsets, rows, side='right') - 1
+        histograms = np.empty((len(rows), HISTOGRAM_WIDTH), dtype=np.float32)
+        for i, segment in enumerate(self.segments):
+            picked = owner == i
+            if picked.any():
+                histograms[picked] = segment.palette.histograms[rows[picked] - self.offsets[i]]
+        return histograms
+
+    @property
+    def keywords(self):
+        """
+        Keyword signatures of every row for recommendation tags, built on first use
+        """
+        if self._keywords is None:
+            self._keywords = KeywordIndex([segment.keywords for segment in self.segments])
+        return self._keywords
+
+    def facet_dot(self, columns, vector):
+        """
+        (rows, len(columns)) dots of each row's `columns` facets with vector,
+        one segment at a time
+        """
+        parts = []
+        for segment in self.segments:
+            facets = segment.facets
+            if len(columns) == 1:
+                # A strided view of one facet; no facet is copied out
+                parts.append((facets[:, columns[0], :] @ vector)[:, None])
+            else:
+                # One pass over the contiguous (rows * facets, dim) matrix beats a strided pass per facet
+                dots = (facets.reshape(-1, facets.shape[2]) @ vector).reshape(facets.shape[:2])
+                parts.append(dots if len(columns) == facets.shape[1] else dots[:, columns])
+        return np.concatenate(parts)
+
+    def column_norms(self, modality, stop):
+        """
+        Norm of each row's first `stop` columns of `modality` (e.g. the CLIP
+        part of the visual vectors), computed the first time it is asked for
+        """
+        norms = self._column_norms.get((modality, stop))
+        if norms is None:
+            parts = []
+            for segment in self.segments:
+                matrix = segment.embeddings[modality]
+                # In blocks, so no copy of the whole slice is made
+                for start in range(0, len(matrix), 65536):
+                    block = matrix[start:start + 65536, :stop]
+                    parts.append(np.sqrt(np.einsum('ij,ij->i', block, block)))
+            norms = np.concatenate(parts).astype(np.float32) if parts else np.zeros(0, dtype=np.float32)
+            # Racing computations produce the same array, so no lock is needed
+            self._column_norms[(modality, stop)] = norms
+        return norms
+
+    def row(self, title):
+        return self.title_index.get(title)
+
+    def has_modality(self, row, modality):
+        return bool(self.present[row, MODALITIES.index(modality)])
+
+    def movie_record(self, row):
+        return self.catalog.movie_record(row, self.documents[row])
+
+
+def load_serving_index(database_path=None, snapshot_path=None, enriched_csv=None, links=None, vectors=True):
+    """
+    Load from the snapshot when one exists, otherwise export ChromaDB in
+    memory. Without `vectors` only titles, documents and metadata are loaded
+    from the snapshot, for a coordinator whose shards do the scoring.
+    """
+    if snapshot_path and os.path.exists(os.path.join(snapshot_path, 'manifest.json')):
+        segments, live = load_segments(snapshot_path, vectors=vectors)
+        source = snapshot_path
+    else:
+        titles, embeddings, documents, present = read_chroma_catalog(database_path)
+        segments, live = [Segment(titles, embeddings, documents, present)], None
+        source = database_path
+
+    enriched_rows = load_enriched_rows(enriched_csv)
+    metadata = [segment.metadata(enriched_rows, links) for segment in segments]
+    columns = concat_columns([columns for columns, _ in metadata])
+    digests = np.concatenate([digests for _, digests in metadata])
+    titles = [title for segment in segments for title in segment.titles]
+    catalog = MetadataCatalog(titles, None, links, live, columns)
+    return ServingIndex.from_segments(segments, catalog, source, live, digests)
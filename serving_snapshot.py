@@ -0,0 +1,232 @@
+"""
+Serving snapshot: the catalog's embeddings as plain NumPy arrays
+
+ChromaDB is the ingest store, but scoring a request only needs three dense
+matrices (narrative / visual / audio) aligned to one title order. A snapshot
+is a directory holding exactly that, so it can be memory-mapped at startup:
+
+    manifest.json     format version, row count, per-modality dimensions
+    titles.json       row order of every matrix
+    documents.jsonl   Gemini analysis per row (one JSON string per line)
+    narrative.npy     float32 (N, 384)  all-MiniLM-L6-v2 of the Gemini text
+    visual.npy        float32 (N, 608)  512 CLIP + 96 color histogram bins
+    audio.npy         float32 (N, 8)    tempo + 7 spectral contrast bands
+    present.npy       bool    (N, 3)    which modalities exist for each row
+    facets.npy        float32 (N, 4, 384)  optional: each Gemini section
+                      embedded on its own (see facet_index.py)
+    segments/         append-only delta segments and tombstones on top of
+                      this base (see index_segments.py)
+
+Build one from the ChromaDB store with:
+    python serving_snapshot.py --db Data/trailer_db --out Data/serving_snapshot
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from movie_analysis import FACETS
+
+SNAPSHOT_FORMAT = 1
+MODALITIES = ('narrative', 'visual', 'audio')
+COLLECTIONS = {'narrative': 'db_narrative', 'visual': 'db_visuals', 'audio': 'db_audio'}
+DIMENSIONS = {'narrative': 384, 'visual': 608, 'audio': 8}
+SEGMENTS_DIR = 'segments'
+SEGMENT_LOG = 'log.json'
+FACET_FILE = 'facets.npy'
+
+
+def open_snapshot_writer(path, count, dims=None):
+    """
+    Preallocate the snapshot arrays on disk so large catalogs can be written
+    chunk by chunk without holding every vector in memory
+    """
+    dims = dims or DIMENSIONS
+    os.makedirs(path, exist_ok=True)
+    # Unlink rather than truncate: a running server memory-maps these files
+    # and keeps reading the old inodes until it swaps to the new snapshot.
+    # The manifest goes first so a half-written snapshot is never loaded.
+    for name in ['manifest.json', 'present.npy', FACET_FILE] + [f'{modality}.npy' for modality in MODALITIES]:
+        if os.path.exists(os.path.join(path, name)):
+            os.unlink(os.path.join(path, name))
+    arrays = {
+        modality: np.lib.format.open_memmap(
+            os.path.join(path, f'{modality}.npy'), mode='w+', dtype=np.float32, shape=(count, dims[modality]))
+        for modality in MODALITIES
+    }
+    arrays['present'] = np.lib.format.open_memmap(
+        os.path.join(path, 'present.npy'), mode='w+', dtype=np.bool_, shape=(count, len(MODALITIES)))
+    return arrays
+
+
+def open_facet_writer(path, count, dim):
+    """
+    Preallocate facets.npy for a snapshot being written; finish_snapshot()
+    records it in the manifest when it is passed in `arrays` as 'facets'
+    """
+    target = os.path.join(path, FACET_FILE)
+    if os.path.exists(target):
+        os.unlink(target)
+    return np.lib.format.open_memmap(target, mode='w+', dtype=np.float32, shape=(count, len(FACETS), dim))
+
+
+def facet_manifest(facets):
+    return {'names': list(FACETS), 'dim': int(facets.shape[2])}
+
+
+def logged_segment_seq(path):
+    """
+    Sequence number of the newest delta segment or tombstone logged on top of
+    the snapshot at `path` (0 when there is no segment log)
+    """
+    try:
+        with open(os.path.join(path, SEGMENTS_DIR, SEGMENT_LOG), encoding='utf-8') as f:
+            return json.load(f)['next_seq'] - 1
+    except FileNotFoundError:
+        return 0
+
+
+def finish_snapshot(path, titles, documents, arrays, source, segment_seq=None):
+    """
+    Flush the arrays and write titles, documents and the manifest last, so a
+    half-written snapshot is never mistaken for a complete one.
+
+    segment_seq records which logged segments the snapshot already contains;
+    by default all of them, as for a fresh export of the whole ingest store.
+    """
+    for array in arrays.values():
+        array.flush()
+
+    with open(os.path.join(path, 'titles.json'), 'w', encoding='utf-8') as f:
+        json.dump(list(titles), f, ensure_ascii=False)
+
+    with open(os.path.join(path, 'documents.jsonl'), 'w', encoding='utf-8') as f:
+        for document in documents:
+            f.write(json.dumps(document or '', ensure_ascii=False))
+            f.write('\n')
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'count': len(titles),
+        'dims': {modality: int(arrays[modality].shape[1]) for modality in MODALITIES},
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'source': source,
+        'segment_seq': logged_segment_seq(path) if segment_seq is None else segment_seq,
+    }
+    if 'facets' in arrays:
+        manifest['facets'] = facet_manifest(arrays['facets'])
+    with open(os.path.join(path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def write_snapshot(path, titles, embeddings, documents, present=None, source='unknown', segment_seq=None,
+                   facets=None):
+    """
+    Write a complete snapshot from in-memory arrays
+    """
+    dims = {modality: embeddings[modality].shape[1] for modality in MODALITIES}
+    arrays = open_snapshot_writer(path, len(titles), dims)
+    for modality in MODALITIES:
+        arrays[modality][:] = embeddings[modality]
+    arrays['present'][:] = True if present is None else present
+    if facets is not None:
+        arrays['facets'] = open_facet_writer(path, len(titles), facets.shape[2])
+        arrays['facets'][:] = facets
+    return finish_snapshot(path, titles, documents, arrays, source, segment_seq)
+
+
+def load_snapshot(path, mmap=True):
+    """
+    Load a snapshot directory. Matrices are memory-mapped by default so
+    startup cost does not grow with the catalog.
+    """
+    with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')} in {path}")
+
+    with open(os.path.join(path, 'titles.json'), encoding='utf-8') as f:
+        titles = json.load(f)
+    with open(os.path.join(path, 'documents.jsonl'), encoding='utf-8') as f:
+        documents = [json.loads(line) for line in f]
+
+    mode = 'r' if mmap else None
+    snapshot = {
+        'manifest': manifest,
+        'titles': titles,
+        'documents': documents,
+        'present': np.load(os.path.join(path, 'present.npy'), mmap_mode=mode),
+    }
+    for modality in MODALITIES:
+        snapshot[modality] = np.load(os.path.join(path, f'{modality}.npy'), mmap_mode=mode)
+    # Facets built for other section names are ignored until rebuilt
+    if manifest.get('facets', {}).get('names') == list(FACETS):
+        snapshot['facets'] = np.load(os.path.join(path, FACET_FILE), mmap_mode=mode)
+    return snapshot
+
+
+def read_chroma_catalog(database_path):
+    """
+    Read all three ChromaDB collections and align them to the narrative order
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=database_path)
+    data = {}
+    for modality, name in COLLECTIONS.items():
+        try:
+            collection = client.get_collection(name)
+        except Exception:
+            data[modality] = None
+            continue
+        include = ['embeddings', 'metadatas', 'documents'] if modality == 'narrative' else ['embeddings', 'metadatas']
+        data[modality] = collection.get(include=include)
+
+    narrative = data['narrative']
+    if narrative is None:
+        raise ValueError(f"No db_narrative collection in {database_path}")
+
+    titles = [metadata.get('title', 'Unknown') for metadata in narrative['metadatas']]
+    documents = list(narrative['documents'])
+    row_of = {title: row for row, title in enumerate(titles)}
+
+    embeddings = {}
+    present = np.zeros((len(titles), len(MODALITIES)), dtype=np.bool_)
+    for m, modality in enumerate(MODALITIES):
+        result = data[modality]
+        dim = DIMENSIONS[modality]
+        if result is not None and len(result['embeddings']) > 0:
+            dim = len(result['embeddings'][0])
+        matrix = np.zeros((len(titles), dim), dtype=np.float32)
+        if result is not None:
+            for metadata, vector in zip(result['metadatas'], result['embeddings']):
+                row = row_of.get(metadata.get('title'))
+                if row is not None and not present[row, m]:
+                    matrix[row] = vector
+                    present[row, m] = True
+        embeddings[modality] = matrix
+
+    return titles, embeddings, documents, present
+
+
+def build_snapshot_from_chroma(database_path, path):
+    """
+    Export the ChromaDB store into a serving snapshot
+    """
+    titles, embeddings, documents, present = read_chroma_catalog(database_path)
+    return write_snapshot(path, titles, embeddings, documents, present, source=os.path.abspath(database_path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export ChromaDB collections into a serving snapshot")
+    parser.add_argument('--db', default=os.environ.get('CHROMA_PERSIST_DIRECTORY', 'Data/trailer_db'))
+    parser.add_argument('--out', default=os.environ.get('SERVING_SNAPSHOT_PATH', 'Data/serving_snapshot'))
+    args = parser.parse_args()
+
+    start = time.time()
+    manifest = build_snapshot_from_chroma(args.db, args.out)
+    print(f"✓ Wrote snapshot with {manifest['count']} movies to {args.out} in {time.time() - start:.1f}s")
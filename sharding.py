@@ -0,0 +1,472 @@
+"""
+Sharded serving: the catalog partitioned across shard processes
+
+One process holding every embedding stops scaling once the catalog outgrows
+a machine's memory or one core's scan time. Here the live rows of the
+serving snapshot are partitioned by a hash of their title (the catalog's
+id) across N shard servers, and backend_api.py, given SHARD_URLS, becomes a
+coordinator for /api/similarity, /api/recommend and /api/session/recommend:
+
+  1. the shard owning the source title returns its vectors and norms
+  2. every shard scores its partition against them and returns its own
+     top-k (similarity) or nearest narrative candidates (recommend)
+  3. the coordinator merges the per-shard lists into the global ranking
+
+Each shard keeps the source's global row number, so merged ties break in
+catalog order exactly as on a single node. Shards that have not answered
+when the timeout passes are left out and the response is marked partial.
+
+    python sharding.py launch --shards 4 --base-port 5101
+    SHARD_URLS=http://127.0.0.1:5101,http://127.0.0.1:5102,... python backend_api.py
+
+    python sharding.py serve --shard 0 --shards 4 --port 5101   # one shard per host
+"""
+
+import argparse
+import base64
+import csv
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from index_segments import load_segments
+from keyword_signatures import KeywordIndex, SegmentKeywords
+from metadata_catalog import MetadataCatalog, load_enriched_rows
+from scoring import (
+    MODALITIES,
+    RECOMMEND_CANDIDATES,
+    RECOMMEND_RESULTS,
+    SIMILARITY_RESULTS,
+    fuse_vectors,
+    query_catalog_similarities,
+    query_distances,
+    query_similarity,
+    row_query,
+    top_k,
+)
+from serving_index import ServingIndex
+
+DEFAULT_BASE_PORT = 5101
+DEFAULT_TIMEOUT_MS = 2000
+# How long launch waits for every shard to load its partition
+STARTUP_TIMEOUT = 300.0
+
+
+def shard_of(title, shards):
+    """
+    The shard that owns `title`; stable across processes and restarts
+    """
+    return zlib.crc32(title.encode('utf-8')) % shards
+
+
+class ShardUnavailable(Exception):
+    pass
+
+
+class Shard:
+    """
+    One shard's partition as a ServingIndex, plus each row's row number in
+    the unsharded catalog
+    """
+
+    def __init__(self, index, catalog_rows, shard, shards):
+        self.index = index
+        self.catalog_rows = catalog_rows
+        self.shard = shard
+        self.shards = shards
+
+
+def read_trailer_links(csv_path):
+    links = {}
+    if csv_path and os.path.exists(csv_path):
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                links[row['Movie Title']] = row.get('YouTube Link') or ''
+    return links
+
+
+def load_shard(snapshot_path, shard, shards, enriched_csv=None, links=None):
+    """
+    The live rows of the snapshot (base plus delta segments) that hash to `shard`
+    """
+    if not os.path.exists(os.path.join(snapshot_path, 'manifest.json')):
+        raise FileNotFoundError(f"No serving snapshot at {snapshot_path} (build one with serving_snapshot.py)")
+    segments, live = load_segments(snapshot_path)
+
+    titles, documents, present, catalog_rows, picks = [], [], [], [], []
+    embeddings = {m: [] for m in MODALITIES}
+    offset = 0
+    for segment in segments:
+        picked = [i for i, title in enumerate(segment.titles)
+                  if (live is None or live[offset + i]) and shard_of(title, shards) == shard]
+        picks.append(picked)
+        titles.extend(segment.titles[i] for i in picked)
+        documents.extend(segment.documents[i] for i in picked)
+        present.append(segment.present[picked])
+        for m in MODALITIES:
+            embeddings[m].append(segment.embeddings[m][picked])
+        catalog_rows.extend(offset + i for i in picked)
+        offset += len(segment)
+
+    embeddings = {m: np.concatenate(blocks) for m, blocks in embeddings.items()}
+    catalog = MetadataCatalog(titles, load_enriched_rows(enriched_csv), links)
+    # Terms are weighed by their frequency in the whole catalog, so every shard explains like one node
+    parts = [segment.keywords for segment in segments]
+    keywords = KeywordIndex([SegmentKeywords.select(parts, picks)], frequencies=parts)
+    index = ServingIndex(titles, embeddings, documents, np.concatenate(present), catalog,
+                         f"{snapshot_path} (shard {shard}/{shards})", keywords=keywords)
+    return Shard(index, np.array(catalog_rows, dtype=np.int64), shard, shards)
+
+
+def encode_query(query):
+    """
+    A row_query as JSON: vectors as base64 float32, norms as the exact float32 values
+    """
+    return {
+        'vectors': {m: base64.b64encode(np.ascontiguousarray(v, dtype=np.float32).tobytes()).decode('ascii')
+                    for m, v in query['vectors'].items()},
+        'norms': {m: float(v) for m, v in query['norms'].items()},
+        'squared_norms': {m: float(v) for m, v in query['squared_norms'].items()},
+        'present': [bool(p) for p in query['present']],
+    }
+
+
+def decode_query(payload):
+    return {
+        'vectors': {m: np.frombuffer(base64.b64decode(v), dtype=np.float32) for m, v in payload['vectors'].items()},
+        'norms': {m: np.float32(v) for m, v in payload['norms'].items()},
+        'squared_norms': {m: np.float32(v) for m, v in payload['squared_norms'].items()},
+        'present': payload['present'],
+    }
+
+
+def shard_similarity(shard, query, source_title, weights, filters=None, k=SIMILARITY_RESULTS, records=False):
+    """
+    This shard's top k for /api/similarity (the source title, if any,
+    excluded); with `records`, each entry carries its movie record too
+    """
+    index = shard.index
+    similarities = query_catalog_similarities(index, query)
+    combined = fuse_vectors(similarities, weights)
+    mask = index.catalog.filter_mask(filters, index.title_index)
+    allowed = np.ones(len(index), dtype=np.bool_) if mask is None else mask
+    source_row = index.row(source_title)
+    if source_row is not None:
+        allowed[source_row] = False
+    entries = []
+    for row in top_k(combined, k, allowed):
+        entry = {
+            'title': index.titles[row],
+            'catalog_row': int(shard.catalog_rows[row]),
+            'similarity': float(combined[row]),
+            'similarities': {m: float(similarities[m][row]) for m in MODALITIES},
+        }
+        if records:
+            entry['movie'] = index.movie_record(row)
+        entries.append(entry)
+    return entries
+
+
+def shard_recommend(shard, query, filters=None, candidates=RECOMMEND_CANDIDATES, keywords=None):
+    """
+    This shard's `candidates` nearest narrative neighbours for /api/recommend,
+    with their visual/audio similarities and movie records, and the themes
+    they share with the source when given its `keywords` (KeywordIndex.source)
+    """
+    index = shard.index
+    distances = query_distances(index, query)
+    nearest = top_k(-distances, candidates, index.catalog.filter_mask(filters, index.title_index))
+    visual = query_similarity(index, 'visual', query, nearest)
+    audio = query_similarity(index, 'audio', query, nearest)
+    themes = index.keywords.shared_themes(keywords, nearest) if keywords else [None] * len(nearest)
+    return [{
+        'catalog_row': int(shard.catalog_rows[row]),
+        'distance': float(distances[row]),
+        'similarities': {'visual': float(visual[i]), 'audio': float(audio[i])},
+        'movie': index.movie_record(row),
+        'themes': themes[i],
+    } for i, row in enumerate(nearest)]
+
+
+def merge_similarity(partials, k=SIMILARITY_RESULTS):
+    """
+    Global top k from per-shard top-k lists; ties in catalog order
+    """
+    merged = sorted((entry for partial in partials for entry in partial),
+                    key=lambda entry: (-entry['similarity'], entry['catalog_row']))
+    return merged[:k]
+
+
+def merge_recommend(partials, source_row, weights, candidates=RECOMMEND_CANDIDATES, k=RECOMMEND_RESULTS):
+    """
+    recommend_rows over per-shard candidate lists: the global nearest
+    `candidates` (the source counts when it passed the filters, then is
+    dropped), re-ranked by fused similarity.
+
+    Returns (movie records, similarities, combined, shared themes) for the
+    top k, best first.
+    """
+    nearest = sorted((entry for partial in partials for entry in partial),
+                     key=lambda entry: (entry['distance'], entry['catalog_row']))[:candidates]
+    nearest = [entry for entry in nearest if entry['catalog_row'] != source_row]
+
+    similarities = {
+        'narrative': np.maximum(0.0, 1.0 - np.array([entry['distance'] for entry in nearest], dtype=np.float64)),
+        'visual': np.array([entry['similarities']['visual'] for entry in nearest], dtype=np.float64),
+        'audio': np.array([entry['similarities']['audio'] for entry in nearest], dtype=np.float64),
+    }
+    combined = fuse_vectors(similarities, weights)
+    order = np.argsort(-combined, kind='stable')[:k]
+    return ([nearest[i]['movie'] for i in order], {m: s[order] for m, s in similarities.items()}, combined[order],
+            [nearest[i].get('themes') for i in order])
+
+
+def create_shard_app(shard):
+    """
+    The Flask app one shard process serves
+    """
+    from flask import Flask, jsonify, request
+
+    from response_encoding import FastJSONProvider
+
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    index = shard.index
+
+    @app.route('/shard/health', methods=['GET'])
+    def health():
+        return jsonify({"status": "healthy", "shard": shard.shard, "shards": shard.shards,
+                        "movies": len(index), "source": index.source})
+
+    @app.route('/shard/source', methods=['POST'])
+    def source():
+        title = (request.json or {}).get('title')
+        row = index.row(title)
+        if row is None:
+            return jsonify({"error": f"Movie '{title}' not found"}), 404
+        return jsonify({'title': title, 'catalog_row': int(shard.catalog_rows[row]),
+                        'query': encode_query(row_query(index, row)), 'keywords': index.keywords.source(row)})
+
+    @app.route('/shard/similarity', methods=['POST'])
+    def similarity():
+        data = request.json
+        return jsonify(shard_similarity(shard, decode_query(data['source']['query']), data['source']['title'],
+                                        data['weights'], data.get('filters'), int(data['k']),
+                                        bool(data.get('records'))))
+
+    @app.route('/shard/recommend', methods=['POST'])
+    def recommend():
+        data = request.json
+        return jsonify(shard_recommend(shard, decode_query(data['source']['query']), data.get('filters'),
+                                       int(data.get('candidates', RECOMMEND_CANDIDATES)),
+                                       data['source'].get('keywords')))
+
+    return app
+
+
+class ScatterGather:
+    """
+    Coordinator-side client: finds the source on its owner shard, fans the
+    query out to every shard and merges what arrives within the timeout
+    """
+
+    def __init__(self, urls, timeout_ms=DEFAULT_TIMEOUT_MS):
+        self.urls = [url.strip().rstrip('/') for url in urls]
+        self.timeout = timeout_ms / 1000.0
+        self.executor = ThreadPoolExecutor(max_workers=4 * len(self.urls), thread_name_prefix='scatter')
+        self.lock = threading.Lock()
+        self.counters = {'queries': 0, 'partial': 0, 'shard_timeouts': 0, 'shard_errors': 0}
+
+    def _post(self, url, path, payload, timeout):
+        req = urllib.request.Request(url + path, data=json.dumps(payload).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return json.loads(res.read())
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def source(self, title, deadline):
+        """
+        The owner shard's /shard/source answer, or None for an unknown title
+        """
+        shard = shard_of(title, len(self.urls))
+        try:
+            return self._post(self.urls[shard], '/shard/source', {'title': title},
+                              max(deadline - time.monotonic(), 0.001))
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            self._count('shard_errors')
+            raise ShardUnavailable(f"Shard {shard} failed looking up '{title}' (HTTP {e.code})")
+        except (OSError, ValueError) as e:
+            self._count('shard_timeouts' if isinstance(getattr(e, 'reason', e), TimeoutError) else 'shard_errors')
+            raise ShardUnavailable(f"Shard {shard} holding '{title}' did not answer: {e}")
+
+    def sources(self, titles, deadline):
+        """
+        source() for several titles at once: {title: answer or None}
+        """
+        futures = {title: self.executor.submit(self.source, title, deadline) for title in dict.fromkeys(titles)}
+        return {title: future.result() for title, future in futures.items()}
+
+    def gather(self, path, payload, deadline):
+        """
+        POST to every shard; the answers that arrived by `deadline`
+        """
+        futures = [self.executor.submit(self._post, url, path, payload, max(deadline - time.monotonic(), 0.001))
+                   for url in self.urls]
+        done, pending = wait(futures, timeout=max(deadline - time.monotonic(), 0.0))
+        answers, timeouts, errors = [], len(pending), 0
+        for future in done:
+            error = future.exception()
+            if error is None:
+                answers.append(future.result())
+            elif isinstance(getattr(error, 'reason', error), TimeoutError):
+                timeouts += 1
+            else:
+                errors += 1
+        with self.lock:
+            self.counters['queries'] += 1
+            self.counters['partial'] += len(answers) < len(self.urls)
+            self.counters['shard_timeouts'] += timeouts
+            self.counters['shard_errors'] += errors
+        return answers
+
+    def similarity(self, title, weights, filters=None, k=SIMILARITY_RESULTS, timeout=None):
+        """
+        /api/similarity across the shards: (entries, shards answered), or
+        None for an unknown title
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        source = self.source(title, deadline)
+        if source is None:
+            return None
+        answers = self.gather('/shard/similarity', {'source': source, 'weights': weights,
+                                                    'filters': filters, 'k': k}, deadline)
+        return merge_similarity(answers, k), len(answers)
+
+    def query_similarity(self, query, weights, filters=None, k=SIMILARITY_RESULTS, timeout=None):
+        """
+        /api/similarity for a row_query that is no catalog title (e.g. a
+        taste profile): (entries with movie records, shards answered)
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        source = {'title': None, 'query': encode_query(query)}
+        answers = self.gather('/shard/similarity', {'source': source, 'weights': weights, 'filters': filters,
+                                                    'k': k, 'records': True}, deadline)
+        return merge_similarity(answers, k), len(answers)
+
+    def recommend(self, title, weights, filters=None, timeout=None):
+        """
+        /api/recommend across the shards: (movie records, similarities,
+        combined, shared themes, shards answered), or None for an unknown title
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        source = self.source(title, deadline)
+        if source is None:
+            return None
+        answers = self.gather('/shard/recommend', {'source': source, 'filters': filters,
+                                                   'candidates': RECOMMEND_CANDIDATES}, deadline)
+        return merge_recommend(answers, source['catalog_row'], weights) + (len(answers),)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, shards=len(self.urls), timeout_ms=round(self.timeout * 1000))
+
+
+def shard_urls(shards, base_port=DEFAULT_BASE_PORT, host='127.0.0.1'):
+    return [f"http://{host}:{base_port + shard}" for shard in range(shards)]
+
+
+def wait_healthy(urls, timeout=STARTUP_TIMEOUT, processes=None):
+    """
+    Block until every shard answers /shard/health; raises if one exits or the timeout passes
+    """
+    deadline = time.monotonic() + timeout
+    for i, url in enumerate(urls):
+        while True:
+            try:
+                with urllib.request.urlopen(url + '/shard/health', timeout=1.0) as res:
+                    if res.status == 200:
+                        break
+            except OSError:
+                pass
+            if processes is not None and processes[i].poll() is not None:
+                raise RuntimeError(f"Shard {i} exited with code {processes[i].returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Shard {i} at {url} not healthy after {timeout}s")
+            time.sleep(0.2)
+
+
+def launch_shards(shards, base_port=DEFAULT_BASE_PORT, host='127.0.0.1', data_args=(), **popen_kwargs):
+    """
+    Start one `serve` process per shard on consecutive ports. Returns (processes, urls).
+    """
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), *data_args, '--host', host,
+                          'serve', '--shard', str(shard), '--shards', str(shards), '--port', str(base_port + shard)],
+                         **popen_kwargs)
+        for shard in range(shards)
+    ]
+    return processes, shard_urls(shards, base_port, host)
+
+
+def stop_shards(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the catalog as hash-partitioned shards")
+    parser.add_argument('--snapshot', default=os.environ.get('SERVING_SNAPSHOT_PATH', 'Data/serving_snapshot'))
+    parser.add_argument('--enriched', default=os.environ.get('MOVIES_ENRICHED_CSV_PATH',
+                                                             'Data/movie_trailers_enriched.csv'))
+    parser.add_argument('--csv', default=os.environ.get('MOVIES_CSV_PATH', 'Data/movie_trailers.csv'))
+    parser.add_argument('--host', default='127.0.0.1')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help="serve one shard")
+    serve.add_argument('--shard', type=int, required=True)
+    serve.add_argument('--shards', type=int, required=True)
+    serve.add_argument('--port', type=int, required=True)
+    launch = commands.add_parser('launch', help="run every shard as a local process")
+    launch.add_argument('--shards', type=int, required=True)
+    launch.add_argument('--base-port', type=int, default=DEFAULT_BASE_PORT)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        if not 0 <= args.shard < args.shards:
+            parser.error("--shard must be between 0 and --shards - 1")
+        start = time.time()
+        shard = load_shard(args.snapshot, args.shard, args.shards, args.enriched, read_trailer_links(args.csv))
+        print(f"✓ Shard {args.shard}/{args.shards}: {len(shard.index)} movies in {time.time() - start:.1f}s, "
+              f"serving on {args.host}:{args.port}")
+        create_shard_app(shard).run(host=args.host, port=args.port, threaded=True)
+    else:
+        data_args = ['--snapshot', args.snapshot, '--enriched', args.enriched, '--csv', args.csv]
+        processes, urls = launch_shards(args.shards, args.base_port, args.host, data_args)
+        try:
+            wait_healthy(urls, processes=processes)
+            print(f"✓ {args.shards} shards ready")
+            print(f"SHARD_URLS={','.join(urls)}")
+            for process in processes:
+                process.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop_shards(processes)
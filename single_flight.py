@@ -0,0 +1,92 @@
+"""
+Request coalescing (single-flight) for identical in-flight queries
+
+When a title trends, many clients ask for the same /api/recommend/<title> or
+/api/analysis/<title> at once. The first request for a key computes the
+response; identical requests that arrive while it is running wait for it and
+share the serialized result instead of repeating the work. Nothing is cached:
+the key is forgotten as soon as its computation finishes.
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time
+
+    stats() counts, per label, the computations executed, the requests that
+    were coalesced onto another request's computation, and failures.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.counters = {}
+        self.max_waiters = 0
+
+    def _count(self, label, field):
+        counters = self.counters.setdefault(label, {'executed': 0, 'coalesced': 0, 'errors': 0})
+        counters[field] += 1
+
+    def do(self, key, fn, label=None):
+        """
+        Return (fn() result, shared). `shared` is True when the result came
+        from a computation another caller started; its exception is re-raised
+        in every waiter.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self._count(label, 'executed')
+            else:
+                call.waiters += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+                self._count(label, 'coalesced')
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self.lock:
+                self._count(label, 'errors')
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self.lock:
+            routes = {label: dict(counters) for label, counters in self.counters.items()}
+            in_flight = len(self.calls)
+            max_waiters = self.max_waiters
+        executed = sum(c['executed'] for c in routes.values())
+        coalesced = sum(c['coalesced'] for c in routes.values())
+        return {
+            'executed': executed,
+            'coalesced': coalesced,
+            'coalesced_ratio': round(coalesced / (executed + coalesced), 4) if executed + coalesced else 0.0,
+            'in_flight': in_flight,
+            'max_waiters': max_waiters,
+            'routes': routes,
+        }
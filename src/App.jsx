@@ -4,6 +4,7 @@ import MovieList from "./components/MovieList"
 import MovieDisplay from "./components/MovieDisplay"
 import StarRating from "./components/StarRating"
 import { BrainIcon, EyeIcon, AudioIcon, GitHubIcon, PopcornIcon } from "./components/CustomIcons"
+import { loadAnalysis, loadMovies } from "./utils/staticApi"
 import "./styles/App.css"
 
 function App() {
@@ -22,8 +23,7 @@ function App() {
 
   // Load movies from API
   useEffect(() => {
-    fetch("/api/movies")
-      .then(res => res.json())
+    loadMovies()
       .then(data => {
         console.log(`✓ Loaded ${data.length} movies`)
         setMovies(data)
@@ -53,9 +53,8 @@ function App() {
 
     try {
       // Fetch movie analysis
-      const analysisRes = await fetch(`/api/analysis/${encodeURIComponent(movie.title)}`)
-      if (analysisRes.ok) {
-        const analysisData = await analysisRes.json()
+      const analysisData = await loadAnalysis(movie.title)
+      if (analysisData) {
         setAnalysis(analysisData)
       }
     } catch (error) {
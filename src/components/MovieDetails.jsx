@@ -1,4 +1,5 @@
 import { useState, useEffect } from 'react'
+import { loadAnalysis } from '../utils/staticApi'
 import './MovieDetails.css'
 
 function MovieDetails({ movie, onGetRecommendations, onBack, weights }) {
@@ -10,12 +11,11 @@ function MovieDetails({ movie, onGetRecommendations, onBack, weights }) {
     const fetchAnalysis = async () => {
       setLoading(true)
       try {
-        const response = await fetch(`/api/analysis/${encodeURIComponent(movie.title)}`)
-        if (response.ok) {
-          const analysisData = await response.json()
+        const analysisData = await loadAnalysis(movie.title)
+        if (analysisData) {
           setAnalysis(analysisData)
         } else {
-          console.error('Failed to fetch analysis:', response.statusText)
+          console.error('Failed to fetch analysis for', movie.title)
         }
       } catch (error) {
         console.error('Error fetching analysis:', error)
@@ -1,17 +1,46 @@
 import { useState, useEffect } from 'react'
 import MovieCard from './MovieCard'
+import { fetchScoreVectors, fuseScoreVectors } from '../utils/scoreVectors'
 import './MovieList.css'
 
 function MovieList({ movies, selectedMovie, weights, onMovieSelect }) {
   const [similarityScores, setSimilarityScores] = useState([])
+  const [scoreVectors, setScoreVectors] = useState(null)
   const [loading, setLoading] = useState(false)
 
-  // Get similarity scores when movie or weights change
+  // Per-modality scores are fetched once per selected movie...
+  useEffect(() => {
+    setScoreVectors(null)
+    if (!selectedMovie) {
+      return
+    }
+
+    let cancelled = false
+    fetchScoreVectors(selectedMovie.title)
+      .then(payload => !cancelled && setScoreVectors(payload))
+      .catch(error => {
+        console.error('Error fetching score vectors:', error)
+        if (!cancelled) setScoreVectors({ source: selectedMovie.title, failed: true })
+      })
+    return () => { cancelled = true }
+  }, [selectedMovie])
+
+  // ...and re-fused locally when the weights change
   useEffect(() => {
     if (!selectedMovie) {
       setSimilarityScores([])
       return
     }
+    if (!scoreVectors || scoreVectors.source !== selectedMovie.title) {
+      return
+    }
+    if (!scoreVectors.failed) {
+      const { results, exact } = fuseScoreVectors(scoreVectors, weights)
+      if (exact) {
+        setSimilarityScores(results)
+        return
+      }
+    }
 
     const fetchSimilarityScores = async () => {
       setLoading(true)
@@ -38,8 +67,9 @@ function MovieList({ movies, selectedMovie, weights, onMovieSelect }) {
       }
     }
 
+    // Fall back to the server when the local top list could be incomplete
     fetchSimilarityScores()
-  }, [selectedMovie, weights])
+  }, [selectedMovie, weights, scoreVectors])
 
   // Merge movie data with similarity scores
   const moviesWithScores = movies.map(movie => {
@@ -1,4 +1,5 @@
 import { useState } from 'react'
+import { loadMovieBundle } from '../utils/staticApi'
 import './MovieTester.css'
 
 function MovieTester() {
@@ -26,22 +27,10 @@ function MovieTester() {
     setLoading(true)
 
     try {
-      // Get analysis
-      const analysisRes = await fetch(`/api/analysis/${encodeURIComponent(movieTitle)}`)
-      const analysisData = await analysisRes.json()
-      setAnalysis(analysisData)
-
-      // Get similarities
-      const simRes = await fetch('/api/similarity', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          movie_title: movieTitle,
-          weights: weights
-        })
-      })
-      const simData = await simRes.json()
-      setSimilarities(simData.slice(0, 8))
+      // Analysis and similarities in one request
+      const bundle = await loadMovieBundle(movieTitle, weights, ['analysis', 'similarity'])
+      setAnalysis(bundle ? bundle.analysis : null)
+      setSimilarities(bundle ? bundle.similarity.slice(0, 8) : [])
 
     } catch (error) {
       console.error('Error testing movie:', error)
@@ -0,0 +1,76 @@
+// Client-side re-weighting of /api/similarity/vectors payloads (layout in score_payload.py)
+
+const MODALITIES = ['narrative', 'visual', 'audio']
+const DEFAULT_TOP = 1000
+
+export const fetchScoreVectors = async (movieTitle, { top = DEFAULT_TOP } = {}) => {
+  const response = await fetch(`/api/similarity/vectors/${encodeURIComponent(movieTitle)}?top=${top}`)
+  if (!response.ok) {
+    throw new Error(`Score vectors request failed (${response.status})`)
+  }
+  return decodeScoreVectors(await response.arrayBuffer())
+}
+
+export const decodeScoreVectors = (buffer) => {
+  const view = new DataView(buffer)
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4))
+  if (magic !== 'SIMV' || view.getUint16(4, true) !== 1) {
+    throw new Error('Unsupported score vector payload')
+  }
+
+  const headerLength = view.getUint32(8, true)
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)))
+  const count = header.count
+  let offset = 12 + headerLength
+
+  // Typed arrays are little endian on every platform browsers ship on
+  const rows = new Uint32Array(buffer, offset, count)
+  offset += 4 * count
+
+  const scores = {}
+  for (const modality of MODALITIES) {
+    const quantized = new Uint16Array(buffer, offset, count)
+    const values = new Float32Array(count)
+    for (let i = 0; i < count; i++) {
+      values[i] = quantized[i] / header.scale
+    }
+    scores[modality] = values
+    offset += 2 * count
+  }
+
+  return { ...header, rows, scores }
+}
+
+// Same result shape as /api/similarity. `exact` is false when a movie left out
+// of the payload could outrank the k-th result at these weights.
+export const fuseScoreVectors = (payload, weights, k = 20) => {
+  const { count, rows, scores, thresholds } = payload
+  const combined = new Float64Array(count)
+  let bound = 0
+  for (const modality of MODALITIES) {
+    const weight = Number(weights[modality]) || 0
+    const values = scores[modality]
+    for (let i = 0; i < count; i++) {
+      combined[i] += values[i] * weight
+    }
+    bound += thresholds[modality] * weight
+  }
+
+  // Best first, ties in catalog order like the server
+  const order = Array.from({ length: count }, (_, i) => i)
+    .sort((a, b) => combined[b] - combined[a] || rows[a] - rows[b])
+    .slice(0, k)
+
+  const results = order.map(i => ({
+    title: payload.titles[i],
+    similarity: combined[i],
+    similarities: {
+      narrative: scores.narrative[i],
+      visual: scores.visual[i],
+      audio: scores.audio[i]
+    }
+  }))
+
+  const last = results.length ? results[results.length - 1].similarity : 0
+  return { results, exact: results.length === k ? last >= bound : bound === 0 }
+}
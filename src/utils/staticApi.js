@@ -0,0 +1,123 @@
+// Read-only API calls served from the pre-rendered static API (static_api.py)
+// when it is deployed, falling back to the Flask routes otherwise
+
+const STATIC_ROOT = '/static-api'
+
+let manifestPromise = null
+const shardCache = new Map()
+
+const fetchJson = async (url) => {
+  const response = await fetch(url)
+  // SPA fallbacks answer unknown paths with index.html, so check the type too
+  if (!response.ok || !(response.headers.get('content-type') || '').includes('json')) {
+    return null
+  }
+  return response.json()
+}
+
+const loadManifest = () => {
+  if (!manifestPromise) {
+    manifestPromise = fetchJson(`${STATIC_ROOT}/manifest.json`).catch(() => null)
+  }
+  return manifestPromise
+}
+
+// Must match static_api.shard_of: FNV-1a over the UTF-8 title
+export const shardOf = (title, shards) => {
+  let hash = 0x811c9dc5
+  for (const byte of new TextEncoder().encode(title)) {
+    hash = Math.imul(hash ^ byte, 0x01000193) >>> 0
+  }
+  return hash % shards
+}
+
+const loadStatic = async (route, title) => {
+  const manifest = await loadManifest()
+  if (!manifest) return null
+
+  const shard = shardOf(title, manifest.shards)
+  const url = `${STATIC_ROOT}/${manifest.routes[route].replace('{shard}', shard)}?v=${manifest.version}`
+  if (!shardCache.has(url)) {
+    shardCache.set(url, fetchJson(url).catch(() => null))
+  }
+  const entries = await shardCache.get(url)
+  return entries ? entries[title] || null : null
+}
+
+const CATALOG_CACHE_KEY = 'movieCatalog'
+
+// localStorage can be full or disabled (private windows); the cache is optional
+const readCachedCatalog = () => {
+  try {
+    return JSON.parse(localStorage.getItem(CATALOG_CACHE_KEY))
+  } catch {
+    return null
+  }
+}
+
+const writeCachedCatalog = (version, movies) => {
+  if (!version) return
+  try {
+    localStorage.setItem(CATALOG_CACHE_KEY, JSON.stringify({ version, movies }))
+  } catch {
+    // Keep serving from memory
+  }
+}
+
+const applyCatalogChanges = (movies, changes) => {
+  const replaced = new Map(changes.updated.map(movie => [movie.title, movie]))
+  const removed = new Set(changes.removed)
+  return movies
+    .filter(movie => !removed.has(movie.title))
+    .map(movie => replaced.get(movie.title) || movie)
+    .concat(changes.added)
+}
+
+// Brings a cached catalog up to date with /api/movies/changes instead of
+// downloading it again; the server answers with the whole catalog when the
+// cached version is too old for its change log
+const syncCachedCatalog = async (cached) => {
+  const changes = await fetchJson(`/api/movies/changes?since=${cached.version}`).catch(() => null)
+  if (!changes) return null
+  const movies = changes.full ? changes.movies : applyCatalogChanges(cached.movies, changes)
+  if (changes.version !== cached.version) writeCachedCatalog(changes.version, movies)
+  return movies
+}
+
+const fetchMovies = async () => {
+  const response = await fetch('/api/movies')
+  if (!response.ok) return null
+  const movies = await response.json()
+  // Headers are strings; /api/movies/changes versions are numbers
+  writeCachedCatalog(Number(response.headers.get('X-Catalog-Version')), movies)
+  return movies
+}
+
+// A cached catalog is synced first, since its changes are smaller than any
+// full copy; without one the pre-rendered catalog saves a backend call
+export const loadMovies = async () => {
+  const cached = readCachedCatalog()
+  if (cached?.version && Array.isArray(cached.movies)) {
+    const movies = await syncCachedCatalog(cached)
+    if (movies) return movies
+  }
+
+  const manifest = await loadManifest()
+  const movies = manifest
+    ? await fetchJson(`${STATIC_ROOT}/${manifest.routes.movies}?v=${manifest.version}`).catch(() => null)
+    : null
+  return movies || fetchMovies()
+}
+
+export const loadAnalysis = async (movieTitle) => {
+  return (await loadStatic('analysis', movieTitle)) ||
+    fetchJson(`/api/analysis/${encodeURIComponent(movieTitle)}`)
+}
+
+// Analysis, recommendations, similarity scores and metadata for one movie in
+// a single round trip; `sections` picks which of them to compute
+export const loadMovieBundle = async (movieTitle, weights, sections) => {
+  const params = new URLSearchParams(weights || {})
+  if (sections) params.set('sections', sections.join(','))
+  return fetchJson(`/api/movie/${encodeURIComponent(movieTitle)}/bundle?${params}`)
+}
@@ -0,0 +1,162 @@
+"""
+Pre-render the read-only API into static, precompressed JSON
+
+The catalog only changes at ingest, so /api/movies and /api/analysis/<title>
+can be rendered once and served as static assets; the Python function is
+then only needed for similarity, recommendations and search. Responses are
+rendered through the Flask routes themselves, so the JSON contracts are
+identical.
+
+Layout (under --out, default dist/static-api):
+
+    manifest.json             version (content hash), shard count, route templates
+    movies.json               /api/movies
+    analysis/<shard>.json     {title: /api/analysis/<title>}
+
+A title lives in shard fnv1a32(utf-8 title) % shards (see src/utils/staticApi.js).
+Every file is written next to a .gz (and .br when the brotli package is
+installed) copy, for nginx gzip_static / brotli_static or any CDN that
+serves precompressed variants.
+
+    npm run build && python static_api.py --out dist/static-api
+
+`npm run vercel-build` runs the same after the frontend build, so Vercel
+deployments serve these files instead of cold-starting the backend.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from urllib.parse import quote
+
+STATIC_API_FORMAT = 1
+DEFAULT_SHARD_SIZE = 64
+SHARDED_ROUTES = ('analysis',)
+
+
+def fnv1a32(data):
+    value = 0x811c9dc5
+    for byte in data:
+        value = ((value ^ byte) * 0x01000193) & 0xffffffff
+    return value
+
+
+def shard_of(title, shards):
+    return fnv1a32(title.encode('utf-8')) % shards
+
+
+def encode_json(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def write_precompressed(path, data):
+    """
+    Write `data` plus .gz / .br variants; returns the encodings written
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        # mtime=0 keeps rebuilds of an unchanged catalog byte-identical
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    encodings = ['gzip']
+    try:
+        import brotli
+    except ImportError:
+        return encodings
+    with open(path + '.br', 'wb') as f:
+        f.write(brotli.compress(data, quality=11))
+    return encodings + ['br']
+
+
+def render_routes(app, titles):
+    """
+    Yield (route, title, payload) for every pre-rendered response. Titles the
+    backend answers with an error are skipped and stay on the dynamic path.
+    """
+    client = app.test_client()
+    response = client.get('/api/movies')
+    yield 'movies', None, response.get_json()
+
+    for title in dict.fromkeys(titles):
+        path = quote(title, safe='')
+        for route in SHARDED_ROUTES:
+            response = client.get(f'/api/{route}/{path}')
+            if response.status_code == 200:
+                yield route, title, response.get_json()
+
+
+def build_static_api(app, titles, out_dir, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Render and write the static API; returns the manifest
+    """
+    shards = max(1, -(-len(titles) // shard_size))
+    sharded = {route: [{} for _ in range(shards)] for route in SHARDED_ROUTES}
+    movies = []
+    for route, title, payload in render_routes(app, titles):
+        if route == 'movies':
+            movies = payload
+        else:
+            sharded[route][shard_of(title, shards)][title] = payload
+
+    # Stale shards from a build with a different shard count must not linger
+    for route in SHARDED_ROUTES:
+        shutil.rmtree(os.path.join(out_dir, route), ignore_errors=True)
+
+    digest = hashlib.sha1()
+    files = {'movies.json': encode_json(movies)}
+    for route in SHARDED_ROUTES:
+        for shard, entries in enumerate(sharded[route]):
+            files[f'{route}/{shard}.json'] = encode_json(entries)
+
+    encodings = []
+    total_bytes = 0
+    for name in sorted(files):
+        digest.update(name.encode('utf-8'))
+        digest.update(files[name])
+        encodings = write_precompressed(os.path.join(out_dir, name), files[name])
+        total_bytes += len(files[name])
+
+    manifest = {
+        'format': STATIC_API_FORMAT,
+        'version': digest.hexdigest()[:16],
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'count': len(movies),
+        'shards': shards,
+        'shard_hash': 'fnv1a32',
+        'routes': dict({'movies': 'movies.json'}, **{route: f'{route}/{{shard}}.json' for route in SHARDED_ROUTES}),
+        'rendered': {route: sum(len(s) for s in sharded[route]) for route in SHARDED_ROUTES},
+        'encodings': encodings,
+        'bytes': total_bytes,
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-render the read-only API into static JSON shards")
+    parser.add_argument('--out', default='dist/static-api')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                        help="target titles per analysis shard")
+    args = parser.parse_args()
+
+    start = time.time()
+    # Rendering visits every title anyway; no warmup thread competing with it
+    os.environ.setdefault('WARMUP', '0')
+    # None of the rendered routes embeds text, so skip loading the encoders
+    os.environ.setdefault('QUERY_ENCODER', 'none')
+    os.environ.setdefault('CLIP_TEXT_ENCODER', 'none')
+    import backend_api
+
+    generation = backend_api.generations.current
+    if not generation:
+        raise SystemExit("❌ Serving index unavailable; nothing to render")
+    manifest = build_static_api(backend_api.app, generation.index.titles, args.out, args.shard_size)
+    print(f"✓ Rendered {manifest['count']} movies into {manifest['shards']} shards per route "
+          f"({manifest['bytes'] / 1e6:.1f} MB uncompressed, {', '.join(manifest['encodings'])}) "
+          f"at {args.out} in {time.time() - start:.1f}s")
@@ -0,0 +1,138 @@
+"""
+Session taste profiles: one query built from many liked and disliked titles
+
+A profile keeps, per modality, the weighted sum of its seed titles' unit
+vectors: liked titles add theirs, disliked ones subtract theirs (Rocchio
+style). Cosine similarity to that sum ranks the catalog by closeness to the
+seeds' average taste, so a whole session is scored in a single pass over
+the catalog rather than one query per seed.
+
+Adding a title, changing its weight or dropping it (weight 0) only adds the
+change in its unit vector to the sums, so updating a profile costs the same
+however many titles it already holds. Between requests the profile travels
+as an opaque token that any worker (or shard coordinator) can continue.
+"""
+
+import base64
+import json
+import math
+
+import numpy as np
+
+from scoring import MODALITIES
+
+# Titles a profile may hold; keeps tokens small
+MAX_SEEDS = 500
+DEFAULT_LIKE_WEIGHT = 1.0
+# Disliked titles push away half as hard as liked ones pull, unless weighted
+DEFAULT_DISLIKE_WEIGHT = 0.5
+
+
+class TasteProfile:
+    """
+    Signed per-title weights and the per-modality sums they add up to
+    """
+
+    def __init__(self):
+        self.seeds = {}
+        self.sums = {}
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def update(self, title, weight, query):
+        """
+        Give `title` (whose row_query is `query`) the signed `weight`; 0 drops it
+        """
+        delta = weight - self.seeds.get(title, 0.0)
+        if weight:
+            if title not in self.seeds and len(self.seeds) >= MAX_SEEDS:
+                raise ValueError(f"A profile holds at most {MAX_SEEDS} titles")
+            self.seeds[title] = weight
+        else:
+            self.seeds.pop(title, None)
+        if not delta:
+            return
+
+        for column, modality in enumerate(MODALITIES):
+            # Rows missing a modality still carry a (zero) vector of its width
+            vector = np.asarray(query['vectors'][modality], dtype=np.float64)
+            if modality not in self.sums:
+                self.sums[modality] = np.zeros(len(vector))
+            elif len(self.sums[modality]) != len(vector):
+                raise ValueError(f"'{title}' has {len(vector)} {modality} dimensions, the profile "
+                                 f"{len(self.sums[modality])}")
+            norm = float(query['norms'][modality])
+            if query['present'][column] and norm > 0:
+                self.sums[modality] += (delta / norm) * vector
+
+    def query(self):
+        """
+        The profile as a row_query for scoring.query_catalog_similarities;
+        modalities no seed contributed to score neutrally. Only valid once
+        a title was added.
+        """
+        vectors, norms, squared_norms, present = {}, {}, {}, []
+        for modality in MODALITIES:
+            vector = self.sums[modality].astype(np.float32)
+            squared = float(vector @ vector)
+            vectors[modality] = vector
+            norms[modality] = np.float32(math.sqrt(squared))
+            squared_norms[modality] = np.float32(squared)
+            present.append(squared > 0)
+        return {'vectors': vectors, 'norms': norms, 'squared_norms': squared_norms, 'present': present}
+
+    def describe(self):
+        return {
+            'liked': {title: weight for title, weight in self.seeds.items() if weight > 0},
+            'disliked': {title: -weight for title, weight in self.seeds.items() if weight < 0},
+        }
+
+    def encode(self):
+        state = {
+            'seeds': self.seeds,
+            'sums': {m: base64.b64encode(s.astype(np.float32).tobytes()).decode('ascii') for m, s in self.sums.items()},
+        }
+        return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii').rstrip('=')
+
+    @classmethod
+    def decode(cls, token):
+        """
+        Opaque profile token -> TasteProfile. Raises ValueError if malformed.
+        """
+        profile = cls()
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            profile.seeds = {str(title): float(weight) for title, weight in state['seeds'].items()}
+            profile.sums = {m: np.frombuffer(base64.b64decode(s), dtype=np.float32).astype(np.float64)
+                            for m, s in state['sums'].items() if m in MODALITIES}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise ValueError("Invalid profile")
+        if (len(profile.seeds) > MAX_SEEDS or (profile.seeds and len(profile.sums) != len(MODALITIES))
+                or not all(np.isfinite(s).all() for s in profile.sums.values())):
+            raise ValueError("Invalid profile")
+        return profile
+
+
+def parse_seeds(source, default_weight):
+    """
+    Titles, or {"title", "weight"} objects, from a request body ->
+    [(title, weight)]. Raises ValueError when malformed.
+    """
+    if source is None:
+        return []
+    if not isinstance(source, list):
+        raise ValueError("liked and disliked must be lists of titles")
+    seeds = []
+    for item in source:
+        if isinstance(item, str):
+            title, weight = item, default_weight
+        elif isinstance(item, dict) and isinstance(item.get('title'), str):
+            title, weight = item['title'], float(item.get('weight', default_weight))
+        else:
+            raise ValueError("Each liked or disliked entry is a title or {\"title\", \"weight\"}")
+        if not math.isfinite(weight) or weight < 0:
+            raise ValueError(f"Weight of '{title}' must be a number >= 0")
+        seeds.append((title, weight))
+    return seeds
@@ -0,0 +1,92 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+# The backend modules live at the repository root, not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Data'))
+
+CATALOG_SIZE = 400
+
+
+@pytest.fixture(scope='session')
+def synthetic_catalog(tmp_path_factory):
+    """
+    Directory holding a small synthetic catalog (generate_synthetic_catalog.py):
+    serving_snapshot/ and the trailer CSVs, without ChromaDB
+    """
+    from generate_synthetic_catalog import generate_catalog
+
+    out = str(tmp_path_factory.mktemp('catalog'))
+    generate_catalog(CATALOG_SIZE, out, clusters=8, seed=7, snapshot_only=True)
+    return out
+
+
+@pytest.fixture
+def snapshot(synthetic_catalog, tmp_path):
+    """
+    A private copy of the synthetic serving snapshot that tests may append to
+    """
+    path = str(tmp_path / 'serving_snapshot')
+    shutil.copytree(os.path.join(synthetic_catalog, 'serving_snapshot'), path)
+    return path
+
+
+def load_index(catalog, snapshot_path):
+    from serving_index import load_serving_index
+
+    return load_serving_index(None, snapshot_path, os.path.join(catalog, 'movie_trailers_enriched.csv'))
+
+
+def delta_rows(index, rows, seed=0):
+    """
+    Embeddings and documents for re-ingesting `rows` with perturbed vectors
+    """
+    rng = np.random.default_rng(seed)
+    embeddings = {}
+    for modality, matrix in index.embeddings.items():
+        vectors = matrix[rows] + rng.normal(0, 0.05, (len(rows), matrix.shape[1])).astype(np.float32)
+        embeddings[modality] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [index.titles[row] for row in rows], embeddings, [index.documents[row] for row in rows]
+
+
+@pytest.fixture
+def segmented_index(synthetic_catalog, snapshot):
+    """
+    A ServingIndex over the snapshot plus one delta segment that re-ingests
+    rows 0-4 (shadowing the base rows) and a tombstone for rows 10-11
+    """
+    from index_segments import append_segment, delete_titles
+
+    base = load_index(synthetic_catalog, snapshot)
+    titles, embeddings, documents = delta_rows(base, [0, 1, 2, 3, 4])
+    append_segment(snapshot, titles, embeddings, documents)
+    delete_titles(snapshot, [base.titles[10], base.titles[11]])
+    return load_index(synthetic_catalog, snapshot)
+
+
+@pytest.fixture(scope='session')
+def backend(synthetic_catalog, tmp_path_factory):
+    """
+    backend_api imported once, serving the synthetic snapshot without text
+    encoders, a lattice or a neighbour table
+    """
+    missing = str(tmp_path_factory.mktemp('missing'))
+    os.environ.update({
+        'CHROMA_PERSIST_DIRECTORY': os.path.join(missing, 'trailer_db'),
+        'SERVING_SNAPSHOT_PATH': os.path.join(synthetic_catalog, 'serving_snapshot'),
+        'MOVIES_CSV_PATH': os.path.join(synthetic_catalog, 'movie_trailers.csv'),
+        'MOVIES_ENRICHED_CSV_PATH': os.path.join(synthetic_catalog, 'movie_trailers_enriched.csv'),
+        'WEIGHT_LATTICE_PATH': os.path.join(missing, 'weight_lattice.npz'),
+        'NEIGHBOUR_TABLE_PATH': os.path.join(missing, 'neighbour_table.npz'),
+        'QUERY_ENCODER': 'none',
+        'CLIP_TEXT_ENCODER': 'none',
+        'WARMUP': '0',
+    })
+    import backend_api
+
+    return backend_api
@@ -0,0 +1,87 @@
+import threading
+import time
+from urllib.parse import quote
+
+import pytest
+
+from admission import DEADLINE_HEADER, MAX_DEADLINE_MS, AdmissionController, Budget, parse_budgets, \
+    retry_after_seconds
+
+
+def test_budget_admits_up_to_its_concurrency():
+    budget = Budget('route', 'interactive', 2, 1000)
+    deadline = time.monotonic() + 1
+    assert budget.acquire(deadline) is None
+    assert budget.acquire(deadline) is None
+    # Full, and a past deadline leaves no time to queue
+    assert budget.acquire(time.monotonic() - 1) > 0
+    budget.release(0.01)
+    assert budget.acquire(deadline) is None
+    stats = budget.stats()
+    assert (stats['admitted'], stats['shed'], stats['in_flight']) == (3, 1, 2)
+
+
+def test_queued_request_gets_the_released_slot():
+    budget = Budget('route', 'interactive', 1, 1000)
+    assert budget.acquire(time.monotonic() + 1) is None
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(budget.acquire(time.monotonic() + 5)))
+    waiter.start()
+    while not budget.waiting:
+        time.sleep(0.001)
+    budget.release(0.01)
+    waiter.join()
+    assert results == [None]
+    assert budget.stats()['queued'] == 1
+
+
+def test_queued_request_expires_at_its_deadline():
+    budget = Budget('route', 'interactive', 1, 1000)
+    budget.service_s = 0.001
+    assert budget.acquire(time.monotonic() + 1) is None
+    assert budget.acquire(time.monotonic() + 0.02) > 0
+    assert budget.stats()['expired'] == 1
+
+
+def test_deadlines_and_budgets():
+    controller = AdmissionController(True, {'similarity': 3})
+    budget = controller.budget('similarity', 'bulk')
+    assert (budget.concurrency, budget.deadline_ms) == (3, 1000)
+    assert controller.budget('health', 'critical') is None
+
+    now = time.monotonic()
+    assert controller.deadline(budget, '250') - now == pytest.approx(0.25, abs=0.05)
+    assert controller.deadline(budget, 'soon') - now == pytest.approx(1.0, abs=0.05)
+    assert controller.deadline(budget, None) - now == pytest.approx(1.0, abs=0.05)
+    assert controller.deadline(budget, '1e9') - now == pytest.approx(MAX_DEADLINE_MS / 1000, abs=0.05)
+    assert controller.deadline(budget, '-5') - now == pytest.approx(0, abs=0.05)
+
+
+def test_parse_budgets_and_retry_after():
+    assert parse_budgets('similarity=4, recommend=8,') == {'similarity': 4, 'recommend': 8}
+    assert parse_budgets(None) == {}
+    assert [retry_after_seconds(wait) for wait in (0, 0.2, 1.0, 1.5)] == [1, 1, 1, 2]
+
+
+def test_off_by_default(backend):
+    assert not backend.admission.enabled
+
+
+def test_each_request_is_admitted_on_its_own_deadline(backend, monkeypatch):
+    monkeypatch.setattr(backend.admission, 'enabled', True)
+    budget = backend.admission.budgets['recommend']
+    title = backend.generations.current.index.titles[0]
+    path = f'/api/recommend/{quote(title, safe="")}'
+    client = backend.app.test_client()
+
+    # Another request holds every slot
+    monkeypatch.setattr(budget, 'in_flight', budget.concurrency)
+    shed = client.get(path, headers={DEADLINE_HEADER: '0'})
+    assert shed.status_code == 503
+    assert shed.headers['Retry-After'] == '1'
+    assert shed.get_json()['route'] == 'recommend'
+    assert 'X-Coalesced' not in shed.headers
+
+    monkeypatch.setattr(budget, 'in_flight', 0)
+    assert client.get(path, headers={DEADLINE_HEADER: '0'}).status_code == 200
+    assert budget.in_flight == 0
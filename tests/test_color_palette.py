@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pytest
+
+from color_palette import CHANNELS, CODE_SCALE, HISTOGRAM_BINS, PaletteQuery, color_histogram, normalize_channels, \
+    palette_rows, parse_color, parse_palette, pixel_histogram
+from conftest import load_index
+
+
+@pytest.fixture(scope='module')
+def index(synthetic_catalog):
+    return load_index(synthetic_catalog, os.path.join(synthetic_catalog, 'serving_snapshot'))
+
+
+def brute_force(histograms, query, metric):
+    """
+    Per-channel scores straight from the metric definitions
+    """
+    rows = normalize_channels(histograms).astype(np.float64)
+    query = query.histogram.reshape(len(CHANNELS), HISTOGRAM_BINS).astype(np.float64)
+    if metric == 'intersection':
+        per_bin = np.minimum(rows, query)
+    else:
+        total = rows + query
+        per_bin = np.divide(2 * rows * query, total, out=np.zeros_like(total), where=total > 0)
+    return per_bin.sum(axis=(1, 2)) / len(CHANNELS)
+
+
+QUERIES = {
+    'palette': lambda: color_histogram(parse_palette('1b2a49,e0a458:0.3')),
+    # One pixel color leaves most bins empty
+    'pixels': lambda: pixel_histogram(np.array([[[200, 40, 10]] * 4, [[20, 20, 90]] * 4], dtype=np.uint8)),
+}
+
+
+@pytest.mark.parametrize('metric', ['intersection', 'chi2'])
+@pytest.mark.parametrize('name', sorted(QUERIES))
+def test_scores_match_the_definitions(index, metric, name):
+    query = QUERIES[name]()
+    histograms = index.palette_histograms(np.arange(len(index)))
+    np.testing.assert_allclose(query.scores(histograms, metric), brute_force(histograms, query, metric), atol=1e-6)
+    own = PaletteQuery(histograms[7])
+    assert own.scores(histograms[7:8], metric)[0] == pytest.approx(1, abs=1e-5)
+
+
+@pytest.mark.parametrize('name', sorted(QUERIES))
+def test_coarse_scores_bound_exact_intersections(index, name):
+    query = QUERIES[name]()
+    palette = index.palettes[0]
+    bounds = query.coarse_scores(palette.codes) / (CODE_SCALE * len(CHANNELS))
+    assert (bounds >= query.scores(palette.histograms, 'intersection')).all()
+
+
+@pytest.mark.parametrize('metric', ['intersection', 'chi2'])
+def test_exact_matches_a_full_scan(index, metric):
+    query = QUERIES['palette']()
+    histograms = index.palette_histograms(np.arange(len(index)))
+    expected = brute_force(histograms, query, metric)
+    mask = np.arange(len(index)) % 3 != 0
+
+    for restrict in (None, mask):
+        allowed = np.ones(len(index), dtype=bool) if restrict is None else restrict
+        rows, scores = palette_rows(index, query, 10, metric, restrict, accuracy='exact')
+        assert allowed[rows].all()
+        np.testing.assert_allclose(scores, np.sort(expected[allowed])[::-1][:10], atol=1e-6)
+
+    # Few enough candidates for the whole catalog, the pre-filter misses nothing
+    rows, scores = palette_rows(index, query, 10, metric, candidates=len(index))
+    np.testing.assert_allclose(scores, np.sort(expected)[::-1][:10], atol=1e-6)
+
+
+def test_approximate_keeps_the_best_candidates(index):
+    query = QUERIES['palette']()
+    exact, _ = palette_rows(index, query, 10, 'intersection', accuracy='exact')
+    approximate, _ = palette_rows(index, query, 10, 'intersection', candidates=100)
+    assert len(set(exact) & set(approximate)) >= 8
+    with pytest.raises(ValueError, match='Unknown metric'):
+        palette_rows(index, query, 10, 'cosine')
+
+
+def test_pixel_histogram_is_bgr():
+    query = pixel_histogram(np.array([[[255, 0, 8]]], dtype=np.uint8))
+    channels = query.histogram.reshape(len(CHANNELS), HISTOGRAM_BINS)
+    assert [int(np.argmax(channel)) for channel in channels] == [1, 0, 31]
+    np.testing.assert_allclose(channels.sum(axis=1), 1)
+
+
+def test_parse_palette():
+    assert parse_color('#F80') == (255, 136, 0)
+    assert parse_palette('1b2a49, e0a458:0.3,') == [((27, 42, 73), 1.0), ((224, 164, 88), 0.3)]
+    assert parse_palette([{'color': '#000000', 'weight': 2}]) == [((0, 0, 0), 2.0)]
+    for value in ('', 'zzzzzz', '12345', 'fff:-1', 'fff:heavy', 42, [{'color': 'fff', 'weight': 'nan'}]):
+        with pytest.raises(ValueError):
+            parse_palette(value)
+    with pytest.raises(ValueError, match='no colors'):
+        color_histogram(parse_palette('fff:0'))
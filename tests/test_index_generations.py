@@ -0,0 +1,37 @@
+from conftest import delta_rows, load_index
+from index_generations import Generation, GenerationManager
+from index_segments import append_segment
+
+
+def test_pinned_generation_outlives_the_swap(synthetic_catalog, snapshot):
+    manager = GenerationManager(lambda: Generation(load_index(synthetic_catalog, snapshot)), drain_timeout=0.1)
+    assert manager.acquire() is None
+    assert manager.reload(wait=True)
+    first = manager.current
+
+    pinned = manager.acquire()
+    assert pinned is first and first.refs == 1
+    base = first.index
+    titles, embeddings, documents = delta_rows(base, [0, 1, 2])
+    append_segment(snapshot, titles, embeddings, documents)
+    assert manager.reload(wait=True)
+
+    # New requests see the new generation, the pinned one still serves its own data
+    second = manager.acquire()
+    assert second is manager.current and second is not first
+    assert (first.number, second.number) == (1, 2)
+    assert len(second.index) == len(base) + 3
+    assert first.index is base and first.retired
+    assert manager.stats()['retired'] == [{'generation': 1, 'in_flight': 1}]
+
+    # A further reload will not build a third generation while the first is pinned
+    assert manager.reload(wait=True)
+    assert manager.current is second
+    assert 'still in use' in manager.last_error
+
+    manager.release(pinned)
+    assert first.refs == 0 and first.index is None
+    assert manager.retired == [] and manager.reclaimed == 1
+
+    manager.release(second)
+    assert second.index is not None and not second.retired
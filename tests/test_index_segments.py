@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import delta_rows, load_index
+from index_segments import append_segment, changed_rows, compact, delete_titles, live_mask, load_segments, \
+    read_log, segment_path
+from scoring import MODALITIES
+
+
+class Rows:
+    def __init__(self, titles, seq):
+        self.titles = titles
+        self.seq = seq
+
+    def __len__(self):
+        return len(self.titles)
+
+
+def test_live_mask():
+    base, delta = Rows(['a', 'b', 'c'], 0), Rows(['b', 'd'], 2)
+    assert live_mask([base], {}) is None
+    # b is re-ingested by the delta, c deleted after the base, d deleted before its re-ingest
+    live = live_mask([base, delta], {'c': 1, 'd': 1})
+    assert live.tolist() == [True, False, False, True, True]
+    assert live_mask([base, delta], {'b': 3}).tolist() == [True, False, True, False, True]
+
+
+def test_shadowed_and_deleted_rows_are_dead(synthetic_catalog, snapshot):
+    base = load_index(synthetic_catalog, snapshot)
+    titles, embeddings, documents = delta_rows(base, [0, 1])
+    seq = append_segment(snapshot, titles, embeddings, documents)
+    assert delete_titles(snapshot, [base.titles[5]]) == seq + 1
+
+    index = load_index(synthetic_catalog, snapshot)
+    assert len(index) == len(base) + 2
+    assert np.flatnonzero(~index.live).tolist() == [0, 1, 5]
+    assert index.row(titles[0]) == len(base)
+    np.testing.assert_allclose(index.vector('narrative', index.row(titles[1])),
+                               embeddings['narrative'][1], rtol=1e-6)
+    assert index.row(base.titles[5]) is None
+
+
+def test_append_rejects_other_dimensions(synthetic_catalog, snapshot):
+    base = load_index(synthetic_catalog, snapshot)
+    titles, embeddings, documents = delta_rows(base, [0])
+    embeddings['audio'] = embeddings['audio'][:, :-1]
+    with pytest.raises(ValueError, match='audio vectors'):
+        append_segment(snapshot, titles, embeddings, documents)
+    assert read_log(snapshot)['segments'] == []
+
+
+def test_compact_keeps_exactly_the_live_rows(synthetic_catalog, snapshot):
+    assert compact(snapshot) is None
+    base = load_index(synthetic_catalog, snapshot)
+    titles, embeddings, documents = delta_rows(base, [2, 3, 4])
+    seq = append_segment(snapshot, titles, embeddings, documents)
+    delete_titles(snapshot, [base.titles[7], titles[0]])
+    before = load_index(synthetic_catalog, snapshot)
+    live = before.live_rows()
+
+    manifest = compact(snapshot)
+    assert manifest['count'] == len(live)
+    assert not os.path.exists(segment_path(snapshot, seq))
+    log = read_log(snapshot)
+    assert (log['segments'], log['tombstones']) == ([], {})
+
+    segments, mask = load_segments(snapshot)
+    assert len(segments) == 1 and mask is None
+    after = load_index(synthetic_catalog, snapshot)
+    assert after.titles == [before.titles[row] for row in live]
+    assert after.documents == [before.documents[row] for row in live]
+    for modality in MODALITIES:
+        np.testing.assert_array_equal(after.embeddings[modality], before.embeddings[modality][live])
+    assert compact(snapshot) is None
+
+    # Sequence numbers keep counting after the merge
+    assert append_segment(snapshot, *delta_rows(after, [0])) == log['next_seq']
+
+
+def test_changed_rows(synthetic_catalog, snapshot):
+    index = load_index(synthetic_catalog, snapshot)
+    titles = list(index.titles[1:])
+    embeddings = {m: index.embeddings[m][1:].copy() for m in MODALITIES}
+    documents = list(index.documents[1:])
+    present = index.present[1:]
+    embeddings['visual'][3] *= -1
+    documents[5] += ' (director\'s cut)'
+
+    rows, removed = changed_rows(index, titles, embeddings, documents, present)
+    assert rows.tolist() == [3, 5]
+    assert removed == [index.titles[0]]
@@ -0,0 +1,69 @@
+from conftest import delta_rows, load_index
+from index_segments import append_segment
+from keyword_signatures import KeywordIndex, SegmentKeywords, section_terms
+from movie_analysis import generate_multimodal_tags
+
+WEIGHTS = {'narrative': 0.5, 'visual': 0.3, 'audio': 0.2}
+SIMILARITIES = {'narrative': 0.75, 'visual': 0.6, 'audio': 0.4}
+
+
+def document(visual, narrative, audio, vibe):
+    return (f'[VISUAL_STYLE]: {visual}\n[NARRATIVE_ARC]: {narrative}\n'
+            f'[AUDIO_LANDSCAPE]: {audio}\n[EMOTIONAL_VIBE]: {vibe}')
+
+
+HEIST = document('Neon noir alleys, rain.', 'A heist crew plans one last score.', 'Pulsing synth score.', 'Tense.')
+CAPER = document('Neon noir rooftops.', 'The heist crew splits.', 'Brass fanfare.', 'Playful.')
+MEADOW = document('Sunlit meadows.', 'Two sisters reconcile.', 'Acoustic guitar.', 'Warm.')
+
+
+def test_section_terms_pair_adjacent_words():
+    assert section_terms('The neon noir shadows, teal') == [
+        'neon', 'noir', 'neon noir', 'shadows', 'noir shadows', 'teal']
+
+
+def test_overlapping_titles_get_a_shared_theme_tag():
+    keywords = KeywordIndex([SegmentKeywords([HEIST, CAPER, MEADOW])])
+    caper, meadow = keywords.shared_themes(keywords.source(0), [1, 2])
+
+    assert meadow is None
+    # Pairs are named before the words they contain, each word once
+    assert set(caper['terms']) == {'neon noir', 'heist crew'}
+    assert 0 < caper['overlap'] <= 1
+
+    tags = generate_multimodal_tags(SIMILARITIES, WEIGHTS, caper)
+    assert len(tags) == 3
+    assert tags[-1]['type'] == 'theme' and tags[-1]['strength'] == caper['overlap']
+    assert tags[-1]['label'].startswith('Shared: ')
+    assert set(tags[-1]['label'][len('Shared: '):].split(', ')) == {'neon noir', 'heist crew'}
+    assert all(tag['type'] != 'theme' for tag in generate_multimodal_tags(SIMILARITIES, WEIGHTS, meadow))
+
+
+def test_delta_segments_get_their_own_signatures(synthetic_catalog, snapshot):
+    base = load_index(synthetic_catalog, snapshot)
+    old = [base.keywords.source(row) for row in (0, 1)]
+    assert not any(theme and 'zeppelin armada' in theme['terms']
+                   for theme in base.keywords.shared_themes(old[0], [1]))
+
+    # Re-ingest two titles with analyses that now share a theme
+    titles, embeddings, _ = delta_rows(base, [0, 1])
+    zeppelins = [document('Zeppelin armada over dunes.', 'A smuggler flees.', 'Droning engines.', 'Grim.'),
+                 document('A zeppelin armada at dawn.', 'Pilots mutiny.', 'Droning engines.', 'Hopeful.')]
+    append_segment(snapshot, titles, embeddings, zeppelins)
+    index = load_index(synthetic_catalog, snapshot)
+
+    keywords = index.keywords
+    assert len(keywords.parts) == len(index.segments) == len(base.segments) + 1
+    assert keywords.offsets[-1] == len(index) == len(base) + 2
+    assert len(keywords.parts[-1]) == 2
+
+    rows = [index.row(title) for title in titles]
+    assert rows == [len(base), len(base) + 1]
+    source = keywords.source(rows[0])
+    assert source != old[0]
+    assert source['minhash'] == keywords.parts[-1].minhash[0].tolist()
+
+    theme, = keywords.shared_themes(source, [rows[1]])
+    assert 'zeppelin armada' in theme['terms'] and 'droning engines' in theme['terms']
+    # The shadowed base rows keep the signatures of the analyses they were loaded with
+    assert keywords.source(0)['minhash'] == old[0]['minhash']
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from load_test import percentile  # noqa: E402
+
+
+@pytest.mark.parametrize('count, pct, rank', [
+    (100, 50, 50), (100, 95, 95), (100, 99, 99), (100, 100, 100),
+    (10, 50, 5), (10, 90, 9), (10, 95, 10), (10, 1, 1),
+    (7, 50, 4), (1, 99, 1), (1000, 99.9, 999),
+])
+def test_nearest_rank(count, pct, rank):
+    assert percentile(list(range(1, count + 1)), pct) == rank
+
+
+def test_edges():
+    assert percentile([], 50) is None
+    assert percentile([3.0, 5.0], 0) == 3.0
@@ -0,0 +1,33 @@
+from urllib.parse import quote
+
+WEIGHTS = {'narrative': 0.5, 'visual': 0.3, 'audio': 0.2}
+
+
+def test_bundle_equals_the_separate_routes(backend):
+    client = backend.app.test_client()
+    title = backend.generations.current.index.titles[40]
+    path = quote(title, safe='')
+    query = '&'.join(f'{m}={w}' for m, w in WEIGHTS.items())
+
+    response = client.get(f'/api/movie/{path}/bundle?{query}&k=12')
+    assert response.status_code == 200
+    bundle = response.get_json()
+
+    movies = {movie['title']: movie for movie in client.get('/api/movies').get_json()}
+    assert bundle['title'] == title
+    assert bundle['movie'] == movies[title]
+    assert bundle['analysis'] == client.get(f'/api/analysis/{path}').get_json()
+    assert bundle['recommendations'] == client.get(f'/api/recommend/{path}?{query}').get_json()
+    similarity = client.post('/api/similarity', json={'movie_title': title, 'weights': WEIGHTS, 'k': 12})
+    assert bundle['similarity'] == similarity.get_json()
+    assert set(bundle['plans']) == {'recommendations', 'similarity'}
+
+    only = client.get(f'/api/movie/{path}/bundle?sections=analysis').get_json()
+    assert only == {'title': title, 'analysis': bundle['analysis']}
+
+
+def test_bundle_errors(backend):
+    client = backend.app.test_client()
+    assert client.get('/api/movie/No%20Such%20Movie/bundle').status_code == 404
+    title = quote(backend.generations.current.index.titles[0], safe='')
+    assert client.get(f'/api/movie/{title}/bundle?sections=poster').status_code == 400
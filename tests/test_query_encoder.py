@@ -0,0 +1,109 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import query_encoder
+from query_encoder import BatchingEncoder, load_clip_text_encoder
+
+
+class GatedEncoder:
+    """
+    Encodes each text as [len(text)], holding every batch until released
+    """
+    name = 'gated'
+
+    def __init__(self):
+        self.batches = []
+        self.gates = []
+        self.started = threading.Semaphore(0)
+
+    def encode_batch(self, texts):
+        gate = threading.Event()
+        self.batches.append((list(texts), threading.current_thread().name))
+        self.gates.append(gate)
+        self.started.release()
+        gate.wait(5)
+        if 'boom' in texts:
+            raise RuntimeError('boom')
+        return [[float(len(text))] for text in texts]
+
+
+def start(encoder, text, results, name):
+    thread = threading.Thread(target=lambda: results.__setitem__(name, encoder.encode(text)), name=name)
+    thread.start()
+    return thread
+
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.001)
+
+
+def test_a_request_runs_no_batch_after_its_own():
+    inner = GatedEncoder()
+    encoder = BatchingEncoder(inner, max_batch=2)
+    results = {}
+    first = start(encoder, 'a', results, 'first')
+    assert inner.started.acquire(timeout=5)
+
+    # These arrive while the first batch runs and are encoded together next
+    waiting = [start(encoder, text, results, name) for text, name in (('bb', 'second'), ('ccc', 'third'))]
+    wait_for(lambda: len(encoder.pending) == 2)
+    inner.gates[0].set()
+    first.join(5)
+    assert not first.is_alive()
+    assert results['first'].tolist() == [1.0]
+
+    # The next batch runs in one of the requests waiting on it
+    assert inner.started.acquire(timeout=5)
+    texts, thread = inner.batches[1]
+    assert texts == ['bb', 'ccc'] and thread in ('second', 'third')
+    inner.gates[1].set()
+    for thread in waiting:
+        thread.join(5)
+    assert results['second'].tolist() == [2.0] and results['third'].tolist() == [3.0]
+    assert encoder.stats()['batches'] == 2 and not encoder.running
+
+
+def test_repeats_are_cached_and_shared():
+    inner = GatedEncoder()
+    encoder = BatchingEncoder(inner, cache_size=1)
+    results = {}
+    threads = [start(encoder, 'same', results, 'one')]
+    assert inner.started.acquire(timeout=5)
+    threads.append(start(encoder, 'same', results, 'two'))
+    wait_for(lambda: encoder.counters['misses'] == 2)
+    inner.gates[0].set()
+    for thread in threads:
+        thread.join(5)
+    assert results['one'] is results['two']
+    assert not results['one'].flags.writeable
+
+    assert encoder.encode('same') is results['one']
+    assert encoder.stats()['hits'] == 1 and len(inner.batches) == 1
+
+
+def test_errors_reach_the_batch_and_not_later_requests():
+    inner = GatedEncoder()
+    encoder = BatchingEncoder(inner)
+    threading.Timer(0.05, lambda: [gate.set() for gate in inner.gates]).start()
+    with pytest.raises(RuntimeError):
+        encoder.encode('boom')
+    assert not encoder.running and encoder.inflight == {}
+
+    threading.Timer(0.05, lambda: [gate.set() for gate in inner.gates]).start()
+    np.testing.assert_array_equal(encoder.encode('ok'), [2.0])
+
+
+def test_auto_clip_encoder_needs_an_export(tmp_path, monkeypatch):
+    def transformers_clip(model_name):
+        raise AssertionError("the transformers CLIP model is opt-in")
+
+    monkeypatch.setattr(query_encoder, 'ClipTextEncoder', transformers_clip)
+    assert load_clip_text_encoder('auto', str(tmp_path)) is None
+    assert load_clip_text_encoder('auto', None) is None
+    assert load_clip_text_encoder('none', str(tmp_path)) is None
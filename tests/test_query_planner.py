@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import load_index
+from index_segments import delete_titles
+from neighbour_table import NeighbourTable, build_neighbour_table
+from query_planner import QueryPlanner
+from scoring import RECOMMEND_CANDIDATES, RECOMMEND_RESULTS, recommend_rows, similarity_rows
+from weight_lattice import WeightLattice, load_lattice, materialize, save_lattice
+
+K = 10
+DEPTH = 24
+OFF_POINT = {'narrative': 0.37, 'visual': 0.41, 'audio': 0.22}
+
+
+@pytest.fixture(scope='module')
+def index(synthetic_catalog):
+    return load_index(synthetic_catalog, os.path.join(synthetic_catalog, 'serving_snapshot'))
+
+
+@pytest.fixture(scope='module')
+def lattice(index):
+    return WeightLattice(materialize(index, 4, K, [0, 1, 2]))
+
+
+@pytest.fixture(scope='module')
+def table(index):
+    return NeighbourTable(build_neighbour_table(index, depth=DEPTH))
+
+
+def assert_same_ranking(got, expected):
+    np.testing.assert_array_equal(got[0], expected[0])
+    np.testing.assert_allclose(got[2], expected[2], rtol=1e-5)
+
+
+def test_accuracy_decides_between_lattice_and_scan(index, lattice):
+    planner = QueryPlanner(index, lattice=lattice)
+    exact = planner.plan('similarity', 0, OFF_POINT, k=K)
+    approximate = planner.plan('similarity', 0, OFF_POINT, k=K, accuracy='approximate')
+
+    # Between lattice points the stored candidates are cheaper but not provably exact
+    assert exact.strategy == 'scan' and exact.exact
+    assert approximate.strategy == 'lattice' and not approximate.exact
+    assert len(planner.execute(approximate)[0]) == K
+    # Approximate answers are never cached
+    assert planner.plan('similarity', 0, OFF_POINT, k=K, accuracy='approximate').strategy == 'lattice'
+
+    on_point = dict(zip(OFF_POINT, lattice.weights[5].tolist()))
+    plan = planner.plan('similarity', 0, on_point, k=K)
+    assert plan.strategy == 'lattice' and plan.exact
+    assert_same_ranking(planner.execute(plan), similarity_rows(index, 0, on_point, None, K))
+
+    with pytest.raises(ValueError):
+        planner.plan('similarity', 0, OFF_POINT, k=K, accuracy='roughly')
+
+
+def test_exact_answers_are_cached(index):
+    planner = QueryPlanner(index)
+    first = planner.plan('similarity', 3, OFF_POINT, k=K)
+    assert first.strategy == 'scan'
+    assert not next(o for o in first.options if o['strategy'] == 'cache')['eligible']
+    expected = planner.execute(first)
+
+    again = planner.plan('similarity', 3, OFF_POINT, k=K)
+    assert again.strategy == 'cache'
+    assert_same_ranking(planner.execute(again), expected)
+
+
+def test_neighbour_table_is_exact_only_with_enough_neighbours(index, table):
+    planner = QueryPlanner(index, table=table)
+    row = 7
+    plan = planner.plan('recommend', row, OFF_POINT, k=RECOMMEND_RESULTS)
+    assert plan.strategy == 'neighbour_table' and plan.exact
+    assert_same_ranking(planner.execute(plan), recommend_rows(index, row, OFF_POINT, None))
+
+    # Excluding stored neighbours leaves fewer than the candidates recommend_rows re-ranks
+    stored = table.candidates(row)
+    excluded = DEPTH - RECOMMEND_CANDIDATES + 2
+    filters = {'exclude': [index.titles[r] for r in stored[:excluded]]}
+    exact = planner.plan('recommend', row, OFF_POINT, filters, RECOMMEND_RESULTS)
+    option = next(o for o in exact.options if o['strategy'] == 'neighbour_table')
+    assert option['available'] and not option['exact']
+    assert exact.strategy == 'scan'
+    approximate = planner.plan('recommend', row, OFF_POINT, filters, RECOMMEND_RESULTS, 'approximate')
+    assert approximate.strategy == 'neighbour_table'
+    mask = index.catalog.filter_mask(filters, index.title_index)
+    assert_same_ranking(planner.execute(exact), recommend_rows(index, row, OFF_POINT, mask))
+
+
+def test_evicted_cache_entry_falls_back_to_scan(index):
+    planner = QueryPlanner(index)
+    expected = planner.execute(planner.plan('recommend', 5, OFF_POINT, k=RECOMMEND_RESULTS))
+    plan = planner.plan('recommend', 5, OFF_POINT, k=RECOMMEND_RESULTS)
+    assert plan.strategy == 'cache'
+
+    planner.cache.clear()
+    assert_same_ranking(planner.execute(plan), expected)
+    assert plan.strategy == 'scan'
+    assert planner.stats()['strategies']['scan']['executed'] == 2
+
+
+def test_dead_rows_do_not_disable_the_lattice(synthetic_catalog, snapshot, segmented_index, tmp_path):
+    index = segmented_index
+    rows = index.live_rows()[:3]
+    path = str(tmp_path / 'lattice.npz')
+    save_lattice(path, materialize(index, 4, K, rows))
+    lattice = load_lattice(path)
+    assert lattice.matches(index)
+
+    planner = QueryPlanner(index, lattice=lattice)
+    weights = dict(zip(OFF_POINT, lattice.weights[5].tolist()))
+    plan = planner.plan('similarity', int(rows[0]), weights, k=K)
+    assert plan.strategy == 'lattice' and plan.exact
+    assert_same_ranking(planner.execute(plan), similarity_rows(index, int(rows[0]), weights, index.live, K))
+    filtered = planner.plan('similarity', int(rows[0]), weights, {'min_rating': 1}, K)
+    assert filtered.strategy != 'lattice'
+
+    # A tombstone-only delete keeps the titles but may kill stored candidates
+    stored = lattice.lookup(int(rows[0]), weights, K)[0]
+    delete_titles(snapshot, [index.titles[stored[0]]])
+    assert not lattice.matches(load_index(synthetic_catalog, snapshot))
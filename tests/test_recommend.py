@@ -0,0 +1,58 @@
+import json
+from urllib.parse import quote
+
+
+def recommend_path(backend, row, **params):
+    title = backend.generations.current.index.titles[row]
+    query = '&'.join(f'{key}={value}' for key, value in params.items())
+    return f'/api/recommend/{quote(title, safe="")}?{query}'
+
+
+def titles(entries):
+    return [entry['title'] for entry in entries]
+
+
+def test_deadline_answer_matches_the_planned_one(backend):
+    client = backend.app.test_client()
+    planned = client.get(recommend_path(backend, 20, narrative=0.5, visual=0.3, audio=0.2))
+    assert planned.status_code == 200
+    assert 'X-Recommend-Phase' not in planned.headers
+
+    timed = client.get(recommend_path(backend, 20, narrative=0.5, visual=0.3, audio=0.2, deadline_ms=10000))
+    assert timed.status_code == 200
+    assert timed.headers['X-Recommend-Phase'] == 'exact'
+    assert timed.get_json() == planned.get_json()
+
+
+def test_deadline_path_uses_the_planner(backend):
+    client = backend.app.test_client()
+    first = client.get(recommend_path(backend, 21, narrative=0.2, visual=0.2, audio=0.6, deadline_ms=10000))
+    assert first.headers['X-Query-Plan'] == 'scan'
+    # The exact scan was cached, so the repeat is answered without one
+    again = client.get(recommend_path(backend, 21, narrative=0.2, visual=0.2, audio=0.6, deadline_ms=0))
+    assert (again.headers['X-Recommend-Phase'], again.headers['X-Query-Plan']) == ('exact', 'cache')
+    assert again.get_json() == first.get_json()
+
+
+def test_approximate_accuracy_skips_the_phases(backend):
+    client = backend.app.test_client()
+    response = client.get(recommend_path(backend, 22, accuracy='approximate', deadline_ms=0))
+    assert response.status_code == 200
+    assert 'X-Recommend-Phase' not in response.headers
+    assert response.headers['X-Query-Plan']
+
+
+def test_streamed_phases_end_exact(backend):
+    client = backend.app.test_client()
+    plain = client.get(recommend_path(backend, 23, min_rating=5))
+    streamed = client.get(recommend_path(backend, 23, min_rating=5, stream='ndjson'))
+    assert streamed.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in streamed.get_data(as_text=True).splitlines() if line.strip()]
+    assert events[-1]['phase'] == 'exact'
+    assert titles(events[-1]['recommendations']) == titles(plain.get_json())
+
+
+def test_bad_deadline(backend):
+    client = backend.app.test_client()
+    assert client.get(recommend_path(backend, 0, deadline_ms=-1)).status_code == 400
+    assert client.get(recommend_path(backend, 0, deadline_ms='soon')).status_code == 400
@@ -0,0 +1,39 @@
+import gzip
+import json
+
+import numpy as np
+import pytest
+from flask import Flask, jsonify
+from werkzeug.datastructures import Accept
+
+import response_encoding
+from response_encoding import FastJSONProvider, compress, dumps
+
+PAYLOAD = {'title': 'Amélie', 'similarity': np.float32(0.5), 'rows': np.arange(3), 'tags': ['Visual Match'],
+           'nested': {1: None, 'ok': True}}
+EXPECTED = {'title': 'Amélie', 'similarity': 0.5, 'rows': [0, 1, 2], 'tags': ['Visual Match'],
+            'nested': {'1': None, 'ok': True}}
+
+
+@pytest.mark.parametrize('with_orjson', [True, False])
+def test_dumps(monkeypatch, with_orjson):
+    if not with_orjson:
+        monkeypatch.setattr(response_encoding, 'orjson', None)
+    elif response_encoding.orjson is None:
+        pytest.skip("orjson is not installed")
+    encoded = dumps(PAYLOAD)
+    assert json.loads(encoded) == EXPECTED
+    assert 'Amélie'.encode('utf-8') in encoded and b', ' not in encoded
+    with pytest.raises(TypeError):
+        dumps({'unserializable': object()})
+
+
+def test_compress_only_large_bodies():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    with app.app_context():
+        accept = Accept([('gzip', 1)])
+        large, small = jsonify(['x' * 2000]), jsonify(['x'])
+        assert compress(large, accept, 1024).headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(large.get_data())) == ['x' * 2000]
+        assert 'Content-Encoding' not in compress(small, accept, 1024).headers
@@ -0,0 +1,99 @@
+"""
+The lite runtime (serving snapshot + ONNX query encoder) answers every route
+like the full one (ChromaDB + sentence-transformers) over the same catalog
+"""
+
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip('chromadb')
+pytest.importorskip('sentence_transformers')
+pytest.importorskip('onnxruntime')
+pytest.importorskip('tokenizers')
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import runtime_parity  # noqa: E402
+
+TITLES = 8
+VOCABULARY = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + (
+    'a the movie film heist space horror love ghost ship detective time loop war dark family adventure opera '
+    'psychological thriller funny sad ##s ##ing ##er').split()
+
+
+@pytest.fixture(scope='module')
+def text_models(tmp_path_factory):
+    """
+    A tiny random 384-dimension sentence-transformers model (the narrative
+    space's width) and its quantized ONNX export
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    from query_encoder import export_onnx
+
+    base = tmp_path_factory.mktemp('text_models')
+    bert = str(base / 'bert')
+    with open(os.path.join(base, 'vocab.txt'), 'w') as f:
+        f.write('\n'.join(VOCABULARY))
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(VOCABULARY), hidden_size=384, num_hidden_layers=1, num_attention_heads=4,
+                        intermediate_size=256, max_position_embeddings=64)
+    BertModel(config).save_pretrained(bert)
+    BertTokenizerFast(os.path.join(base, 'vocab.txt')).save_pretrained(bert)
+
+    transformer = models.Transformer(bert, max_seq_length=32)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), 'mean')
+    model_path = str(base / 'sentence_transformer')
+    SentenceTransformer(modules=[transformer, pooling, models.Normalize()], device='cpu').save(model_path)
+
+    onnx_path = str(base / 'onnx')
+    export_onnx(onnx_path, model_path, quantize=True)
+    return model_path, onnx_path
+
+
+@pytest.fixture(scope='module')
+def chroma_catalog(tmp_path_factory):
+    from generate_synthetic_catalog import generate_catalog
+
+    out = str(tmp_path_factory.mktemp('chroma_catalog'))
+    generate_catalog(300, out, clusters=8, seed=11)
+    return out
+
+
+def test_lite_runtime_matches_full(chroma_catalog, text_models):
+    model_path, onnx_path = text_models
+    shared = {
+        'PYTHONHASHSEED': '0',
+        'HF_HUB_OFFLINE': '1',
+        'WARMUP': '0',
+        'CLIP_TEXT_ENCODER': 'none',
+        'MOVIES_CSV_PATH': os.path.join(chroma_catalog, 'movie_trailers.csv'),
+        'MOVIES_ENRICHED_CSV_PATH': os.path.join(chroma_catalog, 'movie_trailers_enriched.csv'),
+        'NEIGHBOUR_TABLE_PATH': os.path.join(chroma_catalog, 'missing_neighbour_table.npz'),
+        'WEIGHT_LATTICE_PATH': os.path.join(chroma_catalog, 'missing_weight_lattice.npz'),
+    }
+    full = runtime_parity.run_probe(dict(
+        shared, QUERY_ENCODER='sentence-transformers', QUERY_ENCODER_MODEL=model_path,
+        CHROMA_PERSIST_DIRECTORY=os.path.join(chroma_catalog, 'trailer_db'),
+        SERVING_SNAPSHOT_PATH=os.path.join(chroma_catalog, 'missing_snapshot')), TITLES)
+    lite = runtime_parity.run_probe(dict(
+        shared, QUERY_ENCODER='onnx', QUERY_ENCODER_PATH=onnx_path,
+        CHROMA_PERSIST_DIRECTORY=os.path.join(chroma_catalog, 'missing_db'),
+        SERVING_SNAPSHOT_PATH=os.path.join(chroma_catalog, 'serving_snapshot')), TITLES)
+
+    assert 'chromadb' in full['heavy_modules']
+    assert not {'chromadb', 'torch', 'sentence_transformers'} & set(lite['heavy_modules'])
+
+    responses = full['responses']
+    assert len(responses) == len(lite['responses'])
+    assert sum(r['status'] == 200 and r['path'].startswith('/api/recommend/') for r in responses) == TITLES
+    # Text searches (visual and facet ones have no CLIP encoder or facets here, and return nothing in both)
+    searches = [r for r in responses if r['path'].startswith('/api/search?') and '&' not in r['path']]
+    assert searches and all(r['status'] == 200 and r['json'] for r in searches)
+    assert runtime_parity.diff_responses(responses, lite['responses'], search_tolerance=5e-3) == []
@@ -0,0 +1,117 @@
+import json
+
+import numpy as np
+import pytest
+
+from score_payload import (
+    MAGIC,
+    SCORE_SCALE,
+    decode_binary,
+    encode_score_vectors,
+    quantize,
+)
+from scoring import MODALITIES
+
+
+def payload_fields(count=50, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(100000, count, replace=False)
+    similarities = {m: rng.uniform(0, 1, count).astype(np.float32) for m in MODALITIES}
+    titles = [f"Movie {i}" for i in range(count)]
+    return {'source': 'Movie 0', 'count': count}, titles, rows, similarities
+
+
+def test_binary_round_trip():
+    header, titles, rows, similarities = payload_fields()
+    decoded_header, decoded_rows, decoded = decode_binary(encode_score_vectors('binary', header, titles, rows,
+                                                                               similarities))
+
+    assert decoded_header['source'] == 'Movie 0'
+    assert decoded_header['titles'] == titles
+    assert decoded_header['modalities'] == list(MODALITIES)
+    np.testing.assert_array_equal(decoded_rows, rows)
+    for modality in MODALITIES:
+        # 16-bit fixed point: half a step of error at most
+        assert np.abs(decoded[modality] - similarities[modality]).max() <= 0.5 / SCORE_SCALE + 1e-7
+
+
+def test_binary_header_is_padded_to_four_bytes():
+    header, titles, rows, similarities = payload_fields(count=3)
+    payload = encode_score_vectors('binary', header, titles, rows, similarities)
+
+    assert payload[:4] == MAGIC
+    header_length = int.from_bytes(payload[8:12], 'little')
+    assert header_length % 4 == 0
+    assert len(payload) == 12 + header_length + 4 * 3 + 2 * 3 * len(MODALITIES)
+
+
+def test_binary_without_titles():
+    header, _, rows, similarities = payload_fields(count=5)
+    decoded_header, decoded_rows, _ = decode_binary(encode_score_vectors('binary', header, None, rows, similarities))
+
+    assert 'titles' not in decoded_header
+    np.testing.assert_array_equal(decoded_rows, rows)
+
+
+def test_empty_payload():
+    empty = {m: np.zeros(0, dtype=np.float32) for m in MODALITIES}
+    header, rows, similarities = decode_binary(encode_score_vectors('binary', {'count': 0}, [], [], empty))
+
+    assert len(rows) == 0
+    assert all(len(similarities[m]) == 0 for m in MODALITIES)
+
+
+def test_decode_rejects_other_payloads():
+    with pytest.raises(ValueError):
+        decode_binary(b'JUNK' + bytes(20))
+
+    header, titles, rows, similarities = payload_fields(count=2)
+    payload = bytearray(encode_score_vectors('binary', header, titles, rows, similarities))
+    payload[4:6] = (99).to_bytes(2, 'little')
+    with pytest.raises(ValueError, match="version"):
+        decode_binary(bytes(payload))
+
+
+def test_quantize_clips_to_unit_range():
+    np.testing.assert_array_equal(quantize(np.array([-0.5, 0.0, 0.5, 1.0, 2.0])),
+                                  [0, 0, round(0.5 * SCORE_SCALE), SCORE_SCALE, SCORE_SCALE])
+
+
+def test_json_matches_binary():
+    header, titles, rows, similarities = payload_fields(count=10)
+    body = json.loads(encode_score_vectors('json', header, titles, rows, similarities))
+    _, decoded_rows, decoded = decode_binary(encode_score_vectors('binary', header, titles, rows, similarities))
+
+    assert body['rows'] == decoded_rows.tolist()
+    for modality in MODALITIES:
+        np.testing.assert_allclose(np.array(body['scores'][modality]) / SCORE_SCALE, decoded[modality], atol=1e-7)
+
+
+def test_msgpack_matches_binary():
+    msgpack = pytest.importorskip('msgpack')
+    header, titles, rows, similarities = payload_fields(count=10)
+    body = msgpack.unpackb(encode_score_vectors('msgpack', header, titles, rows, similarities), raw=False)
+
+    assert body['titles'] == titles
+    np.testing.assert_array_equal(np.frombuffer(body['rows'], dtype='<u4'), rows)
+    for modality in MODALITIES:
+        np.testing.assert_array_equal(np.frombuffer(body['scores'][modality], dtype='<u2'),
+                                      quantize(similarities[modality]))
+
+
+def test_arrow_matches_binary():
+    pa = pytest.importorskip('pyarrow')
+    header, titles, rows, similarities = payload_fields(count=10)
+    table = pa.ipc.open_stream(encode_score_vectors('arrow', header, titles, rows, similarities)).read_all()
+
+    assert table.column('title').to_pylist() == titles
+    assert table.column('row').to_pylist() == [int(r) for r in rows]
+    for modality in MODALITIES:
+        assert table.column(modality).to_pylist() == quantize(similarities[modality]).tolist()
+    assert json.loads(table.schema.metadata[b'score_vectors'])['scale'] == SCORE_SCALE
+
+
+def test_unknown_format():
+    header, titles, rows, similarities = payload_fields(count=1)
+    with pytest.raises(ValueError, match="Unknown format"):
+        encode_score_vectors('xml', header, titles, rows, similarities)
@@ -0,0 +1,92 @@
+import os
+import urllib.error
+from urllib.parse import quote
+
+import pytest
+
+from index_generations import GenerationManager
+from sharding import ScatterGather, create_shard_app, load_shard, read_trailer_links
+
+SHARDS = 3
+
+
+@pytest.fixture
+def coordinator(backend, synthetic_catalog, monkeypatch):
+    """
+    backend_api as a coordinator in front of SHARDS in-process shards: the
+    shard fetches are stubbed with the shard apps' test clients
+    """
+    snapshot = os.path.join(synthetic_catalog, 'serving_snapshot')
+    links = read_trailer_links(os.path.join(synthetic_catalog, 'movie_trailers.csv'))
+    enriched = os.path.join(synthetic_catalog, 'movie_trailers_enriched.csv')
+    clients = [create_shard_app(load_shard(snapshot, shard, SHARDS, enriched, links)).test_client()
+               for shard in range(SHARDS)]
+    scatter = ScatterGather([f'http://shard{shard}' for shard in range(SHARDS)])
+
+    def post(url, path, payload, timeout):
+        response = clients[scatter.urls.index(url)].post(path, json=payload)
+        if response.status_code != 200:
+            raise urllib.error.HTTPError(url + path, response.status_code, 'shard error', None, None)
+        return response.get_json()
+
+    monkeypatch.setattr(scatter, '_post', post)
+    monkeypatch.setattr(backend, 'SHARD_URLS', scatter.urls)
+    generation = backend.build_generation()
+    monkeypatch.setattr(backend, 'scatter', scatter)
+    monkeypatch.setattr(backend, 'generations', GenerationManager(lambda: generation))
+    backend.generations.load()
+    return generation
+
+
+def responses(backend, titles):
+    client = backend.app.test_client()
+    for title in titles:
+        path = quote(title, safe='')
+        yield client.get(f'/api/recommend/{path}?narrative=0.5&visual=0.3&audio=0.2')
+        yield client.get(f'/api/recommend/{path}?min_rating=6')
+        yield client.post('/api/similarity', json={'movie_title': title, 'k': 15})
+        yield client.get(f'/api/analysis/{path}')
+
+
+def assert_same_json(got, expected):
+    if isinstance(expected, dict):
+        assert got.keys() == expected.keys()
+        for key in expected:
+            assert_same_json(got[key], expected[key])
+    elif isinstance(expected, list):
+        assert len(got) == len(expected)
+        for a, b in zip(got, expected):
+            assert_same_json(a, b)
+    elif isinstance(expected, float):
+        assert got == pytest.approx(expected, rel=1e-5, abs=1e-6)
+    else:
+        assert got == expected
+
+
+def test_coordinator_matches_single_process(backend, request):
+    titles = list(backend.generations.current.index.titles[30:34])
+    single = [(r.status_code, r.get_json()) for r in responses(backend, titles)]
+
+    generation = request.getfixturevalue('coordinator')
+    # Titles and metadata only: the shards hold every vector and derived structure
+    assert not generation.index.has_vectors
+    assert generation.index.squared_norms is None
+    assert (generation.lattice, generation.table, generation.planner) == (None, None, None)
+
+    sharded = list(responses(backend, titles))
+    ranked = [r for r in sharded if '/api/analysis/' not in r.request.path]
+    plans = {(r.headers['X-Query-Plan'], r.headers['X-Shards']) for r in ranked}
+    assert plans == {('scatter_gather', f'{SHARDS}/{SHARDS}')}
+    assert all(expected for _, expected in single)
+    assert [r.status_code for r in sharded] == [status for status, _ in single]
+    for response, (_, expected) in zip(sharded, single):
+        assert_same_json(response.get_json(), expected)
+
+
+def test_coordinator_refuses_local_scoring(backend, coordinator):
+    client = backend.app.test_client()
+    title = quote(coordinator.index.titles[0], safe='')
+    assert client.get(f'/api/similarity/vectors/{title}').status_code == 501
+    assert client.post('/api/explain', json={'movie_title': coordinator.index.titles[0]}).status_code == 501
+    assert client.get('/api/search/palette?colors=1b2a49').status_code == 501
+    assert client.get('/api/recommend/No%20Such%20Movie').status_code == 404
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.001)
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', compute, 'route')))
+               for _ in range(4)]
+    threads[0].start()
+    wait_for(lambda: 'key' in flight.calls)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: flight.calls['key'].waiters == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [('result', False)] + [('result', True)] * 3
+    assert flight.calls == {}
+    stats = flight.stats()
+    assert stats['routes'] == {'route': {'executed': 1, 'coalesced': 3, 'errors': 0}}
+    assert stats['max_waiters'] == 3
+
+
+def test_errors_reach_every_waiter_and_free_the_key():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise KeyError('boom')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('key', fail)
+        except KeyError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    threads[0].start()
+    wait_for(lambda: 'key' in flight.calls)
+    threads[1].start()
+    wait_for(lambda: flight.calls['key'].waiters == 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 2
+    assert flight.do('key', lambda: 'again') == ('again', False)
+
+
+def test_shed_response_is_not_shared(backend):
+    """
+    A follower of a request that got 503 runs the view itself
+    """
+    app = backend.app
+    entered = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    @backend.coalesced
+    def view():
+        calls.append(1)
+        if len(calls) == 1:
+            entered.set()
+            release.wait(5)
+            return {'error': 'overloaded'}, 503
+        return {'ok': True}
+
+    responses = {}
+
+    def call(name):
+        with app.test_request_context('/api/recommend/x'):
+            responses[name] = view()
+
+    leader = threading.Thread(target=call, args=('leader',))
+    leader.start()
+    entered.wait(5)
+    follower = threading.Thread(target=call, args=('follower',))
+    follower.start()
+    wait_for(lambda: any(c.waiters for c in backend.single_flight.calls.values()))
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert responses['leader'].status_code == 503
+    assert responses['follower'].status_code == 200
+    assert responses['follower'].get_json() == {'ok': True}
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('route', ['/api/recommend/<path:movie_title>', '/api/similarity', '/api/search'])
+def test_admission_runs_before_coalescing(backend, route):
+    """
+    Every request is admitted on its own deadline: @admitted wraps @coalesced
+    """
+    rule = next(rule for rule in backend.app.url_map.iter_rules() if rule.rule == route)
+    coalesced = backend.coalesced(lambda: None).__code__
+    admitted = backend.admitted('test', 'interactive')(lambda: None).__code__
+    del backend.admission.budgets['test']
+    view = backend.app.view_functions[rule.endpoint]
+    assert (view.__code__, view.__wrapped__.__code__) == (admitted, coalesced)
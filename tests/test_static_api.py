@@ -0,0 +1,21 @@
+import json
+import os
+from urllib.parse import quote
+
+from static_api import SHARDED_ROUTES, build_static_api, shard_of
+
+
+def test_shards_hold_the_rendered_responses(backend, tmp_path):
+    titles = list(backend.generations.current.index.titles[:12])
+    manifest = build_static_api(backend.app, titles, str(tmp_path), shard_size=5)
+
+    assert manifest['shards'] == 3
+    assert manifest['routes'] == {'movies': 'movies.json', 'analysis': 'analysis/{shard}.json'}
+    assert manifest['rendered'] == {'analysis': len(titles)}
+    assert {name for name in os.listdir(tmp_path) if os.path.isdir(tmp_path / name)} == set(SHARDED_ROUTES)
+
+    client = backend.app.test_client()
+    for title in titles:
+        with open(tmp_path / 'analysis' / f'{shard_of(title, manifest["shards"])}.json', encoding='utf-8') as f:
+            shard = json.load(f)
+        assert shard[title] == client.get(f'/api/analysis/{quote(title, safe="")}').get_json()
@@ -0,0 +1,108 @@
+import base64
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import load_index
+from scoring import MODALITIES, row_query
+from taste_profile import MAX_SEEDS, TasteProfile, parse_seeds
+
+
+@pytest.fixture(scope='module')
+def index(synthetic_catalog):
+    return load_index(synthetic_catalog, os.path.join(synthetic_catalog, 'serving_snapshot'))
+
+
+def profile_of(index, seeds):
+    profile = TasteProfile()
+    for row, weight in seeds:
+        profile.update(index.titles[row], weight, row_query(index, row))
+    return profile
+
+
+def unit(index, modality, row):
+    vector = index.vector(modality, row).astype(np.float64)
+    return vector / np.linalg.norm(vector)
+
+
+def test_sums_are_signed_unit_vectors(index):
+    profile = profile_of(index, [(0, 1.0), (1, 2.0), (2, -0.5)])
+    for modality in MODALITIES:
+        expected = unit(index, modality, 0) + 2 * unit(index, modality, 1) - 0.5 * unit(index, modality, 2)
+        np.testing.assert_allclose(profile.sums[modality], expected, atol=1e-5)
+    assert profile.describe() == {'liked': {index.titles[0]: 1.0, index.titles[1]: 2.0},
+                                  'disliked': {index.titles[2]: 0.5}}
+
+
+def test_reweighting_and_dropping_match_a_fresh_profile(index):
+    profile = profile_of(index, [(0, 1.0), (1, 1.0), (2, 1.0)])
+    profile.update(index.titles[1], 3.0, row_query(index, 1))
+    profile.update(index.titles[2], 0, row_query(index, 2))
+    fresh = profile_of(index, [(0, 1.0), (1, 3.0)])
+    assert profile.seeds == fresh.seeds
+    for modality in MODALITIES:
+        np.testing.assert_allclose(profile.sums[modality], fresh.sums[modality], atol=1e-5)
+
+
+def test_encode_decode_round_trip(index):
+    profile = profile_of(index, [(3, 1.0), (4, -0.5)])
+    token = profile.encode()
+    assert '=' not in token
+    decoded = TasteProfile.decode(token)
+    assert decoded.seeds == profile.seeds
+    for modality in MODALITIES:
+        # Tokens carry float32 sums
+        np.testing.assert_array_equal(decoded.sums[modality], profile.sums[modality].astype(np.float32))
+    assert decoded.encode() == token
+
+    # A decoded profile keeps updating like the original
+    decoded.update(index.titles[5], 1.0, row_query(index, 5))
+    profile.update(index.titles[5], 1.0, row_query(index, 5))
+    np.testing.assert_allclose(decoded.sums['narrative'], profile.sums['narrative'], atol=1e-5)
+
+
+def test_empty_profile_round_trip():
+    decoded = TasteProfile.decode(TasteProfile().encode())
+    assert (decoded.seeds, decoded.sums) == ({}, {})
+
+
+def encoded(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('token', [
+    'not a token!',
+    encoded([1, 2]),
+    encoded({'seeds': {}}),
+    encoded({'seeds': {'a': 1.0}, 'sums': {}}),
+    encoded({'seeds': {'a': 1.0}, 'sums': {m: base64.b64encode(np.full(2, np.nan, np.float32).tobytes()).decode()
+                                          for m in MODALITIES}}),
+    encoded({'seeds': {str(i): 1.0 for i in range(MAX_SEEDS + 1)}, 'sums': {}}),
+])
+def test_decode_rejects_malformed_tokens(token):
+    with pytest.raises(ValueError, match='Invalid profile'):
+        TasteProfile.decode(token)
+
+
+def test_seed_limit_and_dimension_checks(index, monkeypatch):
+    monkeypatch.setattr('taste_profile.MAX_SEEDS', 2)
+    profile = profile_of(index, [(0, 1.0), (1, 1.0)])
+    with pytest.raises(ValueError, match='at most 2'):
+        profile.update(index.titles[2], 1.0, row_query(index, 2))
+    # Reweighting a held title is still allowed
+    profile.update(index.titles[1], 2.0, row_query(index, 1))
+
+    query = row_query(index, 2)
+    query['vectors'] = dict(query['vectors'], audio=query['vectors']['audio'][:-1])
+    with pytest.raises(ValueError, match='audio dimensions'):
+        profile.update(index.titles[0], 0.5, query)
+
+
+def test_parse_seeds():
+    assert parse_seeds(None, 1.0) == []
+    assert parse_seeds(['A', {'title': 'B', 'weight': 2}], 0.5) == [('A', 0.5), ('B', 2.0)]
+    for source in ('A', [1], [{'weight': 1}], [{'title': 'A', 'weight': -1}], [{'title': 'A', 'weight': 'inf'}]):
+        with pytest.raises(ValueError):
+            parse_seeds(source, 1.0)
@@ -0,0 +1,57 @@
+import numpy as np
+
+from scoring import MODALITIES, similarity_rows
+from weight_lattice import DEFAULT_LOOKUP_MODE, WeightLattice, load_lattice, materialize, save_lattice
+
+RESOLUTION = 4
+K = 10
+
+
+def test_default_mode_is_constant_time():
+    assert DEFAULT_LOOKUP_MODE == 'nearest'
+
+
+def test_lattice_points_match_exact_scoring(segmented_index, tmp_path):
+    index = segmented_index
+    rows = index.live_rows()[:20]
+    path = str(tmp_path / 'lattice.npz')
+    save_lattice(path, materialize(index, RESOLUTION, K, rows))
+    lattice = load_lattice(path)
+
+    for row in rows:
+        for weights in lattice.weights[::3]:
+            weights = dict(zip(MODALITIES, weights))
+            expected = similarity_rows(index, row, weights, index.live, K)
+            for mode in ('nearest', 'blend', 'union'):
+                got = lattice.lookup(row, weights, K, mode)
+                np.testing.assert_array_equal(got[0], expected[0])
+                np.testing.assert_allclose(got[2], expected[2], rtol=1e-5)
+
+
+def test_dead_rows_are_not_materialized(segmented_index):
+    index = segmented_index
+    dead = np.flatnonzero(~index.live)
+    assert len(dead) == 7  # five shadowed base rows and two tombstones
+
+    arrays = materialize(index, RESOLUTION, K)
+    assert not np.isin(arrays['rows'], dead).any()
+    stored = arrays['candidates'][arrays['candidates'] >= 0]
+    assert not np.isin(stored, dead).any()
+    # Every lattice point still stores a full top k
+    assert (arrays['tops'] != np.iinfo(arrays['tops'].dtype).max).all()
+
+
+def test_nearest_reads_k_rows(segmented_index):
+    index = segmented_index
+    row = int(index.live_rows()[0])
+    lattice = WeightLattice(materialize(index, RESOLUTION, K, [row]))
+    weights = {'narrative': 0.37, 'visual': 0.41, 'audio': 0.22}
+
+    assert lattice.width(row, 'nearest') == K
+    assert lattice.width(row, 'blend') <= 3 * K
+    assert lattice.width(row, 'union') >= lattice.width(row, 'blend')
+    rows, _, combined = lattice.lookup(row, weights, K)
+    assert len(rows) == K
+    assert not lattice.on_point(weights)
+    assert lattice.lookup(row, {'narrative': -1, 'visual': 1, 'audio': 1}, K) is None
+    assert lattice.lookup(row, weights, K + 1) is None
@@ -0,0 +1,150 @@
+"""
+Warmup before taking traffic, and the readiness it gates (/api/ready)
+
+The first requests after a deploy pay for lazy initialization: the query
+encoder's first inferences (torch / onnxruntime kernel setup), the first
+scans over the snapshot's embedding matrices (cold page cache) and empty
+per-generation caches (the query planner's result LRU and cost model).
+A warmup runs a representative set of requests against a generation before
+it is trusted with traffic: searches, then default-weight recommendations,
+similarity rankings and analyses for the most popular titles, i.e. the
+ones this process has served most, topped up with the most-voted on IMDb.
+
+The first generation warms in the background while /api/health (liveness)
+already answers; /api/ready answers 503 until the warmup finishes or runs
+out of time. Later generations warm while they are built, before they are
+swapped in, so a reload never makes a ready instance unready.
+"""
+
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+DEFAULT_WARMUP_TITLES = 50
+# Seconds a warmup may take before the instance is declared ready anyway
+DEFAULT_WARMUP_TIMEOUT = 120.0
+# Free-text searches run besides the popular titles' own names
+WARMUP_QUERIES = (
+    'space adventure',
+    'haunted house horror',
+    'romantic comedy',
+    'heist thriller',
+    'animated family film',
+)
+
+
+class TitlePopularity:
+    """
+    How often each catalog title was asked for in this process
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def hit(self, title, index):
+        # Only titles in the catalog are counted, so arbitrary input cannot grow the counter
+        if index is None or index.row(title) is None:
+            return
+        with self.lock:
+            self.counts[title] += 1
+
+    def most_common(self, count):
+        with self.lock:
+            return [title for title, _ in self.counts.most_common(count)]
+
+
+def popular_titles(index, count, requested=()):
+    """
+    Up to `count` live titles: `requested` ones first (most requested
+    first), then the rest by IMDb votes
+    """
+    titles = [title for title in dict.fromkeys(requested) if index.row(title) is not None][:count]
+    if len(titles) < count:
+        rows = index.live_rows()
+        votes = index.catalog.imdb_votes[rows]
+        voted = rows[~np.isnan(votes)]
+        order = voted[np.argsort(-index.catalog.imdb_votes[voted], kind='stable')]
+        chosen = set(titles)
+        for row in order:
+            title = index.titles[row]
+            if title not in chosen and index.title_index.get(title) == row:
+                titles.append(title)
+                chosen.add(title)
+                if len(titles) == count:
+                    break
+    return titles
+
+
+def run_warmup(requests, timeout=DEFAULT_WARMUP_TIMEOUT):
+    """
+    Call every (kind, name, call) in order until `timeout` seconds pass;
+    returns a report of what ran. A failing request is counted, not raised.
+    """
+    start = time.perf_counter()
+    counts, errors, timed_out = Counter(), Counter(), False
+    for kind, name, call in requests:
+        if time.perf_counter() - start > timeout:
+            timed_out = True
+            break
+        try:
+            call()
+            counts[kind] += 1
+        except Exception as e:
+            errors[kind] += 1
+            print(f"Warmup {kind} '{name}' failed: {e}")
+    return {
+        'requests': dict(counts),
+        'errors': dict(errors),
+        'seconds': round(time.perf_counter() - start, 3),
+        'timed_out': timed_out,
+    }
+
+
+class Readiness:
+    """
+    'starting' until the first warmup begins, 'warming' while it runs,
+    then 'ready'. 'unavailable' when there is nothing to serve from.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = 'starting'
+        self.since = time.time()
+        self.warmups = 0
+        self.last_warmup = None
+
+    def _set(self, state):
+        self.state = state
+        self.since = time.time()
+
+    def warming(self):
+        with self.lock:
+            if self.state != 'ready':
+                self._set('warming')
+
+    def warmed(self, report):
+        with self.lock:
+            self.warmups += 1
+            self.last_warmup = report
+            if self.state != 'ready':
+                self._set('ready')
+
+    def unavailable(self):
+        with self.lock:
+            self._set('unavailable')
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def describe(self):
+        with self.lock:
+            return {
+                'status': self.state,
+                'since': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.since)),
+                'warmups': self.warmups,
+                'last_warmup': self.last_warmup,
+            }
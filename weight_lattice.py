@@ -0,0 +1,339 @@
+"""
+Materialized /api/similarity results over a lattice of weight vectors
+
+Weights live on the simplex narrative + visual + audio = 1, and the sliders
+move in steps, so most requests land on or near a handful of settings. The
+materializer scores every title once and stores its top k at every point of
+the lattice {(i, j, l) / resolution : i + j + l = resolution}.
+
+Per title only the union of its lattice top-k lists is kept (a few times
+k rows), with those rows' float32 per-modality scores. A request then touches
+at most a few k rows, however large the catalog:
+
+    nearest   the top k stored at the closest lattice point, rescored at
+              the requested weights (the default: k rows)
+    blend     the top-k lists at the corners of the lattice cell holding
+              the weights, fused at the requested weights (up to 3k rows)
+    union     every stored candidate of the title fused at the requested
+              weights; `report` shows it is the most accurate, but it reads
+              every list stored for the title, which grows with resolution
+
+Rows shadowed or deleted in a delta segment (index_segments.py) are neither
+materialized nor stored as candidates, and a lattice built before a delete
+no longer matches the index.
+
+Build and measure with:
+    python weight_lattice.py build --resolution 12 --k 20
+    python weight_lattice.py report --resolutions 4 8 12 20 --titles 200 --samples 20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from scoring import MODALITIES, SIMILARITY_RESULTS, fuse_vectors, modality_vector_rows, similarity_rows, top_k
+
+LATTICE_FORMAT = 1
+LOOKUP_MODES = ('nearest', 'blend', 'union')
+DEFAULT_LOOKUP_MODE = 'nearest'
+# Per-title candidate pool scanned before falling back to the whole catalog
+CANDIDATE_POOL = 256
+
+
+def titles_digest(titles):
+    return hashlib.sha1('\n'.join(titles).encode('utf-8')).hexdigest()
+
+
+def live_digest(index):
+    """
+    titles_digest extended with the live mask: a tombstone leaves the titles
+    as they were but kills rows the lattice may store as candidates
+    """
+    digest = hashlib.sha1('\n'.join(index.titles).encode('utf-8'))
+    if index.live is not None:
+        digest.update(np.packbits(index.live).tobytes())
+    return digest.hexdigest()
+
+
+def simplex_lattice(resolution):
+    """
+    Every (narrative, visual, audio) weight with coordinates in steps of
+    1/resolution summing to 1, as a (P, 3) array
+    """
+    points = [(i, j, resolution - i - j)
+              for i in range(resolution + 1) for j in range(resolution + 1 - i)]
+    return np.array(points, dtype=np.float64) / resolution
+
+
+def _lattice_top_k(index, row, lattice, k, pool):
+    """
+    (candidate rows, their similarities, per-point positions into candidates).
+    Scores a small per-modality candidate pool first; any lattice point whose
+    k-th score does not clear the pool's bound is redone over the whole catalog.
+    """
+    for top in (pool, None):
+        rows, similarities, thresholds = modality_vector_rows(index, row, index.live, top=top)
+        bound = lattice @ np.array([thresholds[m] for m in MODALITIES])
+        tops = []
+        for point, weights in enumerate(lattice):
+            combined = fuse_vectors(similarities, dict(zip(MODALITIES, weights)))
+            positions = top_k(combined, k)
+            if top is not None and len(positions) and combined[positions[-1]] < bound[point]:
+                break
+            tops.append(positions)
+        else:
+            return rows, similarities, tops
+
+
+def materialize(index, resolution, k=SIMILARITY_RESULTS, rows=None, pool=CANDIDATE_POOL):
+    """
+    Build the lattice arrays for `rows` (default: every live row)
+    """
+    lattice = simplex_lattice(resolution)
+    rows = index.live_rows() if rows is None else np.asarray(rows)
+    per_row = []
+    for row in rows:
+        candidates, similarities, tops = _lattice_top_k(index, row, lattice, k, pool)
+        used = np.unique(np.concatenate(tops))
+        remap = np.full(len(candidates), -1, dtype=np.int64)
+        remap[used] = np.arange(len(used))
+        per_row.append((candidates[used], np.stack([similarities[m][used] for m in MODALITIES], axis=1),
+                        [remap[t] for t in tops]))
+
+    width = max((len(c) for c, _, _ in per_row), default=0)
+    position_dtype = np.uint8 if width < 255 else np.uint16
+    missing = np.iinfo(position_dtype).max
+    candidates = np.full((len(rows), width), -1, dtype=np.int32)
+    scores = np.zeros((len(rows), width, 3), dtype=np.float32)
+    tops = np.full((len(rows), len(lattice), k), missing, dtype=position_dtype)
+    for i, (cand, sims, positions) in enumerate(per_row):
+        candidates[i, :len(cand)] = cand
+        scores[i, :len(cand)] = sims
+        for point, pos in enumerate(positions):
+            tops[i, point, :len(pos)] = pos
+
+    return {
+        'format': LATTICE_FORMAT,
+        'resolution': resolution,
+        'k': k,
+        'titles_digest': live_digest(index),
+        'rows': rows.astype(np.int32),
+        'weights': lattice,
+        'candidates': candidates,
+        'scores': scores,
+        'tops': tops,
+    }
+
+
+def save_lattice(path, arrays):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    meta = {key: arrays[key] for key in ('format', 'resolution', 'k', 'titles_digest')}
+    np.savez(path, meta=np.array(json.dumps(meta)),
+             **{key: arrays[key] for key in ('rows', 'weights', 'candidates', 'scores', 'tops')})
+
+
+class WeightLattice:
+    """
+    Request-time lookups into materialized lattice arrays
+    """
+
+    def __init__(self, arrays):
+        self.resolution = int(arrays['resolution'])
+        self.k = int(arrays['k'])
+        self.titles_digest = arrays['titles_digest']
+        self.weights = arrays['weights']
+        self.candidates = arrays['candidates']
+        self.scores = arrays['scores']
+        self.tops = arrays['tops']
+        self.missing = np.iinfo(self.tops.dtype).max
+        self.slot = {int(row): i for i, row in enumerate(arrays['rows'])}
+        # (i, j) lattice coordinates -> point number; the audio coordinate is implied
+        self.point = np.full((self.resolution + 1, self.resolution + 1), -1, dtype=np.int64)
+        steps = np.rint(self.weights * self.resolution).astype(np.int64)
+        self.point[steps[:, 0], steps[:, 1]] = np.arange(len(self.weights))
+
+    def matches(self, index):
+        return self.titles_digest == live_digest(index)
+
+    def _normalize(self, weights):
+        vector = np.array([float(weights[m]) for m in MODALITIES])
+        total = vector.sum()
+        if (vector < 0).any() or total <= 0:
+            return None
+        return vector / total
+
+    def covers(self, row, weights):
+        return row in self.slot and self._normalize(weights) is not None
+
+    def on_point(self, weights):
+        """
+        Whether the weights (up to scale) are a lattice point, where every
+        mode returns the materialized, exact top k
+        """
+        scaled = self._normalize(weights) * self.resolution
+        return bool(np.abs(scaled - np.rint(scaled)).max() < 1e-9)
+
+    def width(self, row, mode=DEFAULT_LOOKUP_MODE):
+        """
+        Most stored candidates a `mode` lookup for `row` fuses
+        """
+        if mode == 'nearest':
+            return self.k
+        stored = int((self.candidates[self.slot[row]] >= 0).sum())
+        return min(3 * self.k, stored) if mode == 'blend' else stored
+
+    def nearest_point(self, vector):
+        # Largest-remainder rounding keeps the coordinates summing to resolution
+        scaled = vector * self.resolution
+        steps = np.floor(scaled).astype(np.int64)
+        for axis in np.argsort(-(scaled - steps), kind='stable')[:self.resolution - steps.sum()]:
+            steps[axis] += 1
+        return self.point[steps[0], steps[1]]
+
+    def cell_points(self, vector):
+        """
+        Corners of the lattice triangle containing `vector` (one point when it
+        sits on the lattice)
+        """
+        scaled = vector * self.resolution
+        base = np.floor(scaled + 1e-9).astype(np.int64)
+        short = self.resolution - base.sum()
+        if short == 0:
+            corners = [base]
+        elif short == 1:
+            corners = [base + np.eye(3, dtype=np.int64)[axis] for axis in range(3)]
+        else:
+            corners = [base + 1 - np.eye(3, dtype=np.int64)[axis] for axis in range(3)]
+        return [self.point[c[0], c[1]] for c in corners if (c >= 0).all() and (c <= self.resolution).all()]
+
+    def lookup(self, row, weights, k=SIMILARITY_RESULTS, mode=DEFAULT_LOOKUP_MODE):
+        """
+        Same (rows, similarities, combined) as scoring.similarity_rows, or None
+        when the lattice cannot answer (unknown row, k too large, negative weights)
+        """
+        slot = self.slot.get(row)
+        vector = self._normalize(weights)
+        if slot is None or vector is None or k > self.k:
+            return None
+
+        if mode == 'nearest':
+            points = [self.nearest_point(vector)]
+        elif mode == 'blend':
+            points = self.cell_points(vector)
+        else:
+            points = slice(None)
+        positions = np.unique(self.tops[slot, points].ravel())
+        positions = positions[positions != self.missing]
+
+        rows = self.candidates[slot, positions]
+        scores = self.scores[slot, positions].astype(np.float64)
+        similarities = {m: scores[:, i] for i, m in enumerate(MODALITIES)}
+        combined = fuse_vectors(similarities, weights)
+        if mode == 'nearest':
+            # Keep the lattice point's own order
+            stored = self.tops[slot, points[0]]
+            order = np.searchsorted(positions, stored[stored != self.missing])[:k]
+        else:
+            order = np.lexsort((rows, -combined))[:k]
+        return rows[order], {m: s[order] for m, s in similarities.items()}, combined[order]
+
+
+def load_lattice(path):
+    with np.load(path) as data:
+        arrays = json.loads(str(data['meta']))
+        if arrays['format'] != LATTICE_FORMAT:
+            raise ValueError(f"Unsupported lattice format {arrays['format']}")
+        arrays.update({key: data[key] for key in ('rows', 'weights', 'candidates', 'scores', 'tops')})
+    return WeightLattice(arrays)
+
+
+def accuracy_report(index, resolutions, titles=200, samples=20, k=SIMILARITY_RESULTS, seed=0):
+    """
+    How often the lattice answer equals the exact answer, per resolution and
+    mode, for random titles and Dirichlet(1, 1, 1) weights
+    """
+    rng = np.random.default_rng(seed)
+    live = index.live_rows()
+    rows = rng.choice(live, size=min(titles, len(live)), replace=False)
+    queries = [(int(row), dict(zip(MODALITIES, rng.dirichlet(np.ones(3)))))
+               for row in rows for _ in range(samples)]
+    exact = {(row, tuple(w.values())): similarity_rows(index, row, w, index.live, k)[0] for row, w in queries}
+
+    report = []
+    for resolution in resolutions:
+        start = time.time()
+        arrays = materialize(index, resolution, k, rows)
+        build_seconds = time.time() - start
+        lattice = WeightLattice(arrays)
+        entry = {
+            'resolution': resolution,
+            'points': len(arrays['weights']),
+            'candidates_per_title': float(np.mean((arrays['candidates'] >= 0).sum(axis=1))),
+            'bytes_per_title': int((arrays['candidates'].nbytes + arrays['scores'].nbytes +
+                                    arrays['tops'].nbytes) / len(rows)),
+            'build_ms_per_title': 1000 * build_seconds / len(rows),
+        }
+        for mode in LOOKUP_MODES:
+            identical = recall = 0.0
+            for row, weights in queries:
+                expected = exact[(row, tuple(weights.values()))]
+                got = lattice.lookup(row, weights, k, mode)[0]
+                identical += np.array_equal(got, expected)
+                recall += len(np.intersect1d(got, expected)) / max(1, len(expected))
+            entry[mode] = {'identical': identical / len(queries), f'recall@{k}': recall / len(queries)}
+        report.append(entry)
+    return report
+
+
+def _load_index(args):
+    from serving_index import load_serving_index
+
+    return load_serving_index(args.db, args.snapshot, args.enriched)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Materialize /api/similarity over a weight lattice")
+    parser.add_argument('--db', default=os.environ.get('CHROMA_PERSIST_DIRECTORY', 'Data/trailer_db'))
+    parser.add_argument('--snapshot', default=os.environ.get('SERVING_SNAPSHOT_PATH', 'Data/serving_snapshot'))
+    parser.add_argument('--enriched', default=os.environ.get('MOVIES_ENRICHED_CSV_PATH',
+                                                            'Data/movie_trailers_enriched.csv'))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="materialize the lattice for every title")
+    build.add_argument('--out', default=os.environ.get('WEIGHT_LATTICE_PATH', 'Data/weight_lattice.npz'))
+    build.add_argument('--resolution', type=int, default=12)
+    build.add_argument('--k', type=int, default=SIMILARITY_RESULTS)
+
+    report = commands.add_parser('report', help="lattice vs exact agreement at several resolutions")
+    report.add_argument('--resolutions', type=int, nargs='+', default=[4, 8, 12, 20])
+    report.add_argument('--titles', type=int, default=200)
+    report.add_argument('--samples', type=int, default=20, help="random weight vectors per title")
+    report.add_argument('--k', type=int, default=SIMILARITY_RESULTS)
+    report.add_argument('--json', help="also write the report to this path")
+
+    args = parser.parse_args()
+    index = _load_index(args)
+
+    if args.command == 'build':
+        start = time.time()
+        arrays = materialize(index, args.resolution, args.k)
+        save_lattice(args.out, arrays)
+        print(f"✓ Wrote {len(arrays['weights'])}-point lattice for {len(index)} movies to {args.out} "
+              f"({os.path.getsize(args.out) / 1e6:.1f} MB) in {time.time() - start:.1f}s")
+    else:
+        results = accuracy_report(index, args.resolutions, args.titles, args.samples, args.k)
+        modes = LOOKUP_MODES
+        recall = f'recall@{args.k}'
+        print(f"{'resolution':>10} {'points':>6} {'cands':>6} {'KB/title':>8} {'build ms':>8}" +
+              ''.join(f"  {mode + ' =':>9} {'recall':>6}" for mode in modes))
+        for entry in results:
+            print(f"{entry['resolution']:>10} {entry['points']:>6} {entry['candidates_per_title']:>6.1f} "
+                  f"{entry['bytes_per_title'] / 1024:>8.1f} {entry['build_ms_per_title']:>8.1f}" +
+                  ''.join(f"  {entry[mode]['identical']:>9.1%} {entry[mode][recall]:>6.1%}" for mode in modes))
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)